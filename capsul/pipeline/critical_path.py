@@ -0,0 +1,206 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Critical-path priorities.
+
+When more jobs are ready than there are workers, the jobs starting the
+longest chains have to run first, or the end of the pipeline waits for a
+long chain started late. The remaining critical-path length of a job is its
+expected duration plus the longest remaining length of the jobs waiting for
+it (:func:`critical_path_lengths`). Jobs are then prioritized by this
+length (:func:`rank_priorities`).
+
+Durations are given by :func:`expected_duration`, also used to bundle
+short jobs (see :mod:`capsul.pipeline.job_bundles`). They are taken from a
+:class:`RuntimeHistory`, which records the execution times of the
+processes (see the runtime_history_file option of
+:class:`~capsul.study_config.study_config.StudyConfig`), else from the
+``expected_duration`` attribute the processes may declare.
+"""
+
+# System import
+import os
+import json
+import threading
+import six
+
+
+class RuntimeHistory(object):
+    """ Execution times of processes, stored in a JSON file.
+
+    The last executions of each process are kept, and its expected duration
+    is their median::
+
+        history = RuntimeHistory("/study/runtimes.json")
+        history.record("capsul.process.test.MyProcess", 12.5)
+        history.save()
+        history.get("capsul.process.test.MyProcess")
+
+    Attributes
+    ----------
+    filename: str
+        the JSON file, or None for a history kept in memory.
+    size: int
+        number of executions kept for each process.
+    """
+
+    def __init__(self, filename=None, size=20):
+        """ Initialize the RuntimeHistory class, and read the file, if it
+        exists.
+        """
+        self.filename = filename
+        self.size = size
+        self.runtimes = {}
+        self._lock = threading.Lock()
+        if filename is not None and os.path.exists(filename):
+            with open(filename) as json_file:
+                self.runtimes = json.load(json_file)
+
+    def record(self, process_id, duration):
+        """ Record an execution time (in seconds).
+        """
+        with self._lock:
+            runtimes = self.runtimes.setdefault(process_id, [])
+            runtimes.append(duration)
+            del runtimes[:-self.size]
+
+    def get(self, process_id, default=None):
+        """ Get the expected duration of a process: the median of its
+        recorded execution times.
+
+        The history can thus be used as a {process_id: seconds} dict.
+        """
+        runtimes = sorted(self.runtimes.get(process_id, ()))
+        if not runtimes:
+            return default
+        middle = len(runtimes) // 2
+        if len(runtimes) % 2:
+            return runtimes[middle]
+        return (runtimes[middle - 1] + runtimes[middle]) / 2.
+
+    def durations(self):
+        """ Get the expected durations of all the recorded processes.
+
+        Returns
+        -------
+        durations: dict
+            {process_id: seconds}
+        """
+        return dict((process_id, self.get(process_id))
+                    for process_id in list(self.runtimes))
+
+    def save(self):
+        """ Write the history file.
+        """
+        if self.filename is None:
+            return
+        with self._lock:
+            runtimes = dict(self.runtimes)
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_filename = "{0}.{1}.tmp".format(self.filename, os.getpid())
+        with open(tmp_filename, "w") as json_file:
+            json.dump(runtimes, json_file, sort_keys=True)
+        if os.path.exists(self.filename) and os.name == "nt":
+            os.unlink(self.filename)
+        os.rename(tmp_filename, self.filename)
+
+
+def expected_duration(process, history=None, default=1.):
+    """ Expected duration of a process execution, for priorities and jobs
+    bundling.
+
+    Parameters
+    ----------
+    process: Process
+        the process.
+    history: RuntimeHistory or dict (optional)
+        {process_id: seconds} past execution times.
+    default: float (optional)
+        duration of the processes whose duration is unknown (None: the
+        duration is unknown).
+
+    Returns
+    -------
+    duration: float
+        the past duration, else the declared one (``expected_duration``
+        attribute of the process), else the default.
+    """
+    duration = None
+    if history is not None:
+        duration = history.get(getattr(process, "id", None))
+    if duration is None:
+        duration = getattr(process, "expected_duration", None)
+    if duration is None:
+        duration = default
+    return duration
+
+
+def critical_path_lengths(elements, successors, durations):
+    """ Remaining critical-path length of the elements of a graph.
+
+    Parameters
+    ----------
+    elements: sequence
+        the graph elements (jobs, nodes...).
+    successors: dict
+        {element: elements waiting for it}.
+    durations: dict
+        {element: seconds} expected durations (0 if missing).
+
+    Returns
+    -------
+    lengths: dict
+        {element: seconds} duration of the longest chain starting with each
+        element.
+    """
+    lengths = {}
+    visiting = set()
+    for element in elements:
+        if element in lengths:
+            continue
+        # depth-first walk, without recursion limits
+        stack = [(element, iter(successors.get(element, ())))]
+        visiting.add(element)
+        while stack:
+            current, pending = stack[-1]
+            for successor in pending:
+                if successor not in lengths and successor not in visiting:
+                    visiting.add(successor)
+                    stack.append(
+                        (successor, iter(successors.get(successor, ()))))
+                    break
+            else:
+                stack.pop()
+                visiting.discard(current)
+                lengths[current] = (durations.get(current) or 0) + max(
+                    [lengths.get(successor, 0)
+                     for successor in successors.get(current, ())] or [0])
+    return lengths
+
+
+def rank_priorities(lengths, base=0):
+    """ Integer priorities ordering elements by decreasing lengths.
+
+    Parameters
+    ----------
+    lengths: dict
+        {element: length}.
+    base: int (optional)
+        priority of the shortest elements.
+
+    Returns
+    -------
+    priorities: dict
+        {element: priority}: the longer, the higher.
+    """
+    ranks = dict((length, rank) for rank, length
+                 in enumerate(sorted(set(six.itervalues(lengths)))))
+    return dict((element, base + ranks[length])
+                for element, length in six.iteritems(lengths))
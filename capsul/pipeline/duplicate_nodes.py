@@ -0,0 +1,282 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Elimination of duplicate nodes.
+
+Composite pipelines often embed the same processing several times with the
+same inputs (a sub-pipeline used by several branches for instance). Leaf
+nodes running the same process with the same effective inputs are found
+with the smart-caching hash (see
+:func:`capsul.study_config.memory.get_process_hash`): inputs produced by
+other nodes are identified by the key of their producer, so that chains of
+duplicates are found too. Only one representative of each group is run;
+the outputs of the others are aliased to its results:
+
+* temporary outputs (empty linked files) get the representative values,
+  before the execution, so that downstream nodes read the representative
+  files.
+* files outputs with a value are hard links (or copies) of the
+  representative ones, made once it has run.
+* other outputs get the representative values once it has run.
+
+Nodes whose process has a ``side_effects`` attribute set to True, view
+nodes, iterative nodes and nodes without outputs are never merged.
+"""
+
+# System import
+import hashlib
+import logging
+from collections import OrderedDict
+from collections import deque
+import six
+
+# Capsul import
+from capsul.pipeline.pipeline_nodes import Switch, PipelineNode
+from capsul.pipeline.process_iteration import ProcessIteration
+from capsul.study_config.memory import (
+    get_process_hash, get_process_inputs, is_empty_value)
+from capsul.utils.file_copy import copy_files
+from capsul.utils.trait_paths import is_path_trait, path_values
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+def _plug_sources(plug):
+    """ Get the leaf nodes outputs an input plug value comes from.
+
+    Returns
+    -------
+    sources: list of (Node, str)
+        the producing nodes and their output names.
+    """
+    sources = []
+    links = deque(plug.links_from)
+    while links:
+        node_name, param_name, node, in_plug, weak = links.popleft()
+        if not node.activated or not node.enabled:
+            continue
+        if isinstance(node, Switch):
+            switch_input = "{0}_switch_{1}".format(node.switch, param_name)
+            links.extend(node.plugs[switch_input].links_from)
+        elif isinstance(node, PipelineNode):
+            links.extend(in_plug.links_from)
+        else:
+            sources.append((node, param_name))
+    return sources
+
+
+def _mergeable(node):
+    """ Tells if a node may be replaced by an identical one.
+    """
+    process = getattr(node, "process", None)
+    if process is None or isinstance(process, ProcessIteration) \
+            or getattr(process, "side_effects", False) \
+            or getattr(node, "node_type", None) == "view_node":
+        return False
+    return any(plug.output for plug in six.itervalues(node.plugs))
+
+
+def node_keys(nodes):
+    """ Compute the keys identifying the executions of leaf nodes.
+
+    Parameters
+    ----------
+    nodes: list of Node
+        the leaf nodes, in execution order.
+
+    Returns
+    -------
+    keys: dict
+        {id(node): key}. Two nodes with the same key run the same process
+        with the same inputs. Nodes which must not be merged have a None
+        key.
+    """
+    keys = {}
+    for node in nodes:
+        if not _mergeable(node):
+            keys[id(node)] = None
+            continue
+        process = node.process
+        input_parameters = get_process_inputs(process)
+        key = True
+        for name, plug in six.iteritems(node.plugs):
+            if plug.output or not plug.activated:
+                continue
+            sources = [(keys.get(id(source)), source_name)
+                       for source, source_name in _plug_sources(plug)
+                       if id(source) in keys]
+            if not sources:
+                continue
+            if any(source_key is None for source_key, _ in sources):
+                # produced by a node which is run anyway
+                key = None
+                break
+            # produced upstream: only the producer identifies the value
+            input_parameters[name] = ["<node>"] + sorted(
+                "{0}.{1}".format(source_key, source_name)
+                for source_key, source_name in sources)
+        if key is not None:
+            process_hash = get_process_hash(
+                process, input_parameters=input_parameters)[0]
+            hasher = hashlib.new("md5")
+            hasher.update("{0}:{1}".format(process.id,
+                                           process_hash).encode())
+            key = hasher.hexdigest()
+        keys[id(node)] = key
+    return keys
+
+
+def _aliasable(representative, duplicate):
+    """ Check that the temporary outputs of a duplicate can be replaced by
+    the representative outputs.
+    """
+    for name, plug in six.iteritems(duplicate.plugs):
+        if not plug.output or not plug.links_to \
+                or not is_empty_value(duplicate.get_plug_value(name)):
+            continue
+        rep_plug = representative.plugs.get(name)
+        if rep_plug is None or (
+                not rep_plug.links_to
+                and is_empty_value(representative.get_plug_value(name))):
+            # the representative would not produce this output
+            return False
+    return True
+
+
+def duplicate_nodes(nodes):
+    """ Find the leaf nodes which run the same process with the same
+    effective inputs.
+
+    Parameters
+    ----------
+    nodes: list of Node
+        the leaf nodes, in execution order (for instance
+        :meth:`Pipeline.workflow_ordered_nodes`).
+
+    Returns
+    -------
+    duplicates: OrderedDict
+        {representative: [duplicate nodes]}, the representative being the
+        first node of its group in execution order. Nodes without
+        duplicates are not listed.
+    """
+    keys = node_keys(nodes)
+    representatives = {}
+    duplicates = OrderedDict()
+    for node in nodes:
+        key = keys[id(node)]
+        if key is None:
+            continue
+        representative = representatives.get(key)
+        if representative is None:
+            representatives[key] = node
+        elif _aliasable(representative, node):
+            duplicates.setdefault(representative, []).append(node)
+    return duplicates
+
+
+def alias_temporary_outputs(representative, duplicate,
+                            temporary_values=()):
+    """ Give the duplicate temporary outputs the representative values, so
+    that the nodes reading them use the representative files.
+
+    Values are propagated through the pipeline links.
+
+    Parameters
+    ----------
+    representative: Node
+        the node which is run.
+    duplicate: Node
+        the node which is not run.
+    temporary_values: container (optional)
+        values which are temporaries, in addition to empty values.
+
+    Returns
+    -------
+    aliased: list of (Node, str, object)
+        the changed plugs, and their previous values, to restore them.
+    """
+    aliased = []
+    for name, plug in six.iteritems(duplicate.plugs):
+        if not plug.output or not plug.links_to:
+            continue
+        value = duplicate.get_plug_value(name)
+        if not all(item is None or item in temporary_values
+                   for item in path_values(value, keep_empty=True)):
+            continue
+        rep_value = representative.get_plug_value(name)
+        if is_empty_value(rep_value):
+            continue
+        aliased.append((duplicate, name, value))
+        duplicate.set_plug_value(name, rep_value)
+    return aliased
+
+
+def restore_aliased_outputs(aliased):
+    """ Restore the plugs changed by :func:`alias_temporary_outputs`.
+    """
+    for node, name, value in reversed(aliased):
+        node.set_plug_value(name, value)
+
+
+def aliased_copies(representative, duplicate):
+    """ Get the files to copy from the representative outputs to the
+    duplicate outputs which have their own values.
+
+    Returns
+    -------
+    copies: list of (str, str)
+        (source, destination) files.
+    """
+    copies = []
+    process = duplicate.process
+    for name, trait in six.iteritems(process.user_traits()):
+        if not trait.output or not is_path_trait(trait):
+            continue
+        value = duplicate.get_plug_value(name)
+        rep_value = representative.get_plug_value(name)
+        if is_empty_value(value) or value == rep_value:
+            continue
+        for src, dest in zip(path_values(rep_value, keep_empty=True),
+                             path_values(value, keep_empty=True)):
+            if src and dest and src != dest:
+                copies.append((src, dest))
+    return copies
+
+
+def alias_outputs(representative, duplicate, strategy="hardlink"):
+    """ Give a duplicate node the results of its representative, once the
+    representative has run.
+
+    Files outputs with a value are copied (see
+    :mod:`capsul.utils.file_copy`), the other outputs get the
+    representative values.
+
+    Parameters
+    ----------
+    representative: Node
+        the node which has run.
+    duplicate: Node
+        the node which is not run.
+    strategy: str (optional, default 'hardlink')
+        the files copy strategy.
+    """
+    copy_files([(src, dest, strategy)
+                for src, dest in aliased_copies(representative, duplicate)])
+    process = duplicate.process
+    for name, trait in six.iteritems(process.user_traits()):
+        if not trait.output:
+            continue
+        value = duplicate.get_plug_value(name)
+        if is_path_trait(trait) and not is_empty_value(value):
+            # the duplicate files have been copied
+            continue
+        rep_value = representative.get_plug_value(name)
+        if value != rep_value:
+            duplicate.set_plug_value(name, rep_value)
@@ -0,0 +1,327 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Make-style incremental execution.
+
+Each time a node is executed, the fingerprints of its input and output
+files, and a signature of its other parameters, are recorded in a small
+JSON manifest. On the next execution, a node is up to date, and skipped,
+when its parameters and input files did not change, and its output files
+are still the ones it wrote. Stale nodes are executed again, as well as
+all the nodes which read their outputs.
+
+Nodes exchanging temporary files are always executed, since temporaries
+do not outlive the execution.
+
+Fingerprints are either the files modification times and sizes
+('timestamp' mode) or their contents digests ('hash' mode). Directories
+are fingerprinted by their modification time.
+"""
+
+# System import
+from __future__ import print_function
+import os
+import sys
+import json
+import hashlib
+import logging
+import optparse
+import six
+
+# Trait import
+from traits.api import Undefined
+
+# Capsul import
+from capsul.utils.fingerprint import (
+    path_fingerprint, value_fingerprint, fingerprint_modes)
+from capsul.utils.trait_paths import is_path_trait, path_values
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+def nodes_full_names(pipeline_or_process):
+    """ Get unique names for the nodes of a pipeline and its sub-pipelines.
+
+    Parameters
+    ----------
+    pipeline_or_process: Pipeline or Process
+        the executed pipeline or process.
+
+    Returns
+    -------
+    names: dict
+        {id(node): dotted_name}. A single process is named after its id.
+    """
+    from capsul.pipeline.pipeline import Pipeline
+
+    if not isinstance(pipeline_or_process, Pipeline):
+        return {id(pipeline_or_process): pipeline_or_process.id}
+    names = {}
+    todo = [("", pipeline_or_process)]
+    while todo:
+        prefix, pipeline = todo.pop()
+        for node_name, node in six.iteritems(pipeline.nodes):
+            if node_name == "":
+                continue
+            full_name = prefix + node_name
+            names[id(node)] = full_name
+            process = getattr(node, "process", None)
+            if isinstance(process, Pipeline):
+                todo.append((full_name + ".", process))
+    return names
+
+
+class NodeFiles(object):
+    """ The files and parameters of a node, as seen by the manifest.
+
+    Attributes
+    ----------
+    inputs: list of str
+        input files and directories.
+    outputs: list of str
+        output files and directories.
+    signature: str
+        digest of the other input parameters values.
+    temporary: bool
+        True if the node reads or writes pipeline temporaries.
+    """
+
+    def __init__(self, node):
+        """ Initialize the NodeFiles class.
+
+        Parameters
+        ----------
+        node: Node or Process
+            an executed node.
+        """
+        process = getattr(node, "process", node)
+        plugs = getattr(node, "plugs", {})
+        self.inputs = []
+        self.outputs = []
+        self.temporary = False
+        parameters = []
+        for name, trait in six.iteritems(process.user_traits()):
+            value = getattr(process, name, Undefined)
+            if not is_path_trait(trait):
+                if not trait.output:
+                    parameters.append((name, value_fingerprint(value)))
+                continue
+            paths = path_values(value, keep_empty=True)
+            plug = plugs.get(name)
+            if None in paths and plug is not None:
+                # empty linked file: a temporary
+                if (trait.output and plug.links_to) \
+                        or (not trait.output and plug.links_from):
+                    self.temporary = True
+            paths = [path for path in paths if path is not None]
+            if trait.output:
+                self.outputs.extend(paths)
+            else:
+                self.inputs.extend(paths)
+                parameters.append((name, paths))
+        self.signature = hashlib.sha1(
+            json.dumps(sorted(parameters), sort_keys=True).encode(
+                "utf-8")).hexdigest()
+
+
+class IncrementalManifest(object):
+    """ Record of the nodes executions, used to skip up-to-date nodes.
+
+    ::
+
+        manifest = IncrementalManifest("/data/out/capsul_manifest.json")
+        names = nodes_full_names(pipeline)
+        to_run = manifest.stale_nodes(execution_list, names)
+        for node in to_run:
+            # run the node
+            manifest.record(names[id(node)], node)
+        manifest.save()
+
+    Attributes
+    ----------
+    filename: str
+        the JSON manifest file.
+    mode: str
+        the fingerprints mode: 'timestamp' or 'hash'.
+    entries: dict
+        {node_name: {'signature': str, 'inputs': {path: fingerprint},
+        'outputs': {path: fingerprint}}}
+    """
+
+    def __init__(self, filename, mode="timestamp"):
+        """ Initialize the IncrementalManifest class.
+
+        Parameters
+        ----------
+        filename: str
+            the JSON manifest file. It is loaded if it exists.
+        mode: str (optional, default 'timestamp')
+            the fingerprints mode: 'timestamp' or 'hash'. Entries recorded
+            in another mode are stale.
+        """
+        if mode not in fingerprint_modes:
+            raise ValueError("'{0}' is not a valid fingerprint mode, expect "
+                             "one of {1}".format(mode, fingerprint_modes))
+        self.filename = filename
+        self.mode = mode
+        self.entries = {}
+        if os.path.isfile(filename):
+            with open(filename) as openfile:
+                manifest = json.load(openfile)
+            if manifest.get("mode") == mode:
+                self.entries = manifest.get("nodes", {})
+
+    def save(self):
+        """ Write the manifest file.
+        """
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as openfile:
+            json.dump({"mode": self.mode, "nodes": self.entries}, openfile,
+                      indent=1, sort_keys=True)
+        os.rename(tmp_filename, self.filename)
+
+    def _fingerprints(self, paths):
+        return dict((path, path_fingerprint(path, self.mode))
+                    for path in paths)
+
+    def is_up_to_date(self, name, node_files):
+        """ Check if a node needs to be executed again.
+
+        Parameters
+        ----------
+        name: str
+            the node name.
+        node_files: NodeFiles
+            the node files and parameters.
+
+        Returns
+        -------
+        up_to_date: bool
+        """
+        entry = self.entries.get(name)
+        if entry is None or node_files.temporary \
+                or entry["signature"] != node_files.signature \
+                or sorted(entry["inputs"]) != sorted(node_files.inputs) \
+                or sorted(entry["outputs"]) != sorted(node_files.outputs):
+            return False
+        for key in ("inputs", "outputs"):
+            for path, fingerprint in six.iteritems(entry[key]):
+                if fingerprint is None \
+                        or path_fingerprint(path, self.mode) != fingerprint:
+                    return False
+        return True
+
+    def stale_nodes(self, execution_list, names):
+        """ Select the nodes which have to be executed.
+
+        Parameters
+        ----------
+        execution_list: list of Node or Process
+            the nodes, in execution order.
+        names: dict
+            {id(node): name} (see :func:`nodes_full_names`).
+
+        Returns
+        -------
+        stale_nodes: list
+            the nodes to execute, in execution order: the stale nodes and
+            the nodes reading their outputs.
+        """
+        stale_nodes = []
+        stale_outputs = set()
+        for node in execution_list:
+            node_files = NodeFiles(node)
+            if stale_outputs.intersection(node_files.inputs) \
+                    or not self.is_up_to_date(names[id(node)], node_files):
+                stale_nodes.append(node)
+                stale_outputs.update(node_files.outputs)
+            else:
+                logger.info("'{0}' is up to date".format(names[id(node)]))
+        return stale_nodes
+
+    def record(self, name, node, temporary=False):
+        """ Record a node execution.
+
+        Nodes using temporaries are not recorded.
+
+        Parameters
+        ----------
+        name: str
+            the node name.
+        node: Node or Process
+            the executed node.
+        temporary: bool (optional, default False)
+            True if the node uses temporaries. Temporaries are allocated
+            when the pipeline is executed, so they have to be detected
+            before (see :attr:`NodeFiles.temporary`).
+        """
+        node_files = NodeFiles(node)
+        if temporary or node_files.temporary:
+            self.entries.pop(name, None)
+            return
+        self.entries[name] = {
+            "signature": node_files.signature,
+            "inputs": self._fingerprints(node_files.inputs),
+            "outputs": self._fingerprints(node_files.outputs)}
+
+    def record_command(self, recorded_nodes, python_command="python"):
+        """ Get a command line recording node executions once they are done,
+        for execution on another machine (soma-workflow).
+
+        Parameters
+        ----------
+        recorded_nodes: list of (str, NodeFiles)
+            the names of the nodes to be recorded, and their files.
+        python_command: str (optional)
+            the python interpreter command.
+
+        Returns
+        -------
+        command: list of str
+        """
+        nodes = dict((name, {"signature": node_files.signature,
+                             "inputs": node_files.inputs,
+                             "outputs": node_files.outputs})
+                     for name, node_files in recorded_nodes
+                     if not node_files.temporary)
+        return [python_command, "-m", "capsul.pipeline.incremental",
+                "--manifest", self.filename, "--mode", self.mode,
+                "--record", json.dumps(nodes)]
+
+
+def main():
+    """ Record node executions in a manifest (used by soma-workflow jobs).
+    """
+    parser = optparse.OptionParser(
+        usage="python -m capsul.pipeline.incremental --manifest FILE "
+              "--record JSON")
+    parser.add_option("--manifest", dest="manifest",
+                      help="the incremental manifest file")
+    parser.add_option("--mode", dest="mode", default="timestamp",
+                      help="fingerprints mode: timestamp or hash")
+    parser.add_option("--record", dest="record",
+                      help="JSON dict {node_name: {'signature': str, "
+                           "'inputs': [paths], 'outputs': [paths]}}")
+    options, args = parser.parse_args()
+    if not options.manifest or not options.record:
+        parser.error("--manifest and --record are mandatory")
+    manifest = IncrementalManifest(options.manifest, options.mode)
+    for name, node in six.iteritems(json.loads(options.record)):
+        manifest.entries[name] = {
+            "signature": node["signature"],
+            "inputs": manifest._fingerprints(node["inputs"]),
+            "outputs": manifest._fingerprints(node["outputs"])}
+    manifest.save()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Bundling of short jobs.
+
+Many pipeline nodes are very short processes (format converters, parameter
+pickers...): as soma-workflow jobs, they spend more time in the scheduler
+and in the interpreter startup than running. Short jobs are merged into
+bundle jobs which run them one after the other in a single interpreter::
+
+    python -m capsul.pipeline.job_bundles 3 python -c "..." arg 2 cmd arg
+
+Each bundled command is preceded by its number of items, so that
+soma-workflow still replaces the temporary, transferred and translated
+paths it contains. Python commands (``python -c`` and ``python -m``) are
+run in the bundle interpreter, other commands in a subprocess.
+
+A job is short when its expected duration is known and below the bundle
+duration limit. The duration of a process is taken from past executions,
+or declared by its ``expected_duration`` attribute, in seconds (see
+:func:`capsul.pipeline.critical_path.expected_duration`). Are bundled:
+
+* linear chains: a job whose only successor is a job which only waits for
+  it.
+* siblings: jobs of the same group waiting for the same jobs, and waited
+  for by the same jobs (iterations for instance).
+
+Bundles are filled until their expected duration reaches the limit.
+"""
+
+from __future__ import print_function
+
+# System import
+import sys
+import runpy
+import traceback
+import subprocess
+import optparse
+import six
+
+# Commands run in the bundle interpreter
+_PYTHON_COMMANDS = ("python", "python{0}".format(sys.version_info[0]),
+                    sys.executable)
+
+
+def _bundleable(job):
+    """ Tells if a job can be run in a bundle.
+    """
+    if not job.command:
+        # barrier job
+        return False
+    for attribute in ("stdin", "stdout_file", "stderr_file",
+                      "parallel_job_info", "native_specification"):
+        if getattr(job, attribute, None):
+            return False
+    return True
+
+
+def _signature(job):
+    """ Execution settings which have to be the same for bundled jobs.
+    """
+    return (getattr(job, "user_storage", None),
+            getattr(job, "working_directory", None))
+
+
+def _containers(elements, containers=None):
+    """ Map the jobs and groups to the elements list they belong to.
+    """
+    if containers is None:
+        containers = {}
+    for element in elements:
+        containers[element] = elements
+        if hasattr(element, "elements"):
+            _containers(element.elements, containers)
+    return containers
+
+
+def bundle_job(jobs):
+    """ Build a job running several jobs one after the other.
+
+    Parameters
+    ----------
+    jobs: list of Job
+        the jobs, in execution order.
+
+    Returns
+    -------
+    bundle: Job
+        a job of the same class as the first one, with the highest priority
+        of the jobs.
+    """
+    command = ["python", "-m", "capsul.pipeline.job_bundles"]
+    inputs = []
+    outputs = []
+    for job in jobs:
+        command += [str(len(job.command))] + list(job.command)
+        for path in job.referenced_input_files or []:
+            # files produced by a previous job of the bundle are internal
+            if not any(path is output for output in outputs) \
+                    and not any(path is item for item in inputs):
+                inputs.append(path)
+        outputs.extend(job.referenced_output_files or [])
+    first = jobs[0]
+    bundle = first.__class__(
+        name=", ".join(job.name for job in jobs),
+        command=command,
+        referenced_input_files=inputs,
+        referenced_output_files=outputs,
+        priority=max(getattr(job, "priority", 0) for job in jobs))
+    user_storage = getattr(first, "user_storage", None)
+    if user_storage:
+        bundle.user_storage = user_storage
+    working_directory = getattr(first, "working_directory", None)
+    if working_directory:
+        bundle.working_directory = working_directory
+    return bundle
+
+
+def bundle_jobs(jobs, dependencies, root_group, durations, max_duration):
+    """ Merge short jobs into bundle jobs.
+
+    Parameters
+    ----------
+    jobs: dict
+        {key: job} the workflow jobs.
+    dependencies: set
+        the workflow (job or group) dependencies. It is updated.
+    root_group: list
+        the workflow root group elements. It is updated, as well as the
+        groups it contains.
+    durations: dict
+        {job: seconds} the expected durations of the jobs.
+    max_duration: float
+        jobs expected to last more than this are not bundled, and bundles
+        are filled up to this duration.
+
+    Returns
+    -------
+    jobs: dict
+        {key: job} the workflow jobs: a bundle has the key of its first
+        job, the other bundled jobs are removed.
+    """
+    short_jobs = [job for job in six.itervalues(jobs)
+                  if durations.get(job) is not None
+                  and durations[job] <= max_duration and _bundleable(job)]
+    if len(short_jobs) < 2:
+        return jobs
+    short_ids = set(id(job) for job in short_jobs)
+    containers = _containers(root_group)
+    predecessors = {}
+    successors = {}
+    for source, dest in dependencies:
+        successors.setdefault(source, set()).add(dest)
+        predecessors.setdefault(dest, set()).add(source)
+
+    def mergeable(job, other):
+        return id(other) in short_ids \
+            and containers.get(other) is containers.get(job) \
+            and _signature(other) == _signature(job)
+
+    # linear chains
+    units = []
+    in_units = set()
+    for job in short_jobs:
+        if id(job) in in_units:
+            continue
+        unit = [job]
+        duration = durations[job]
+        in_units.add(id(job))
+        while True:
+            next_jobs = successors.get(unit[-1], ())
+            if len(next_jobs) != 1:
+                break
+            next_job = list(next_jobs)[0]
+            if id(next_job) in in_units \
+                    or not mergeable(job, next_job) \
+                    or predecessors.get(next_job) != set([unit[-1]]) \
+                    or duration + durations[next_job] > max_duration:
+                break
+            unit.append(next_job)
+            duration += durations[next_job]
+            in_units.add(id(next_job))
+        units.append((unit, duration))
+
+    # siblings
+    bundles = []
+    open_bundles = {}
+    for unit, duration in units:
+        key = (id(containers.get(unit[0])), _signature(unit[0]),
+               frozenset(predecessors.get(unit[0], ())),
+               frozenset(successors.get(unit[-1], ())))
+        bundle = open_bundles.get(key)
+        if bundle is None or bundle[1] + duration > max_duration:
+            bundle = [list(unit), duration]
+            open_bundles[key] = bundle
+            bundles.append(bundle)
+        else:
+            bundle[0].extend(unit)
+            bundle[1] += duration
+
+    # replace the bundled jobs
+    replacement = {}
+    for bundled, duration in bundles:
+        if len(bundled) < 2:
+            continue
+        bundle = bundle_job(bundled)
+        elements = containers.get(bundled[0])
+        if elements is not None:
+            elements[elements.index(bundled[0])] = bundle
+            for job in bundled[1:]:
+                elements.remove(job)
+        for job in bundled:
+            replacement[job] = bundle
+    if not replacement:
+        return jobs
+    new_dependencies = set()
+    for source, dest in dependencies:
+        source = replacement.get(source, source)
+        dest = replacement.get(dest, dest)
+        if source is not dest:
+            new_dependencies.add((source, dest))
+    dependencies.clear()
+    dependencies.update(new_dependencies)
+    new_jobs = {}
+    added = set()
+    for key, job in six.iteritems(jobs):
+        job = replacement.get(job, job)
+        if id(job) not in added:
+            added.add(id(job))
+            new_jobs[key] = job
+    return new_jobs
+
+
+def run_command(command):
+    """ Run a bundled command.
+
+    Python commands are run in the current interpreter.
+
+    Returns
+    -------
+    returncode: int
+    """
+    if len(command) >= 3 and command[0] in _PYTHON_COMMANDS \
+            and command[1] in ("-c", "-m"):
+        saved_argv = sys.argv
+        try:
+            if command[1] == "-c":
+                sys.argv = ["-c"] + list(command[3:])
+                code = compile(command[2], "<string>", "exec")
+                exec(code, {"__name__": "__main__"})
+            else:
+                sys.argv = [command[2]] + list(command[3:])
+                runpy.run_module(command[2], run_name="__main__",
+                                 alter_sys=True)
+        except SystemExit as e:
+            if e.code is None:
+                return 0
+            if isinstance(e.code, int):
+                return e.code
+            print(e.code, file=sys.stderr)
+            return 1
+        except Exception:
+            traceback.print_exc()
+            return 1
+        finally:
+            sys.argv = saved_argv
+        return 0
+    return subprocess.call(command)
+
+
+def main():
+    """ Run bundled commands (used by soma-workflow bundle jobs).
+    """
+    parser = optparse.OptionParser(
+        usage="python -m capsul.pipeline.job_bundles "
+              "N1 COMMAND1... [N2 COMMAND2...]")
+    parser.disable_interspersed_args()
+    options, args = parser.parse_args()
+    commands = []
+    index = 0
+    try:
+        while index < len(args):
+            size = int(args[index])
+            commands.append(args[index + 1:index + 1 + size])
+            index += size + 1
+    except ValueError:
+        parser.error("expect commands preceded by their number of items")
+    if index != len(args):
+        parser.error("truncated command")
+    for command in commands:
+        returncode = run_command(command)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if returncode:
+            return returncode
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
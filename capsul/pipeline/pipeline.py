@@ -13,8 +13,8 @@ from __future__ import absolute_import
 import logging
 from copy import deepcopy
 import tempfile
+import hashlib
 import os
-import shutil
 import six
 from soma.utils.weak_proxy import weak_proxy, get_ref
 
@@ -39,6 +39,7 @@ from .pipeline_nodes import Plug
 from .pipeline_nodes import ProcessNode
 from .pipeline_nodes import PipelineNode
 from .pipeline_nodes import Switch
+from .temporary_files import release_temporary_file
 
 # Soma import
 from soma.controller import Controller
@@ -1274,7 +1275,10 @@ class Pipeline(Process):
 
         return workflow_list
 
-    def _check_temporary_files_for_node(self, node, temp_files):
+    def _check_temporary_files_for_node(self, node, temp_files,
+                                        temp_directory=None,
+                                        scratch_directory=None,
+                                        allow_fifos=False):
         """ Check temporary outputs and allocate files for them.
 
         Temporary files or directories will be appended to the temp_files list,
@@ -1292,6 +1296,22 @@ class Pipeline(Process):
         temp_files: list
             list of temporary files for the pipeline execution. The list will
             be modified (completed).
+        temp_directory: str (optional)
+            if specified, temporary files get stable names in this directory
+            (see :meth:`_stable_temporary_name`) instead of random names
+            generated by the tempfile module. Nodes have to be checked in
+            execution order for the names of downstream temporaries to be
+            stable also.
+        scratch_directory: str (optional)
+            directory where randomly named temporary files are created
+            (default: the tempfile module default directory).
+        allow_fifos: bool (optional, default False)
+            if True, temporary files linking a "streamable" output to a
+            single "streamable" input (File traits with the streamable
+            metadata) are named pipes (FIFOs) instead of regular files
+            (see :meth:`_is_streamable_link`). Producer and consumer nodes
+            then have to run concurrently. FIFOs are not used for stable
+            temporary names.
         """
         process = getattr(node, 'process', None)
         if process is not None and isinstance(process, NipypeProcess):
@@ -1299,6 +1319,9 @@ class Pipeline(Process):
             # file names
             return
 
+        if temp_directory is not None and not os.path.isdir(temp_directory):
+            os.makedirs(temp_directory)
+        process_hash = None
         for plug_name, plug in six.iteritems(node.plugs):
             value = node.get_plug_value(plug_name)
             if not plug.activated or not plug.enabled \
@@ -1325,16 +1348,34 @@ class Pipeline(Process):
             if isinstance(trait.trait_type, traits.List):
                 trait = trait.trait_type.inner_traits()[0]
                 is_list = True
+            if temp_directory is not None and process_hash is None:
+                process_hash = self._stable_temporary_key(node)
             if trait.trait_type is traits.Directory:
                 if is_list:
                     tmp_files = []
-                    for v in value:
-                        tmpdir = tempfile.mkdtemp(suffix='capsul_run')
+                    for i, v in enumerate(value):
+                        if temp_directory is not None:
+                            tmpdir = self._stable_temporary_name(
+                                temp_directory, process_hash, plug_name,
+                                'capsul_run', i)
+                            if not os.path.isdir(tmpdir):
+                                os.makedirs(tmpdir)
+                        else:
+                            tmpdir = tempfile.mkdtemp(suffix='capsul_run',
+                                                      dir=scratch_directory)
                         temp_files.append((node, plug_name, tmpdir, v))
                         tmp_files.append(tmpdir)
                     node.set_plug_value(plug_name, tmp_files)
                 else:
-                    tmpdir = tempfile.mkdtemp(suffix='capsul_run')
+                    if temp_directory is not None:
+                        tmpdir = self._stable_temporary_name(
+                            temp_directory, process_hash, plug_name,
+                            'capsul_run')
+                        if not os.path.isdir(tmpdir):
+                            os.makedirs(tmpdir)
+                    else:
+                        tmpdir = tempfile.mkdtemp(suffix='capsul_run',
+                                                  dir=scratch_directory)
                     temp_files.append((node, plug_name, tmpdir, value))
                     node.set_plug_value(plug_name, tmpdir)
             else:
@@ -1344,17 +1385,134 @@ class Pipeline(Process):
                     suffix = 'capsul'
                 if is_list:
                     tmp_files = []
-                    for v in value:
-                        tmpfile = tempfile.mkstemp(suffix=suffix)
-                        tmp_files.append(tmpfile[1])
-                        os.close(tmpfile[0])
+                    for i, v in enumerate(value):
+                        if temp_directory is not None:
+                            tmp_files.append(self._stable_temporary_name(
+                                temp_directory, process_hash, plug_name,
+                                suffix, i))
+                        else:
+                            tmpfile = tempfile.mkstemp(suffix=suffix,
+                                                       dir=scratch_directory)
+                            tmp_files.append(tmpfile[1])
+                            os.close(tmpfile[0])
                     temp_files.append((node, plug_name, tmp_files, value))
                     node.set_plug_value(plug_name, tmp_files)
                 else:
-                    tmpfile = tempfile.mkstemp(suffix=suffix)
-                    node.set_plug_value(plug_name, tmpfile[1])
-                    os.close(tmpfile[0])
-                    temp_files.append((node, plug_name, tmpfile[1], value))
+                    if temp_directory is not None:
+                        tmpfile = self._stable_temporary_name(
+                            temp_directory, process_hash, plug_name, suffix)
+                    else:
+                        tmpfd, tmpfile = tempfile.mkstemp(
+                            suffix=suffix, dir=scratch_directory)
+                        os.close(tmpfd)
+                        if allow_fifos and self._is_streamable_link(
+                                node, plug_name, plug):
+                            # replace the file with a named pipe
+                            os.unlink(tmpfile)
+                            os.mkfifo(tmpfile)
+                    node.set_plug_value(plug_name, tmpfile)
+                    temp_files.append((node, plug_name, tmpfile, value))
+
+    @staticmethod
+    def _is_streamable_link(node, plug_name, plug):
+        """ Check if a temporary output can be streamed through a named pipe
+        to the node reading it.
+
+        Both the output and the input have to be File traits with the
+        streamable metadata, the output must have a single consumer, which
+        is a process node, and named pipes must be supported by the system.
+
+        Parameters
+        ----------
+        node: Node
+            the node producing the temporary
+        plug_name: str
+            the temporary output plug name
+        plug: Plug
+            the temporary output plug
+
+        Returns
+        -------
+        streamable: bool
+        """
+        if not hasattr(os, 'mkfifo') or len(plug.links_to) != 1:
+            return False
+        trait = node.get_trait(plug_name)
+        if not trait.streamable \
+                or not isinstance(trait.trait_type, traits.File):
+            return False
+        dest_node_name, dest_plug_name, dest_node, dest_plug, weak_link \
+            = list(plug.links_to)[0]
+        if not isinstance(dest_node, ProcessNode) \
+                or isinstance(dest_node, PipelineNode):
+            return False
+        dest_trait = dest_node.get_trait(dest_plug_name)
+        return bool(dest_trait.streamable) \
+            and isinstance(dest_trait.trait_type, traits.File)
+
+    def _stable_temporary_key(self, node):
+        """ Get the key used to name the temporary outputs of a node in
+        :meth:`_check_temporary_files_for_node`.
+
+        The key is the smart-caching hash of the node process (see
+        :func:`capsul.study_config.memory.get_process_hash`), so that it only
+        changes when the node inputs change. Temporary inputs of the node have
+        already been assigned stable names when nodes are checked in
+        execution order.
+
+        Parameters
+        ----------
+        node: Node
+            the node producing temporary outputs
+
+        Returns
+        -------
+        key: str
+            the temporary files naming key.
+        """
+        # Import here to avoid making the pipeline module depend on the
+        # study_config package
+        from capsul.study_config.memory import get_process_hash
+
+        process = getattr(node, 'process', node)
+        process_hash = get_process_hash(process)[0]
+        hasher = hashlib.new('md5')
+        hasher.update(('%s:%s' % (process.id, process_hash)).encode())
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _stable_temporary_name(temp_directory, key, plug_name, suffix,
+                               index=None):
+        """ Build a stable temporary file name.
+
+        Contrarily to names generated by the tempfile module, the same name is
+        obtained from one run to another as long as the producing node inputs
+        do not change. Downstream nodes thus get the same input file names,
+        which allows smart-caching to find their results.
+
+        Parameters
+        ----------
+        temp_directory: str
+            directory where the temporary file will be created
+        key: str
+            producing node key (see :meth:`_stable_temporary_key`)
+        plug_name: str
+            name of the producing node output parameter
+        suffix: str
+            file name suffix (extension)
+        index: int (optional)
+            item index for lists of temporary files
+
+        Returns
+        -------
+        path: str
+            the temporary file name.
+        """
+        if index is None:
+            fname = '%s_%s%s' % (key, plug_name, suffix)
+        else:
+            fname = '%s_%s_%d%s' % (key, plug_name, index, suffix)
+        return os.path.join(temp_directory, fname)
 
     def _free_temporary_files(self, temp_files):
         """ Delete and reset temp files after the pipeline execution.
@@ -1368,23 +1526,8 @@ class Pipeline(Process):
             if not isinstance(value, list):
                 tmpfiles = [tmpfiles]
             for tmpfile in tmpfiles:
-                if os.path.isdir(tmpfile):
-                    try:
-                        shutil.rmtree(tmpfile)
-                    except:
-                        pass
-                else:
-                    try:
-                        os.unlink(tmpfile)
-                    except:
-                        pass
-                # handle additional files (.hdr, .minf...)
-                # TODO
-                if os.path.exists(tmpfile + '.minf'):
-                    try:
-                        os.unlink(tmpfile + '.minf')
-                    except:
-                        pass
+                # additional files (.hdr, .minf...) are also deleted
+                release_temporary_file(tmpfile)
 
     def _run_process(self):
         '''
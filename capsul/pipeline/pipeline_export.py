@@ -0,0 +1,380 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Export of pipelines as Makefiles or shell scripts.
+
+The command lines of the pipeline nodes (see
+:meth:`~capsul.process.process.Process.get_commandline`) are written in
+execution order with their dependencies, so that a pipeline runs on
+machines where neither soma-workflow nor a capsul scheduler is available,
+and without the cost of building a workflow::
+
+    save_makefile(pipeline, "/data/out/pipeline.mk")
+    # then: make -j 8 -f /data/out/pipeline.mk
+
+    save_shell_script(pipeline, "/data/out/pipeline.sh")
+    # then: sh /data/out/pipeline.sh
+
+Each command still imports the module of its process. In a Makefile, the
+targets of a command are its output files, and its prerequisites are its
+input files and the targets of the commands it waits for: ``make`` only runs
+the commands whose outputs are older than their inputs. Commands without
+output files (directory outputs, or iteration outputs computed at runtime)
+touch a stamp file instead. Temporary files are intermediate targets,
+deleted by ``make`` once read. A shell script runs the commands by waves of
+independent commands, in background processes, and deletes the temporary
+files at the end.
+
+Both files run the commands with the ``python`` command, which may be
+changed by the ``PYTHON`` variable (``make PYTHON=python3``, or
+``PYTHON=python3 sh pipeline.sh``).
+"""
+
+# System import
+import os
+import re
+import logging
+import six
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+# Trait import
+from traits import api as traits
+
+# Capsul import
+from capsul.pipeline.pipeline import Pipeline
+from capsul.pipeline.process_iteration import ProcessIteration
+from capsul.pipeline.pipeline_tools import where_is_plug_value_from
+from capsul.pipeline.pipeline_tools import get_output_directories
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+class _Command(object):
+    """ A command line of an exported pipeline.
+    """
+
+    def __init__(self, index, node, name, commandline, inputs, outputs):
+        self.index = index
+        self.node = node
+        self.name = name
+        self.commandline = commandline
+        self.inputs = inputs
+        self.outputs = outputs
+        self.upstream = []
+        self.targets = []
+        self.stamp = None
+
+
+def _file_values(process, output):
+    """ Get the File values of the inputs or outputs of a process.
+    """
+    paths = []
+    for name, trait in six.iteritems(process.user_traits()):
+        if bool(trait.output) != output:
+            continue
+        value = getattr(process, name)
+        if isinstance(trait.trait_type, traits.File):
+            values = [value]
+        elif isinstance(trait.trait_type, traits.List) \
+                and isinstance(trait.inner_traits[0].trait_type,
+                               traits.File):
+            values = value or []
+        else:
+            continue
+        for path in values:
+            if isinstance(path, six.string_types) and path \
+                    and path not in paths:
+                paths.append(path)
+    return paths
+
+
+def _export_commands(process_or_pipeline, temp_directory):
+    """ Get the command lines of a pipeline (or a single process), with their
+    dependencies.
+
+    Parameters
+    ----------
+    process_or_pipeline: Process or Pipeline
+        the process or pipeline to export.
+    temp_directory: str
+        directory of the temporary files.
+
+    Returns
+    -------
+    commands: list of _Command
+        the commands, in execution order.
+    temporaries: list of str
+        the temporary files and directories.
+    directories: list of str
+        the output directories, to be created first.
+    """
+    if isinstance(process_or_pipeline, Pipeline):
+        nodes = process_or_pipeline.workflow_ordered_nodes()
+    else:
+        nodes = [process_or_pipeline]
+    temp_files = []
+    commands = []
+    try:
+        if isinstance(process_or_pipeline, Pipeline):
+            for node in nodes:
+                process_or_pipeline._check_temporary_files_for_node(
+                    node, temp_files, temp_directory)
+        node_commands = {}
+        for node in nodes:
+            process = getattr(node, "process", node)
+            name = getattr(node, "name", None) or process.name
+            node_commands[id(node)] = []
+
+            def add_command(command_name, command_process):
+                # the command is built at once: an iteration process holds
+                # the values of the current iteration only
+                command = _Command(
+                    len(commands), node, command_name,
+                    [six.text_type(item)
+                     for item in command_process.get_commandline()],
+                    _file_values(command_process, False),
+                    _file_values(command_process, True))
+                commands.append(command)
+                node_commands[id(node)].append(command)
+
+            if isinstance(process, ProcessIteration):
+                size, no_output_value = process.iteration_size()
+                for parameter in process.regular_parameters:
+                    setattr(process.process, parameter,
+                            getattr(process, parameter))
+                for iteration in range(size or 0):
+                    process._set_iteration(iteration, no_output_value)
+                    add_command("{0}_{1}".format(name, iteration),
+                                process.process)
+            else:
+                add_command(name, process)
+            for plug_name, plug in six.iteritems(getattr(node, "plugs", {})):
+                if plug.output:
+                    continue
+                source, source_plug, parent = where_is_plug_value_from(plug)
+                if source is None or source is node \
+                        or id(source) not in node_commands:
+                    continue
+                for command in node_commands[id(node)]:
+                    for upstream in node_commands[id(source)]:
+                        if upstream not in command.upstream:
+                            command.upstream.append(upstream)
+        # the output directories, temporary ones included
+        directories = sorted(get_output_directories(process_or_pipeline)[1])
+    finally:
+        # reset the temporary values, without deleting the files: they are
+        # written by the exported commands
+        for node, plug_name, tmpfiles, value in temp_files:
+            node.set_plug_value(plug_name, value)
+    temporaries = []
+    for node, plug_name, tmpfiles, value in temp_files:
+        if not isinstance(tmpfiles, list):
+            tmpfiles = [tmpfiles]
+        temporaries.extend(tmpfiles)
+    return commands, temporaries, directories
+
+
+def _assign_targets(commands, temp_directory):
+    """ Set the targets of commands: their output files which are not
+    already the target of another command, else a stamp file.
+    """
+    owners = {}
+    for command in commands:
+        for path in command.outputs:
+            if path not in owners:
+                owners[path] = command
+                command.targets.append(path)
+        if not command.targets:
+            command.stamp = os.path.join(
+                temp_directory, "stamps", "{0:04d}_{1}".format(
+                    command.index, re.sub(r"[^\w.-]", "_", command.name)))
+            command.targets.append(command.stamp)
+    return owners
+
+
+def _make_path(path):
+    """ Escape a path in a Makefile target or prerequisites list.
+    """
+    return path.replace("$", "$$").replace("#", r"\#").replace(" ", r"\ ")
+
+
+def _quoted_commandline(commandline, python, make=False):
+    """ Quote a command line for a shell, the python command being replaced
+    by the given expression. In a Makefile, the $ signs are escaped.
+    """
+    items = [quote(item) for item in commandline]
+    if make:
+        items = [item.replace("$", "$$") for item in items]
+    if commandline and commandline[0] == "python":
+        items[0] = python
+    return " ".join(items)
+
+
+def save_makefile(process_or_pipeline, filename, temp_directory=None):
+    """ Export a pipeline (or a single process) as a Makefile.
+
+    The commands are run with ``make -f filename``, in parallel with the
+    ``-j`` option. The ``all`` target runs the whole pipeline; the
+    ``clean-temporaries`` target deletes the temporary directory.
+
+    Parameters
+    ----------
+    process_or_pipeline: Process or Pipeline
+        the process or pipeline to export.
+    filename: str
+        the Makefile to write.
+    temp_directory: str (optional)
+        directory of the temporary files and stamp files. Temporary files
+        are given stable names (see
+        :meth:`~capsul.pipeline.pipeline.Pipeline._stable_temporary_key`),
+        so that ``make`` recognizes them from a run to another. Default:
+        the Makefile name with a ``.tmp`` extension.
+    """
+    filename = os.path.abspath(filename)
+    if temp_directory is None:
+        temp_directory = os.path.splitext(filename)[0] + ".tmp"
+    temp_directory = os.path.abspath(temp_directory)
+    commands, temporaries, directories = _export_commands(
+        process_or_pipeline, temp_directory)
+    owners = _assign_targets(commands, temp_directory)
+    directories_stamp = os.path.join(temp_directory, "stamps", "directories")
+    directories = list(directories) + [os.path.dirname(directories_stamp)]
+
+    intermediates = [path for path in temporaries if path in owners]
+    # temporary files are not goals: they are only remade for the commands
+    # reading them
+    goals = [command.targets[0] for command in commands
+             if command.targets[0] not in intermediates]
+
+    lines = [
+        "# Generated by capsul from {0}".format(process_or_pipeline.id),
+        "",
+        "PYTHON = python",
+        "",
+        ".PHONY: all clean-temporaries",
+        "",
+        "all: {0}".format(" ".join(_make_path(path) for path in goals)),
+        "",
+        "{0}:".format(_make_path(directories_stamp)),
+        "\tmkdir -p {0}".format(
+            " ".join(quote(path) for path in directories)
+            ).replace("$", "$$"),
+        "\ttouch {0}".format(quote(directories_stamp)).replace("$", "$$"),
+        "",
+    ]
+    for command in commands:
+        prerequisites = []
+        for path in command.inputs:
+            if path in owners or os.path.isfile(path):
+                prerequisites.append(path)
+            else:
+                logger.debug("{0}: {1} is not a known file, it is not a "
+                             "prerequisite".format(command.name, path))
+        for upstream in command.upstream:
+            if upstream.targets[0] not in prerequisites:
+                prerequisites.append(upstream.targets[0])
+        primary = command.targets[0]
+        lines.append("# {0}".format(command.name))
+        lines.append("{0}: {1} | {2}".format(
+            _make_path(primary),
+            " ".join(_make_path(path) for path in prerequisites),
+            _make_path(directories_stamp)))
+        lines.append("\t{0}".format(_quoted_commandline(
+            command.commandline, "$(PYTHON)", make=True)))
+        if command.stamp is not None:
+            lines.append("\ttouch {0}".format(
+                quote(command.stamp)).replace("$", "$$"))
+        for path in command.targets[1:]:
+            # other outputs are written by the command of the first one
+            lines.append("{0}: {1} ;".format(_make_path(path),
+                                             _make_path(primary)))
+        lines.append("")
+    if intermediates:
+        lines.append(".INTERMEDIATE: {0}".format(
+            " ".join(_make_path(path) for path in intermediates)))
+        lines.append("")
+    lines.extend([
+        "clean-temporaries:",
+        "\trm -rf {0}".format(quote(temp_directory)).replace("$", "$$"),
+        "",
+    ])
+    with open(filename, "w") as openfile:
+        openfile.write("\n".join(lines))
+
+
+def save_shell_script(process_or_pipeline, filename, temp_directory=None):
+    """ Export a pipeline (or a single process) as a POSIX shell script.
+
+    The commands are run by waves: each wave runs, in parallel, the commands
+    whose upstream commands are in the previous waves. The script stops at
+    the first wave with a failed command. Temporary files are deleted when
+    the script exits.
+
+    Parameters
+    ----------
+    process_or_pipeline: Process or Pipeline
+        the process or pipeline to export.
+    filename: str
+        the script to write.
+    temp_directory: str (optional)
+        directory of the temporary files. Default: the script name with a
+        ``.tmp`` extension.
+    """
+    filename = os.path.abspath(filename)
+    if temp_directory is None:
+        temp_directory = os.path.splitext(filename)[0] + ".tmp"
+    temp_directory = os.path.abspath(temp_directory)
+    commands, temporaries, directories = _export_commands(
+        process_or_pipeline, temp_directory)
+
+    waves = {}
+    for command in commands:
+        waves[command.index] = 1 + max(
+            [waves[upstream.index] for upstream in command.upstream] or [-1])
+    lines = [
+        "#!/bin/sh",
+        "# Generated by capsul from {0}".format(process_or_pipeline.id),
+        "",
+        "set -e",
+        "PYTHON=\"${PYTHON:-python}\"",
+        "",
+        "wait_all() {",
+        "    status=0",
+        "    for pid in \"$@\"; do",
+        "        wait \"$pid\" || status=1",
+        "    done",
+        "    return $status",
+        "}",
+        "",
+    ]
+    if temporaries:
+        lines.append("trap {0} EXIT".format(quote("rm -rf {0}".format(
+            " ".join(quote(path) for path in temporaries)))))
+    if directories:
+        lines.append("mkdir -p {0}".format(
+            " ".join(quote(path) for path in directories)))
+    lines.append("")
+    for wave in range(max(six.itervalues(waves)) + 1 if waves else 0):
+        lines.append("# wave {0}".format(wave + 1))
+        lines.append("pids=")
+        for command in commands:
+            if waves[command.index] != wave:
+                continue
+            lines.append("# {0}".format(command.name))
+            lines.append("{0} &".format(_quoted_commandline(
+                command.commandline, "\"$PYTHON\"")))
+            lines.append("pids=\"$pids $!\"")
+        lines.append("wait_all $pids")
+        lines.append("")
+    with open(filename, "w") as openfile:
+        openfile.write("\n".join(lines))
+    os.chmod(filename, 0o755)
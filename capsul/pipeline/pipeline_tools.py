@@ -15,6 +15,7 @@ import tempfile
 import subprocess
 import six
 import sys
+from collections import deque
 
 # Define the logger
 logger = logging.getLogger(__name__)
@@ -29,7 +30,9 @@ except ImportError:
 from capsul.pipeline.pipeline import Pipeline, PipelineNode, Switch, \
     ProcessNode
 from capsul.pipeline.process_iteration import ProcessIteration
+from capsul.utils.stat_cache import StatCache
 from soma.controller import Controller
+from soma.controller.trait_utils import is_trait_pathname
 
 if sys.version_info[0] >= 3:
     basestring = str
@@ -490,7 +493,32 @@ def save_dot_image(pipeline, filename, nodes_sizes={}, use_nodes_pos=False,
     os.unlink(dot_filename)
 
 
-def disable_runtime_steps_with_existing_outputs(pipeline):
+def _prefetch_plug_values(pipeline, stat_cache, recursive=True):
+    '''
+    List at once the directories of all the string values of the pipeline
+    nodes plugs, so that their existence can be checked without one system
+    call per file (see :class:`capsul.utils.stat_cache.StatCache`).
+    '''
+    paths = []
+    nodes = deque(node for node_name, node in six.iteritems(pipeline.nodes)
+                  if node_name != '')
+    while nodes:
+        node = nodes.popleft()
+        process = getattr(node, 'process', None)
+        if process is None:
+            continue
+        if recursive and isinstance(process, Pipeline):
+            nodes.extend(new_node
+                         for new_name, new_node in six.iteritems(process.nodes)
+                         if new_name != '')
+        for plug_name in node.plugs:
+            value = getattr(process, plug_name, None)
+            if isinstance(value, basestring):
+                paths.append(value)
+    stat_cache.prefetch(paths)
+
+
+def disable_runtime_steps_with_existing_outputs(pipeline, stat_cache=None):
     '''
     Disable steps in a pipeline which outputs contain existing files. This
     disabling is the "runtime steps disabling" one (see
@@ -503,7 +531,14 @@ def disable_runtime_steps_with_existing_outputs(pipeline):
     ----------
     pipeline: Pipeline (mandatory)
         pipeline to disbale nodes in.
+    stat_cache: StatCache (optional)
+        files existence cache (see :mod:`capsul.utils.stat_cache`).
+        Default: a new cache, so that the files written since a previous
+        call are seen.
     '''
+    if stat_cache is None:
+        stat_cache = StatCache()
+    _prefetch_plug_values(pipeline, stat_cache, recursive=False)
     steps = getattr(pipeline, 'pipeline_steps', Controller())
     for step, trait in six.iteritems(steps.user_traits()):
         if not getattr(steps, step):
@@ -519,7 +554,7 @@ def disable_runtime_steps_with_existing_outputs(pipeline):
                         or isinstance(trait.trait_type, traits.Directory)):
                     value = getattr(process, param)
                     if value is not None and value is not traits.Undefined \
-                            and os.path.exists(value):
+                            and stat_cache.exists(value):
                         # disable step
                         print('disable step', step, 'because of:', node_name,
                               '.', param)
@@ -528,7 +563,8 @@ def disable_runtime_steps_with_existing_outputs(pipeline):
 
 
 def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
-                                recursive=False, exclude_inputs=True):
+                                recursive=False, exclude_inputs=True,
+                                stat_cache=None):
     '''
     Checks nodes in a pipeline which outputs contain existing files on the
     filesystem. Such nodes, maybe, should not run again. Only nodes which
@@ -556,6 +592,10 @@ def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
         inputs will not be listed in the existing outputs, so that they will
         not be erased by a cleaning operation, and will not prevent execution
         of these nodes.
+    stat_cache: StatCache (optional)
+        files existence cache (see :mod:`capsul.utils.stat_cache`).
+        Default: a new cache, so that the files written since a previous
+        call are seen.
 
     Returns
     -------
@@ -564,6 +604,9 @@ def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
         values: list of pairs (param_name, file_name)
     '''
     selected_nodes = {}
+    if stat_cache is None:
+        stat_cache = StatCache()
+    _prefetch_plug_values(pipeline, stat_cache, recursive)
     if exclude_inactive:
         steps = getattr(pipeline, 'pipeline_steps', Controller())
         disabled_nodes = set()
@@ -571,9 +614,9 @@ def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
             if not getattr(steps, step):
                 disabled_nodes.update(trait.nodes)
 
-    nodes = pipeline.nodes.items()
+    nodes = deque(pipeline.nodes.items())
     while nodes:
-        node_name, node = nodes.pop(0)
+        node_name, node = nodes.popleft()
         if node_name == '' or not hasattr(node, 'process'):
             # main pipeline node, switch...
             continue
@@ -582,9 +625,10 @@ def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
             continue
         process = node.process
         if recursive and isinstance(process, Pipeline):
-            nodes += [('%s.%s' % (node_name, new_name), new_node)
-                      for new_name, new_node in six.iteritems(process.nodes)
-                      if new_name != '']
+            nodes.extend([('%s.%s' % (node_name, new_name), new_node)
+                          for new_name, new_node
+                          in six.iteritems(process.nodes)
+                          if new_name != ''])
             continue
         plug_list = []
         input_files_list = set()
@@ -595,7 +639,7 @@ def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
                     or isinstance(trait.trait_type, traits.Any):
                 value = getattr(process, plug_name)
                 if isinstance(value, basestring) \
-                        and os.path.exists(value) \
+                        and stat_cache.exists(value) \
                         and value not in input_files_list:
                     if plug.output:
                         plug_list.append((plug_name, value))
@@ -610,7 +654,7 @@ def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
     return selected_nodes
 
 
-def nodes_with_missing_inputs(pipeline, recursive=True):
+def nodes_with_missing_inputs(pipeline, recursive=True, stat_cache=None):
     '''
     Checks nodes in a pipeline which inputs contain invalid inputs.
     Inputs which are files non-existing on the filesystem (so, which cannot
@@ -627,6 +671,10 @@ def nodes_with_missing_inputs(pipeline, recursive=True):
         that if not set, a pipeline is regarded as a process, but pipelines may
         not use all their inputs/outputs so the result might be inaccurate.
         Default: True
+    stat_cache: StatCache (optional)
+        files existence cache (see :mod:`capsul.utils.stat_cache`).
+        Default: a new cache, so that the files written since a previous
+        call are seen.
 
     Returns
     -------
@@ -635,6 +683,9 @@ def nodes_with_missing_inputs(pipeline, recursive=True):
         values: list of pairs (param_name, file_name)
     '''
     selected_nodes = {}
+    if stat_cache is None:
+        stat_cache = StatCache()
+    _prefetch_plug_values(pipeline, stat_cache, recursive)
     steps = getattr(pipeline, 'pipeline_steps', Controller())
     disabled_nodes = set()
     for step, trait in six.iteritems(steps.user_traits()):
@@ -642,9 +693,9 @@ def nodes_with_missing_inputs(pipeline, recursive=True):
             disabled_nodes.update(
                 [pipeline.nodes[node_name] for node_name in trait.nodes])
 
-    nodes = pipeline.nodes.items()
+    nodes = deque(pipeline.nodes.items())
     while nodes:
-        node_name, node = nodes.pop(0)
+        node_name, node = nodes.popleft()
         if node_name == '' or not hasattr(node, 'process'):
             # main pipeline node, switch...
             continue
@@ -652,9 +703,10 @@ def nodes_with_missing_inputs(pipeline, recursive=True):
             continue
         process = node.process
         if recursive and isinstance(process, Pipeline):
-            nodes += [('%s.%s' % (node_name, new_name), new_node)
-                      for new_name, new_node in six.iteritems(process.nodes)
-                      if new_name != '']
+            nodes.extend([('%s.%s' % (node_name, new_name), new_node)
+                          for new_name, new_node
+                          in six.iteritems(process.nodes)
+                          if new_name != ''])
             continue
         for plug_name, plug in six.iteritems(node.plugs):
             if not plug.output:
@@ -664,7 +716,8 @@ def nodes_with_missing_inputs(pipeline, recursive=True):
                     value = getattr(process, plug_name)
                     keep_me = False
                     if value is None or value is traits.Undefined \
-                            or value == '' or not os.path.exists(value):
+                            or value == '' \
+                            or not stat_cache.exists(value):
                         # check where this file comes from
                         origin_node, origin_param, origin_parent \
                             = where_is_plug_value_from(plug, recursive)
@@ -751,6 +804,218 @@ def where_is_plug_value_from(plug, recursive=True):
     # not found
     return None, None, None
 
+def where_is_plug_value_used(plug):
+    '''
+    Find the leaf nodes which take the value of the given (output) plug as
+    input. This is the downstream counterpart of
+    :func:`where_is_plug_value_from`: links are followed through switches
+    (active input only) and pipeline walls.
+
+    Parameters
+    ----------
+    plug: Plug instance (mandatory)
+        the plug to find destination connections of
+
+    Returns
+    -------
+    destinations: list of (Node, str)
+        the active leaf nodes using the value, and their input names.
+    '''
+    destinations = []
+    links = deque(plug.links_to)
+    while links:
+        node_name, param_name, node, in_plug, weak = links.popleft()
+        if not node.activated or not node.enabled:
+            continue
+        if isinstance(node, Switch):
+            # only the active input is forwarded
+            prefix = '%s_switch_' % node.switch
+            if param_name.startswith(prefix):
+                out_plug = node.plugs.get(param_name[len(prefix):])
+                if out_plug is not None:
+                    links.extend(out_plug.links_to)
+        elif isinstance(node, PipelineNode):
+            # input of a sub-pipeline or output of the parent pipeline
+            links.extend(in_plug.links_to)
+        else:
+            destinations.append((node, param_name))
+    return destinations
+
+def nodes_needed_for_outputs(pipeline, targets, skip_existing=False,
+                             stat_cache=None):
+    '''
+    Find the minimal set of leaf nodes which have to run to produce some
+    outputs of a pipeline.
+
+    Links are followed upstream from the requested outputs, through switches
+    (active input only) and sub-pipelines walls. Inactive or disabled nodes
+    are not followed.
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        the pipeline.
+    targets: sequence of str (mandatory)
+        names of the pipeline outputs to produce.
+    skip_existing: bool (optional, default: False)
+        if set, a node is not needed when the files it should produce for
+        its downstream consumers already exist, and the nodes upstream of it
+        are not needed either (unless for another reason).
+    stat_cache: StatCache (optional)
+        files existence cache (see :mod:`capsul.utils.stat_cache`).
+        Default: a new cache, so that the files written since a previous
+        call are seen.
+
+    Returns
+    -------
+    nodes: list
+        the needed leaf nodes (Node instances).
+    '''
+    if skip_existing and stat_cache is None:
+        stat_cache = StatCache()
+        _prefetch_plug_values(pipeline, stat_cache)
+    links = deque()
+    for target in targets:
+        plug = pipeline.pipeline_node.plugs.get(target)
+        if plug is None or not plug.output:
+            raise ValueError('%s is not an output of the pipeline %s'
+                             % (target, pipeline.name))
+        links.extend(plug.links_from)
+    return _upstream_leaf_nodes(links, [], skip_existing, stat_cache)
+
+
+def _upstream_leaf_nodes(links, nodes, skip_existing=False, stat_cache=None):
+    '''
+    Walk links upstream and collect the leaf nodes they come from.
+
+    Parameters
+    ----------
+    links: deque
+        links (as in Plug.links_from) to follow upstream. It is consumed.
+    nodes: list
+        leaf nodes which are needed anyway. Their inputs are followed.
+    skip_existing, stat_cache:
+        see :func:`nodes_needed_for_outputs`.
+
+    Returns
+    -------
+    nodes: list
+        the leaf nodes (Node instances), starting with the given ones.
+    '''
+    needed_ids = set()
+    needed_nodes = []
+
+    def add_node(node):
+        needed_ids.add(id(node))
+        needed_nodes.append(node)
+        for plug_name, plug in six.iteritems(node.plugs):
+            if not plug.output:
+                links.extend(plug.links_from)
+
+    for node in nodes:
+        if id(node) not in needed_ids:
+            add_node(node)
+    while links:
+        node_name, param_name, node, in_plug, weak = links.popleft()
+        if not node.activated or not node.enabled:
+            # disabled nodes are not influencing
+            continue
+        if isinstance(node, Switch):
+            # recover through switch input
+            switch_input = '%s_switch_%s' % (node.switch, param_name)
+            links.extend(node.plugs[switch_input].links_from)
+        elif isinstance(node, PipelineNode):
+            # output of a sub-pipeline or input of the parent pipeline
+            links.extend(in_plug.links_from)
+        elif id(node) not in needed_ids:
+            # output of a leaf node
+            if skip_existing:
+                process = getattr(node, 'process', node)
+                value = getattr(process, param_name, None)
+                if not isinstance(value, (list, tuple)):
+                    value = [value]
+                if value and all(isinstance(item, basestring)
+                                 and stat_cache.exists(item)
+                                 for item in value):
+                    continue
+            add_node(node)
+    return needed_nodes
+
+
+def has_side_effects(node):
+    '''
+    Tells if a leaf node has to run even when none of its outputs is used
+    in the pipeline.
+
+    A node has side effects when its process has a ``side_effects``
+    attribute set to True, when it is a view node, when it has no outputs,
+    or when one of its File or Directory outputs has a value: the files it
+    writes are wanted, even if nothing reads them in the pipeline. Empty
+    outputs would be temporaries.
+
+    Parameters
+    ----------
+    node: Node (mandatory)
+        a leaf node.
+
+    Returns
+    -------
+    side_effects: bool
+    '''
+    process = getattr(node, 'process', node)
+    if getattr(process, 'side_effects', False) \
+            or getattr(node, 'node_type', None) == 'view_node':
+        return True
+    outputs = [plug_name for plug_name, plug in six.iteritems(node.plugs)
+               if plug.output]
+    if not outputs:
+        return True
+    for plug_name in outputs:
+        trait = process.trait(plug_name)
+        if trait is None or not (
+                is_trait_pathname(trait)
+                or (trait.inner_traits
+                    and is_trait_pathname(trait.inner_traits[0]))):
+            continue
+        value = getattr(process, plug_name, None)
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        if any(isinstance(item, basestring) and item for item in value):
+            return True
+    return False
+
+
+def dead_nodes(pipeline, nodes=None):
+    '''
+    Find the leaf nodes which do not need to run: none of their outputs
+    reach an output of the pipeline, nor a node which has to run, and they
+    have no side effects (see :func:`has_side_effects`).
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        the pipeline.
+    nodes: list (optional)
+        the leaf nodes to consider. Default: the nodes of the pipeline
+        workflow graph (:meth:`Pipeline.workflow_ordered_nodes`).
+
+    Returns
+    -------
+    dead_nodes: list
+        the leaf nodes which can be removed, in the order of nodes.
+    '''
+    if nodes is None:
+        nodes = pipeline.workflow_ordered_nodes()
+    links = deque()
+    for plug_name, plug in six.iteritems(pipeline.pipeline_node.plugs):
+        if plug.output:
+            links.extend(plug.links_from)
+    live_nodes = _upstream_leaf_nodes(
+        links, [node for node in nodes if has_side_effects(node)])
+    live_ids = set(id(node) for node in live_nodes)
+    return [node for node in nodes if id(node) not in live_ids]
+
+
 def dump_pipeline_state_as_dict(pipeline):
     '''
     Get a pipeline state (parameters values, nodes activation, selected
@@ -15,6 +15,7 @@ workflow = workflow_from_pipeline(pipeline)
 from __future__ import print_function
 import os
 import socket
+import logging
 import sys
 import six
 
@@ -29,7 +30,19 @@ from soma.sorted_dictionary import OrderedDict
 from .process_iteration import ProcessIteration
 from capsul.attributes import completion_engine_iteration
 from capsul.attributes.completion_engine import ProcessCompletionEngine
-
+from capsul.utils.formats import files_group, get_merged_formats
+from capsul.utils.io_limits import process_io_limits, io_limited_command
+from capsul.utils.path_trie import PathTrie
+from capsul.pipeline.incremental import nodes_full_names, NodeFiles
+from capsul.pipeline.job_bundles import bundle_jobs
+from capsul.pipeline.critical_path import (
+    expected_duration, critical_path_lengths, rank_priorities)
+from capsul.pipeline.workflow_engine import LocalWorkflowController
+from capsul.pipeline.duplicate_nodes import (
+    duplicate_nodes, alias_temporary_outputs, aliased_copies)
+
+# Define the logger
+logger = logging.getLogger(__name__)
 
 if sys.version_info[0] >= 3:
     xrange = range
@@ -41,7 +54,14 @@ else:
 
 
 def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
-                           jobs_priority=0, create_directories=True):
+                           jobs_priority=0, create_directories=True,
+                           io_limits=None, incremental=None, targets=None,
+                           skip_existing_outputs=False,
+                           prune_dead_nodes=None, merge_duplicates=None,
+                           iteration_templates=True, jobs_parameters=None,
+                           bundle_duration=None,
+                           critical_path_priorities=None,
+                           runtime_history=None, io_locks_directory=None):
     """ Create a soma-workflow workflow from a Capsul Pipeline
 
     Parameters
@@ -65,6 +85,66 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
     create_directories: bool (optional, default: True)
         if set, needed output directories (which will contain output files)
         will be created in a first job, which all other ones depend on.
+    io_limits: dict (optional)
+        {path: max_jobs} maximum number of jobs using the filesystem of each
+        path at the same time (see :mod:`capsul.utils.io_limits`). Default:
+        the study_config io_concurrency_limits, if any. The commands of
+        the jobs using a limited filesystem wait for a free slot when they
+        start (see :func:`capsul.utils.io_limits.io_slots`).
+    incremental: IncrementalManifest (optional)
+        if set, nodes which are up to date according to this manifest are
+        disabled (see :mod:`capsul.pipeline.incremental`), and a last job
+        records the executed nodes in the manifest once all the others are
+        done. File paths are recorded as seen on the client side.
+    targets: sequence of str (optional)
+        names of the pipeline outputs to produce: only the nodes needed to
+        produce them are kept (see
+        :func:`capsul.pipeline.pipeline_tools.nodes_needed_for_outputs`).
+    skip_existing_outputs: bool (optional, default: False)
+        when targets are given, nodes whose needed outputs already exist are
+        not run, nor the nodes upstream of them.
+    prune_dead_nodes: bool (optional)
+        if set, nodes whose outputs are neither used nor wanted are removed
+        from the workflow (see
+        :func:`capsul.pipeline.pipeline_tools.dead_nodes`), and logged.
+        Default: the study_config prune_dead_nodes option, if any.
+    merge_duplicates: bool (optional)
+        if set, only one job runs the nodes doing the same processing (see
+        :mod:`capsul.pipeline.duplicate_nodes`): the jobs of the other ones
+        wait for it and link its output files to theirs. Default: the
+        study_config merge_duplicate_nodes option, if any.
+    iteration_templates: bool (optional, default: True)
+        build the jobs of iterated processes from their command line
+        template and the iterated values, instead of setting the values on
+        the process for each iteration (see
+        :meth:`Process.commandline_from_values`). Iterated pipelines, and
+        processes with a custom command line, file transfers or values left
+        to completion, are still built one iteration at a time.
+    jobs_parameters: dict (optional)
+        if given, it is filled with {process: (job, values)} for the jobs
+        of the (non-iterated) processes, values being the {parameter:
+        value} dict the job was built from. Temporary files values have a
+        'pattern' attribute. Used by
+        :class:`~capsul.pipeline.workflow_cache.WorkflowCache`.
+    bundle_duration: float (optional)
+        if set (in seconds), jobs expected to last less than this are
+        merged into bundle jobs running them in a single interpreter, up to
+        this duration (see :mod:`capsul.pipeline.job_bundles`). Default:
+        the study_config job_bundle_duration option, if any (0: no
+        bundling).
+    critical_path_priorities: bool (optional)
+        if set, jobs priorities are given by their remaining critical-path
+        length, starting from jobs_priority, so that the longest chains of
+        jobs start first (see :mod:`capsul.pipeline.critical_path`).
+        Default: the study_config critical_path_priorities option, if any.
+    runtime_history: RuntimeHistory or dict (optional)
+        {process_id: seconds} past execution times, used for jobs bundling
+        and critical-path priorities (see
+        :func:`capsul.pipeline.critical_path.expected_duration`).
+    io_locks_directory: str (optional)
+        directory of the lock files of the io_limits slots. It has to be
+        shared by the machines running the jobs. Default: the study_config
+        io_locks_directory, if any, else a local temporary directory.
 
     Returns
     -------
@@ -126,24 +206,19 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
             return self.referent() is other.referent()
 
 
+    # shared resource and transfer directories, compiled once for the whole
+    # pipeline: {id(paths): (paths, PathTrie)}
+    path_tries = {}
+
+    def _path_trie(paths):
+        item = path_tries.get(id(paths))
+        if item is None or item[0] is not paths:
+            item = (paths, PathTrie(paths))
+            path_tries[id(paths)] = item
+        return item[1]
+
     def _files_group(path, merged_formats):
-        bname = os.path.basename(path)
-        l0 = len(path) - len(bname)
-        p0 = 0
-        paths = [path]
-        while True:
-            p = bname.find('.', p0)
-            if p < 0:
-                break
-            ext = bname[p:]
-            p0 = p + 1
-            format_def = merged_formats.get(ext)
-            if format_def:
-                path0 = path[:l0 + p]
-                paths += [path0 + e[0] for e in format_def]
-                break
-        paths.append(path + '.minf')
-        return paths
+        return files_group(path, merged_formats)
 
     def _translated_path(path, shared_map, shared_paths, trait=None):
         if path is None or path is Undefined \
@@ -157,15 +232,14 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
             # already in map
             return item
 
-        for base_dir, (namespace, uuid) in six.iteritems(shared_paths):
-            if path.startswith(base_dir + os.sep):
-                rel_path = path[len(base_dir)+1:]
-                #uuid = path
-                item = swclient.SharedResourcePath(
-                    rel_path, namespace, uuid=uuid)
-                shared_map[path] = item
-                return item
-        return None
+        match = _path_trie(shared_paths).lookup(path)
+        if match is None:
+            return None
+        base_dir, (namespace, uuid) = match
+        rel_path = path[len(base_dir.rstrip(os.sep))+1:]
+        item = swclient.SharedResourcePath(rel_path, namespace, uuid=uuid)
+        shared_map[path] = item
+        return item
 
     def build_job(process, temp_map={}, shared_map={}, transfers=[{}, {}],
                   shared_paths={}, forbidden_temp=set(), name='', priority=0,
@@ -407,9 +481,10 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
                 resource_conf.path_translations.export_to_dict())
 
     def _propagate_transfer(node, param, path, output, transfers,
-                            transfer_item):
+                            transfer_item, done_plugs=None):
         todo_plugs = [(node, param, output)]
-        done_plugs = set()
+        if done_plugs is None:
+            done_plugs = set()
         while todo_plugs:
             node, param, output = todo_plugs.pop()
             plug = node.plugs[param]
@@ -490,6 +565,10 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         in_transfers = {}
         out_transfers = {}
         transfers = [in_transfers, out_transfers]
+        transfer_trie = _path_trie(transfer_paths)
+        # {path: (FileTransfer, plugs already reached)}: a path is
+        # propagated once through the links
+        path_transfers = {}
         todo_nodes = [pipeline.pipeline_node]
         while todo_nodes:
             node = todo_nodes.pop(0)
@@ -508,19 +587,26 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
                     output = bool(trait.output)
                     existing_transfers = transfers[output].get(process, {})
                     existing_transfer = existing_transfers.get(param)
-                    if existing_transfer:
+                    if existing_transfer \
+                            or not isinstance(path, six.string_types) \
+                            or transfer_trie.lookup(path) is None:
+                        continue
+                    transfer_item, done_plugs = path_transfers.get(
+                        path, (None, None))
+                    if transfer_item is None:
+                        transfer_item = swclient.FileTransfer(
+                            is_input=not output,
+                            client_path=path,
+                            client_paths=_files_group(path,
+                                                      merged_formats))
+                        done_plugs = set()
+                        path_transfers[path] = (transfer_item, done_plugs)
+                    elif node.plugs.get(param) in done_plugs:
+                        # already reached from a linked parameter
                         continue
-                    for tpath in transfer_paths:
-                        if path.startswith(os.path.join(tpath, '')):
-                            transfer_item = swclient.FileTransfer(
-                                is_input=not output,
-                                client_path=path,
-                                client_paths=_files_group(path,
-                                                          merged_formats))
-                            _propagate_transfer(node, param,
-                                                path, not output, transfers,
-                                                transfer_item)
-                            break
+                    _propagate_transfer(node, param,
+                                        path, not output, transfers,
+                                        transfer_item, done_plugs)
             if hasattr(process, 'nodes'):
                 todo_nodes += [sub_node
                                for name, sub_node
@@ -642,12 +728,20 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
 
     def build_iteration(it_process, step_name, temp_map,
                         shared_map, transfers, shared_paths, disabled_nodes,
-                        remove_temp, steps, study_config={}):
+                        remove_temp, steps, study_config={}, node=None):
         '''
         Build workflow for an iterative process: the process / sub-pipeline is
         filled with appropriate parameters for each iteration, and its
         workflow is generated.
 
+        When the iterative outputs have no value, each iteration job
+        computes its own outputs: this is only possible if no other job
+        uses them (node is needed to check it). Iterations whose size is
+        only known once an upstream node has run cannot be expanded in a
+        workflow built beforehand, and raise a ValueError: they are
+        expanded at runtime by the local execution, and by the work queue
+        (:mod:`capsul.study_config.work_queue`).
+
         Returns
         -------
         (jobs, dependencies, groups, root_jobs)
@@ -702,66 +796,190 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         root_jobs = {}
 
         if size == 0:
+            _check_static_iteration_size(it_process, node)
             return (jobs, dependencies, groups, root_jobs)
 
         if no_output_value:
-            # this case is a "really" dynamic iteration, the number of
-            # iterations and parameters are determined in runtime, so we
-            # cannot handle it at the moment.
-            raise ValueError('Dynamic iteration is not handled in this '
-                'version of CAPSUL / Soma-Workflow')
+            # the iterative outputs are determined in runtime
+            _check_unused_iteration_outputs(it_process, node)
+
+        if iteration_templates and not no_output_value \
+                and _is_template_iteration(it_process, size, transfers):
+            return build_iteration_from_template(
+                it_process, step_name, size, temp_map, shared_map,
+                shared_paths, remove_temp)
 
+        for iteration in xrange(size):
             for parameter in it_process.iterative_parameters:
-                trait = it_process.trait(parameter)
-                if trait.output:
-                    setattr(it_process, parameter, [])
-            outputs = {}
-            for iteration in xrange(size):
-                for parameter in it_process.iterative_parameters:
-                    if not no_output_value \
-                            or not it_process.trait(parameter).output:
-                        setattr(it_process.process, parameter,
-                                getattr(it_process, parameter)[iteration])
-
-                # operate completion
-                complete_iteration(it_process, iteration)
-
-                #workflow = workflow_from_pipeline(it_process.process,
-                                                  #study_config=study_config)
-                #workflows.append(workflow)
-
-                for parameter in it_process.iterative_parameters:
-                    trait = it_process.trait(parameter)
-                    if trait.output:
-                        outputs.setdefault(
-                            parameter,[]).append(getattr(it_process.process,
-                                                         parameter))
-            for parameter, value in six.iteritems(outputs):
-                setattr(it_process, parameter, value)
-        else:
-            for iteration in xrange(size):
-                for parameter in it_process.iterative_parameters:
+                if no_output_value \
+                        and it_process.trait(parameter).output:
+                    setattr(it_process.process, parameter, Undefined)
+                else:
                     setattr(it_process.process, parameter,
                             getattr(it_process, parameter)[iteration])
 
-                # operate completion
-                complete_iteration(it_process, iteration)
-
-                process_name = it_process.process.name + '_%d' % iteration
-                (sub_jobs, sub_dependencies, sub_groups, sub_root_jobs) = \
-                    iter_to_workflow(it_process.process, process_name,
-                        step_name,
-                        temp_map, shared_map, transfers,
-                        shared_paths, disabled_nodes, remove_temp, steps,
-                        study_config, iteration)
-                jobs.update(dict([((p, iteration), j)
-                                  for p, j in six.iteritems(sub_jobs)]))
-                dependencies.update(sub_dependencies)
-                groups.update(sub_groups)
-                root_jobs.update(sub_root_jobs)
+            # operate completion
+            complete_iteration(it_process, iteration)
+
+            process_name = it_process.process.name + '_%d' % iteration
+            (sub_jobs, sub_dependencies, sub_groups, sub_root_jobs) = \
+                iter_to_workflow(it_process.process, process_name,
+                    step_name,
+                    temp_map, shared_map, transfers,
+                    shared_paths, disabled_nodes, remove_temp, steps,
+                    study_config, iteration)
+            jobs.update(dict([((p, iteration), j)
+                              for p, j in six.iteritems(sub_jobs)]))
+            dependencies.update(sub_dependencies)
+            groups.update(sub_groups)
+            root_jobs.update(sub_root_jobs)
 
         return (jobs, dependencies, groups, root_jobs)
 
+    def _check_static_iteration_size(it_process, node):
+        ''' Raise a ValueError if the iterative inputs of an empty iteration
+        are produced by an upstream node which does not give them a value
+        yet: their size is only known in runtime. Empty lists are
+        legitimate values, giving an empty job set.
+        '''
+        if node is None:
+            return
+        for parameter in it_process.iterative_parameters:
+            plug = node.plugs.get(parameter)
+            if plug is None or plug.output:
+                continue
+            source, source_param, parent \
+                = pipeline_tools.where_is_plug_value_from(plug)
+            if source is None:
+                continue
+            undetermined = (Undefined, None)
+            if getattr(it_process, parameter) in undetermined \
+                    or source.get_plug_value(source_param) in undetermined:
+                raise ValueError(
+                    'Dynamic iteration is not handled in soma-workflow: the '
+                    'size of %s.%s is only known once %s.%s has run. Run '
+                    'the pipeline locally, or on a work queue (see '
+                    'capsul.study_config.work_queue), to expand it in '
+                    'runtime.'
+                    % (node.name, parameter, source.name, source_param))
+
+    def _check_unused_iteration_outputs(it_process, node):
+        ''' Raise a ValueError if the iterative outputs computed in runtime
+        are used by other jobs, which would not get their values.
+        '''
+        if node is None:
+            raise ValueError('Dynamic iteration is not handled in this '
+                'version of CAPSUL / Soma-Workflow')
+        for parameter in it_process.iterative_parameters:
+            plug = node.plugs.get(parameter)
+            if plug is None or not plug.output:
+                continue
+            destinations = pipeline_tools.where_is_plug_value_used(plug)
+            if destinations:
+                dest_node, dest_param = destinations[0]
+                raise ValueError(
+                    'Dynamic iteration is not handled in soma-workflow: '
+                    '%s.%s is computed in runtime and used by %s.%s. Run '
+                    'the pipeline locally, or on a work queue (see '
+                    'capsul.study_config.work_queue), to expand it in '
+                    'runtime.'
+                    % (node.name, parameter, dest_node.name, dest_param))
+
+
+    def _is_template_iteration(it_process, size, transfers):
+        ''' Tells if the jobs of an iterative process can be built by
+        build_iteration_from_template()
+        '''
+        process = it_process.process
+        if not isinstance(process, Process) \
+                or isinstance(process, (Pipeline, ProcessIteration)) \
+                or six.get_unbound_function(type(process).get_commandline) \
+                    is not six.get_unbound_function(Process.get_commandline) \
+                or process in transfers[0] or process in transfers[1]:
+            return False
+        completion_engine = ProcessCompletionEngine.get_completion_engine(
+            it_process)
+        if not hasattr(completion_engine, 'complete_iteration_step'):
+            return True
+        # the iteration step completion only fills missing values
+        for parameter in it_process.iterative_parameters:
+            values = getattr(it_process, parameter)
+            if len(values) < size \
+                    or any(value in (Undefined, None, '') for value in values):
+                return False
+        return True
+
+    def build_iteration_from_template(it_process, step_name, size, temp_map,
+                                      shared_map, shared_paths, remove_temp):
+        '''
+        Build the jobs of an iterated process: the parameters description
+        is computed once, then each iteration command line is built from
+        the iterated values, without modifying the process.
+
+        Returns
+        -------
+        (jobs, dependencies, groups, root_jobs)
+        '''
+        process = it_process.process
+        parameters = process.get_commandline_parameters()
+        path_parameters = [name for name, kind in parameters
+                           if kind != 'value']
+        outputs = set(name for name, trait
+                      in six.iteritems(process.user_traits())
+                      if trait.output)
+        columns = dict((parameter, getattr(it_process, parameter))
+                       for parameter in it_process.iterative_parameters)
+        values = dict((name, getattr(process, name))
+                      for name, kind in parameters)
+
+        def _job_path(value, name, referenced):
+            if isinstance(value, TempFile):
+                if name not in outputs and value in remove_temp:
+                    raise ValueError(
+                        'Temporary value used cannot be generated '
+                        'in the workflkow: %s.%s' % (job_name, name))
+                tval = temp_map[value]
+                tval = tval.__class__(tval)
+                tval.pattern = value.pattern
+                referenced.append(tval)
+                return tval
+            return _translated_path(value, shared_map, shared_paths) \
+                or value
+
+        jobs = {}
+        root_jobs = {}
+        for iteration in xrange(size):
+            job_name = process.name + '_%d' % iteration
+            for parameter, column in six.iteritems(columns):
+                values[parameter] = column[iteration]
+            job_values = dict(values)
+            input_paths = []
+            output_paths = []
+            for name in path_parameters:
+                value = values[name]
+                if value in (Undefined, None, ''):
+                    continue
+                referenced = output_paths if name in outputs \
+                    else input_paths
+                if isinstance(value, (list, tuple)):
+                    job_values[name] = [
+                        _job_path(item, name, referenced)
+                        if item not in (Undefined, None, '') else item
+                        for item in value]
+                else:
+                    job_values[name] = _job_path(value, name, referenced)
+            job = swclient.Job(
+                name=job_name,
+                command=process.commandline_from_values(parameters,
+                                                        job_values),
+                referenced_input_files=input_paths,
+                referenced_output_files=output_paths,
+                priority=jobs_priority)
+            if step_name:
+                job.user_storage = step_name
+            jobs[((process, iteration), iteration)] = job
+            root_jobs[(process, iteration)] = job
+        return (jobs, set(), {}, root_jobs)
 
     def complete_iteration(it_process, iteration):
         completion_engine = ProcessCompletionEngine.get_completion_engine(
@@ -859,7 +1077,7 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
                     sub_workflows = build_iteration(
                         process, step_name, temp_map,
                         shared_map, transfers, shared_paths, disabled_nodes,
-                        {}, steps, study_config={})
+                        {}, steps, study_config={}, node=it_node)
                     (sub_jobs, sub_deps, sub_groups, sub_root_jobs) = \
                         sub_workflows
                     group = build_group(node_name, six_values(sub_root_jobs))
@@ -925,13 +1143,72 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         root_jobs = OrderedDict([x[1:] for x in root_jobs_list])
         return jobs, dependencies, groups, root_jobs
 
+    def _alias_job(job, representative, duplicate, temp_map={},
+                   shared_map={}, shared_paths={}):
+        ''' Turn the job of a duplicate node into a job linking the
+        representative node output files to the duplicate ones (see
+        :mod:`capsul.pipeline.duplicate_nodes`).
+        '''
+        def _job_path(path):
+            if isinstance(path, TempFile):
+                tval = temp_map[path]
+                tval = tval.__class__(tval)
+                tval.pattern = path.pattern
+                return tval
+            return _translated_path(path, shared_map, shared_paths) or path
+
+        paths = []
+        for src, dest in aliased_copies(representative, duplicate):
+            paths += [_job_path(src), _job_path(dest)]
+        job.name = '%s (results of %s)' % (job.name, representative.name)
+        job.command = ['python', '-m', 'capsul.utils.file_copy',
+                       '--strategy', 'hardlink'] + paths
+        job.referenced_input_files = [
+            path for path in paths[::2]
+            if not isinstance(path, six.string_types)]
+        job.referenced_output_files = [
+            path for path in paths[1::2]
+            if not isinstance(path, six.string_types)]
+
+    def _job_process(key):
+        ''' Get the process of a jobs dict key (iterations keys are
+        tuples).
+        '''
+        while isinstance(key, tuple):
+            key = key[0]
+        return key
+
+    def _set_critical_path_priorities(jobs, dependencies, history):
+        ''' Set the jobs priorities from their remaining critical-path
+        length.
+        '''
+        def element_jobs(element):
+            if not hasattr(element, 'elements'):
+                return [element]
+            return [job for sub_element in element.elements
+                    for job in element_jobs(sub_element)]
+
+        jobs_durations = {}
+        for key, job in six.iteritems(jobs):
+            process = _job_process(key)
+            if isinstance(process, ProcessIteration):
+                process = process.process
+            jobs_durations[job] = expected_duration(process, history)
+        successors = {}
+        for source, dest in dependencies:
+            dest_jobs = element_jobs(dest)
+            for job in element_jobs(source):
+                successors.setdefault(job, set()).update(dest_jobs)
+        lengths = critical_path_lengths(list(jobs_durations), successors,
+                                        jobs_durations)
+        for job, priority in six.iteritems(
+                rank_priorities(lengths, jobs_priority)):
+            job.priority = priority
+
     def _create_directories_job(pipeline, shared_map={}, shared_paths={},
                                 priority=0, transfer_paths=[]):
         def _is_transfer(d, transfer_paths):
-            for path in transfer_paths:
-                if d.startswith(os.path.join(path, '')):
-                    return True
-            return False
+            return _path_trie(transfer_paths).lookup(d) is not None
 
         directories = [d
                        for d in pipeline_tools.get_output_directories(
@@ -957,23 +1234,10 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
             priority=priority)
         return job
 
-    # TODO: handle formats in a separate, centralized place
-    # formats: {name: ext_props}
-    #     ext_props: {ext: [dependent_exts]}
-    #     dependent_exts: (ext, mandatory)
-    formats = {
-        'NIFTI-1': {'.nii': [], '.img': [('.hdr', True)], '.nii.gz': []},
-        'GIS': {'.ima': [('.dim', True)]},
-        'GIFTI': {'.gii': []},
-        'MESH': {'.mesh': []},
-        'ARG': {'.arg': [('.data', False)]},
-    }
-    # transform it to an ext-based dict
+    # formats are defined in capsul.utils.formats
     # merged_formats: {ext: [dependent_exts]}
     # (formats names are lost here)
-    merged_formats = {}
-    for format, values in six.iteritems(formats):
-        merged_formats.update(values)
+    merged_formats = get_merged_formats()
 
     if not isinstance(pipeline, Pipeline):
         # "pipeline" is actally a single process (or should, if it is not a
@@ -983,17 +1247,74 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         new_pipeline.add_process('main', pipeline)
         new_pipeline.autoexport_nodes_parameters()
         pipeline = new_pipeline
+    # skip the nodes which do not need to run, before temporary files are
+    # assigned
+    recorded_nodes = []
+    skipped_nodes = []
+    execution_list = None
+    if prune_dead_nodes is None:
+        prune_dead_nodes = getattr(study_config, 'prune_dead_nodes', False)
+    if targets is not None or incremental is not None or prune_dead_nodes:
+        execution_list = pipeline.workflow_ordered_nodes()
+        if prune_dead_nodes and targets is None:
+            # with targets, unneeded nodes are already skipped
+            skipped_nodes = pipeline_tools.dead_nodes(pipeline,
+                                                      execution_list)
+            if skipped_nodes:
+                names = nodes_full_names(pipeline)
+                logger.info('pruned dead nodes: %s' % ', '.join(
+                    names[id(node)] for node in skipped_nodes))
+            pruned_ids = set(id(node) for node in skipped_nodes)
+            execution_list = [node for node in execution_list
+                              if id(node) not in pruned_ids]
+        if targets is not None:
+            needed_ids = set(
+                id(node) for node in pipeline_tools.nodes_needed_for_outputs(
+                    pipeline, targets, skip_existing=skip_existing_outputs))
+            skipped_nodes = [node for node in execution_list
+                             if id(node) not in needed_ids]
+            execution_list = [node for node in execution_list
+                              if id(node) in needed_ids]
+        if incremental is not None:
+            names = nodes_full_names(pipeline)
+            stale_nodes = incremental.stale_nodes(execution_list, names)
+            stale_ids = set(id(node) for node in stale_nodes)
+            skipped_nodes += [node for node in execution_list
+                              if id(node) not in stale_ids]
+            recorded_nodes = [(names[id(node)], NodeFiles(node))
+                              for node in stale_nodes]
+
+    # get complete list of disabled leaf nodes
+    if disabled_nodes is None:
+        disabled_nodes = pipeline.disabled_pipeline_steps_nodes()
+    disabled_nodes = _expand_nodes(list(disabled_nodes) + skipped_nodes)
+
+    # find the nodes doing the same processing
+    if merge_duplicates is None:
+        merge_duplicates = getattr(study_config, 'merge_duplicate_nodes',
+                                   False)
+    duplicates = {}
+    if merge_duplicates:
+        if execution_list is None:
+            execution_list = pipeline.workflow_ordered_nodes()
+        duplicates = duplicate_nodes([node for node in execution_list
+                                      if node not in disabled_nodes])
+        for representative, nodes in six.iteritems(duplicates):
+            logger.info('%s will reuse the results of %s'
+                        % (', '.join(node.name for node in nodes),
+                           representative.name))
+
     temp_map = assign_temporary_filenames(pipeline)
     temp_subst_list = [(x1, x2[0]) for x1, x2 in six.iteritems(temp_map)]
     temp_subst_map = dict(temp_subst_list)
     shared_map = {}
     swf_paths = _get_swf_paths(study_config)
     transfers = _get_transfers(pipeline, swf_paths[0], merged_formats)
-    #print('disabling nodes:', disabled_nodes)
-    # get complete list of disabled leaf nodes
-    if disabled_nodes is None:
-        disabled_nodes = pipeline.disabled_pipeline_steps_nodes()
-    disabled_nodes = _expand_nodes(disabled_nodes)
+    # the jobs reading the duplicates temporaries read the
+    # representatives ones
+    for representative, nodes in six.iteritems(duplicates):
+        for node in nodes:
+            alias_temporary_outputs(representative, node, temp_map)
     move_to_input, remove_temp = _handle_disable_nodes(
         pipeline, temp_subst_map, transfers, disabled_nodes)
     #print('changed transfers:', move_to_input)
@@ -1022,13 +1343,61 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         (jobs, dependencies, groups, root_jobs) = workflow_from_graph(
             graph, temp_subst_map, shared_map, transfers, swf_paths[1],
             disabled_nodes=disabled_nodes, forbidden_temp=remove_temp,
-            steps=steps, study_config=study_config)
+            jobs_priority=jobs_priority, steps=steps,
+            study_config=study_config)
+        if jobs_parameters is not None:
+            for process, job in six.iteritems(jobs):
+                if isinstance(process, Process):
+                    jobs_parameters[process] = (job, dict(
+                        (name, getattr(process, name))
+                        for name in process.user_traits()))
+        # the duplicates jobs only link the representatives outputs
+        for representative, nodes in six.iteritems(duplicates):
+            rep_job = jobs[representative.process]
+            for node in nodes:
+                _alias_job(jobs[node.process], representative, node,
+                           temp_subst_map, shared_map, swf_paths[1])
+                dependencies.add((rep_job, jobs[node.process]))
     finally:
         restore_empty_filenames(temp_map)
 
+    # limit the number of jobs using the same filesystem at the same time
+    if io_limits is None:
+        io_limits = getattr(study_config, 'io_concurrency_limits', None)
+    if io_limits:
+        if io_locks_directory is None:
+            io_locks_directory = getattr(study_config, 'io_locks_directory',
+                                         None)
+            if io_locks_directory is Undefined:
+                io_locks_directory = None
+        for key, job in six.iteritems(jobs):
+            limits = process_io_limits(_job_process(key), io_limits)
+            if limits and job.command:
+                job.command = io_limited_command(job.command, limits,
+                                                 io_locks_directory)
+
     all_jobs = six_values(jobs)
     root_jobs = six_values(root_jobs)
 
+    # start the longest chains first
+    if critical_path_priorities is None:
+        critical_path_priorities = getattr(study_config,
+                                           'critical_path_priorities', False)
+    if critical_path_priorities:
+        _set_critical_path_priorities(jobs, dependencies, runtime_history)
+
+    # merge short jobs
+    if bundle_duration is None:
+        bundle_duration = getattr(study_config, 'job_bundle_duration', 0)
+    if bundle_duration:
+        jobs_durations = dict(
+            (job, expected_duration(_job_process(key), runtime_history,
+                                    default=None))
+            for key, job in six.iteritems(jobs))
+        jobs = bundle_jobs(jobs, dependencies, root_jobs, jobs_durations,
+                           bundle_duration)
+        all_jobs = six_values(jobs)
+
     # if directories have to be created, all other primary jobs will depend
     # on this first one
     if create_directories and dirs_job is not None:
@@ -1041,6 +1410,16 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         all_jobs.insert(0, dirs_job)
         root_jobs.insert(0, dirs_job)
 
+    # record the executed nodes in the incremental manifest
+    if recorded_nodes:
+        record_job = swclient.Job(
+            name='incremental manifest',
+            command=incremental.record_command(recorded_nodes),
+            priority=jobs_priority)
+        dependencies.update([(job, record_job) for job in all_jobs])
+        all_jobs.append(record_job)
+        root_jobs.append(record_job)
+
     workflow = swclient.Workflow(jobs=all_jobs,
         dependencies=dependencies,
         root_group=root_jobs,
@@ -1049,7 +1428,8 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
     return workflow
 
 
-def local_workflow_run(workflow_name, workflow):
+def local_workflow_run(workflow_name, workflow, local_engine=False,
+                       workers=None):
     """ Create a soma-workflow controller and submit a workflow
 
     Parameters
@@ -1058,7 +1438,20 @@ def local_workflow_run(workflow_name, workflow):
         the name of the workflow
     workflow: Workflow (mandatory)
         the soma-workflow workflow
+    local_engine: bool (optional, default False)
+        run the workflow in the current process (see
+        :class:`~capsul.pipeline.workflow_engine.LocalWorkflowController`)
+        instead of a soma-workflow controller and its server.
+    workers: int (optional)
+        number of jobs run at the same time by the local engine. Default:
+        the number of CPUs.
     """
+    if local_engine:
+        controller = LocalWorkflowController(workers)
+        wf_id = controller.submit_workflow(workflow=workflow,
+                                           name=workflow_name)
+        controller.wait_workflow(wf_id)
+        return controller, wf_id
     localhost = socket.gethostname()
     controller = swclient.WorkflowController(localhost)
     wf_id = controller.submit_workflow(workflow=workflow, name=workflow_name)
@@ -7,16 +7,23 @@
 ##########################################################################
 
 import sys
+import logging
 import six
+from six.moves import queue
+from multiprocessing.pool import ThreadPool
 from traits.api import List, Undefined
 
 from capsul.process.process import Process
 from capsul.study_config.process_instance import get_process_instance
 from capsul.attributes.completion_engine import ProcessCompletionEngine
+from capsul.utils.io_limits import process_io_limits, io_slots
 
 if sys.version_info[0] >= 3:
     xrange = range
 
+# Define the logger
+logger = logging.getLogger(__name__)
+
 class ProcessIteration(Process):
     def __init__(self, process, iterative_parameters, study_config=None,
                  context_name=None):
@@ -69,8 +76,18 @@ class ProcessIteration(Process):
                 # Note: should be this be done via a links system ?
                 setattr(self, name, getattr(self.process, name))
 
-    def _run_process(self):
-        # Check that all iterative parameter value have the same size
+    def iteration_size(self):
+        """ Check that all iterative parameter values have the same size,
+        and get this size.
+
+        Returns
+        -------
+        size: int
+            the number of iterations.
+        no_output_value: bool
+            True if the iterative outputs have no value: they are computed
+            by the iterations.
+        """
         no_output_value = None
         size = None
         size_error = False
@@ -105,6 +122,10 @@ class ProcessIteration(Process):
 
         if size_error:
             raise ValueError('Iterative parameter values must be lists of the same size: %s' % ','.join('%s=%d' % (n, len(getattr(self,n))) for n in self.iterative_parameters))
+        return size, no_output_value
+
+    def _run_process(self):
+        size, no_output_value = self.iteration_size()
         if size == 0:
             return
 
@@ -115,32 +136,144 @@ class ProcessIteration(Process):
                 trait = self.trait(parameter)
                 if trait.output:
                     setattr(self, parameter, [])
-            outputs = {}
-            for iteration in xrange(size):
-                for parameter in self.iterative_parameters:
-                    if not no_output_value or not self.trait(parameter).output:
-                        setattr(self.process, parameter,
-                                getattr(self, parameter)[iteration])
-                # operate completion
-                self.complete_iteration(iteration)
-                self.process()
-                for parameter in self.iterative_parameters:
-                    trait = self.trait(parameter)
-                    if trait.output:
-                        outputs.setdefault(parameter,[]).append(
-                            getattr(self.process, parameter))
-                        # reset empty value
-                        setattr(self.process, parameter, Undefined)
-            for parameter, value in six.iteritems(outputs):
-                setattr(self, parameter, value)
+        workers = min(self.iteration_workers(), size)
+        if workers > 1:
+            outputs = self._run_parallel_iterations(size, no_output_value,
+                                                    workers)
         else:
-            for iteration in xrange(size):
-                for parameter in self.iterative_parameters:
-                    setattr(self.process, parameter,
-                            getattr(self, parameter)[iteration])
-                # operate completion
-                self.complete_iteration(iteration)
+            outputs = self._run_iterations(size, no_output_value)
+        for parameter, value in six.iteritems(outputs):
+            setattr(self, parameter, value)
+
+    def iteration_workers(self):
+        """ Number of iterations run at the same time, given by the
+        ``iteration_workers`` option of the study config (default: 1).
+        """
+        workers = getattr(self.study_config, 'iteration_workers', 1)
+        if workers in (None, Undefined):
+            workers = 1
+        return max(1, workers)
+
+    def _set_iteration(self, iteration, no_output_value):
+        """ Fill the iterated process with the values of an iteration, and
+        operate completion.
+        """
+        for parameter in self.iterative_parameters:
+            if not no_output_value or not self.trait(parameter).output:
+                setattr(self.process, parameter,
+                        getattr(self, parameter)[iteration])
+        # operate completion
+        self.complete_iteration(iteration)
+
+    def _iteration_outputs(self, process, no_output_value):
+        """ Get (and reset) the iterative outputs computed by a run, when
+        they are not given.
+        """
+        outputs = {}
+        if not no_output_value:
+            return outputs
+        for parameter in self.iterative_parameters:
+            trait = self.trait(parameter)
+            if trait.output:
+                outputs[parameter] = getattr(process, parameter)
+                # reset empty value
+                setattr(process, parameter, Undefined)
+        return outputs
+
+    def _run_iterations(self, size, no_output_value):
+        """ Run the iterations one after the other.
+
+        Returns
+        -------
+        outputs: dict
+            {parameter: list of values} for the iterative outputs computed
+            during the run (when no_output_value is set).
+        """
+        outputs = {}
+        for iteration in xrange(size):
+            self._set_iteration(iteration, no_output_value)
+            with self._io_slots(self.process):
                 self.process()
+            for parameter, value in six.iteritems(
+                    self._iteration_outputs(self.process, no_output_value)):
+                outputs.setdefault(parameter, []).append(value)
+        return outputs
+
+    def _run_parallel_iterations(self, size, no_output_value, workers):
+        """ Run the iterations on a pool of workers.
+
+        The iterations are expanded when the iteration node runs, so that
+        their number may depend on the results of upstream nodes. Each
+        iteration is completed on the iterated process, then its parameters
+        are copied to a copy of the iterated process owned by a worker.
+
+        Returns
+        -------
+        outputs: dict
+            see :meth:`_run_iterations`.
+        """
+        instances = queue.Queue()
+        try:
+            for worker in xrange(workers):
+                instances.put(self._process_copy())
+        except Exception as e:
+            logger.warning('cannot copy %s for parallel iterations, '
+                           'running them sequentially: %s'
+                           % (self.process.id, e))
+            return self._run_iterations(size, no_output_value)
+        parameters = list(self.process.user_traits())
+
+        def run_iteration(values):
+            instance = instances.get()
+            try:
+                for name, value in values:
+                    setattr(instance, name, value)
+                with self._io_slots(instance):
+                    instance()
+                return self._iteration_outputs(instance, no_output_value)
+            finally:
+                instances.put(instance)
+
+        pool = ThreadPool(workers)
+        try:
+            results = []
+            for iteration in xrange(size):
+                self._set_iteration(iteration, no_output_value)
+                values = [(name, getattr(self.process, name))
+                          for name in parameters]
+                results.append(pool.apply_async(run_iteration, (values, )))
+            outputs = {}
+            for result in results:
+                for parameter, value in six.iteritems(result.get()):
+                    outputs.setdefault(parameter, []).append(value)
+        finally:
+            pool.close()
+            pool.join()
+        return outputs
+
+    def _io_slots(self, process):
+        """ Get the I/O slots (see :func:`capsul.utils.io_limits.io_slots`)
+        an iteration holds while it runs, according to the
+        ``io_concurrency_limits`` option of the study config.
+        """
+        io_limits = getattr(self.study_config, 'io_concurrency_limits', None)
+        lock_directory = getattr(self.study_config, 'io_locks_directory',
+                                 None)
+        if lock_directory in (Undefined, ''):
+            lock_directory = None
+        return io_slots(process_io_limits(process, io_limits),
+                        lock_directory)
+
+    def _process_copy(self):
+        """ Copy the iterated process, with its traits (which may have been
+        modified since its instantiation), their values, and its context.
+        """
+        instance = self.process.copy(with_values=True)
+        if self.process.study_config is not None:
+            instance.set_study_config(self.process.study_config)
+        if hasattr(self.process, 'context_name'):
+            instance.context_name = self.process.context_name
+        return instance
 
     def set_study_config(self, study_config):
         super(ProcessIteration, self).set_study_config(study_config)
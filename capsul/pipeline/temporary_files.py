@@ -0,0 +1,422 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Pipeline temporary files management during a sequential execution.
+
+Temporary files are allocated by
+:meth:`~capsul.pipeline.pipeline.Pipeline._check_temporary_files_for_node`
+before the execution starts. :class:`TemporaryFilesTracker` counts the
+nodes which read each temporary, and deletes it as soon as its last
+consumer has been executed, instead of keeping all intermediate files
+until the end of the pipeline.
+
+Temporaries may also be named pipes (FIFOs, see
+:meth:`~capsul.pipeline.pipeline.Pipeline._is_streamable_link`): the
+tracker checks that the producer and the consumer of each FIFO can run
+concurrently (see :attr:`TemporaryFilesTracker.streams`).
+"""
+
+# System import
+import os
+import stat
+import shutil
+import sys
+import time
+import logging
+import threading
+import six
+
+# Capsul import
+from capsul.utils.formats import files_group
+from capsul.utils.trait_paths import path_values
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+def release_temporary_file(path):
+    """ Delete a temporary file or directory, and its companion files
+    (.hdr, .minf... see :mod:`capsul.utils.formats`).
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    for fname in files_group(path):
+        try:
+            os.unlink(fname)
+        except OSError:
+            pass
+
+
+def is_fifo(path):
+    """ Check if a path is a named pipe.
+    """
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def unblock_fifo(path):
+    """ Unblock a process waiting to write in a named pipe which will not be
+    read: the pipe is opened for reading and closed at once, so that the
+    writer gets a broken pipe error.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        os.close(fd)
+    except OSError:
+        pass
+
+
+def path_size(path):
+    """ Get the size in bytes of a file and its companion files, or of a
+    directory contents.
+    """
+    size = 0
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            for fname in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, fname))
+                except OSError:
+                    pass
+        return size
+    for fname in files_group(path):
+        try:
+            size += os.path.getsize(fname)
+        except OSError:
+            pass
+    return size
+
+
+class StreamProducer(threading.Thread):
+    """ Run a node which writes named pipes in the background, while its
+    consumers are executed.
+
+    If the node fails, its named pipes are opened for writing and closed so
+    that their reader does not wait forever. The error is kept in the
+    'exc_info' attribute and raised by :meth:`check`.
+    """
+
+    def __init__(self, node, fifos, target):
+        """ Initialize the StreamProducer class.
+
+        Parameters
+        ----------
+        node: Node
+            the producer node.
+        fifos: list of str
+            the named pipes written by the node.
+        target: callable
+            the function which executes the node.
+        """
+        super(StreamProducer, self).__init__(name=node.name)
+        self.daemon = True
+        self.node = node
+        self.fifos = fifos
+        self.target = target
+        self.result = None
+        self.exc_info = None
+
+    def run(self):
+        try:
+            self.result = self.target()
+        except Exception:
+            self.exc_info = sys.exc_info()
+            for path in self.fifos:
+                try:
+                    open(path, "w").close()
+                except (IOError, OSError):
+                    pass
+
+    def check(self):
+        """ Raise the node execution error, if any.
+        """
+        if self.exc_info is not None:
+            six.reraise(*self.exc_info)
+
+    def abort(self, timeout=None):
+        """ Unblock the node if it is still waiting for its consumers, and
+        wait for its termination.
+        """
+        start = time.time()
+        while self.is_alive():
+            # the node may open its pipes later: retry until it is done
+            for path in self.fifos:
+                unblock_fifo(path)
+            self.join(0.1)
+            if timeout is not None and time.time() - start > timeout:
+                break
+
+
+class TemporaryFilesTracker(object):
+    """ Reference counting of the pipeline temporary files.
+
+    ::
+
+        tracker = TemporaryFilesTracker(execution_list, temporary_files)
+        for node in execution_list:
+            tracker.before_node(node)
+            # run the node
+            tracker.after_node(node)
+
+    Nodes listed in 'streams' write named pipes: they are started in the
+    background with a :class:`StreamProducer`, and 'after_node' is called
+    for them once their consumers are done.
+
+    Attributes
+    ----------
+    consumers: dict
+        {temporary_path: set of the ids of the nodes still to be executed
+        which read it}
+    streams: dict
+        {producer_node_id: (fifo_paths, consumer_node_ids)} named pipes
+        written by a node. The producer has to be started in the
+        background, and is done when its consumers are done.
+    """
+
+    def __init__(self, execution_list, temp_files, scratch_directory=None,
+                 budget=0, spill_directory=None):
+        """ Initialize the TemporaryFilesTracker class.
+
+        Parameters
+        ----------
+        execution_list: list of Node
+            the nodes to be executed, in execution order.
+        temp_files: list
+            the temporary files allocated by
+            Pipeline._check_temporary_files_for_node(). When temporaries
+            are moved out of the scratch directory, the list is updated so
+            that Pipeline._free_temporary_files() still finds them.
+        scratch_directory: str (optional)
+            the directory where temporaries are allocated.
+        budget: int (optional, default 0)
+            the size in bytes that temporaries may use in the scratch
+            directory (0: no limit). When the temporaries of a node are
+            not expected to fit in the remaining budget, they are created
+            in spill_directory. The budget is only used with a scratch
+            directory.
+        spill_directory: str (optional)
+            the directory used when the scratch budget is exceeded.
+        """
+        self.temp_files = temp_files
+        self.scratch_directory = scratch_directory
+        self.budget = budget
+        self.spill_directory = spill_directory
+
+        # Temporaries produced by each node
+        self.produced = {}
+        # Temporaries read by each node
+        self.node_inputs = {}
+        self.consumers = {}
+        temp_paths = set()
+        for index, temp_file in enumerate(temp_files):
+            node = temp_file[0]
+            paths = path_values(temp_file[2])
+            self.produced.setdefault(id(node), []).append(index)
+            temp_paths.update(paths)
+            for path in paths:
+                self.consumers[path] = set()
+        for node in execution_list:
+            inputs = set()
+            for plug_name, plug in six.iteritems(node.plugs):
+                if plug.output:
+                    continue
+                inputs.update(
+                    path_values(node.get_plug_value(plug_name)))
+            inputs.intersection_update(temp_paths)
+            self.node_inputs[id(node)] = inputs
+            for path in inputs:
+                self.consumers[path].add(id(node))
+        self.released = set()
+        self.streams = {}
+        self._check_streams(execution_list)
+
+    def _check_streams(self, execution_list):
+        """ Check that the producer and the consumer of each named pipe can
+        run concurrently, and replace the other pipes with regular files.
+
+        A named pipe must have a single consumer, executed after its
+        producer, which does not read other outputs of the producer. Nodes
+        executed between the producer and the consumer must not read any
+        output of the producer. A producer streams a single named pipe: the
+        order in which it opens its outputs is unknown, so it could wait
+        for a pipe whose consumer is not running, or which its consumer
+        has not opened yet.
+        """
+        fifos = {}
+        for temp_file in self.temp_files:
+            paths = [path for path in path_values(temp_file[2])
+                     if is_fifo(path)]
+            if paths:
+                fifos.setdefault(id(temp_file[0]), []).extend(paths)
+        if not fifos:
+            return
+        order = dict((id(node), index)
+                     for index, node in enumerate(execution_list))
+
+        def node_values(node, output):
+            values = set()
+            for plug_name, plug in six.iteritems(node.plugs):
+                if bool(plug.output) == output:
+                    values.update(
+                        path_values(node.get_plug_value(plug_name)))
+            return values
+
+        for node in execution_list:
+            paths = fifos.get(id(node))
+            if not paths:
+                continue
+            outputs = node_values(node, True)
+            streamed = None
+            for path in sorted(paths):
+                if streamed is not None:
+                    break
+                consumers = self.consumers[path]
+                if len(consumers) != 1:
+                    continue
+                consumer_id = list(consumers)[0]
+                consumer_index = order[consumer_id]
+                consumer = execution_list[consumer_index]
+                if consumer_index <= order[id(node)] \
+                        or node_values(consumer, False).intersection(
+                            outputs) != set([path]):
+                    continue
+                for other in execution_list[order[id(node)] + 1:
+                                            consumer_index]:
+                    if node_values(other, False).intersection(outputs):
+                        break
+                else:
+                    streamed = (path, consumer_id)
+            for path in paths:
+                if streamed is None or path != streamed[0]:
+                    logger.debug("'{0}' can't be streamed, a regular file "
+                                 "is used".format(path))
+                    os.unlink(path)
+                    open(path, "w").close()
+            if streamed is not None:
+                self.streams[id(node)] = ([streamed[0]],
+                                          set([streamed[1]]))
+
+    def scratch_usage(self):
+        """ Get the size in bytes of the live temporaries in the scratch
+        directory.
+        """
+        size = 0
+        for path in self.consumers:
+            if path not in self.released and self._in_scratch(path):
+                size += path_size(path)
+        return size
+
+    def _in_scratch(self, path):
+        scratch_directory = os.path.join(
+            os.path.abspath(self.scratch_directory), "")
+        return os.path.abspath(path).startswith(scratch_directory)
+
+    def expected_size(self, node):
+        """ Estimate the size in bytes of the temporaries a node will write.
+
+        The sizes of outputs are not known before a node runs: they are
+        estimated as the size of the node input files, once per temporary
+        output.
+        """
+        indices = self.produced.get(id(node))
+        if not indices:
+            return 0
+        inputs = set()
+        for plug_name, plug in six.iteritems(node.plugs):
+            if not plug.output:
+                inputs.update(path_values(node.get_plug_value(plug_name)))
+        input_size = sum(path_size(path) for path in inputs
+                         if os.path.exists(path))
+        outputs = 0
+        for index in indices:
+            tmpfiles = self.temp_files[index][2]
+            outputs += len(tmpfiles) if isinstance(tmpfiles, list) else 1
+        return input_size * outputs
+
+    def before_node(self, node):
+        """ Check the scratch budget before a node is executed: if the
+        expected size of its temporaries (see :meth:`expected_size`) does
+        not fit in the remaining budget, the node temporary outputs are
+        moved to the spill directory.
+
+        The expected size is an estimate: a node writing outputs larger
+        than its inputs may still exceed the budget.
+        """
+        if not self.budget or self.spill_directory is None \
+                or self.scratch_directory is None:
+            return
+        indices = self.produced.get(id(node))
+        if not indices:
+            return
+        usage = self.scratch_usage()
+        expected = self.expected_size(node)
+        if usage < self.budget and usage + expected <= self.budget:
+            return
+        logger.info("Scratch budget exceeded ({0} bytes used, {1} bytes "
+                    "expected): temporary outputs of {2} are written in "
+                    "{3}".format(usage, expected, node.name,
+                                 self.spill_directory))
+        if not os.path.isdir(self.spill_directory):
+            os.makedirs(self.spill_directory)
+        for index in indices:
+            tnode, plug_name, tmpfiles, value = self.temp_files[index]
+            if isinstance(tmpfiles, list):
+                new_files = [self._spill(path) for path in tmpfiles]
+            else:
+                new_files = self._spill(tmpfiles)
+            self.temp_files[index] = (tnode, plug_name, new_files, value)
+            tnode.set_plug_value(plug_name, new_files)
+
+    def _spill(self, path):
+        """ Move a temporary (not written yet) to the spill directory.
+        """
+        if not self._in_scratch(path):
+            return path
+        new_path = os.path.join(self.spill_directory,
+                                os.path.basename(path))
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            if not os.path.isdir(new_path):
+                os.makedirs(new_path)
+        else:
+            release_temporary_file(path)
+        consumers = self.consumers.pop(path)
+        self.consumers[new_path] = consumers
+        for node_id in consumers:
+            inputs = self.node_inputs[node_id]
+            inputs.discard(path)
+            inputs.add(new_path)
+        return new_path
+
+    def after_node(self, node):
+        """ Release the temporaries which are not needed anymore once a
+        node has been executed.
+        """
+        node_id = id(node)
+        for path in self.node_inputs.get(node_id, ()):
+            consumers = self.consumers[path]
+            consumers.discard(node_id)
+            if not consumers:
+                self.release(path)
+        # Outputs with no consumer
+        for index in self.produced.get(node_id, ()):
+            for path in path_values(self.temp_files[index][2]):
+                if not self.consumers.get(path):
+                    self.release(path)
+
+    def release(self, path):
+        """ Delete a temporary and its companion files.
+        """
+        if path in self.released:
+            return
+        logger.debug("Releasing temporary '{0}'".format(path))
+        release_temporary_file(path)
+        self.released.add(path)
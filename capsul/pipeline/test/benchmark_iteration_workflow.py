@@ -0,0 +1,114 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Benchmark of the soma-workflow generation of large iterations.
+
+Prints the time spent per iteration by
+:func:`~capsul.pipeline.pipeline_workflow.workflow_from_pipeline` on a
+pipeline iterating over a simple process, with and without iteration
+templates::
+
+    python -m capsul.pipeline.test.benchmark_iteration_workflow -n 5000
+"""
+
+from __future__ import print_function
+
+# System import
+import sys
+import time
+import optparse
+
+# Trait import
+from traits.api import File, Float
+
+# Capsul import
+from capsul.api import Process
+from capsul.api import Pipeline
+from capsul.pipeline.pipeline_workflow import workflow_from_pipeline
+
+
+class ThresholdProcess(Process):
+    """ Process with a few parameters of each kind
+    """
+    def __init__(self):
+        super(ThresholdProcess, self).__init__()
+        self.add_trait("input_image", File(optional=False))
+        self.add_trait("mask", File(optional=True))
+        self.add_trait("threshold", Float(0.5, optional=True))
+        self.add_trait("output_image", File(optional=False, output=True))
+
+    def _run_process(self):
+        pass
+
+
+class IterationPipeline(Pipeline):
+    """ Pipeline iterating over ThresholdProcess
+    """
+    def pipeline_definition(self):
+        self.add_iterative_process(
+            "threshold",
+            "capsul.pipeline.test.benchmark_iteration_workflow."
+            "ThresholdProcess",
+            iterative_plugs=["input_image", "threshold", "output_image"])
+
+
+def benchmark(size, iteration_templates=True):
+    """ Time the workflow generation of an iteration.
+
+    Parameters
+    ----------
+    size: int
+        number of iterations.
+    iteration_templates: bool (optional, default True)
+        see :func:`workflow_from_pipeline`.
+
+    Returns
+    -------
+    duration: float
+        the generation time, in seconds.
+    """
+    pipeline = IterationPipeline()
+    pipeline.input_image = ["/data/sub%05d/t1.nii" % i for i in range(size)]
+    pipeline.threshold = [0.5 + i * 1e-4 for i in range(size)]
+    pipeline.output_image = ["/data/sub%05d/mask.nii" % i
+                             for i in range(size)]
+    pipeline.mask = "/data/template/brain_mask.nii"
+    start = time.time()
+    workflow = workflow_from_pipeline(
+        pipeline, create_directories=False,
+        iteration_templates=iteration_templates)
+    duration = time.time() - start
+    if len(workflow.jobs) != size:
+        raise RuntimeError("expected {0} jobs, got {1}".format(
+            size, len(workflow.jobs)))
+    return duration
+
+
+def main():
+    parser = optparse.OptionParser(
+        usage="python -m capsul.pipeline.test.benchmark_iteration_workflow "
+              "[-n ITERATIONS]")
+    parser.add_option("-n", "--iterations", dest="iterations", type="int",
+                      default=5000, help="number of iterations")
+    parser.add_option("--no-compare", dest="compare", action="store_false",
+                      default=True,
+                      help="do not time the generation without templates")
+    options, args = parser.parse_args()
+    modes = [("templates", True)]
+    if options.compare:
+        modes.append(("per iteration", False))
+    for label, iteration_templates in modes:
+        duration = benchmark(options.iterations, iteration_templates)
+        print("{0:<14} {1} iterations: {2:.2f}s, {3:.1f}us per "
+              "iteration".format(label, options.iterations, duration,
+                                 duration * 1e6 / options.iterations))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
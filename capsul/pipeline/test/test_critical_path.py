@@ -0,0 +1,119 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from traits.api import File
+from capsul.api import Process
+from capsul.api import Pipeline
+from capsul.pipeline.pipeline_workflow import workflow_from_pipeline
+from capsul.pipeline.critical_path import (
+    RuntimeHistory, critical_path_lengths, rank_priorities)
+
+
+class DeclaredProcess(Process):
+    """ Process declaring its duration
+    """
+    expected_duration = 10.
+
+    def __init__(self):
+        super(DeclaredProcess, self).__init__()
+        self.add_trait("input_image", File(optional=False))
+        self.add_trait("output_image", File(optional=False, output=True))
+
+    def _run_process(self):
+        pass
+
+
+class BranchesPipeline(Pipeline):
+    """ A chain of three processes, and a single one
+    """
+    def pipeline_definition(self):
+        for name in ("node1", "node2", "node3", "node4"):
+            self.add_process(
+                name,
+                "capsul.pipeline.test.test_critical_path.DeclaredProcess")
+        self.add_link("node1.output_image->node2.input_image")
+        self.add_link("node2.output_image->node3.input_image")
+        self.export_parameter("node1", "input_image")
+        self.export_parameter("node3", "output_image")
+        self.export_parameter("node4", "input_image", "single_input")
+        self.export_parameter("node4", "output_image", "single_output")
+
+
+class TestCriticalPath(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="capsul_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_history(self):
+        filename = os.path.join(self.directory, "history", "runtimes.json")
+        history = RuntimeHistory(filename, size=3)
+        for duration in (100., 1., 2., 4.):
+            history.record("process", duration)
+        history.save()
+        history = RuntimeHistory(filename)
+        # the oldest execution is forgotten
+        self.assertEqual(history.get("process"), 2.)
+        history.record("process", 6.)
+        self.assertEqual(history.get("process"), 3.)
+        self.assertEqual(history.get("other", 5.), 5.)
+        self.assertEqual(history.durations(), {"process": 3.})
+
+    def test_lengths(self):
+        successors = {"a": ["b", "c"], "b": ["d"], "c": ["d"]}
+        durations = {"a": 1., "b": 5., "c": 1., "d": 2.}
+        lengths = critical_path_lengths("abcd", successors, durations)
+        self.assertEqual(lengths, {"a": 8., "b": 7., "c": 3., "d": 2.})
+        self.assertEqual(rank_priorities(lengths, 10),
+                         {"a": 13, "b": 12, "c": 11, "d": 10})
+
+    def test_workflow_priorities(self):
+        pipeline = BranchesPipeline()
+        pipeline.input_image = "/data/t1.nii"
+        pipeline.output_image = "/data/out/t1.nii"
+        pipeline.single_input = "/data/t2.nii"
+        pipeline.single_output = "/data/out/t2.nii"
+        workflow = workflow_from_pipeline(
+            pipeline, create_directories=False,
+            critical_path_priorities=True)
+        priorities = dict((job.name, job.priority) for job in workflow.jobs)
+        self.assertEqual(priorities,
+                         {"node1": 2, "node2": 1, "node3": 0, "node4": 0})
+        # the history takes precedence over the declared durations
+        workflow = workflow_from_pipeline(
+            pipeline, create_directories=False, jobs_priority=5,
+            critical_path_priorities=True,
+            runtime_history={DeclaredProcess().id: 1.})
+        priorities = dict((job.name, job.priority) for job in workflow.jobs)
+        self.assertEqual(priorities,
+                         {"node1": 7, "node2": 6, "node3": 5, "node4": 5})
+        # without critical path, the jobs priority is used
+        workflow = workflow_from_pipeline(
+            pipeline, create_directories=False, jobs_priority=5)
+        self.assertEqual(set(job.priority for job in workflow.jobs), set([5]))
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCriticalPath)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,117 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import sys
+import unittest
+from traits.api import File
+from capsul.api import Process
+from capsul.api import Pipeline
+from capsul.pipeline.pipeline_tools import dead_nodes
+
+
+class FileProcess(Process):
+    """ Process reading and writing a file
+    """
+    def __init__(self):
+        super(FileProcess, self).__init__()
+        self.add_trait("input_image", File(optional=False))
+        self.add_trait("output_image", File(optional=False, output=True))
+
+    def _run_process(self):
+        pass
+
+
+class ReportProcess(FileProcess):
+    """ Process writing a report somewhere else than in its outputs
+    """
+    side_effects = True
+
+
+class DeadBranchPipeline(Pipeline):
+    """ Pipeline with branches whose outputs are not exported
+    """
+    def pipeline_definition(self):
+        self.add_process(
+            "node", "capsul.pipeline.test.test_dead_nodes.FileProcess")
+        self.add_process(
+            "main", "capsul.pipeline.test.test_dead_nodes.FileProcess")
+        self.add_process(
+            "side1", "capsul.pipeline.test.test_dead_nodes.FileProcess")
+        self.add_process(
+            "side2", "capsul.pipeline.test.test_dead_nodes.FileProcess")
+        self.add_process(
+            "report", "capsul.pipeline.test.test_dead_nodes.ReportProcess")
+
+        self.export_parameter("node", "input_image")
+        self.add_link("node.output_image->main.input_image")
+        self.add_link("node.output_image->side1.input_image")
+        self.add_link("side1.output_image->side2.input_image")
+        self.add_link("node.output_image->report.input_image")
+        self.export_parameter("main", "output_image")
+
+
+class SideOutputPipeline(Pipeline):
+    """ Pipeline with a branch whose output is automatically exported
+    """
+    def pipeline_definition(self):
+        self.add_process(
+            "node", "capsul.pipeline.test.test_dead_nodes.FileProcess")
+        self.add_process(
+            "main", "capsul.pipeline.test.test_dead_nodes.FileProcess")
+        self.add_process(
+            "side1", "capsul.pipeline.test.test_dead_nodes.FileProcess")
+        self.add_process(
+            "side2", "capsul.pipeline.test.test_dead_nodes.FileProcess")
+
+        self.export_parameter("node", "input_image")
+        self.add_link("node.output_image->main.input_image")
+        self.add_link("node.output_image->side1.input_image")
+        self.add_link("side1.output_image->side2.input_image")
+        self.export_parameter("main", "output_image", "main_image")
+
+
+class TestDeadNodes(unittest.TestCase):
+
+    def setUp(self):
+        # unlinked outputs are not exported: the side branches are dead
+        self.pipeline = DeadBranchPipeline(autoexport_nodes_parameters=False)
+
+    def dead(self):
+        return sorted(node.name for node in dead_nodes(self.pipeline))
+
+    def test_dead_branch(self):
+        self.assertEqual(self.dead(), ["side1", "side2"])
+
+    def test_wanted_output(self):
+        # a file output with a value is wanted
+        self.pipeline.nodes["side2"].process.output_image = "/tmp/side2.nii"
+        self.assertEqual(self.dead(), [])
+
+    def test_side_effects(self):
+        self.pipeline.nodes["side1"].process.side_effects = True
+        self.assertEqual(self.dead(), ["side2"])
+
+    def test_autoexported_output(self):
+        # the side branch output is exported: it is a pipeline output
+        self.pipeline = SideOutputPipeline()
+        self.assertTrue("output_image" in self.pipeline.user_traits())
+        self.assertEqual(self.dead(), [])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestDeadNodes)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,119 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from traits.api import File, Float, Undefined
+from capsul.api import Process
+from capsul.api import Pipeline
+from capsul.pipeline.duplicate_nodes import (
+    duplicate_nodes, alias_temporary_outputs, restore_aliased_outputs,
+    alias_outputs)
+
+
+class FactorProcess(Process):
+    """ Process reading and writing a file
+    """
+    def __init__(self):
+        super(FactorProcess, self).__init__()
+        self.add_trait("input_image", File(optional=False))
+        self.add_trait("factor", Float(1., optional=True))
+        self.add_trait("output_image", File(optional=False, output=True))
+
+    def _run_process(self):
+        pass
+
+
+class DuplicatesPipeline(Pipeline):
+    """ Pipeline with two identical branches
+    """
+    def pipeline_definition(self):
+        for name in ("node", "strip1", "strip2", "other", "out1", "out2"):
+            self.add_process(
+                name,
+                "capsul.pipeline.test.test_duplicate_nodes.FactorProcess")
+        self.export_parameter("node", "input_image")
+        self.add_link("node.output_image->strip1.input_image")
+        self.add_link("node.output_image->strip2.input_image")
+        self.add_link("node.output_image->other.input_image")
+        self.add_link("strip1.output_image->out1.input_image")
+        self.add_link("strip2.output_image->out2.input_image")
+        self.nodes["other"].process.factor = 2.
+        self.export_parameter("out1", "output_image",
+                              pipeline_parameter="output1")
+        self.export_parameter("out2", "output_image",
+                              pipeline_parameter="output2")
+        self.export_parameter("other", "output_image",
+                              pipeline_parameter="output3")
+
+
+class TestDuplicateNodes(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = DuplicatesPipeline()
+        self.pipeline.input_image = "/data/t1.nii"
+
+    def duplicates(self):
+        duplicates = duplicate_nodes(self.pipeline.workflow_ordered_nodes())
+        return sorted((node.name, sorted(dup.name for dup in dups))
+                      for node, dups in duplicates.items())
+
+    def test_duplicates(self):
+        self.assertEqual(self.duplicates(),
+                         [("out1", ["out2"]), ("strip1", ["strip2"])])
+
+    def test_different_inputs(self):
+        self.pipeline.nodes["strip2"].process.factor = 3.
+        self.assertEqual(self.duplicates(), [])
+
+    def test_side_effects(self):
+        self.pipeline.nodes["strip2"].process.side_effects = True
+        self.assertEqual(self.duplicates(), [])
+
+    def test_alias_temporary_outputs(self):
+        strip1 = self.pipeline.nodes["strip1"]
+        strip2 = self.pipeline.nodes["strip2"]
+        out2 = self.pipeline.nodes["out2"]
+        strip1.process.output_image = "/tmp/strip1.nii"
+        aliased = alias_temporary_outputs(strip1, strip2)
+        self.assertEqual(strip2.process.output_image, "/tmp/strip1.nii")
+        self.assertEqual(out2.process.input_image, "/tmp/strip1.nii")
+        restore_aliased_outputs(aliased)
+        self.assertTrue(strip2.process.output_image in (Undefined, ""))
+
+    def test_alias_outputs(self):
+        tmpdir = tempfile.mkdtemp(prefix="capsul_test_")
+        try:
+            out1 = self.pipeline.nodes["out1"]
+            out2 = self.pipeline.nodes["out2"]
+            out1.process.output_image = os.path.join(tmpdir, "out1.nii")
+            out2.process.output_image = os.path.join(tmpdir, "out2.nii")
+            with open(out1.process.output_image, "w") as openfile:
+                openfile.write("result")
+            alias_outputs(out1, out2)
+            with open(out2.process.output_image) as openfile:
+                self.assertEqual(openfile.read(), "result")
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestDuplicateNodes)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
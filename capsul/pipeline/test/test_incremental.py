@@ -0,0 +1,106 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+# System import
+import unittest
+import os
+import time
+import tempfile
+import shutil
+
+# Trait import
+from traits.api import File, Float
+
+# Capsul import
+from capsul.api import Process
+from capsul.pipeline.incremental import IncrementalManifest
+
+
+class DummyCopy(Process):
+    """ Dummy process copying a file.
+    """
+    input = File(output=False, optional=False, desc="input file")
+    factor = Float(1., output=False, optional=True, desc="a parameter")
+    output = File(output=True, optional=False, desc="output file")
+
+    def _run_process(self):
+        with open(self.output, "w") as f:
+            f.write(open(self.input).read())
+
+
+class TestIncremental(unittest.TestCase):
+    """ Test the make-style incremental execution.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="capsul_test_")
+        self.input = os.path.join(self.tmpdir, "input.txt")
+        with open(self.input, "w") as f:
+            f.write("data")
+        # a -> b, c
+        self.processes = []
+        for name in ("a", "b", "c"):
+            process = DummyCopy()
+            process.input = self.input
+            process.output = os.path.join(self.tmpdir, name + ".txt")
+            self.processes.append(process)
+        self.processes[1].input = self.processes[0].output
+        self.names = dict((id(process), name)
+                          for name, process in zip("abc", self.processes))
+        self.manifest_file = os.path.join(self.tmpdir, "manifest.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_stale(self, mode="timestamp"):
+        manifest = IncrementalManifest(self.manifest_file, mode)
+        stale = manifest.stale_nodes(self.processes, self.names)
+        for process in stale:
+            process._run_process()
+            manifest.record(self.names[id(process)], process)
+        manifest.save()
+        return [self.names[id(process)] for process in stale]
+
+    def test_timestamp(self):
+        self.assertEqual(self.run_stale(), ["a", "b", "c"])
+        self.assertEqual(self.run_stale(), [])
+        # a parameter change makes the node and its downstream nodes stale
+        self.processes[0].factor = 2.
+        self.assertEqual(self.run_stale(), ["a", "b"])
+        # an output removed or modified
+        os.unlink(self.processes[2].output)
+        self.assertEqual(self.run_stale(), ["c"])
+        # an input modified
+        time.sleep(0.01)
+        with open(self.input, "w") as f:
+            f.write("new data")
+        self.assertEqual(self.run_stale(), ["a", "b", "c"])
+        self.assertEqual(open(self.processes[1].output).read(), "new data")
+
+    def test_hash(self):
+        self.assertEqual(self.run_stale("hash"), ["a", "b", "c"])
+        # same content, new timestamp: up to date in hash mode
+        with open(self.input, "w") as f:
+            f.write("data")
+        os.utime(self.input, (0, 0))
+        self.assertEqual(self.run_stale("hash"), [])
+        # entries recorded in another mode are stale
+        self.assertEqual(self.run_stale("timestamp"), ["a", "b", "c"])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestIncremental)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -14,6 +14,7 @@ import re
 import os
 import tempfile
 import shutil
+import six
 
 # Trait import
 from traits.api import String, Float, Undefined, List, File
@@ -21,6 +22,7 @@ from traits.api import String, Float, Undefined, List, File
 # Capsul import
 from capsul.api import Process
 from capsul.api import Pipeline
+from capsul.api import StudyConfig
 from capsul.pipeline import pipeline_workflow
 
 debug = False
@@ -207,6 +209,53 @@ class TestPipeline(unittest.TestCase):
                          [self.pipeline.other_input,
                           self.pipeline.other_input])
 
+    def test_parallel_iterations(self):
+        """ Method to test iterations run on several workers
+        """
+        self.pipeline.input_image = [
+            os.path.join(self.directory, name)
+            for name in ("toto", "tutu", "tata", "titi")]
+        self.pipeline.dynamic_parameter = [3, 1, 4, 2]
+        for f in self.pipeline.input_image:
+            open(f, "w").write("input: %s\n" % f)
+        study_config = StudyConfig(modules=[], iteration_workers=3)
+        self.pipeline.set_study_config(study_config)
+        self.pipeline()
+        # outputs are computed in runtime, in the iterations order
+        self.assertEqual([os.path.basename(f)
+                          for f in self.pipeline.output_image],
+                         ["toto-5.0-3.0", "tutu-5.0-1.0", "tata-5.0-4.0",
+                          "titi-5.0-2.0"])
+        self.assertEqual(self.pipeline.other_output, [5.] * 4)
+
+    def test_parallel_iterations_process_copy(self):
+        """ Method to test that the workers get the configured process
+        """
+        iteration = self.pipeline.nodes["iterative"].process
+        iteration.process.add_trait("extra", Float(2.))
+        iteration.process.context_name = "context"
+        copy = iteration._process_copy()
+        self.assertTrue(copy is not iteration.process)
+        self.assertEqual(copy.extra, 2.)
+        self.assertEqual(copy.context_name, "context")
+
+    def test_dynamic_iteration_workflow(self):
+        # outputs computed in runtime and not used: one job per iteration
+        workflow = pipeline_workflow.workflow_from_pipeline(self.pipeline)
+        self.assertEqual(len(workflow.jobs), 2)
+        # outputs computed in runtime and used by the "end" node
+        self.assertRaises(ValueError,
+                          pipeline_workflow.workflow_from_pipeline,
+                          self.small_pipeline)
+        # inputs linked from the "init" node, legitimately empty: no
+        # iteration job
+        self.small_pipeline.files_to_create = []
+        self.small_pipeline.dynamic_parameter = []
+        workflow = pipeline_workflow.workflow_from_pipeline(
+            self.small_pipeline)
+        self.assertFalse([job for job in workflow.jobs
+                          if job.name.startswith("DummyProcess")])
+
     def test_iterative_pipeline_workflow(self):
         self.small_pipeline.output_image = [
             os.path.join(self.directory, 'toto_out'),
@@ -223,6 +272,22 @@ class TestPipeline(unittest.TestCase):
         # iterative jobs -> iterative output barrier (2)
         self.assertEqual(len(workflow.dependencies), 6)
 
+    def test_iteration_templates(self):
+        self.small_pipeline.output_image = [
+            os.path.join(self.directory, 'toto_out'),
+            os.path.join(self.directory, 'tutu_out')]
+        self.small_pipeline.other_output = [1., 2.]
+        commands = []
+        for iteration_templates in (True, False):
+            workflow = pipeline_workflow.workflow_from_pipeline(
+                self.small_pipeline, iteration_templates=iteration_templates)
+            commands.append(sorted(
+                (job.name, [arg for arg in job.command
+                            if isinstance(arg, six.string_types)])
+                for job in workflow.jobs))
+        # the same jobs as when values are set on the process
+        self.assertEqual(commands[0], commands[1])
+
     def test_iterative_big_pipeline_workflow(self):
         self.big_pipeline.files_to_create = [["toto", "tutu"],
                                          ["tata", "titi", "tete"]]
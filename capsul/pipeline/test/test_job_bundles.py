@@ -0,0 +1,128 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from traits.api import File
+from capsul.api import Process
+from capsul.api import Pipeline
+from capsul.pipeline.pipeline_workflow import workflow_from_pipeline
+from capsul.pipeline.job_bundles import run_command
+
+
+class ShortProcess(Process):
+    """ Process declaring a short duration
+    """
+    expected_duration = 0.1
+
+    def __init__(self):
+        super(ShortProcess, self).__init__()
+        self.add_trait("input_image", File(optional=False))
+        self.add_trait("output_image", File(optional=False, output=True))
+
+    def _run_process(self):
+        pass
+
+
+class ChainPipeline(Pipeline):
+    """ Three short processes in a row
+    """
+    def pipeline_definition(self):
+        for name in ("node1", "node2", "node3"):
+            self.add_process(
+                name, "capsul.pipeline.test.test_job_bundles.ShortProcess")
+        self.add_link("node1.output_image->node2.input_image")
+        self.add_link("node2.output_image->node3.input_image")
+        self.export_parameter("node1", "input_image")
+        self.export_parameter("node3", "output_image")
+
+
+class IterationPipeline(Pipeline):
+    """ Iteration over a short process
+    """
+    def pipeline_definition(self):
+        self.add_iterative_process(
+            "short", "capsul.pipeline.test.test_job_bundles.ShortProcess",
+            iterative_plugs=["input_image", "output_image"])
+
+
+class TestJobBundles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="capsul_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_chain(self):
+        pipeline = ChainPipeline()
+        pipeline.input_image = "/data/t1.nii"
+        pipeline.output_image = "/data/out/t1.nii"
+        workflow = workflow_from_pipeline(
+            pipeline, create_directories=False, bundle_duration=1.)
+        self.assertEqual(len(workflow.jobs), 1)
+        self.assertEqual(workflow.jobs[0].command[:3],
+                         ["python", "-m", "capsul.pipeline.job_bundles"])
+        # bundles are filled up to the duration limit
+        workflow = workflow_from_pipeline(
+            pipeline, create_directories=False, bundle_duration=0.25)
+        self.assertEqual(len(workflow.jobs), 2)
+        self.assertEqual(len(workflow.dependencies), 1)
+        # long jobs
+        workflow = workflow_from_pipeline(
+            pipeline, create_directories=False, bundle_duration=0.05)
+        self.assertEqual(len(workflow.jobs), 3)
+        # the runtime history takes precedence over the declared durations,
+        # as for critical-path priorities
+        workflow = workflow_from_pipeline(
+            pipeline, create_directories=False, bundle_duration=1.,
+            runtime_history={ShortProcess().id: 2.})
+        self.assertEqual(len(workflow.jobs), 3)
+
+    def test_iteration(self):
+        pipeline = IterationPipeline()
+        pipeline.input_image = ["/data/sub%d/t1.nii" % i for i in range(4)]
+        pipeline.output_image = ["/data/sub%d/mask.nii" % i
+                                 for i in range(4)]
+        workflow = workflow_from_pipeline(
+            pipeline, create_directories=False, bundle_duration=0.25)
+        self.assertEqual(len(workflow.jobs), 2)
+        for job in workflow.jobs:
+            self.assertEqual(len([arg for arg in job.command
+                                  if arg == "-c"]), 2)
+
+    def test_run_command(self):
+        filename = os.path.join(self.directory, "result")
+        self.assertEqual(run_command(
+            ["python", "-c",
+             "import sys; open(sys.argv[1], 'w').write('done')", filename]),
+            0)
+        with open(filename) as openfile:
+            self.assertEqual(openfile.read(), "done")
+        self.assertEqual(run_command(
+            ["python", "-c", "import sys; sys.exit(int(sys.argv[1]))", "3"]),
+            3)
+        self.assertEqual(run_command(
+            ["python", "-c", "raise ValueError('failed')"]), 1)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestJobBundles)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,126 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import sys
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+from distutils.spawn import find_executable
+from traits.api import File
+from capsul.api import Process
+from capsul.api import Pipeline
+from capsul.pipeline.pipeline_export import save_makefile
+from capsul.pipeline.pipeline_export import save_shell_script
+
+
+class CopyProcess(Process):
+    """ Process copying a file
+    """
+    def __init__(self):
+        super(CopyProcess, self).__init__()
+        self.add_trait("input_image", File(optional=False))
+        self.add_trait("output_image", File(optional=False, output=True))
+
+    def _run_process(self):
+        with open(self.input_image) as input_file:
+            with open(self.output_image, "w") as output_file:
+                output_file.write(input_file.read())
+
+
+class CopyPipeline(Pipeline):
+    """ Copies exchanging a temporary file, and iterated copies
+    """
+    def pipeline_definition(self):
+        self.add_process(
+            "node1", "capsul.pipeline.test.test_pipeline_export.CopyProcess")
+        self.add_process(
+            "node2", "capsul.pipeline.test.test_pipeline_export.CopyProcess")
+        self.add_iterative_process(
+            "copies", "capsul.pipeline.test.test_pipeline_export.CopyProcess",
+            iterative_plugs=["input_image", "output_image"])
+        self.add_link("node1.output_image->node2.input_image")
+        self.export_parameter("node1", "input_image")
+        self.export_parameter("node2", "output_image")
+        self.export_parameter("copies", "input_image", "inputs")
+        self.export_parameter("copies", "output_image", "outputs")
+
+
+class TestPipelineExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="capsul_test_")
+        self.pipeline = CopyPipeline()
+        self.pipeline.input_image = self.write_input("input")
+        self.pipeline.output_image = os.path.join(self.directory, "out",
+                                                  "output")
+        self.pipeline.inputs = [self.write_input("input{0}".format(i))
+                                for i in range(3)]
+        self.pipeline.outputs = [
+            os.path.join(self.directory, "out", "output{0}".format(i))
+            for i in range(3)]
+        self.env = dict(os.environ)
+        self.env["PYTHON"] = sys.executable
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_input(self, name):
+        filename = os.path.join(self.directory, name)
+        with open(filename, "w") as openfile:
+            openfile.write(name)
+        return filename
+
+    def check_outputs(self):
+        with open(self.pipeline.output_image) as openfile:
+            self.assertEqual(openfile.read(), "input")
+        for i, output in enumerate(self.pipeline.outputs):
+            with open(output) as openfile:
+                self.assertEqual(openfile.read(), "input{0}".format(i))
+
+    def test_makefile(self):
+        if find_executable("make") is None:
+            self.skipTest("make is not available")
+        makefile = os.path.join(self.directory, "pipeline.mk")
+        save_makefile(self.pipeline, makefile)
+        # the temporary values are reset
+        self.assertEqual(self.pipeline.nodes["node2"].process.input_image,
+                         self.pipeline.nodes["node1"].process.output_image)
+        subprocess.check_call(["make", "-j", "2", "-f", makefile],
+                              env=self.env)
+        self.check_outputs()
+        # the temporary file is deleted, and nothing has to run again
+        self.assertEqual(os.listdir(os.path.join(self.directory,
+                                                 "pipeline.tmp")),
+                         ["stamps"])
+        output = subprocess.check_output(
+            ["make", "-f", makefile, "all"], env=self.env)
+        self.assertIn(b"Nothing to be done", output)
+
+    def test_shell_script(self):
+        script = os.path.join(self.directory, "pipeline.sh")
+        save_shell_script(self.pipeline, script)
+        subprocess.check_call(["sh", script], env=self.env)
+        self.check_outputs()
+        self.assertEqual(os.listdir(os.path.join(self.directory,
+                                                 "pipeline.tmp")), [])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPipelineExport)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
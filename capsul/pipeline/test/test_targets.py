@@ -0,0 +1,70 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import sys
+import os
+import tempfile
+import unittest
+from capsul.pipeline.pipeline_tools import nodes_needed_for_outputs
+from capsul.pipeline.test.test_switch_pipeline import SwitchPipeline
+from capsul.utils.stat_cache import StatCache
+
+
+class TestTargets(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = SwitchPipeline()
+
+    def needed(self, targets, **kwargs):
+        return sorted(node.name for node in nodes_needed_for_outputs(
+            self.pipeline, targets, **kwargs))
+
+    def test_targets(self):
+        self.pipeline.switch = "two"
+        self.assertEqual(self.needed(["result_image"]),
+                         ["node", "way21", "way22"])
+        self.assertEqual(self.needed(["hard_output"]), ["node"])
+        self.pipeline.switch = "one"
+        self.assertEqual(self.needed(["result_image"]), ["node", "way1"])
+        self.assertEqual(self.needed(["result_image", "hard_output"]),
+                         ["node", "way1"])
+        self.assertRaises(ValueError, self.needed, ["input_image"])
+        self.assertRaises(ValueError, self.needed, ["unknown"])
+
+    def test_skip_existing(self):
+        self.pipeline.switch = "two"
+        tmpfile = tempfile.mkstemp(prefix="capsul_test_")
+        os.close(tmpfile[0])
+        try:
+            self.pipeline.nodes["way22"].process.output_image = tmpfile[1]
+            self.assertEqual(self.needed(["result_image"]),
+                             ["node", "way21", "way22"])
+            self.assertEqual(
+                self.needed(["result_image"], skip_existing=True,
+                            stat_cache=StatCache()), [])
+            self.assertEqual(
+                self.needed(["result_image"], skip_existing=True), [])
+        finally:
+            os.unlink(tmpfile[1])
+        # each call sees the current files
+        self.assertEqual(self.needed(["result_image"], skip_existing=True),
+                         ["node", "way21", "way22"])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTargets)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
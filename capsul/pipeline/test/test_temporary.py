@@ -12,10 +12,14 @@ import unittest
 import os
 import sys
 import tempfile
+import shutil
+import stat
 from traits.api import File, List, Int, Undefined
 from capsul.api import Process
 from capsul.api import Pipeline, PipelineNode
 from capsul.pipeline import pipeline_workflow
+from capsul.pipeline.temporary_files import (
+    TemporaryFilesTracker, release_temporary_file)
 from capsul.study_config.study_config import StudyConfig
 
 
@@ -89,6 +93,84 @@ class DummyProcess3(Process):
             for in_filename in self.input:
                 f.write(open(in_filename).read())
 
+class StreamWriter(Process):
+    """ Dummy Test Process writing a streamable file
+    """
+    def __init__(self):
+        super(StreamWriter, self).__init__()
+        self.add_trait("input", File(optional=False))
+        self.add_trait("output", File(output=True, streamable=True))
+
+    def _run_process(self):
+        with open(self.output, 'w') as f:
+            f.write(self.input + '\n')
+
+class StreamReader(Process):
+    """ Dummy Test Process reading a streamable file
+    """
+    def __init__(self):
+        super(StreamReader, self).__init__()
+        self.add_trait("input", File(optional=False, streamable=True))
+        self.add_trait("output", File(output=True))
+
+    def _run_process(self):
+        with open(self.output, 'w') as f:
+            f.write(open(self.input).read())
+
+class DoubleStreamWriter(Process):
+    """ Dummy Test Process writing two streamable files, the second one
+    first
+    """
+    def __init__(self):
+        super(DoubleStreamWriter, self).__init__()
+        self.add_trait("input", File(optional=False))
+        self.add_trait("output1", File(output=True, streamable=True))
+        self.add_trait("output2", File(output=True, streamable=True))
+
+    def _run_process(self):
+        with open(self.output2, 'w') as f:
+            f.write('2: ' + self.input + '\n')
+        with open(self.output1, 'w') as f:
+            f.write('1: ' + self.input + '\n')
+
+class DoubleStreamReader(Process):
+    """ Dummy Test Process reading two streamable files, the first one
+    first
+    """
+    def __init__(self):
+        super(DoubleStreamReader, self).__init__()
+        self.add_trait("input1", File(optional=False, streamable=True))
+        self.add_trait("input2", File(optional=False, streamable=True))
+        self.add_trait("output", File(output=True))
+
+    def _run_process(self):
+        with open(self.output, 'w') as f:
+            f.write(open(self.input1).read())
+            f.write(open(self.input2).read())
+
+class StreamPipeline(Pipeline):
+
+    def pipeline_definition(self):
+        self.add_process(
+            "writer",
+            'capsul.pipeline.test.test_temporary.StreamWriter')
+        self.add_process(
+            "reader",
+            'capsul.pipeline.test.test_temporary.StreamReader')
+        self.add_link("writer.output->reader.input")
+
+class DoubleStreamPipeline(Pipeline):
+
+    def pipeline_definition(self):
+        self.add_process(
+            "writer",
+            'capsul.pipeline.test.test_temporary.DoubleStreamWriter')
+        self.add_process(
+            "reader",
+            'capsul.pipeline.test.test_temporary.DoubleStreamReader')
+        self.add_link("writer.output1->reader.input1")
+        self.add_link("writer.output2->reader.input2")
+
 class DummyPipeline(Pipeline):
 
     def pipeline_definition(self):
@@ -168,6 +250,162 @@ class TestTemporary(unittest.TestCase):
         res_out = open(self.pipeline.output).readlines()
         self.assertEqual(len(res_out), 3)
 
+    def test_stable_names(self):
+        self.pipeline.nb_outputs = 3
+        temp_directory = tempfile.mkdtemp(prefix='capsul_test_')
+        try:
+            def allocate():
+                temporary_files = []
+                for node in self.pipeline.workflow_ordered_nodes():
+                    self.pipeline._check_temporary_files_for_node(
+                        node, temporary_files, temp_directory)
+                names = list(self.pipeline.nodes["node2"].process.output)
+                self.pipeline._free_temporary_files(temporary_files)
+                return names
+            names1 = allocate()
+            names2 = allocate()
+            self.assertEqual(len(names1), 3)
+            self.assertEqual(len(set(names1)), 3)
+            self.assertEqual(names1, names2)
+            for name in names1:
+                self.assertEqual(os.path.dirname(name), temp_directory)
+            self.assertEqual(self.pipeline.nodes["node2"].process.output,
+                             ["", "", ""])
+            # changing an upstream input changes downstream names
+            self.pipeline.input = '/tmp/other_file_in.nii'
+            names3 = allocate()
+            self.assertEqual(len(set(names1).intersection(names3)), 0)
+        finally:
+            shutil.rmtree(temp_directory)
+
+    def test_early_release(self):
+        self.pipeline.nb_outputs = 2
+        temporary_files = []
+        nodes = self.pipeline.workflow_ordered_nodes()
+        for node in nodes:
+            self.pipeline._check_temporary_files_for_node(
+                node, temporary_files)
+        tracker = TemporaryFilesTracker(nodes, temporary_files)
+        try:
+            temp1 = list(self.pipeline.nodes["node1"].process.output)
+            temp2 = list(self.pipeline.nodes["node2"].process.output)
+            self.assertEqual(len(tracker.consumers), 4)
+            for node in nodes:
+                tracker.before_node(node)
+                # "execute" the node: write its outputs
+                outputs = node.process.output
+                if not isinstance(outputs, list):
+                    outputs = [outputs]
+                for name in outputs:
+                    open(name, 'w').close()
+                tracker.after_node(node)
+                if node.name == "node2":
+                    # node1 outputs are not needed anymore
+                    self.assertFalse(any(os.path.exists(name)
+                                         for name in temp1))
+                    self.assertTrue(all(os.path.exists(name)
+                                        for name in temp2))
+            self.assertFalse(any(os.path.exists(name) for name in temp2))
+        finally:
+            self.pipeline._free_temporary_files(temporary_files)
+
+        # companion files are released together
+        tmpdir = tempfile.mkdtemp(prefix='capsul_test_')
+        try:
+            for ext in ('.img', '.hdr', '.img.minf'):
+                open(os.path.join(tmpdir, 'image' + ext), 'w').close()
+            release_temporary_file(os.path.join(tmpdir, 'image.img'))
+            self.assertEqual(os.listdir(tmpdir), [])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @unittest.skipIf(not hasattr(os, 'mkfifo'), 'named pipes not supported')
+    def test_streaming(self):
+        pipeline = StreamPipeline()
+        pipeline.input = '/tmp/file_in.nii'
+        pipeline.output = self.output
+        nodes = pipeline.workflow_ordered_nodes()
+        temporary_files = []
+        for node in nodes:
+            pipeline._check_temporary_files_for_node(
+                node, temporary_files, allow_fifos=True)
+        try:
+            fifo = pipeline.nodes["writer"].process.output
+            self.assertTrue(stat.S_ISFIFO(os.stat(fifo).st_mode))
+            tracker = TemporaryFilesTracker(nodes, temporary_files)
+            self.assertEqual(
+                tracker.streams[id(pipeline.nodes["writer"])],
+                ([fifo], set([id(pipeline.nodes["reader"])])))
+        finally:
+            pipeline._free_temporary_files(temporary_files)
+
+        # writer and reader run concurrently
+        self.study_config.use_soma_workflow = False
+        self.study_config.run(pipeline)
+        self.assertEqual(open(self.output).read(), '/tmp/file_in.nii\n')
+
+    @unittest.skipIf(not hasattr(os, 'mkfifo'), 'named pipes not supported')
+    def test_double_streaming(self):
+        pipeline = DoubleStreamPipeline()
+        pipeline.input = '/tmp/file_in.nii'
+        pipeline.output = self.output
+        nodes = pipeline.workflow_ordered_nodes()
+        temporary_files = []
+        for node in nodes:
+            pipeline._check_temporary_files_for_node(
+                node, temporary_files, allow_fifos=True)
+        try:
+            tracker = TemporaryFilesTracker(nodes, temporary_files)
+            # the reader reads two outputs of the writer: it can't stream
+            # one and wait for the other
+            self.assertEqual(tracker.streams, {})
+            writer = pipeline.nodes["writer"].process
+            for path in (writer.output1, writer.output2):
+                self.assertFalse(stat.S_ISFIFO(os.stat(path).st_mode))
+        finally:
+            pipeline._free_temporary_files(temporary_files)
+
+        # the writer opens its outputs in another order than the reader
+        self.study_config.use_soma_workflow = False
+        self.study_config.run(pipeline)
+        self.assertEqual(open(self.output).read(),
+                         '1: /tmp/file_in.nii\n2: /tmp/file_in.nii\n')
+
+    def test_scratch_budget(self):
+        tmpdir = tempfile.mkdtemp(prefix='capsul_test_')
+        try:
+            scratch = os.path.join(tmpdir, 'scratch')
+            spill = os.path.join(tmpdir, 'spill')
+            os.mkdir(scratch)
+            input_file = os.path.join(tmpdir, 'input.txt')
+            with open(input_file, 'w') as f:
+                f.write('x' * 1000)
+            for budget, spilled in ((5000, False), (500, True)):
+                pipeline = StreamPipeline()
+                pipeline.input = input_file
+                pipeline.output = self.output
+                nodes = pipeline.workflow_ordered_nodes()
+                temporary_files = []
+                for node in nodes:
+                    pipeline._check_temporary_files_for_node(
+                        node, temporary_files, scratch_directory=scratch)
+                try:
+                    tracker = TemporaryFilesTracker(
+                        nodes, temporary_files, scratch_directory=scratch,
+                        budget=budget, spill_directory=spill)
+                    writer = pipeline.nodes["writer"]
+                    self.assertEqual(tracker.expected_size(writer), 1000)
+                    # nothing is allocated yet, but the writer output is
+                    # not expected to fit in a small budget
+                    tracker.before_node(writer)
+                    self.assertEqual(
+                        os.path.dirname(writer.process.output),
+                        spill if spilled else scratch)
+                finally:
+                    pipeline._free_temporary_files(temporary_files)
+        finally:
+            shutil.rmtree(tmpdir)
+
     def test_full_wf(self):
         self.study_config.use_soma_workflow = True
         self.pipeline.nb_outputs = 3
@@ -0,0 +1,105 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import sys
+import shutil
+import tempfile
+import unittest
+from traits.api import File, Float
+from capsul.api import Process
+from capsul.api import Pipeline
+from capsul.pipeline.workflow_cache import WorkflowCache
+
+
+class ScaleProcess(Process):
+    """ Process with a file and a value parameter
+    """
+    def __init__(self):
+        super(ScaleProcess, self).__init__()
+        self.add_trait("input_image", File(optional=False))
+        self.add_trait("factor", Float(1., optional=True))
+        self.add_trait("output_image", File(optional=False, output=True))
+
+    def _run_process(self):
+        pass
+
+
+class ScalePipeline(Pipeline):
+    """ Two processes exchanging a temporary file
+    """
+    def pipeline_definition(self):
+        self.add_process(
+            "node1", "capsul.pipeline.test.test_workflow_cache.ScaleProcess")
+        self.add_process(
+            "node2", "capsul.pipeline.test.test_workflow_cache.ScaleProcess")
+        self.add_link("node1.output_image->node2.input_image")
+        self.export_parameter("node1", "input_image")
+        self.export_parameter("node1", "factor")
+        self.export_parameter("node2", "output_image")
+
+
+class TestWorkflowCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="capsul_test_")
+        self.pipeline = self.new_pipeline()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def new_pipeline():
+        pipeline = ScalePipeline()
+        pipeline.input_image = "/data/t1.nii"
+        pipeline.output_image = "/data/out/t1_scaled.nii"
+        return pipeline
+
+    def node1_job(self, workflow):
+        return [job for job in workflow.jobs if job.name == "node1"][0]
+
+    def test_hit(self):
+        cache = WorkflowCache()
+        workflow = cache.get_workflow(self.pipeline)
+        self.assertTrue(cache.get_workflow(self.pipeline) is workflow)
+        # same structure and values
+        self.assertTrue(cache.get_workflow(self.new_pipeline()) is workflow)
+        # other generation options
+        self.assertFalse(cache.get_workflow(
+            self.pipeline, create_directories=False) is workflow)
+
+    def test_patch(self):
+        cache = WorkflowCache()
+        workflow = cache.get_workflow(self.pipeline)
+        self.assertTrue('"factor": 1.0' in self.node1_job(workflow).command[2])
+        self.pipeline.factor = 2.
+        self.assertTrue(cache.get_workflow(self.pipeline) is workflow)
+        self.assertTrue('"factor": 2.0' in self.node1_job(workflow).command[2])
+        self.pipeline.input_image = "/data/t2.nii"
+        self.assertTrue(cache.get_workflow(self.pipeline) is workflow)
+        self.assertTrue("/data/t2.nii" in self.node1_job(workflow).command)
+
+    def test_directory(self):
+        workflow = WorkflowCache(self.directory).get_workflow(self.pipeline)
+        cache = WorkflowCache(self.directory)
+        cached_workflow = cache.get_workflow(self.pipeline)
+        self.assertEqual(len(cached_workflow.jobs), len(workflow.jobs))
+        self.assertEqual(len(cache.entries), 1)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestWorkflowCache)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
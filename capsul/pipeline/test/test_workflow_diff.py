@@ -0,0 +1,131 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from traits.api import File
+from soma_workflow import constants as swconstants
+from capsul.api import Process
+from capsul.api import Pipeline
+from capsul.pipeline.pipeline_workflow import workflow_from_pipeline
+from capsul.pipeline.workflow_engine import LocalWorkflowController
+from capsul.pipeline.workflow_diff import WorkflowRecord
+
+
+class CopyProcess(Process):
+    """ Process copying a file
+    """
+    def __init__(self):
+        super(CopyProcess, self).__init__()
+        self.add_trait("input_image", File(optional=False))
+        self.add_trait("output_image", File(optional=False, output=True))
+
+    def _run_process(self):
+        with open(self.input_image) as input_file:
+            with open(self.output_image, "w") as output_file:
+                output_file.write(input_file.read())
+
+
+class DiffPipeline(Pipeline):
+    """ Two copies exchanging a temporary file, and an independent copy
+    """
+    def pipeline_definition(self):
+        for name in ("node1", "node2", "node3"):
+            self.add_process(
+                name, "capsul.pipeline.test.test_workflow_diff.CopyProcess")
+        self.add_link("node1.output_image->node2.input_image")
+        self.export_parameter("node1", "input_image")
+        self.export_parameter("node2", "output_image")
+        self.export_parameter("node3", "input_image", "other_input")
+        self.export_parameter("node3", "output_image", "other_output")
+
+
+class TestWorkflowDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="capsul_test_")
+        self.pipeline = DiffPipeline()
+        for name in ("input", "other_input"):
+            filename = os.path.join(self.directory, name)
+            with open(filename, "w") as openfile:
+                openfile.write(name)
+        self.pipeline.input_image = os.path.join(self.directory, "input")
+        self.pipeline.output_image = os.path.join(self.directory, "output")
+        self.pipeline.other_input = os.path.join(self.directory,
+                                                 "other_input")
+        self.pipeline.other_output = os.path.join(self.directory,
+                                                  "other_output")
+        self.record_file = os.path.join(self.directory, "record.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_workflow(self, workflow):
+        controller = LocalWorkflowController(workers=2)
+        wf_id = controller.submit_workflow(workflow, name="test")
+        controller.wait_workflow(wf_id)
+        self.assertEqual(controller.workflow_status(wf_id),
+                         swconstants.WORKFLOW_DONE)
+        controller.delete_workflow(wf_id)
+
+    def changed_names(self):
+        workflow = workflow_from_pipeline(self.pipeline,
+                                          create_directories=False)
+        record = WorkflowRecord(self.record_file)
+        incremental = record.incremental_workflow(workflow)
+        return workflow, incremental, sorted(job.name
+                                             for job in incremental.jobs)
+
+    def run_incremental(self):
+        workflow, incremental, names = self.changed_names()
+        if incremental.jobs:
+            self.run_workflow(incremental)
+        record = WorkflowRecord(self.record_file)
+        record.record(workflow)
+        record.save()
+        return names
+
+    def test_incremental(self):
+        self.assertEqual(self.run_incremental(),
+                         ["node1", "node2", "node3"])
+        # nothing changed
+        self.assertEqual(self.changed_names()[2], [])
+        # a changed input
+        with open(self.pipeline.other_input, "w") as openfile:
+            openfile.write("modified input")
+        self.assertEqual(self.run_incremental(), ["node3"])
+        with open(self.pipeline.other_output) as openfile:
+            self.assertEqual(openfile.read(), "modified input")
+        # a changed parameter: node1 writes the temporary file read by node2
+        self.pipeline.output_image = os.path.join(self.directory,
+                                                  "new_output")
+        workflow, incremental, names = self.changed_names()
+        self.assertEqual(names, ["node1", "node2"])
+        self.assertEqual(len(incremental.dependencies), 1)
+        # a missing output
+        os.unlink(self.pipeline.other_output)
+        self.assertEqual(self.run_incremental(),
+                         ["node1", "node2", "node3"])
+        self.assertTrue(os.path.exists(self.pipeline.other_output))
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestWorkflowDiff)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
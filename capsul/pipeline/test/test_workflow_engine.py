@@ -0,0 +1,111 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from traits.api import File, Bool
+from soma_workflow import constants as swconstants
+from capsul.api import Process
+from capsul.api import Pipeline
+from capsul.pipeline.pipeline_workflow import workflow_from_pipeline
+from capsul.pipeline.workflow_engine import LocalWorkflowController
+
+
+class CopyProcess(Process):
+    """ Process copying a file, or failing
+    """
+    def __init__(self):
+        super(CopyProcess, self).__init__()
+        self.add_trait("input_image", File(optional=False))
+        self.add_trait("fail", Bool(False, optional=True))
+        self.add_trait("output_image", File(optional=False, output=True))
+
+    def _run_process(self):
+        if self.fail:
+            raise RuntimeError("failure requested")
+        with open(self.input_image) as input_file:
+            with open(self.output_image, "w") as output_file:
+                output_file.write(input_file.read())
+
+
+class CopyPipeline(Pipeline):
+    """ Two copies exchanging a temporary file
+    """
+    def pipeline_definition(self):
+        self.add_process(
+            "node1", "capsul.pipeline.test.test_workflow_engine.CopyProcess")
+        self.add_process(
+            "node2", "capsul.pipeline.test.test_workflow_engine.CopyProcess")
+        self.add_link("node1.output_image->node2.input_image")
+        self.export_parameter("node1", "input_image")
+        self.export_parameter("node1", "fail")
+        self.export_parameter("node2", "output_image")
+
+
+class TestWorkflowEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="capsul_test_")
+        self.pipeline = CopyPipeline()
+        self.pipeline.input_image = os.path.join(self.directory, "input")
+        self.pipeline.output_image = os.path.join(self.directory, "output")
+        with open(self.pipeline.input_image, "w") as openfile:
+            openfile.write("data")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_workflow(self):
+        workflow = workflow_from_pipeline(self.pipeline,
+                                          create_directories=False)
+        controller = LocalWorkflowController(workers=2)
+        wf_id = controller.submit_workflow(workflow, name="test")
+        controller.wait_workflow(wf_id)
+        self.assertEqual(controller.workflow_status(wf_id),
+                         swconstants.WORKFLOW_DONE)
+        status = dict((element[0], element[1:])
+                      for element in controller.workflow_elements_status(
+                          wf_id)[0])
+        controller.delete_workflow(wf_id)
+        return status
+
+    def test_run(self):
+        status = self.run_workflow()
+        self.assertEqual(len(status), 2)
+        for job_status in status.values():
+            self.assertEqual(job_status[0], swconstants.DONE)
+            self.assertEqual(job_status[2][0],
+                             swconstants.FINISHED_REGULARLY)
+        with open(self.pipeline.output_image) as openfile:
+            self.assertEqual(openfile.read(), "data")
+
+    def test_failure(self):
+        self.pipeline.fail = True
+        status = self.run_workflow()
+        exit_status = sorted(job_status[2][0]
+                             for job_status in status.values())
+        self.assertEqual(exit_status, sorted(
+            [swconstants.FINISHED_REGULARLY, swconstants.EXIT_NOTRUN]))
+        self.assertFalse(os.path.exists(self.pipeline.output_image))
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestWorkflowEngine)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,424 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Cache of the soma-workflow workflows generated from pipelines.
+
+Workflows are indexed by a structural fingerprint of the pipeline (nodes,
+processes, links, activations and switches values) and the generation
+options. The parameters values of the leaf nodes are stored with the
+workflow. When a pipeline with the same structure is submitted again:
+
+* if no parameter changed, the cached workflow is returned.
+* if some parameters changed, the command lines of the jobs of the
+  modified processes are patched in the cached workflow.
+* otherwise, when the changes can't be patched (temporary files,
+  translated or transferred paths, iterations...), the workflow is
+  generated again.
+
+::
+
+    cache = WorkflowCache("/home/me/.cache/capsul_workflows")
+    workflow = cache.get_workflow(pipeline, study_config)
+
+Cached workflows are kept in memory, and in a directory if one is given.
+"""
+
+# System import
+import os
+import json
+import hashlib
+import logging
+import six
+
+# Trait import
+from traits.api import Undefined
+
+# Capsul import
+from capsul.pipeline.pipeline import Pipeline
+from capsul.pipeline.pipeline_nodes import Switch
+from capsul.pipeline import pipeline_tools
+from capsul.process.process import Process
+from capsul.utils.fingerprint import value_fingerprint
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+def _nodes(pipeline):
+    """ Iterate over the nodes of a pipeline and its sub-pipelines.
+
+    Yields
+    ------
+    (full_name, node)
+    """
+    todo = [("", pipeline)]
+    while todo:
+        prefix, pipeline = todo.pop(0)
+        for node_name in sorted(pipeline.nodes):
+            node = pipeline.nodes[node_name]
+            if node_name == "":
+                continue
+            full_name = prefix + node_name
+            yield full_name, node
+            process = getattr(node, "process", None)
+            if isinstance(process, Pipeline):
+                todo.append((full_name + ".", process))
+
+
+def _json_value(value):
+    """ Convert a parameter value to a JSON compatible value.
+
+    Temporary paths (see :func:`workflow_from_pipeline`) are converted to
+    strings. Empty values (Undefined, None and empty strings) are all
+    converted to None. Values which are not JSON compatible raise a
+    TypeError.
+    """
+    if value is Undefined or value is None \
+            or (isinstance(value, six.string_types) and not value):
+        return None
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, _json_value(item))
+                    for key, item in six.iteritems(value))
+    if hasattr(value, "pattern"):
+        # temporary path
+        return str(value)
+    if isinstance(value, (six.string_types, bool, float) +
+                  six.integer_types):
+        return value
+    raise TypeError("{0!r} is not JSON compatible".format(value))
+
+
+def pipeline_structure(pipeline):
+    """ Get a description of a pipeline structure: its nodes, their
+    processes, activations, links and switches values, recursively.
+
+    Parameters values are not part of the structure (see
+    :func:`pipeline_parameters`).
+
+    Returns
+    -------
+    structure: list
+        JSON compatible description.
+    """
+    structure = [getattr(pipeline, "id", pipeline.__class__.__name__)]
+    for full_name, node in _nodes(pipeline):
+        process = getattr(node, "process", None)
+        links = []
+        for plug_name in sorted(node.plugs):
+            plug = node.plugs[plug_name]
+            links.append([plug_name, plug.activated, plug.enabled] + sorted(
+                "{0}.{1}".format(link[0], link[1])
+                for link in plug.links_to))
+        item = [full_name, node.__class__.__name__,
+                getattr(process, "id", None), node.activated, node.enabled,
+                links]
+        if isinstance(node, Switch):
+            item.append(node.switch)
+        structure.append(item)
+    return structure
+
+
+def _parameter_value(value):
+    """ Get the fingerprint of a parameter value. Temporary paths, which are
+    only set during the workflow generation, are empty values.
+    """
+    if hasattr(value, "pattern"):
+        return None
+    if isinstance(value, (list, tuple)):
+        return [_parameter_value(item) for item in value]
+    return value_fingerprint(value)
+
+
+def pipeline_parameters(pipeline):
+    """ Get the parameters values of the leaf nodes of a pipeline.
+
+    Returns
+    -------
+    parameters: dict
+        {node_full_name: {parameter: value}}, JSON compatible.
+    """
+    parameters = {}
+    for full_name, node in _nodes(pipeline):
+        process = getattr(node, "process", None)
+        if process is None or isinstance(process, Pipeline):
+            continue
+        parameters[full_name] = dict(
+            (name, _parameter_value(getattr(process, name, Undefined)))
+            for name in process.user_traits())
+    return parameters
+
+
+def _digest(obj):
+    return hashlib.md5(
+        json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class WorkflowCache(object):
+    """ Cache of the workflows generated by
+    :func:`~capsul.pipeline.pipeline_workflow.workflow_from_pipeline`.
+
+    Attributes
+    ----------
+    directory: str
+        the directory where workflows are saved (None: memory only).
+    entries: dict
+        {key: {'parameters': dict, 'jobs': dict, 'workflow': Workflow}}
+    """
+
+    def __init__(self, directory=None):
+        """ Initialize the WorkflowCache class.
+
+        Parameters
+        ----------
+        directory: str (optional)
+            the directory where workflows are saved. Default: memory only.
+        """
+        self.directory = directory
+        self.entries = {}
+
+    def key(self, pipeline, study_config={}, **kwargs):
+        """ Get the cache key of a pipeline workflow.
+
+        Parameters
+        ----------
+        pipeline: Pipeline
+            the pipeline.
+        study_config: StudyConfig or dict (optional)
+            the workflow generation configuration.
+        kwargs: dict
+            other workflow_from_pipeline() parameters. Nodes are identified
+            by their names.
+
+        Returns
+        -------
+        key: str
+        """
+        options = {}
+        for name, value in six.iteritems(kwargs):
+            if name == "disabled_nodes" and value is not None:
+                names = dict((id(node), full_name)
+                             for full_name, node in _nodes(pipeline))
+                value = sorted(names.get(id(node), node.name)
+                               for node in value)
+            options[name] = value_fingerprint(value)
+        if hasattr(study_config, "export_to_dict"):
+            config = study_config.export_to_dict(exclude_transient=True)
+        else:
+            config = study_config
+        config = dict((name, value_fingerprint(value))
+                      for name, value in six.iteritems(config))
+        return _digest([pipeline_structure(pipeline), options, config])
+
+    def get_workflow(self, pipeline, study_config={}, **kwargs):
+        """ Get the workflow of a pipeline, from the cache if possible.
+
+        The returned workflow is the cached one: it is modified by later
+        calls patching it.
+
+        Parameters
+        ----------
+        pipeline: Pipeline or Process
+            the pipeline.
+        study_config: StudyConfig or dict (optional)
+            see workflow_from_pipeline().
+        kwargs: dict
+            other workflow_from_pipeline() parameters.
+
+        Returns
+        -------
+        workflow: Workflow
+        """
+        # Import here since soma-workflow is an optional dependency
+        from capsul.pipeline.pipeline_workflow import workflow_from_pipeline
+
+        if not isinstance(pipeline, Pipeline) \
+                or kwargs.get("incremental") is not None \
+                or kwargs.get("skip_existing_outputs"):
+            # depends on the files state
+            return workflow_from_pipeline(pipeline, study_config, **kwargs)
+        key = self.key(pipeline, study_config, **kwargs)
+        parameters = pipeline_parameters(pipeline)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self._load(key)
+        if entry is not None:
+            if entry["parameters"] == parameters:
+                logger.debug("Workflow found in the cache")
+                return entry["workflow"]
+            if self._patch(entry, pipeline, parameters, study_config):
+                logger.debug("Cached workflow patched")
+                entry["parameters"] = parameters
+                self._save(key, entry)
+                return entry["workflow"]
+        jobs_parameters = {}
+        workflow = workflow_from_pipeline(
+            pipeline, study_config, jobs_parameters=jobs_parameters,
+            **kwargs)
+        # the generation resets the temporary values: the parameters are
+        # compared to the ones of the next submissions once it is done
+        parameters = pipeline_parameters(pipeline)
+        entry = {"parameters": parameters, "workflow": workflow,
+                 "jobs": self._jobs_records(pipeline, workflow,
+                                            jobs_parameters)}
+        self.entries[key] = entry
+        self._save(key, entry)
+        return workflow
+
+    @staticmethod
+    def _jobs_records(pipeline, workflow, jobs_parameters):
+        """ Record the values used to build the command lines of the jobs
+        which can be patched.
+
+        Returns
+        -------
+        records: dict
+            {node_full_name: {'index': job_index, 'values': dict,
+            'temporaries': list}}
+        """
+        names = dict((id(getattr(node, "process", None)), full_name)
+                     for full_name, node in _nodes(pipeline))
+        indices = dict((id(job), index)
+                       for index, job in enumerate(workflow.jobs))
+        records = {}
+        for process, (job, values) in six.iteritems(jobs_parameters):
+            name = names.get(id(process))
+            if name is None or id(job) not in indices \
+                    or six.get_unbound_function(
+                        type(process).get_commandline) \
+                    is not six.get_unbound_function(Process.get_commandline):
+                continue
+            try:
+                json_values = dict((param, _json_value(value))
+                                   for param, value in six.iteritems(values))
+            except TypeError:
+                continue
+            temporaries = sorted(
+                param for param, value in six.iteritems(values)
+                if any(hasattr(item, "pattern") for item in (
+                    value if isinstance(value, (list, tuple))
+                    else [value])))
+            # the job command has to be the process one
+            plain = process.commandline_from_values(
+                process.get_commandline_parameters(), json_values)
+            if len(plain) != len(job.command) or any(
+                    isinstance(item, six.string_types) and item != plain[i]
+                    for i, item in enumerate(job.command)):
+                continue
+            records[name] = {"index": indices[id(job)],
+                             "values": json_values,
+                             "temporaries": temporaries}
+        for index, job in enumerate(workflow.jobs):
+            if job.name == "output directories creation":
+                records[""] = {"index": index}
+        return records
+
+    def _patch(self, entry, pipeline, parameters, study_config):
+        """ Patch the jobs of the processes whose parameters changed.
+
+        Returns
+        -------
+        patched: bool
+            False if the workflow has to be generated again.
+        """
+        old_parameters = entry["parameters"]
+        records = entry["jobs"]
+        jobs = entry["workflow"].jobs
+        processes = dict((full_name, node.process)
+                         for full_name, node in _nodes(pipeline)
+                         if full_name in parameters)
+        translations = getattr(
+            study_config, "somaworkflow_computing_resource", None) \
+            not in (None, Undefined)
+        commands = {}
+        paths_changed = False
+        for name, values in six.iteritems(parameters):
+            changed = [param for param, value in six.iteritems(values)
+                       if old_parameters.get(name, {}).get(param) != value]
+            if not changed:
+                continue
+            record = records.get(name)
+            if record is None or set(changed).intersection(
+                    record["temporaries"]):
+                return False
+            process = processes[name]
+            commandline_parameters = process.get_commandline_parameters()
+            new_values = dict(record["values"])
+            for param in changed:
+                new_values[param] = values[param]
+            old_plain = process.commandline_from_values(
+                commandline_parameters, record["values"])
+            new_plain = process.commandline_from_values(
+                commandline_parameters, new_values)
+            command = list(jobs[record["index"]].command)
+            if len(new_plain) != len(old_plain) \
+                    or len(command) != len(old_plain):
+                return False
+            for i in range(len(command)):
+                if new_plain[i] == old_plain[i]:
+                    continue
+                if not isinstance(command[i], six.string_types):
+                    # translated or transferred path
+                    return False
+                if i >= 3:
+                    paths_changed = True
+                    if translations:
+                        return False
+                command[i] = new_plain[i]
+            commands[name] = (command, new_values)
+        if paths_changed and "" in records:
+            # output directories may have changed
+            directories = sorted(
+                pipeline_tools.get_output_directories(pipeline)[1])
+            job = jobs[records[""]["index"]]
+            job.command = list(job.command[:3]) + directories
+        for name, (command, new_values) in six.iteritems(commands):
+            jobs[records[name]["index"]].command = command
+            records[name]["values"] = new_values
+        return True
+
+    def _paths(self, key):
+        return (os.path.join(self.directory, key + ".json"),
+                os.path.join(self.directory, key + ".workflow"))
+
+    def _load(self, key):
+        """ Load a cache entry from the cache directory.
+        """
+        if self.directory is None:
+            return None
+        meta_file, workflow_file = self._paths(key)
+        if not os.path.exists(meta_file) or not os.path.exists(workflow_file):
+            return None
+        import soma_workflow.client as swclient
+        try:
+            with open(meta_file) as openfile:
+                entry = json.load(openfile)
+            entry["workflow"] = swclient.Helper.unserialize(workflow_file)
+        except Exception as e:
+            logger.debug("Can't read the cached workflow {0}: {1}".format(
+                workflow_file, e))
+            return None
+        self.entries[key] = entry
+        return entry
+
+    def _save(self, key, entry):
+        """ Save a cache entry in the cache directory.
+        """
+        if self.directory is None:
+            return
+        import soma_workflow.client as swclient
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        meta_file, workflow_file = self._paths(key)
+        swclient.Helper.serialize(workflow_file + ".tmp", entry["workflow"])
+        os.rename(workflow_file + ".tmp", workflow_file)
+        with open(meta_file + ".tmp", "w") as openfile:
+            json.dump({"parameters": entry["parameters"],
+                       "jobs": entry["jobs"]}, openfile)
+        os.rename(meta_file + ".tmp", meta_file)
@@ -0,0 +1,301 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Incremental resubmission of soma-workflow workflows.
+
+After a partial failure, or a small change of parameters, the workflow of
+a pipeline is generated again, and only the jobs which changed have to run.
+A :class:`WorkflowRecord` keeps the signatures of the jobs done by past
+submissions: their command line, and the fingerprints of the files it
+names (see :func:`~capsul.utils.fingerprint.path_fingerprint`). A job
+of a new workflow has to run when no done job had the same signature, or
+when a job it depends on has to run. The minimal workflow holds these
+jobs, and reuses the files written by the others::
+
+    record = WorkflowRecord("/data/out/workflow_record.json")
+    workflow = workflow_from_pipeline(pipeline)
+    to_run = record.incremental_workflow(workflow)
+    # submit to_run, and wait for it
+    record.record(workflow, done_jobs=jobs_done_by_to_run + reused_jobs)
+    record.save()
+
+Temporary files do not outlive a workflow: the jobs writing the temporary
+files read by the jobs to run are run again too.
+"""
+
+# System import
+import os
+import json
+import hashlib
+import logging
+import six
+
+# Soma-workflow import
+import soma_workflow.client as swclient
+
+# Capsul import
+from capsul.utils.fingerprint import path_fingerprint, fingerprint_modes
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+def _element_jobs(element):
+    """ Get the jobs of a workflow element (a job, or a group of jobs and
+    groups).
+    """
+    if not hasattr(element, "elements"):
+        return [element]
+    jobs = []
+    for sub_element in element.elements:
+        jobs.extend(_element_jobs(sub_element))
+    return jobs
+
+
+def _command_item(item, paths):
+    """ Get a JSON description of a job command item, and collect the local
+    paths it names.
+    """
+    if isinstance(item, six.string_types):
+        if os.path.isabs(item):
+            paths.append(item)
+        return item
+    if isinstance(item, (list, tuple)):
+        return [_command_item(sub_item, paths) for sub_item in item]
+    pattern = getattr(item, "pattern", "%s")
+    referent = item.referent() if hasattr(item, "referent") else item
+    if hasattr(referent, "client_path"):
+        # file transfer
+        paths.append(referent.client_path)
+        return ["transfer", pattern % referent.client_path]
+    if hasattr(referent, "relative_path"):
+        # shared resource path
+        return ["shared", referent.namespace, referent.uuid,
+                pattern % referent.relative_path]
+    if hasattr(referent, "is_directory"):
+        # temporary path: it is written by a job of the same workflow
+        return ["temporary", pattern, referent.suffix]
+    return repr(item)
+
+
+def job_signature(job, mode="timestamp"):
+    """ Get the signature of a job: a digest of its command line, and of the
+    fingerprints of the local files it names. Directories are only checked
+    for existence.
+
+    Parameters
+    ----------
+    job: Job
+        the soma-workflow job.
+    mode: str (optional, default 'timestamp')
+        the fingerprints mode: 'timestamp' or 'hash'.
+
+    Returns
+    -------
+    signature: str
+    """
+    paths = []
+    command = [_command_item(item, paths) for item in job.command or []]
+    fingerprints = []
+    for path in sorted(set(paths)):
+        fingerprint = path_fingerprint(path, mode)
+        if fingerprint is not None and fingerprint[0] == "directory":
+            # output directories are modified by the other jobs
+            fingerprint = ["directory"]
+        fingerprints.append([path, fingerprint])
+    description = json.dumps([command, fingerprints], sort_keys=True)
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+
+class WorkflowRecord(object):
+    """ Record of the jobs done by submitted workflows.
+
+    Attributes
+    ----------
+    filename: str
+        the JSON record file.
+    mode: str
+        the fingerprints mode: 'timestamp' or 'hash'.
+    signatures: dict
+        {signature: count} the signatures of the done jobs.
+    """
+
+    def __init__(self, filename, mode="timestamp"):
+        """ Initialize the WorkflowRecord class.
+
+        Parameters
+        ----------
+        filename: str
+            the JSON record file. It is loaded if it exists.
+        mode: str (optional, default 'timestamp')
+            the fingerprints mode: 'timestamp' or 'hash'. Jobs recorded in
+            another mode have to run again.
+        """
+        if mode not in fingerprint_modes:
+            raise ValueError("'{0}' is not a valid fingerprint mode, expect "
+                             "one of {1}".format(mode, fingerprint_modes))
+        self.filename = filename
+        self.mode = mode
+        self.signatures = {}
+        if os.path.isfile(filename):
+            with open(filename) as openfile:
+                record = json.load(openfile)
+            if record.get("mode") == mode:
+                self.signatures = record.get("jobs", {})
+
+    def save(self):
+        """ Write the record file.
+        """
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as openfile:
+            json.dump({"mode": self.mode, "jobs": self.signatures},
+                      openfile, indent=1, sort_keys=True)
+        os.rename(tmp_filename, self.filename)
+
+    def record(self, workflow, done_jobs=None):
+        """ Record the jobs done by a workflow, once it has run. The
+        previous records are replaced.
+
+        Parameters
+        ----------
+        workflow: Workflow
+            the full workflow (not the incremental one).
+        done_jobs: sequence of Job (optional)
+            the jobs of the workflow which are done, or have been reused.
+            Default: all of them.
+        """
+        if done_jobs is None:
+            done_jobs = workflow.jobs
+        done_ids = set(id(job) for job in done_jobs)
+        self.signatures = {}
+        for job in workflow.jobs:
+            if id(job) in done_ids:
+                signature = job_signature(job, self.mode)
+                self.signatures[signature] \
+                    = self.signatures.get(signature, 0) + 1
+
+    def changed_jobs(self, workflow):
+        """ Select the jobs of a workflow which have to run.
+
+        Parameters
+        ----------
+        workflow: Workflow
+            the new workflow.
+
+        Returns
+        -------
+        jobs: list
+            the jobs to run, in the workflow order: the jobs whose
+            signature has not been recorded, the jobs depending on them,
+            and the jobs writing the temporary files they read.
+        """
+        available = dict(self.signatures)
+        selected = set()
+        for job in workflow.jobs:
+            signature = job_signature(job, self.mode)
+            if available.get(signature):
+                available[signature] -= 1
+            else:
+                selected.add(id(job))
+        successors = {}
+        for source, dest in workflow.dependencies:
+            dest_jobs = _element_jobs(dest)
+            for job in _element_jobs(source):
+                successors.setdefault(id(job), []).extend(dest_jobs)
+        writers = {}
+        for job in workflow.jobs:
+            for path in getattr(job, "referenced_output_files", None) or []:
+                if hasattr(path, "referent") \
+                        or hasattr(path, "is_directory"):
+                    referent = path.referent() \
+                        if hasattr(path, "referent") else path
+                    writers.setdefault(id(referent), []).append(job)
+
+        # jobs depending on the changed ones
+        todo = [job for job in workflow.jobs if id(job) in selected]
+        while todo:
+            job = todo.pop()
+            for successor in successors.get(id(job), []):
+                if id(successor) not in selected:
+                    selected.add(id(successor))
+                    todo.append(successor)
+        # jobs writing the temporaries they read
+        todo = [job for job in workflow.jobs if id(job) in selected]
+        while todo:
+            job = todo.pop()
+            for path in getattr(job, "referenced_input_files", None) or []:
+                if not hasattr(path, "referent") \
+                        and not hasattr(path, "is_directory"):
+                    continue
+                referent = path.referent() if hasattr(path, "referent") \
+                    else path
+                if not hasattr(referent, "is_directory"):
+                    continue
+                for writer in writers.get(id(referent), []):
+                    if id(writer) not in selected:
+                        selected.add(id(writer))
+                        todo.append(writer)
+        return [job for job in workflow.jobs if id(job) in selected]
+
+    def incremental_workflow(self, workflow):
+        """ Build the minimal workflow running the jobs which changed.
+
+        Parameters
+        ----------
+        workflow: Workflow
+            the new workflow.
+
+        Returns
+        -------
+        workflow: Workflow
+            a workflow holding the jobs to run (see :meth:`changed_jobs`),
+            with the same groups and dependencies. Jobs are the ones of the
+            given workflow, not copies. The workflow may have no jobs.
+        """
+        jobs = self.changed_jobs(workflow)
+        job_ids = set(id(job) for job in jobs)
+        logger.info("{0} jobs out of {1} have to run".format(
+            len(jobs), len(workflow.jobs)))
+        dependencies = set()
+        for source, dest in workflow.dependencies:
+            for source_job in _element_jobs(source):
+                if id(source_job) not in job_ids:
+                    continue
+                for dest_job in _element_jobs(dest):
+                    if id(dest_job) in job_ids:
+                        dependencies.add((source_job, dest_job))
+
+        def pruned_elements(elements):
+            kept = []
+            for element in elements:
+                if hasattr(element, "elements"):
+                    sub_elements = pruned_elements(element.elements)
+                    if sub_elements:
+                        group = swclient.Group(elements=sub_elements,
+                                               name=element.name)
+                        user_storage = getattr(element, "user_storage",
+                                               None)
+                        if user_storage is not None:
+                            group.user_storage = user_storage
+                        kept.append(group)
+                elif id(element) in job_ids:
+                    kept.append(element)
+            return kept
+
+        root_group = getattr(workflow, "root_group", None)
+        if root_group is None:
+            root_group = workflow.jobs
+        elif hasattr(root_group, "elements"):
+            root_group = root_group.elements
+        return swclient.Workflow(jobs=jobs,
+                                 dependencies=dependencies,
+                                 root_group=pruned_elements(root_group),
+                                 name=getattr(workflow, "name", None))
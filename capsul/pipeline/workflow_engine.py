@@ -0,0 +1,393 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" In-process engine for soma-workflow workflows.
+
+A soma-workflow ``WorkflowController`` needs a database and a server
+process, and polls the workflow state: for short pipelines run on the local
+machine, this costs more than the jobs. :class:`LocalWorkflowController`
+runs the same :class:`~soma_workflow.client.Workflow` objects (generated by
+:func:`~capsul.pipeline.pipeline_workflow.workflow_from_pipeline`) on a
+pool of local processes, with the subset of the controller API used by
+:meth:`StudyConfig.run <capsul.study_config.study_config.StudyConfig.run>`::
+
+    controller = LocalWorkflowController(workers=4)
+    wf_id = controller.submit_workflow(workflow, name="pipeline")
+    controller.wait_workflow(wf_id)
+    print(controller.workflow_elements_status(wf_id)[0])
+
+Jobs run when the jobs and groups they depend on are done, the ready jobs
+with the highest priority first. Jobs depending on a failed job are not
+run. Temporary paths are created in a directory removed with the
+workflow; transferred files are used at their client path. Shared resource
+paths cannot be translated without a soma-workflow computing resource, and
+are rejected.
+"""
+
+from __future__ import print_function
+
+# System import
+import os
+import shutil
+import heapq
+import tempfile
+import datetime
+import threading
+import subprocess
+import multiprocessing
+import logging
+import six
+from six.moves import queue
+
+# Soma-workflow import
+from soma_workflow import constants as swconstants
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+def _group_jobs(element):
+    """ Get the jobs of a workflow element (a job, or a group of jobs and
+    groups).
+    """
+    if not hasattr(element, "elements"):
+        return [element]
+    jobs = []
+    for sub_element in element.elements:
+        jobs.extend(_group_jobs(sub_element))
+    return jobs
+
+
+class _WorkflowRun(object):
+    """ Execution of a workflow by a LocalWorkflowController.
+    """
+
+    def __init__(self, workflow, name, workers, first_id):
+        self.workflow = workflow
+        self.name = name or getattr(workflow, "name", None)
+        self.workers = workers
+        self.jobs = list(workflow.jobs)
+        self.job_indices = dict((id(job), index)
+                                for index, job in enumerate(self.jobs))
+        self.job_ids = dict((id(job), first_id + index)
+                            for index, job in enumerate(self.jobs))
+        self.temp_directory = None
+        self._paths = {}
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._processes = {}
+        self.status = dict((id(job), (swconstants.NOT_SUBMITTED, None))
+                           for job in self.jobs)
+        self.dates = dict((id(job), [None, None, None])
+                          for job in self.jobs)
+        self.commands = dict((id(job), self._job_command(job))
+                             for job in self.jobs)
+
+        # job dependencies, groups being expanded to their jobs
+        self.successors = dict((id(job), []) for job in self.jobs)
+        self.waited = dict((id(job), 0) for job in self.jobs)
+        for source, dest in workflow.dependencies:
+            for source_job in _group_jobs(source):
+                for dest_job in _group_jobs(dest):
+                    self.successors[id(source_job)].append(dest_job)
+                    self.waited[id(dest_job)] += 1
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+    def _path(self, item):
+        """ Get the local path of a soma-workflow path object.
+        """
+        referent = item.referent() if hasattr(item, "referent") else item
+        path = self._paths.get(id(referent))
+        if path is None:
+            if hasattr(referent, "client_path"):
+                # file transfer: the files are on the local machine
+                path = referent.client_path
+            elif hasattr(referent, "is_directory"):
+                # temporary path
+                if self.temp_directory is None:
+                    self.temp_directory = tempfile.mkdtemp(
+                        prefix="capsul_workflow_")
+                if referent.is_directory:
+                    path = tempfile.mkdtemp(dir=self.temp_directory)
+                else:
+                    path = os.path.join(
+                        self.temp_directory, "tmp{0}{1}".format(
+                            len(self._paths), referent.suffix or ""))
+            else:
+                raise ValueError(
+                    "{0} paths cannot be used by the local workflow "
+                    "engine".format(referent.__class__.__name__))
+            self._paths[id(referent)] = path
+        return getattr(item, "pattern", "%s") % path
+
+    def _argument(self, item):
+        """ Get the command line argument of a job command item.
+        """
+        if isinstance(item, six.string_types):
+            return item
+        if isinstance(item, (list, tuple)):
+            return repr([self._argument(sub_item) for sub_item in item])
+        if hasattr(item, "referent") or hasattr(item, "client_path") \
+                or hasattr(item, "is_directory"):
+            return self._path(item)
+        return str(item)
+
+    def _job_command(self, job):
+        return [self._argument(item) for item in job.command]
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        """ Schedule the jobs on the workers.
+        """
+        ready = []
+        for index, job in enumerate(self.jobs):
+            if self.waited[id(job)] == 0:
+                heapq.heappush(ready,
+                               (-getattr(job, "priority", 0), index, job))
+        done = queue.Queue()
+        running = 0
+        while ready or running:
+            while ready and running < self.workers and not self._stopped:
+                job = heapq.heappop(ready)[2]
+                thread = threading.Thread(target=self._run_job,
+                                          args=(job, done))
+                thread.daemon = True
+                running += 1
+                thread.start()
+            if not running:
+                break
+            job, status, exit_info = done.get()
+            running -= 1
+            with self._lock:
+                self.status[id(job)] = (status, exit_info)
+                self.dates[id(job)][2] = datetime.datetime.now()
+            if status != swconstants.DONE:
+                self._cancel_successors(job)
+                continue
+            for successor in self.successors[id(job)]:
+                self.waited[id(successor)] -= 1
+                if self.waited[id(successor)] == 0:
+                    heapq.heappush(
+                        ready, (-getattr(successor, "priority", 0),
+                                self.job_indices[id(successor)], successor))
+        # jobs which could not run
+        with self._lock:
+            for job in self.jobs:
+                if self.status[id(job)][0] == swconstants.NOT_SUBMITTED:
+                    self.status[id(job)] = (
+                        swconstants.FAILED,
+                        (swconstants.EXIT_NOTRUN, None, None, None))
+
+    def _cancel_successors(self, job):
+        """ Mark the jobs depending on a failed job as not run.
+        """
+        todo = list(self.successors[id(job)])
+        with self._lock:
+            while todo:
+                successor = todo.pop()
+                if self.status[id(successor)][0] \
+                        != swconstants.NOT_SUBMITTED:
+                    continue
+                self.status[id(successor)] = (
+                    swconstants.FAILED,
+                    (swconstants.EXIT_NOTRUN, None, None, None))
+                todo.extend(self.successors[id(successor)])
+
+    def _run_job(self, job, done):
+        """ Run a job in a subprocess (in a worker thread).
+        """
+        with self._lock:
+            self.status[id(job)] = (swconstants.RUNNING, None)
+            self.dates[id(job)][:2] = [datetime.datetime.now()] * 2
+        command = self.commands[id(job)]
+        if not command:
+            # barrier job
+            done.put((job, swconstants.DONE,
+                      (swconstants.FINISHED_REGULARLY, 0, None, None)))
+            return
+        files = []
+        try:
+            kwargs = {}
+            working_directory = getattr(job, "working_directory", None)
+            if working_directory:
+                kwargs["cwd"] = self._argument(working_directory)
+            for attribute, mode in (("stdin", "r"), ("stdout_file", "w"),
+                                    ("stderr_file", "w")):
+                value = getattr(job, attribute, None)
+                if value:
+                    files.append(open(self._argument(value), mode))
+                    kwargs[attribute.split("_")[0]] = files[-1]
+            if getattr(job, "join_stderrout", False):
+                kwargs["stderr"] = subprocess.STDOUT
+            with self._lock:
+                if self._stopped:
+                    raise OSError("the workflow has been stopped")
+                process = subprocess.Popen(command, **kwargs)
+                self._processes[id(job)] = process
+            returncode = process.wait()
+        except (OSError, IOError) as e:
+            logger.error("Job '{0}' could not run: {1}".format(job.name, e))
+            done.put((job, swconstants.FAILED,
+                      (swconstants.EXIT_ABORTED, None, None, None)))
+            return
+        finally:
+            for openfile in files:
+                openfile.close()
+            with self._lock:
+                self._processes.pop(id(job), None)
+        if returncode == 0:
+            done.put((job, swconstants.DONE,
+                      (swconstants.FINISHED_REGULARLY, 0, None, None)))
+        elif returncode < 0:
+            done.put((job, swconstants.FAILED,
+                      (swconstants.FINISHED_TERM_SIG, None, -returncode,
+                       None)))
+        else:
+            done.put((job, swconstants.FAILED,
+                      (swconstants.FINISHED_REGULARLY, returncode, None,
+                       None)))
+
+    def stop(self):
+        """ Do not start new jobs, and kill the running ones.
+        """
+        with self._lock:
+            self._stopped = True
+            for process in six.itervalues(self._processes):
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+
+    def workflow_status(self):
+        if self.thread.is_alive():
+            return swconstants.WORKFLOW_IN_PROGRESS
+        if self.thread.ident is None:
+            return swconstants.WORKFLOW_NOT_STARTED
+        return swconstants.WORKFLOW_DONE
+
+    def jobs_status(self):
+        with self._lock:
+            return [(self.job_ids[id(job)], self.status[id(job)][0], None,
+                     self.status[id(job)][1] or (None, None, None, None),
+                     tuple(self.dates[id(job)]))
+                    for job in self.jobs]
+
+    def clean(self):
+        if self.temp_directory is not None:
+            shutil.rmtree(self.temp_directory, ignore_errors=True)
+            self.temp_directory = None
+
+
+class LocalWorkflowController(object):
+    """ Run soma-workflow workflows in the current process, on a pool of
+    local processes.
+
+    The methods follow the soma-workflow ``WorkflowController`` ones, and
+    the statuses are soma-workflow constants, so that the controller can be
+    used by code written for soma-workflow.
+
+    Attributes
+    ----------
+    workers: int
+        the number of jobs run at the same time.
+    """
+
+    def __init__(self, workers=None):
+        """ Initialize the LocalWorkflowController class.
+
+        Parameters
+        ----------
+        workers: int (optional)
+            the number of jobs run at the same time. Default: the number of
+            CPUs.
+        """
+        if not workers:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self._runs = {}
+        self._next_id = 1
+        self._next_job_id = 1
+
+    def submit_workflow(self, workflow, name=None, **kwargs):
+        """ Start running a workflow.
+
+        Other soma-workflow keyword arguments (expiration date, queue) are
+        ignored.
+
+        Returns
+        -------
+        wf_id: int
+            the workflow identifier.
+        """
+        run = _WorkflowRun(workflow, name, self.workers, self._next_job_id)
+        wf_id = self._next_id
+        self._next_id += 1
+        self._next_job_id += len(run.jobs)
+        self._runs[wf_id] = run
+        run.start()
+        return wf_id
+
+    def wait_workflow(self, wf_id, timeout=None):
+        """ Wait for the end of a workflow.
+
+        Parameters
+        ----------
+        timeout: float (optional)
+            maximum waiting time, in seconds. Default: no limit.
+        """
+        self._runs[wf_id].thread.join(timeout)
+
+    def workflow_status(self, wf_id):
+        """ Get the status of a workflow (a soma-workflow WORKFLOW_*
+        constant). Like with soma-workflow, a workflow is done when no job
+        can run anymore, even if some jobs have failed.
+        """
+        return self._runs[wf_id].workflow_status()
+
+    def workflow_elements_status(self, wf_id):
+        """ Get the status of the workflow jobs.
+
+        Returns
+        -------
+        status: tuple
+            (jobs, transfers, temporary_files) status lists. Each job
+            status is (job_id, status, queue, (exit_status, exit_value,
+            term_signal, resource_usage), (submission_date,
+            execution_date, ending_date)). Transfers and temporary files
+            are not tracked.
+        """
+        return (self._runs[wf_id].jobs_status(), [], [])
+
+    def stop_workflow(self, wf_id):
+        """ Stop a workflow: the running jobs are killed.
+        """
+        self._runs[wf_id].stop()
+        return True
+
+    def delete_workflow(self, wf_id, force=True):
+        """ Stop a workflow, and remove its temporary files.
+        """
+        run = self._runs.pop(wf_id)
+        run.stop()
+        run.thread.join()
+        run.clean()
+        return True
+
+    def workflows(self):
+        """ Get the submitted workflows.
+
+        Returns
+        -------
+        workflows: dict
+            {wf_id: (name, None)}
+        """
+        return dict((wf_id, (run.name, None))
+                    for wf_id, run in six.iteritems(self._runs))
@@ -19,7 +19,6 @@ import shutil
 import six
 import sys
 import functools
-import glob
 
 # Define the logger
 logger = logging.getLogger(__name__)
@@ -38,6 +37,7 @@ from soma.controller.trait_utils import get_trait_desc
 
 # Capsul import
 from capsul.utils.version_utils import get_tool_version
+from capsul.utils.file_copy import copy_files, copy_files_group
 
 if sys.version_info[0] <= 3:
     unicode = str
@@ -408,7 +408,60 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
     def get_commandline(self):
         """ Method to generate a comandline representation of the process.
         """
-        # Get command line arguments (ie., the process user traits)
+        parameters = self.get_commandline_parameters()
+        return self.commandline_from_values(
+            parameters,
+            dict((name, getattr(self, name)) for name, kind in parameters))
+
+    def get_commandline_parameters(self):
+        """ Get the parameters passed on the command line, and how they are
+        passed (see :meth:`commandline_from_values`).
+
+        Returns
+        -------
+        parameters: list of (str, str)
+            (parameter_name, kind) in user traits order. kind is 'path' for
+            File and Directory parameters, 'path_list' for lists of them,
+            and 'value' for other parameters.
+        """
+        reserved_params = ("nodes_activation", "selection_changed")
+        parameters = []
+        for trait_name, trait in six.iteritems(self.user_traits()):
+            if trait_name in reserved_params:
+                continue
+            if is_trait_pathname(trait):
+                kind = "path"
+            elif isinstance(trait.trait_type, List) \
+                    and is_trait_pathname(trait.inner_traits[0]):
+                kind = "path_list"
+            else:
+                kind = "value"
+            parameters.append((trait_name, kind))
+        return parameters
+
+    def commandline_from_values(self, parameters, values):
+        """ Build the command line of the process for given parameters
+        values, without setting them on the process.
+
+        This is what :meth:`get_commandline` does for the process own
+        values. Many command lines of the same process (for iterations
+        for instance) can be built this way from the same parameters
+        description.
+
+        Parameters
+        ----------
+        parameters: list of (str, str)
+            the parameters description, see
+            :meth:`get_commandline_parameters`.
+        values: dict
+            {parameter_name: value}
+
+        Returns
+        -------
+        commandline: list
+            the command line. Path values are separate arguments, after the
+            third one.
+        """
         # Build the python call expression, keeping apart file names.
         # File names are given separately since they might be modified
         # externally afterwards, typically to handle temporary files, or
@@ -422,7 +475,6 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
             def __repr__(self):
                 return 'sys.argv[%d]' % self.num
 
-        reserved_params = ("nodes_activation", "selection_changed")
         # pathslist is for files referenced from lists: a list of files will
         # look like [sys.argv[5], sys.argv[6]...], then the corresponding
         # path args will be in additional arguments, here stored in pathslist
@@ -434,15 +486,13 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
         # series of arg_name, path_value, all in separate commandline arguments
         pathsdict = {}
 
-        for trait_name, trait in six.iteritems(self.user_traits()):
-            value = getattr(self, trait_name)
-            if trait_name in reserved_params \
-                    or not is_trait_value_defined(value):
+        for trait_name, kind in parameters:
+            value = values[trait_name]
+            if not is_trait_value_defined(value):
                 continue
-            if is_trait_pathname(trait):
+            if kind == "path":
                 pathsdict[trait_name] = value
-            elif isinstance(trait.trait_type, List) \
-                    and is_trait_pathname(trait.inner_traits[0]):
+            elif kind == "path_list":
                 plist = []
                 for pathname in value:
                     if is_trait_value_defined(pathname):
@@ -807,6 +857,13 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
 class FileCopyProcess(Process):
     """ A specific process that copies all the input files.
 
+    Inputs which are only read do not need a real copy: the copy strategy
+    ('copy', 'hardlink', 'symlink', 'reflink' or 'cow', see
+    :mod:`capsul.utils.file_copy`) can be set for the whole process and
+    for each input. Inputs modified in place are always really copied.
+    Companion files (.hdr, .minf...) are given by the formats registry
+    (:mod:`capsul.utils.formats`).
+
     Attributes
     ----------
     `copied_inputs` : list of 2-uplet
@@ -820,7 +877,9 @@ class FileCopyProcess(Process):
     _copy_input_files
     """
     def __init__(self, activate_copy=True, inputs_to_copy=None,
-                 inputs_to_clean=None, destination=None):
+                 inputs_to_clean=None, destination=None,
+                 copy_strategy="copy", copy_strategies=None,
+                 inputs_modified_in_place=None, copy_workers=1):
         """ Initialize the FileCopyProcess class.
 
         Parameters
@@ -837,6 +896,17 @@ class FileCopyProcess(Process):
             where the files are copied.
             If None, files are copied in a '_workspace' folder included in the
             image folder.
+        copy_strategy: str (optional, default 'copy')
+            how input files are copied: 'copy', 'hardlink', 'symlink',
+            'reflink' or 'cow'.
+        copy_strategies: dict (optional, default None)
+            {input_name: strategy} copy strategies overloading copy_strategy
+            for some inputs.
+        inputs_modified_in_place: list of str (optional, default None)
+            inputs modified by the process: they are always really copied,
+            whatever their copy strategy.
+        copy_workers: int (optional, default 1)
+            the number of files copied in parallel.
         """
         # Inheritance
         super(FileCopyProcess, self).__init__()
@@ -850,6 +920,10 @@ class FileCopyProcess(Process):
                 self.inputs_to_copy = self.user_traits().keys()
             else:
                 self.inputs_to_copy = inputs_to_copy
+            self.copy_strategy = copy_strategy
+            self.copy_strategies = copy_strategies or {}
+            self.inputs_modified_in_place = inputs_modified_in_place or []
+            self.copy_workers = copy_workers
             self.copied_inputs = None
 
     def _before_run_process(self):
@@ -914,15 +988,43 @@ class FileCopyProcess(Process):
         """
         # Get the new trait values
         input_parameters = self._get_process_arguments()
-        self.copied_inputs = self._copy_input_files(input_parameters)
+        copies = []
+        self.copied_inputs = {}
+        for name, value in six.iteritems(input_parameters):
+            self.copied_inputs[name] = self._copy_input_files(
+                value, self._get_copy_strategy(name), copies)
+        copy_files(copies, self.copy_workers)
 
-    def _copy_input_files(self, python_object):
+    def _get_copy_strategy(self, name):
+        """ Get the copy strategy of an input.
+
+        Parameters
+        ----------
+        name: str
+            the input name.
+
+        Returns
+        -------
+        strategy: str
+            the copy strategy (see :mod:`capsul.utils.file_copy`).
+        """
+        if name in self.inputs_modified_in_place:
+            return "copy"
+        return self.copy_strategies.get(name, self.copy_strategy)
+
+    def _copy_input_files(self, python_object, strategy="copy", copies=None):
         """ Recursive method that copy the input process files.
 
         Parameters
         ----------
         python_object: object
             a generic python object.
+        strategy: str (optional, default 'copy')
+            the copy strategy (see :mod:`capsul.utils.file_copy`).
+        copies: list (optional, default None)
+            if specified, the copies are not done but appended to this list
+            as (src, dest, strategy) 3-uplets (see
+            :func:`capsul.utils.file_copy.copy_files`).
 
         Returns
         -------
@@ -936,7 +1038,7 @@ class FileCopyProcess(Process):
             out = {}
             for key, val in python_object.items():
                 if val is not Undefined:
-                    out[key] = self._copy_input_files(val)
+                    out[key] = self._copy_input_files(val, strategy, copies)
 
         # Deal with tuple and list
         # Create an output list or tuple that will contain the copied file
@@ -945,12 +1047,12 @@ class FileCopyProcess(Process):
             out = []
             for val in python_object:
                 if val is not Undefined:
-                    out.append(self._copy_input_files(val))
+                    out.append(self._copy_input_files(val, strategy, copies))
             if isinstance(python_object, tuple):
                 out = tuple(out)
 
-        # Otherwise start the copy (with metadata cp -p) if the object is
-        # a file
+        # Otherwise start the copy if the object is a file. Associated
+        # files (.hdr, .minf...) are copied with it.
         else:
             out = python_object
             if (python_object is not Undefined and
@@ -965,16 +1067,10 @@ class FileCopyProcess(Process):
                     os.makedirs(destdir)
                 fname = os.path.basename(python_object)
                 out = os.path.join(destdir, fname)
-                shutil.copy2(python_object, out)
-                
-                # Copy associated .mat files
-                name = fname.split(".")[0]
-                matfnames = glob.glob(os.path.join(
-                    os.path.dirname(python_object), name + ".*"))
-                for matfname in matfnames:
-                    extrafname = os.path.basename(matfname)
-                    extraout = os.path.join(destdir, extrafname)
-                    shutil.copy2(matfname, extraout)
+                if copies is None:
+                    copy_files_group(python_object, out, strategy)
+                else:
+                    copies.append((python_object, out, strategy))
 
         return out
 
@@ -0,0 +1,124 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+# System import
+import unittest
+import os
+import sys
+import tempfile
+import shutil
+
+# Trait import
+from traits.api import File, List
+
+# Capsul import
+from capsul.api import FileCopyProcess
+from capsul.utils.file_copy import copy_file
+
+
+class DummyCopyProcess(FileCopyProcess):
+    """ Dummy file copy.
+    """
+    i = File(output=False, optional=False, desc="a file")
+    l = List(File(), output=False, optional=False, desc="a list of file")
+
+    def _run_process(self):
+        pass
+
+
+class TestFileCopy(unittest.TestCase):
+    """ Test the FileCopyProcess copy strategies.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="capsul_test_")
+        self.srcdir = os.path.join(self.tmpdir, "src")
+        self.destdir = os.path.join(self.tmpdir, "dest")
+        os.mkdir(self.srcdir)
+        self.files = []
+        for name in ("i", "l1", "l2"):
+            fname = os.path.join(self.srcdir, name + ".img")
+            for ext in (".img", ".hdr", ".img.minf"):
+                with open(os.path.join(self.srcdir, name + ext), "w") as f:
+                    f.write(name + ext)
+            self.files.append(fname)
+        # not a companion file of the image: not copied
+        open(os.path.join(self.srcdir, "i.txt"), "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_process(self, **kwargs):
+        process = DummyCopyProcess(destination=self.destdir, **kwargs)
+        process.i = self.files[0]
+        process.l = self.files[1:]
+        process()
+        return process
+
+    def test_copy(self):
+        process = self.run_process()
+        self.assertEqual(process.copied_inputs["i"],
+                         os.path.join(self.destdir, "i.img"))
+        self.assertEqual(sorted(os.listdir(self.destdir)),
+                         ["i.hdr", "i.img", "i.img.minf",
+                          "l1.hdr", "l1.img", "l1.img.minf",
+                          "l2.hdr", "l2.img", "l2.img.minf"])
+        for fname in os.listdir(self.destdir):
+            dest = os.path.join(self.destdir, fname)
+            self.assertFalse(os.path.islink(dest))
+            self.assertFalse(os.path.samefile(
+                dest, os.path.join(self.srcdir, fname)))
+            self.assertEqual(open(dest).read(), fname)
+
+    def test_mat_sidecar(self):
+        # SPM .mat files are copied with their image
+        image = os.path.join(self.srcdir, "spm.nii")
+        for ext in (".nii", ".mat"):
+            with open(os.path.join(self.srcdir, "spm" + ext), "w") as f:
+                f.write("spm" + ext)
+        process = DummyCopyProcess(destination=self.destdir)
+        process.i = image
+        process.l = []
+        process()
+        self.assertEqual(sorted(os.listdir(self.destdir)),
+                         ["spm.mat", "spm.nii"])
+        self.assertEqual(
+            open(os.path.join(self.destdir, "spm.mat")).read(), "spm.mat")
+
+    def test_strategies(self):
+        process = self.run_process(
+            copy_strategy="symlink", copy_strategies={"l": "hardlink"},
+            inputs_modified_in_place=["i"], copy_workers=4)
+        for fname in os.listdir(self.destdir):
+            dest = os.path.join(self.destdir, fname)
+            src = os.path.join(self.srcdir, fname)
+            if fname.startswith("i."):
+                # modified in place: real copy
+                self.assertFalse(os.path.samefile(dest, src))
+            else:
+                self.assertFalse(os.path.islink(dest))
+                self.assertTrue(os.path.samefile(dest, src))
+        # cow falls back to a copy when clones are not supported
+        dest = os.path.join(self.tmpdir, "cow.img")
+        copy_file(self.files[0], dest, "cow")
+        self.assertEqual(open(dest).read(), "i.img")
+        self.assertRaises(ValueError, copy_file, self.files[0], dest,
+                          "unknown")
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFileCopy)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -30,6 +30,7 @@ from capsul.api import Pipeline
 from capsul.api import Process
 from capsul.api import get_process_instance
 from capsul.pipeline.process_iteration import ProcessIteration
+from capsul.utils.stat_cache import get_stat_cache
 from capsul.qt_gui.widgets.pipeline_file_warning_widget \
     import PipelineFileWarningWidget
 import capsul.pipeline.xml as capsulxml
@@ -1419,7 +1420,8 @@ class PipelineScene(QtGui.QGraphicsScene):
     @staticmethod
     def is_existing_path(value):
         if value not in (None, traits.Undefined) \
-                and type(value) in (str, unicode) and os.path.exists(value):
+                and type(value) in (str, unicode) \
+                and get_stat_cache().exists(value):
             return True
         return False
 
@@ -0,0 +1,526 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Smart-caching storage backends.
+
+A cache entry is a directory holding the memorized result of a process
+execution (see :class:`~capsul.study_config.memory.MemorizedProcess`). It is
+identified by the process id and the process hash. Backends define where
+entries are stored:
+
+* :class:`LocalCacheBackend`: a directory, possibly read-only (a cache
+  shared between studies for instance).
+* :class:`TieredCacheBackend`: a writable fast tier and slower tiers.
+  Lookups fall through the tiers, and entries found in a slow tier are
+  promoted to the fast one.
+* :class:`SocketCacheBackend`: the client of a :class:`CacheServer` which
+  stores entries for several hosts or users.
+
+A cache server can be started with::
+
+    python -m capsul.study_config.cache_backends -d /cache/directory -p 8750
+"""
+
+from __future__ import print_function
+
+# System import
+import os
+import re
+import io
+import json
+import shutil
+import socket
+import tarfile
+import tempfile
+import threading
+import logging
+from optparse import OptionParser
+import six
+from six.moves import socketserver
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+_process_id_re = re.compile(r"^[\w.]+$")
+_process_hash_re = re.compile(r"^\w+$")
+
+
+class CacheBackend(object):
+    """ Smart-caching storage interface.
+
+    Memorized processes use backends this way::
+
+        process_dir = backend.lookup(process_id, process_hash)
+        if process_dir is None:
+            process_dir = backend.new_entry(process_id, process_hash)
+            try:
+                # write the results in process_dir
+                backend.store(process_id, process_hash, process_dir)
+            except:
+                backend.discard(process_id, process_hash, process_dir)
+                raise
+        else:
+            # read the results from process_dir
+    """
+
+    def lookup(self, process_id, process_hash, fetch=True):
+        """ Find a cache entry.
+
+        Parameters
+        ----------
+        process_id: str
+            the process id.
+        process_hash: str
+            the process hash.
+        fetch: bool (optional, default True)
+            if False, only entries which can be read in place are returned:
+            nothing is transferred nor promoted.
+
+        Returns
+        -------
+        process_dir: str
+            a local directory holding the entry, or None if it is not in
+            the cache.
+        """
+        raise NotImplementedError()
+
+    def keys(self, process_id):
+        """ Get the hashes of all the cached executions of a process.
+        """
+        raise NotImplementedError()
+
+    def new_entry(self, process_id, process_hash):
+        """ Get a local directory where a new cache entry is written.
+        """
+        raise NotImplementedError()
+
+    def store(self, process_id, process_hash, process_dir):
+        """ Validate a new cache entry, once it has been written.
+        """
+        raise NotImplementedError()
+
+    def discard(self, process_id, process_hash, process_dir):
+        """ Remove a new cache entry which could not be written.
+        """
+        shutil.rmtree(process_dir, ignore_errors=True)
+
+
+class LocalCacheBackend(CacheBackend):
+    """ Cache entries stored in a directory:
+    <cachedir>/<process id split on dots>/<process hash>.
+    """
+
+    def __init__(self, cachedir, readonly=False):
+        """ Initialize the LocalCacheBackend class.
+
+        Parameters
+        ----------
+        cachedir: str
+            the cache directory.
+        readonly: bool (optional, default False)
+            if True, no entry is written in the cache directory.
+        """
+        self.cachedir = os.path.abspath(cachedir)
+        self.readonly = readonly
+
+    def _process_id_dir(self, process_id):
+        return os.path.join(self.cachedir, *process_id.split("."))
+
+    def lookup(self, process_id, process_hash, fetch=True):
+        process_dir = os.path.join(self._process_id_dir(process_id),
+                                   process_hash)
+        if os.path.isdir(process_dir):
+            return process_dir
+        return None
+
+    def keys(self, process_id):
+        try:
+            names = os.listdir(self._process_id_dir(process_id))
+        except OSError:
+            return set()
+        # entries being added are hidden
+        return set(name for name in names if not name.startswith("."))
+
+    def new_entry(self, process_id, process_hash):
+        if self.readonly:
+            raise IOError(
+                "The cache directory '{0}' is read-only.".format(
+                    self.cachedir))
+        process_dir = os.path.join(self._process_id_dir(process_id),
+                                   process_hash)
+        os.makedirs(process_dir)
+        return process_dir
+
+    def store(self, process_id, process_hash, process_dir):
+        pass
+
+    def add_entry(self, process_id, process_hash, source_dir):
+        """ Copy an entry from another cache.
+
+        The copy is made in a temporary directory renamed at the end, so
+        that a partially copied entry is never seen.
+
+        Returns
+        -------
+        process_dir: str
+            the entry directory in this cache.
+        """
+        process_id_dir = self._process_id_dir(process_id)
+        process_dir = os.path.join(process_id_dir, process_hash)
+        if not os.path.isdir(process_id_dir):
+            os.makedirs(process_id_dir)
+        tmp_dir = tempfile.mkdtemp(prefix=".{0}.".format(process_hash),
+                                   dir=process_id_dir)
+        try:
+            tmp_entry = os.path.join(tmp_dir, process_hash)
+            shutil.copytree(source_dir, tmp_entry)
+            try:
+                os.rename(tmp_entry, process_dir)
+            except OSError:
+                # another process has added the same entry
+                if not os.path.isdir(process_dir):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return process_dir
+
+
+class TieredCacheBackend(CacheBackend):
+    """ Cache made of a writable fast tier and slower tiers.
+
+    Lookups fall through the tiers in order, and entries found in a slower
+    tier are copied (promoted) into the first one. New entries are written
+    in the first tier, or in another writable tier.
+    """
+
+    def __init__(self, tiers, write_tier=None):
+        """ Initialize the TieredCacheBackend class.
+
+        Parameters
+        ----------
+        tiers: list of CacheBackend
+            the cache tiers, fastest first. The first tier has to be a
+            writable LocalCacheBackend.
+        write_tier: CacheBackend (optional)
+            the tier where new entries are written (default: the first
+            one).
+        """
+        self.tiers = list(tiers)
+        self.write_tier = write_tier or self.tiers[0]
+
+    def lookup(self, process_id, process_hash, fetch=True):
+        local_tier = self.tiers[0]
+        process_dir = local_tier.lookup(process_id, process_hash, fetch)
+        if process_dir is not None:
+            return process_dir
+        for tier in self.tiers[1:]:
+            process_dir = tier.lookup(process_id, process_hash, fetch)
+            if process_dir is not None:
+                if not fetch or local_tier.lookup(
+                        process_id, process_hash) == process_dir:
+                    # read in place, or already fetched in the first tier
+                    return process_dir
+                logger.debug("Promoting cache entry '{0}'.".format(
+                    process_dir))
+                return local_tier.add_entry(process_id, process_hash,
+                                            process_dir)
+        return None
+
+    def keys(self, process_id):
+        keys = set()
+        for tier in self.tiers:
+            keys.update(tier.keys(process_id))
+        return keys
+
+    def new_entry(self, process_id, process_hash):
+        return self.write_tier.new_entry(process_id, process_hash)
+
+    def store(self, process_id, process_hash, process_dir):
+        self.write_tier.store(process_id, process_hash, process_dir)
+
+    def discard(self, process_id, process_hash, process_dir):
+        self.write_tier.discard(process_id, process_hash, process_dir)
+
+
+###########################################################################
+# Cache server
+###########################################################################
+
+# Protocol: each request is a json line {"command": ..., "process_id": ...,
+# "process_hash": ..., "size": ...}, optionally followed by "size" bytes of
+# data (a tar archive of a cache entry). Answers have the same layout, with
+# a "status" which is "ok" or "error".
+
+
+def _check_key(process_id, process_hash=None):
+    """ Check cache keys received from the network, which are used to build
+    paths.
+    """
+    if not _process_id_re.match(process_id or "") \
+            or process_id.startswith(".") or ".." in process_id:
+        raise ValueError("Invalid process id '{0}'.".format(process_id))
+    if process_hash is not None and not _process_hash_re.match(process_hash):
+        raise ValueError("Invalid process hash '{0}'.".format(process_hash))
+
+
+def _pack_entry(process_dir):
+    """ Get a tar archive of a cache entry.
+    """
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w") as archive:
+        for name in os.listdir(process_dir):
+            archive.add(os.path.join(process_dir, name), arcname=name)
+    return data.getvalue()
+
+
+def _unpack_entry(data, process_dir):
+    """ Extract a cache entry archive.
+    """
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r") as archive:
+        members = archive.getmembers()
+        for member in members:
+            name = os.path.normpath(member.name)
+            if os.path.isabs(name) or name.startswith(os.pardir) \
+                    or not (member.isfile() or member.isdir()):
+                raise ValueError(
+                    "Invalid cache entry member '{0}'.".format(member.name))
+        archive.extractall(process_dir, members)
+
+
+def _send_message(stream, message, data=None):
+    if data is not None:
+        message["size"] = len(data)
+    stream.write((json.dumps(message) + "\n").encode("utf-8"))
+    if data is not None:
+        stream.write(data)
+    stream.flush()
+
+
+def _read_message(stream):
+    line = stream.readline()
+    if not line:
+        raise IOError("Cache connection closed.")
+    message = json.loads(line.decode("utf-8"))
+    data = None
+    if "size" in message:
+        data = stream.read(message["size"])
+        if len(data) != message["size"]:
+            raise IOError("Truncated cache message.")
+    return message, data
+
+
+class _CacheRequestHandler(socketserver.StreamRequestHandler):
+    """ Handle the requests of a cache client connection.
+    """
+
+    def handle(self):
+        backend = self.server.backend
+        while True:
+            try:
+                message, data = _read_message(self.rfile)
+            except IOError:
+                return
+            try:
+                command = message.get("command")
+                process_id = message.get("process_id")
+                process_hash = message.get("process_hash")
+                _check_key(process_id, process_hash)
+                if command == "keys":
+                    _send_message(self.wfile, {
+                        "status": "ok",
+                        "keys": sorted(backend.keys(process_id))})
+                elif command == "get":
+                    process_dir = backend.lookup(process_id, process_hash)
+                    if process_dir is None:
+                        _send_message(self.wfile, {"status": "missing"})
+                    else:
+                        _send_message(self.wfile, {"status": "ok"},
+                                      _pack_entry(process_dir))
+                elif command == "put":
+                    if backend.lookup(process_id, process_hash) is None:
+                        tmp_dir = tempfile.mkdtemp()
+                        try:
+                            _unpack_entry(data, tmp_dir)
+                            backend.add_entry(process_id, process_hash,
+                                              tmp_dir)
+                        finally:
+                            shutil.rmtree(tmp_dir, ignore_errors=True)
+                    _send_message(self.wfile, {"status": "ok"})
+                else:
+                    raise ValueError(
+                        "Unknown cache command '{0}'.".format(command))
+            except Exception as e:
+                logger.error("Cache request failed: {0}".format(e))
+                _send_message(self.wfile, {"status": "error",
+                                           "message": str(e)})
+
+
+class CacheServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """ Serve a local cache directory to SocketCacheBackend clients.
+
+    >>> server = CacheServer("/cache/directory", ("localhost", 0))
+    >>> server.start()
+    >>> backend = SocketCacheBackend(server.server_address, "/local/cache")
+    >>> server.shutdown()
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, cachedir, server_address=("localhost", 0)):
+        """ Initialize the CacheServer class.
+
+        Parameters
+        ----------
+        cachedir: str
+            the served cache directory.
+        server_address: 2-uplet (optional)
+            the (host, port) address to listen to. With port 0, a free port
+            is chosen: see the server_address attribute.
+        """
+        socketserver.TCPServer.__init__(self, server_address,
+                                        _CacheRequestHandler)
+        self.backend = LocalCacheBackend(cachedir)
+
+    def start(self):
+        """ Serve requests in a background thread.
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+class SocketCacheBackend(CacheBackend):
+    """ Client of a :class:`CacheServer`.
+
+    Entries fetched from the server, or written before being sent to it,
+    are stored in a local directory.
+    """
+
+    def __init__(self, server_address, localdir, timeout=60):
+        """ Initialize the SocketCacheBackend class.
+
+        Parameters
+        ----------
+        server_address: 2-uplet or str
+            the (host, port) server address, or a "host:port" string.
+        localdir: str
+            the local directory where entries are fetched and written.
+        timeout: float (optional, default 60)
+            the connection timeout, in seconds.
+        """
+        if isinstance(server_address, six.string_types):
+            host, port = server_address.rsplit(":", 1)
+            server_address = (host, int(port))
+        self.server_address = tuple(server_address)
+        self.local = LocalCacheBackend(localdir)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _request(self, message, data=None):
+        """ Send a request to the server and get its answer.
+        """
+        with self._lock:
+            for attempt in (0, 1):
+                try:
+                    if self._connection is None:
+                        sock = socket.create_connection(self.server_address,
+                                                        self.timeout)
+                        self._connection = (sock, sock.makefile("rwb"))
+                    stream = self._connection[1]
+                    _send_message(stream, message, data)
+                    answer, answer_data = _read_message(stream)
+                    break
+                except (IOError, socket.error):
+                    # the server may have closed an idle connection
+                    self.close()
+                    if attempt:
+                        raise
+        if answer.get("status") == "error":
+            raise IOError("Cache server error: {0}".format(
+                answer.get("message")))
+        return answer, answer_data
+
+    def close(self):
+        """ Close the server connection.
+        """
+        if self._connection is not None:
+            sock, stream = self._connection
+            self._connection = None
+            try:
+                stream.close()
+                sock.close()
+            except (IOError, socket.error):
+                pass
+
+    def lookup(self, process_id, process_hash, fetch=True):
+        process_dir = self.local.lookup(process_id, process_hash)
+        if process_dir is not None or not fetch:
+            return process_dir
+        answer, data = self._request({"command": "get",
+                                      "process_id": process_id,
+                                      "process_hash": process_hash})
+        if answer["status"] != "ok":
+            return None
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            _unpack_entry(data, tmp_dir)
+            return self.local.add_entry(process_id, process_hash, tmp_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def keys(self, process_id):
+        answer, data = self._request({"command": "keys",
+                                      "process_id": process_id})
+        return set(answer["keys"]) | self.local.keys(process_id)
+
+    def new_entry(self, process_id, process_hash):
+        return self.local.new_entry(process_id, process_hash)
+
+    def store(self, process_id, process_hash, process_dir):
+        # The entry is kept in the local directory if the server can't be
+        # reached
+        try:
+            self._request({"command": "put",
+                           "process_id": process_id,
+                           "process_hash": process_hash},
+                          _pack_entry(process_dir))
+        except (IOError, socket.error) as e:
+            logger.warning("Can't send cache entry '{0}' to the cache "
+                           "server: {1}".format(process_dir, e))
+
+
+def main(argv=None):
+    """ Run a cache server.
+    """
+    parser = OptionParser(
+        usage="python -m capsul.study_config.cache_backends -d DIRECTORY "
+              "[-H HOST] [-p PORT]")
+    parser.add_option("-d", "--directory", dest="directory",
+                      help="the served cache directory.")
+    parser.add_option("-H", "--host", dest="host", default="localhost",
+                      help="the address to listen to (default localhost).")
+    parser.add_option("-p", "--port", dest="port", type="int", default=0,
+                      help="the port to listen to (default: a free port).")
+    options, args = parser.parse_args(argv)
+    if not options.directory:
+        parser.error("a cache directory is required.")
+    server = CacheServer(options.directory, (options.host, options.port))
+    print("Serving '{0}' on {1}:{2}".format(
+        options.directory, *server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
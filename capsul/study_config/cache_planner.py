@@ -0,0 +1,442 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Dry-run smart-caching planner.
+
+Find out which nodes of a process or pipeline will be found in the
+smart-caching memory before executing anything. The cache keys are the
+ones computed by :class:`~capsul.study_config.memory.MemorizedProcess`,
+and the plan can be reused by :meth:`StudyConfig.run` to avoid hashing
+the processes again::
+
+    plan = study_config.plan_cache(pipeline)
+    print(plan.report())
+    study_config.run(pipeline, cache_plan=plan)
+
+It can also be used from the command line::
+
+    python -m capsul.study_config.cache_planner -p my.module.Pipeline \\
+        -o /output/directory -s input=/data/t1.nii
+"""
+
+from __future__ import print_function
+
+# System import
+import os
+import sys
+import json
+import hashlib
+import logging
+import six
+from optparse import OptionParser
+
+# CAPSUL import
+from capsul.pipeline.pipeline import Pipeline
+from capsul.utils.fingerprint import value_fingerprint
+from capsul.utils.stat_cache import StatCache
+from capsul.utils.trait_paths import path_values
+from capsul.study_config.memory import (
+    Memory, get_process_hash, load_process_result,
+    unrelocate_path, is_empty_value, map_paths)
+
+if sys.version_info[0] >= 3:
+    basestring = str
+
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# Number of cached executions used to estimate a process duration
+DURATION_SAMPLES = 10
+
+
+class CachePlanEntry(object):
+    """ Smart-caching plan of one process.
+
+    Attributes
+    ----------
+    name: str
+        the node (or process) name.
+    process: Process
+        the planned process.
+    status: str
+        'hit' if the process results will be restored from the cache,
+        'miss' if the process will be executed, 'stale' if the process will
+        be executed because some of its inputs are produced by an executed
+        (or temporary) upstream process: its cache key is then only known
+        at run time.
+    process_hash: str
+        the process cache key (None for stale processes).
+    process_dir: str
+        the process cache entry folder (None if it is not a hit).
+    duration: float
+        the recorded execution time for hits, the estimated execution time
+        otherwise (None if it is unknown).
+    input_state: str
+        digest of the process input values and of the stats of its input
+        files when the cache key was computed (None for stale processes).
+    """
+
+    def __init__(self, name, process, status, process_hash=None,
+                 process_dir=None, duration=None, input_state=None):
+        self.name = name
+        self.process = process
+        self.status = status
+        self.process_hash = process_hash
+        self.process_dir = process_dir
+        self.duration = duration
+        self.input_state = input_state
+
+    def __repr__(self):
+        return "{0}({1}, {2})".format(self.__class__.__name__, self.name,
+                                      self.status)
+
+
+class CachePlan(object):
+    """ Smart-caching plan of a process or pipeline execution.
+
+    Attributes
+    ----------
+    entries: list of CachePlanEntry
+        the planned processes, in execution order.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self._entries_by_process = {}
+
+    def add_entry(self, entry):
+        """ Add a planned process.
+        """
+        self.entries.append(entry)
+        self._entries_by_process[id(entry.process)] = entry
+
+    def get_entry(self, process):
+        """ Get the plan of a process (None if it has not been planned).
+        """
+        return self._entries_by_process.get(id(process))
+
+    def get_process_hash(self, process):
+        """ Get the planned cache key of a process.
+
+        The key is only given if the process inputs (values and files
+        stats) did not change since the plan was computed.
+
+        Returns
+        -------
+        process_hash: str
+            the cache key, or None if it has to be computed at run time.
+        """
+        entry = self.get_entry(process)
+        if entry is None or entry.process_hash is None:
+            return None
+        if input_state(process) != entry.input_state:
+            logger.debug("The inputs of '{0}' changed since the cache was "
+                         "planned, its key is computed again.".format(
+                             entry.name))
+            return None
+        return entry.process_hash
+
+    @property
+    def hits(self):
+        return [entry for entry in self.entries if entry.status == "hit"]
+
+    @property
+    def misses(self):
+        return [entry for entry in self.entries if entry.status != "hit"]
+
+    @property
+    def estimated_duration(self):
+        """ Estimated execution time of the planned misses, in seconds.
+        Misses with no duration estimate are not accounted for.
+        """
+        return sum(entry.duration for entry in self.misses
+                   if entry.duration is not None)
+
+    @property
+    def saved_duration(self):
+        """ Recorded execution time of the planned hits, in seconds.
+        """
+        return sum(entry.duration for entry in self.hits
+                   if entry.duration is not None)
+
+    def report(self):
+        """ Get a printable plan report.
+        """
+        lines = []
+        for entry in self.entries:
+            if entry.duration is None:
+                duration = "?"
+            else:
+                duration = "{0:.1f}s".format(entry.duration)
+            lines.append("{0:<6} {1:<32} {2:>10}  {3}".format(
+                entry.status, entry.process_hash or "-", duration,
+                entry.name))
+        unknown = len([entry for entry in self.misses
+                       if entry.duration is None])
+        lines.append(
+            "{0} hit(s), {1} miss(es); estimated recompute time: {2:.1f}s"
+            "{3}; saved time: {4:.1f}s".format(
+                len(self.hits), len(self.misses), self.estimated_duration,
+                " ({0} unknown)".format(unknown) if unknown else "",
+                self.saved_duration))
+        return "\n".join(lines)
+
+
+def plan_cache(process_or_pipeline, cachedir, temp_directory=None,
+               executer_qc_nodes=True, cache_options=None):
+    """ Compute the smart-caching plan of a process or pipeline.
+
+    Nothing is executed: processes are hashed in execution order, input
+    file stats are batched (see :class:`~capsul.utils.stat_cache.StatCache`)
+    and the cache keys of each process are queried once. The output files of
+    planned hits are predicted from the memorized copies which will be
+    restored, so that downstream processes can be planned too.
+
+    Parameters
+    ----------
+    process_or_pipeline: Process or Pipeline
+        the process or pipeline to plan.
+    cachedir: str
+        the smart-caching directory (the run output directory).
+    temp_directory: str (optional)
+        the directory of stable temporary files (see
+        :meth:`StudyConfig._stable_temporary_directory`). If None,
+        processes reading pipeline temporaries are 'stale'.
+    executer_qc_nodes: bool (optional, default True)
+        if False, quality control nodes are not planned.
+    cache_options: dict (optional)
+        the Memory options (relocatable keys, cache backends...).
+
+    Returns
+    -------
+    plan: CachePlan
+        the smart-caching plan.
+    """
+    memory = Memory(cachedir, **(cache_options or {}))
+
+    plan = CachePlan()
+    stat_cache = StatCache(ttl=None)
+    catalog = {}
+    # Files which will be written during the execution
+    pending = set()
+    temporary_files = []
+    try:
+        # Get the processes in execution order, with their temporaries
+        # allocated the same way StudyConfig.run does
+        if isinstance(process_or_pipeline, Pipeline):
+            nodes = process_or_pipeline.workflow_ordered_nodes()
+            if not executer_qc_nodes:
+                nodes = [node for node in nodes
+                         if node.node_type != "view_node"]
+            for node in nodes:
+                process_or_pipeline._check_temporary_files_for_node(
+                    node, temporary_files, temp_directory)
+            processes = [(node.name, node.process) for node in nodes]
+            if temp_directory is None:
+                # random temporary names will change at run time
+                for temp_file in temporary_files:
+                    pending.update(path_values(temp_file[2]))
+        else:
+            processes = [(process_or_pipeline.name, process_or_pipeline)]
+
+        for name, process in processes:
+            entry = _plan_process(name, process, memory, catalog,
+                                  stat_cache, pending)
+            plan.add_entry(entry)
+    finally:
+        if temporary_files:
+            process_or_pipeline._free_temporary_files(temporary_files)
+
+    return plan
+
+
+def input_state(process, stat_cache=None):
+    """ Get a digest of the input values of a process and of the stats of
+    its input files, to check that a planned cache key still holds.
+
+    Parameters
+    ----------
+    process: Process
+        the process.
+    stat_cache: StatCache (optional)
+        the files stats, including the files which will be restored from
+        the cache. Default: the current files stats.
+
+    Returns
+    -------
+    state: str
+    """
+    values = []
+    for param, trait in sorted(six.iteritems(process.user_traits())):
+        if not trait.output:
+            values.append((param, value_fingerprint(
+                process.get_parameter(param), "timestamp", stat_cache)))
+    return hashlib.md5(
+        json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _plan_process(name, process, memory, catalog, stat_cache, pending):
+    """ Plan one process and update the predicted workspace state.
+    """
+    backend = memory.backend
+    relocatable = memory.relocatable
+    path_roots = memory.path_roots or {}
+    if process.id not in catalog:
+        catalog[process.id] = backend.keys(process.id)
+    cached_keys = catalog[process.id]
+    output_names = list(process.traits(output=True).keys())
+
+    # Processes reading files which will be written before them
+    inputs = [process.get_parameter(param)
+              for param, trait in six.iteritems(process.user_traits())
+              if not trait.output]
+    if pending.intersection(path_values(inputs)):
+        entry = CachePlanEntry(
+            name, process, "stale",
+            duration=_estimate_duration(backend, process.id, cached_keys))
+    else:
+        process_hash = get_process_hash(
+            process, relocatable=relocatable, path_roots=path_roots,
+            stat_cache=stat_cache)[0]
+        state = input_state(process, stat_cache)
+        process_dir = None
+        if process_hash in cached_keys:
+            try:
+                process_dir = backend.lookup(process.id, process_hash)
+                if process_dir is None:
+                    raise KeyError(process_hash)
+                result_dict = load_process_result(process_dir, output_names)
+                _predict_restored_files(process, process_dir, result_dict,
+                                        stat_cache, relocatable, path_roots)
+                return CachePlanEntry(name, process, "hit", process_hash,
+                                      process_dir, result_dict["duration"],
+                                      state)
+            except (KeyError, IOError, OSError, ValueError):
+                logger.debug("Can't read the '{0}' cache entry, it will be "
+                             "computed again.".format(process_dir))
+        entry = CachePlanEntry(
+            name, process, "miss", process_hash,
+            duration=_estimate_duration(backend, process.id, cached_keys),
+            input_state=state)
+
+    # The process outputs will be written
+    pending.update(path_values([process.get_parameter(param)
+                                for param in output_names]))
+    return entry
+
+
+def _predict_restored_files(process, process_dir, result_dict, stat_cache,
+                            relocatable, path_roots):
+    """ Declare the workspace files which will be restored from a cache
+    entry, the same way MemorizedProcess does.
+    """
+    with open(os.path.join(process_dir, "file_mapping.json")) as open_file:
+        file_mapping = json.load(open_file)
+    path_map = {}
+    if relocatable:
+        parameters = unrelocate_path(result_dict["parameters"], path_roots)
+        for name, value in six.iteritems(parameters):
+            if name not in process.traits(output=True):
+                continue
+            current_value = process.get_parameter(name)
+            if not is_empty_value(current_value):
+                map_paths(value, current_value, path_map)
+    for workspace_file, memory_file in file_mapping:
+        if relocatable:
+            workspace_file = unrelocate_path(workspace_file, path_roots)
+            workspace_file = path_map.get(workspace_file, workspace_file)
+        stat_cache.alias(workspace_file,
+                         os.path.join(process_dir, memory_file))
+
+
+def _estimate_duration(backend, process_id, cached_keys):
+    """ Estimate a process execution time from its most recent cached
+    executions which can be read without transfer.
+    """
+    process_dirs = [backend.lookup(process_id, key, fetch=False)
+                    for key in cached_keys]
+    process_dirs = sorted((process_dir for process_dir in process_dirs
+                           if process_dir is not None),
+                          key=_mtime, reverse=True)
+    durations = []
+    for process_dir in process_dirs[:DURATION_SAMPLES]:
+        try:
+            duration = load_process_result(process_dir, [])["duration"]
+        except (KeyError, IOError, OSError, ValueError):
+            continue
+        if duration is not None:
+            durations.append(duration)
+    if not durations:
+        return None
+    return sum(durations) / len(durations)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
+
+
+def _parse_value(value):
+    """ Command line parameter values are json, or plain strings.
+    """
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def main(argv=None):
+    """ Cache planner command line.
+    """
+    from capsul.api import StudyConfig
+
+    parser = OptionParser(
+        usage="python -m capsul.study_config.cache_planner -p PROCESS "
+              "-o OUTPUT_DIRECTORY [-s NAME=VALUE ...]")
+    parser.add_option("-p", "--process", dest="process",
+                      help="the process or pipeline id.")
+    parser.add_option("-o", "--output-directory", dest="output_directory",
+                      help="the execution output directory, which holds "
+                           "the smart-caching memory.")
+    parser.add_option("-s", "--set", dest="parameters", action="append",
+                      default=[],
+                      help="set a process parameter: NAME=VALUE, VALUE "
+                           "being json or a string. May be repeated.")
+    parser.add_option("-r", "--relocatable", dest="relocatable",
+                      action="store_true", default=False,
+                      help="use relocatable cache keys.")
+    parser.add_option("-R", "--path-root", dest="path_roots",
+                      action="append", default=[],
+                      help="relocatable path root: NAME=DIRECTORY. May be "
+                           "repeated.")
+    options, args = parser.parse_args(argv)
+    if not options.process or not options.output_directory:
+        parser.error("a process and an output directory are required.")
+
+    config = {"use_smart_caching": True,
+              "output_directory": options.output_directory}
+    if options.relocatable:
+        config["smart_caching_relocatable"] = True
+        config["smart_caching_path_roots"] = dict(
+            root.split("=", 1) for root in options.path_roots)
+    study_config = StudyConfig(**config)
+    process = study_config.get_process_instance(options.process)
+    for parameter in options.parameters:
+        name, value = parameter.split("=", 1)
+        setattr(process, name, _parse_value(value))
+
+    plan = study_config.plan_cache(process)
+    print(plan.report())
+    return plan
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@
 # for details.
 ##########################################################################
 
-from traits.api import Bool, Undefined
+from traits.api import Bool, Undefined, Dict, Str, Enum, List, Directory
 from capsul.study_config.study_config import StudyConfigModule
 
 
@@ -17,5 +17,40 @@ class SmartCachingConfig(StudyConfigModule):
             False,
             output=False,
             desc='Use smart-caching during the execution'))
+        study_config.add_trait('smart_caching_relocatable', Bool(
+            False,
+            output=False,
+            desc='Use cache keys which do not depend on absolute file '
+            'paths, so that a cache can be shared between studies, storage '
+            'mounts or users'))
+        study_config.add_trait('smart_caching_path_roots', Dict(
+            Str(), Str(),
+            output=False,
+            desc='Relocatable smart-caching roots mapping: '
+            '{root_name: directory}. Files located in a root are identified '
+            'by their path relative to it, other files by their content.'))
+        study_config.add_trait('smart_caching_result_format', Enum(
+            'json', 'binary',
+            output=False,
+            desc='Format used to store process results in the smart-caching '
+            'memory: "json" (human readable) or "binary" (faster for large '
+            'parameters, lazily decoded)'))
+        study_config.add_trait('smart_caching_directory', Directory(
+            Undefined,
+            output=False,
+            desc='Directory of the writable smart-caching memory (default: '
+            'the execution output directory)'))
+        study_config.add_trait('smart_caching_shared_directories', List(
+            Directory(),
+            output=False,
+            desc='Read-only smart-caching memories looked up after the '
+            'writable one. Their entries are promoted (copied) to the '
+            'writable memory when they are used.'))
+        study_config.add_trait('smart_caching_server', Str(
+            Undefined,
+            output=False,
+            desc='"host:port" address of a smart-caching server, looked up '
+            'after the local memories, and where new cache entries are '
+            'sent'))
         self.study_config = study_config
         # self.study_config.on_trait_change(self._use_smart_caching_changed, 'use_smart_caching')
@@ -6,7 +6,7 @@
 # for details.
 ##########################################################################
 
-from traits.api import Bool, Str, Undefined, List, Dict
+from traits.api import Bool, Str, Undefined, List, Dict, Int
 from capsul.study_config.study_config import StudyConfigModule
 from soma.controller import Controller, ControllerTrait, OpenKeyController
 
@@ -45,6 +45,16 @@ class SomaWorkflowConfig(StudyConfigModule):
                 Undefined,
                 output=False,
                 desc='Soma-workflow computing resource to be used to run processing'))
+        study_config.add_trait('somaworkflow_local_engine', Bool(
+            False,
+            output=False,
+            desc='Run the workflows in the current process instead of a '
+            'soma-workflow controller (local machine only)'))
+        study_config.add_trait('somaworkflow_local_workers', Int(
+            0,
+            output=False,
+            desc='Number of jobs run at the same time by the local engine '
+            '(0: number of CPUs)'))
 
         study_config.add_trait(
             'somaworkflow_computing_resources_config',
@@ -19,9 +19,18 @@ import numpy
 import logging
 import six
 import sys
+import struct
+from collections import OrderedDict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 # CAPSUL import
 from capsul.process.process import Process, ProcessResult
+from capsul.study_config.cache_backends import (
+    LocalCacheBackend, TieredCacheBackend, SocketCacheBackend)
+from capsul.utils.fingerprint import path_fingerprint
 
 # NIPYPE import
 try:
@@ -190,7 +199,9 @@ class MemorizedProcess(object):
     structure. Methods are provided to inspect the cache or clean it.
     """
 
-    def __init__(self, process, cachedir, timestamp=None, verbose=1):
+    def __init__(self, process, cachedir, timestamp=None, verbose=1,
+                 relocatable=False, path_roots=None, result_format="json",
+                 process_hash=None, backend=None):
         """ Initialize the MemorizedProcess class.
 
         Parameters
@@ -207,6 +218,27 @@ class MemorizedProcess(object):
             is called.
         verbose: int
             if different from zero, print console messages.
+        relocatable: bool (optional, default False)
+            if True, the cache keys do not depend on absolute file paths:
+            input files are identified by their path relative to one of the
+            path_roots, or by their content digest and basename. Cached
+            results are restored to the current workspace paths.
+        path_roots: dict (optional)
+            {root_name: directory} mapping used in relocatable mode. The same
+            root names should point to the study directories on each storage
+            mount or checkout sharing the cache.
+        result_format: str (optional, default "json")
+            "json" or "binary": format used to write process results in the
+            cache. Binary results (see :func:`write_binary_result`) are
+            faster to write and read for large parameter values, and are
+            decoded lazily. Both formats can be read whatever this option.
+        process_hash: str (optional)
+            the process cache key, if it is already known (for instance from
+            a :class:`~capsul.study_config.cache_planner.CachePlan`). It is
+            then used instead of hashing the process inputs again.
+        backend: CacheBackend (optional)
+            the cache storage (see :mod:`capsul.study_config.cache_backends`).
+            Default: entries are stored in the cachedir directory.
         """
         # Check the a process is passed
         self.process_class = process.__class__
@@ -223,6 +255,9 @@ class MemorizedProcess(object):
         if not os.path.exists(cachedir) and os.path.isdir(cachedir):
             raise ValueError("'base_dir' should be an existing directory.")
         self.cachedir = cachedir
+        if backend is None:
+            backend = LocalCacheBackend(cachedir)
+        self.backend = backend
 
         # Define the cache time
         if timestamp is None:
@@ -235,6 +270,22 @@ class MemorizedProcess(object):
         # Store if some messages have to be displayed
         self.verbose = verbose
 
+        # Relocatable cache keys
+        self.relocatable = relocatable
+        self.path_roots = path_roots or {}
+
+        # Result serialization
+        if result_format not in ("json", "binary"):
+            raise ValueError(
+                "Unknown result format '{0}'.".format(result_format))
+        self.result_format = result_format
+
+        # Precomputed cache key
+        self.process_hash = process_hash
+
+        # True when the last call loaded the results from the cache
+        self.cache_hit = False
+
     def __call__(self, **kwargs):
         """ Call wrapped process and cache result, or read cache if
         available.
@@ -254,15 +305,17 @@ class MemorizedProcess(object):
         for name, value in six.iteritems(kwargs):
             self.process.set_parameter(name, value)
 
-        # Create the destination folder and a unique id for the current
-        # process
+        # Get a unique id for the current process and look for it in the
+        # cache
         process_dir, process_hash, input_parameters = self._get_process_id()
+        self.cache_hit = process_dir is not None
 
         # Execute the process
-        if not os.path.isdir(process_dir):
+        if process_dir is None:
 
             # Create the destination memory folder
-            os.makedirs(process_dir)
+            process_dir = self.backend.new_entry(self.process.id,
+                                                 process_hash)
 
             # Try to execute the process and if an error occured remove the
             # cache folder
@@ -280,36 +333,72 @@ class MemorizedProcess(object):
                 file_mapping = []
                 self._copy_files_to_memory(output_parameters, process_dir,
                                            file_mapping)
+                # Memory files are stored relative to the memory folder so
+                # that entries can be moved between cache backends
+                file_mapping = [
+                    (workspace_file, os.path.relpath(memory_file, process_dir))
+                    for workspace_file, memory_file in file_mapping]
+                if self.relocatable:
+                    file_mapping = [
+                        (relocate_path(workspace_file, self.path_roots),
+                         memory_file)
+                        for workspace_file, memory_file in file_mapping]
                 map_fname = os.path.join(process_dir, "file_mapping.json")
                 with open(map_fname, "w") as open_file:
                     open_file.write(json.dumps(file_mapping))
 
+                # Validate the cache entry
+                self.backend.store(self.process.id, process_hash,
+                                   process_dir)
+
             except:
-                shutil.rmtree(process_dir)
+                self.backend.discard(self.process.id, process_hash,
+                                     process_dir)
                 raise
 
         # Restore the process results from the cache folder
         else:
-            # Restore the memorized files
-            map_fname = os.path.join(process_dir, "file_mapping.json")
-            with open(map_fname, "r") as json_data:
-                file_mapping = json.load(json_data)
-
-            # Go through all mapping files
-            for workspace_file, memory_file in file_mapping:
-
-                # Determine if the workspace directory is writeable
-                if os.access(os.path.dirname(workspace_file), os.W_OK):
-                    shutil.copy2(memory_file, workspace_file)
-                else:
-                    logger.debug("Can't restore file '{0}', access rights are "
-                                 "not sufficients.".format(workspace_file))
-
-            # Update the process output traits
+            # Restore the memorized files and update the process output
+            # traits
             result = self._load_process_result(process_dir, input_parameters)
 
         return result
 
+    def _restore_files(self, process_dir, path_map=None):
+        """ Copy memorized files back to the workspace.
+
+        Parameters
+        ----------
+        process_dir: str
+            the process memory path.
+        path_map: dict (optional)
+            relocatable mode: {recorded_path: current_path} mapping of the
+            workspace files.
+        """
+        # Restore the memorized files
+        map_fname = os.path.join(process_dir, "file_mapping.json")
+        with open(map_fname, "r") as json_data:
+            file_mapping = json.load(json_data)
+
+        # Go through all mapping files
+        for workspace_file, memory_file in file_mapping:
+
+            # In relocatable mode paths are stored relative to path roots.
+            # Memory files are relative to the memory folder (former caches
+            # stored absolute paths, which are left unchanged by the join)
+            if self.relocatable:
+                workspace_file = unrelocate_path(workspace_file,
+                                                 self.path_roots)
+                workspace_file = path_map.get(workspace_file, workspace_file)
+            memory_file = os.path.join(process_dir, memory_file)
+
+            # Determine if the workspace directory is writeable
+            if os.access(os.path.dirname(workspace_file), os.W_OK):
+                shutil.copy2(memory_file, workspace_file)
+            else:
+                logger.debug("Can't restore file '{0}', access rights are "
+                             "not sufficients.".format(workspace_file))
+
     def _copy_files_to_memory(self, python_object, process_dir, file_mapping):
         """ Copy file items inside the memory.
 
@@ -373,16 +462,29 @@ class MemorizedProcess(object):
         result = self.process()
         duration = time.time() - start_time
 
-        # Save the result in json format
+        # Save the result
         cache = {'parameters': dict((i, getattr(self.process, i)) 
                                     for i in self.process.user_traits()),
-                 'result': result}
-        json_data = json.dumps(cache, sort_keys=True,
-                               check_circular=True, indent=4,
-                               cls=CapsulResultEncoder)
-        result_fname = os.path.join(process_dir, "result.json")
-        with open(result_fname, "w") as open_file:
-            open_file.write(json_data)
+                 'result': result,
+                 'duration': duration}
+        if self.relocatable:
+            cache['parameters'] = relocate_path(cache['parameters'],
+                                                self.path_roots)
+        if self.result_format == "binary":
+            entries = [("result", picklable_result(result)),
+                       ("duration", duration)]
+            entries.extend(
+                ("parameters/" + name, plain_value(value))
+                for name, value in six.iteritems(cache['parameters']))
+            write_binary_result(os.path.join(process_dir, "result.bin"),
+                                entries)
+        else:
+            json_data = json.dumps(cache, sort_keys=True,
+                                   check_circular=True, indent=4,
+                                   cls=CapsulResultEncoder)
+            result_fname = os.path.join(process_dir, "result.json")
+            with open(result_fname, "w") as open_file:
+                open_file.write(json_data)
 
         # Information message
         if self.verbose != 0:
@@ -411,19 +513,35 @@ class MemorizedProcess(object):
             print("[Memory]: Loading {0}...".format(
                 get_process_signature(self.process, input_parameters)))
 
-        # Load the process result
-        result_fname = os.path.join(process_dir, "result.json")
-        if not os.path.isfile(result_fname):
-            raise KeyError(
-                "Non-existing cache value (may have been cleared).\n"
-                "File {0} does not exist.".format(result_fname))
-        with open(result_fname, "r") as json_data:
-            result_dict = json.load(json_data, cls=CapsulResultDecoder)
-
-
-        ## Update the process output traits
-        for name, value in six.iteritems(result_dict['parameters']):
-            self.process.set_parameter(name, value)
+        # Load the process result: binary results are decoded lazily, only
+        # output parameters are loaded
+        result_dict = load_process_result(
+            process_dir, list(self.process.traits(output=True).keys()))
+
+        # Non relocatable cache: restore files and parameters as they were
+        # recorded
+        if not self.relocatable:
+            self._restore_files(process_dir)
+            for name, value in six.iteritems(result_dict['parameters']):
+                self.process.set_parameter(name, value)
+            return result_dict['result']
+
+        # Relocatable cache: inputs are left untouched (they match the cache
+        # key anyway), and outputs which already have a value in the
+        # workspace keep it: memorized files are restored there.
+        parameters = unrelocate_path(result_dict['parameters'],
+                                     self.path_roots)
+        path_map = {}
+        output_names = self.process.traits(output=True)
+        for name, value in six.iteritems(parameters):
+            if name not in output_names:
+                continue
+            current_value = self.process.get_parameter(name)
+            if is_empty_value(current_value):
+                self.process.set_parameter(name, value)
+            else:
+                map_paths(value, current_value, path_map)
+        self._restore_files(process_dir, path_map)
 
         return result_dict['result']
 
@@ -434,15 +552,20 @@ class MemorizedProcess(object):
         Returns
         -------
         process_dir: string
-            the directory where the cache should be write.
+            the cache entry directory, or None if the process has not been
+            cached with these arguments.
         process_hash: string
             the process md5 hash.
         input_parameters: dict
             the process input_parameters.
         """
         # Get the process id
-        process_hash, input_parameters = self._get_argument_hash()
-        process_dir = os.path.join(self._get_process_dir(), process_hash)
+        if self.process_hash is not None:
+            process_hash = self.process_hash
+            input_parameters = get_process_inputs(self.process)
+        else:
+            process_hash, input_parameters = self._get_argument_hash()
+        process_dir = self.backend.lookup(self.process.id, process_hash)
 
         return process_dir, process_hash, input_parameters
 
@@ -466,43 +589,8 @@ class MemorizedProcess(object):
         input_parameters: dict
             the process input_parameters.
         """
-        # Store for input parameters
-        input_parameters = {}
-
-        # Go through all the user traits
-        for name, trait in six.iteritems(self.process.user_traits()):
-
-            # Get the trait value
-            value = self.process.get_parameter(name)
-
-            # Split input and output traits
-            is_input = True
-            if "output" in trait.__dict__ and trait.output:
-                is_input = False
-
-            # Skip undefined trait attributes and outputs
-            if is_input and value is not Undefined:
-
-                # Check specific flags before hash
-                if has_attribute(trait, "nohash", attribute_value=True,
-                                 recursive=True):
-                    continue
-
-                # Store the input parameter
-                input_parameters[name] = value
-
-        # Add the tool versions to check roughly if the running codes have
-        # changed and add file path fingerprints
-        process_parameters = input_parameters.copy()
-        process_parameters = self._add_fingerprints(process_parameters)
-        process_parameters["versions"] = self.process.versions
-
-        # Generate the process hash
-        hasher = hashlib.new("md5")
-        hasher.update(json.dumps(process_parameters, sort_keys=True).encode())
-        process_hash = hasher.hexdigest()
-
-        return process_hash, input_parameters
+        return get_process_hash(self.process, relocatable=self.relocatable,
+                                path_roots=self.path_roots)
 
     def _add_fingerprints(self, python_object):
         """ Add file path fingerprints.
@@ -517,31 +605,8 @@ class MemorizedProcess(object):
         out: object
             the input object with fingerprint-file representation.
         """
-        # Deal with dictionary
-        out = {}
-        if isinstance(python_object, dict):
-            for key, val in six.iteritems(python_object):
-                if val is not Undefined:
-                    out[key] = self._add_fingerprints(val)
-
-        # Deal with tuple and list
-        elif isinstance(python_object, (list, tuple)):
-            out = []
-            for val in python_object:
-                if val is not Undefined:
-                    out.append(self._add_fingerprints(val))
-            if isinstance(python_object, tuple):
-                out = tuple(out)
-
-        # Otherwise start the deletion if the object is a file
-        else:
-            out = python_object
-            if (python_object is not Undefined and
-                    isinstance(python_object, basestring) and
-                    os.path.isfile(python_object)):
-                out = file_fingerprint(python_object)
-
-        return out
+        return add_fingerprints(python_object, relocatable=self.relocatable,
+                                path_roots=self.path_roots)
 
     def _get_process_dir(self):
         """ Get the directory corresponding to the cache for the current
@@ -673,7 +738,177 @@ def has_attribute(trait, attribute_name, attribute_value=None,
     return count > 0
 
 
-def file_fingerprint(afile):
+def get_process_inputs(process):
+    """ Get the process input parameters which are part of its cache key.
+
+    Undefined values, outputs and parameters whose trait has a 'nohash'
+    attribute are omitted.
+
+    Parameters
+    ----------
+    process: Process
+        a capsul process object
+
+    Returns
+    -------
+    input_parameters: dict
+        the process input_parameters.
+    """
+    # Store for input parameters
+    input_parameters = {}
+
+    # Go through all the user traits
+    for name, trait in six.iteritems(process.user_traits()):
+
+        # Get the trait value
+        value = process.get_parameter(name)
+
+        # Split input and output traits
+        is_input = True
+        if "output" in trait.__dict__ and trait.output:
+            is_input = False
+
+        # Skip undefined trait attributes and outputs
+        if is_input and value is not Undefined:
+
+            # Check specific flags before hash
+            if has_attribute(trait, "nohash", attribute_value=True,
+                             recursive=True):
+                continue
+
+            # Store the input parameter
+            input_parameters[name] = value
+
+    return input_parameters
+
+
+def get_process_hash(process, relocatable=False, path_roots=None,
+                     stat_cache=None, input_parameters=None):
+    """ Get a hash of the process arguments.
+
+    This is the key used by the smart-caching to identify a process
+    execution (see :class:`MemorizedProcess`).
+
+    The user process traits are accessed through the user_traits()
+    method that returns a sorted dictionary.
+
+    Some parameters are not considered during the hash computation:
+        * if the parameter value is not defined
+        * if the corresponding trait has an attribute 'nohash'
+
+    Add the tool versions to check roughly if the running codes have
+    changed.
+
+    Parameters
+    ----------
+    process: Process
+        a capsul process object
+    relocatable: bool (optional, default False)
+        if True, the hash does not depend on absolute file paths (see
+        :func:`add_fingerprints`).
+    path_roots: dict (optional)
+        {root_name: directory} mapping used in relocatable mode.
+    stat_cache: StatCache (optional)
+        directories listings (see :mod:`capsul.utils.stat_cache`) to use
+        instead of one system call per file.
+    input_parameters: dict (optional)
+        the input parameters to hash. Default: the process ones (see
+        :func:`get_process_inputs`).
+
+    Returns
+    -------
+    process_hash: string
+        the process md5 hash.
+    input_parameters: dict
+        the process input_parameters.
+    """
+    if input_parameters is None:
+        input_parameters = get_process_inputs(process)
+
+    # Add the tool versions to check roughly if the running codes have
+    # changed and add file path fingerprints
+    process_parameters = input_parameters.copy()
+    process_parameters = add_fingerprints(
+        process_parameters, relocatable=relocatable, path_roots=path_roots,
+        stat_cache=stat_cache)
+    process_parameters["versions"] = process.versions
+
+    # Generate the process hash
+    hasher = hashlib.new("md5")
+    hasher.update(json.dumps(process_parameters, sort_keys=True).encode())
+    process_hash = hasher.hexdigest()
+
+    return process_hash, input_parameters
+
+
+def add_fingerprints(python_object, relocatable=False, path_roots=None,
+                     stat_cache=None):
+    """ Add file path fingerprints.
+
+    Parameters
+    ----------
+    python_object: object
+        a generic python object.
+    relocatable: bool (optional, default False)
+        if True, files are identified by their path relative to one of the
+        path_roots (with their size and mtime), or by their basename and
+        content digest if they are not in any root. Other path strings are
+        made relative to the path roots.
+    path_roots: dict (optional)
+        {root_name: directory} mapping used in relocatable mode.
+    stat_cache: StatCache (optional)
+        directories listings (see :mod:`capsul.utils.stat_cache`) to use
+        instead of one system call per file.
+
+    Returns
+    -------
+    out: object
+        the input object with fingerprint-file representation.
+    """
+    # Deal with dictionary
+    out = {}
+    if isinstance(python_object, dict):
+        for key, val in six.iteritems(python_object):
+            if val is not Undefined:
+                out[key] = add_fingerprints(val, relocatable, path_roots,
+                                            stat_cache)
+
+    # Deal with tuple and list
+    elif isinstance(python_object, (list, tuple)):
+        out = []
+        for val in python_object:
+            if val is not Undefined:
+                out.append(add_fingerprints(val, relocatable, path_roots,
+                                            stat_cache))
+        if isinstance(python_object, tuple):
+            out = tuple(out)
+
+    # Otherwise start the deletion if the object is a file
+    else:
+        out = python_object
+        if (python_object is not Undefined and
+                isinstance(python_object, basestring) and
+                _isfile(python_object, stat_cache)):
+            if relocatable:
+                out = relocatable_file_fingerprint(python_object, path_roots,
+                                                   stat_cache)
+            else:
+                out = file_fingerprint(python_object, stat_cache)
+        elif relocatable and isinstance(python_object, basestring):
+            out = relocate_path(python_object, path_roots)
+
+    return out
+
+
+def _isfile(afile, stat_cache=None):
+    """ Check if a path is an existing file, using a stat cache if given.
+    """
+    if stat_cache is not None:
+        return stat_cache.stat(afile) is not None
+    return os.path.isfile(afile)
+
+
+def file_fingerprint(afile, stat_cache=None):
     """ Computes the file fingerprint.
 
     Do not consider the file content, just the fingerprint (ie. the mtime,
@@ -683,22 +918,155 @@ def file_fingerprint(afile):
     ----------
     afile: string
         the file to process.
+    stat_cache: StatCache (optional)
+        directories listings (see :mod:`capsul.utils.stat_cache`) to use
+        instead of a system call.
 
     Returns
     -------
-    fingerprint: tuple
-        the file location, mtime and size.
+    fingerprint: dict
+        the file location and its fingerprint (see
+        :func:`~capsul.utils.fingerprint.path_fingerprint`).
     """
-    fingerprint = {
+    return {
         "name": afile,
-        "mtime": None,
-        "size": None
+        "fingerprint": path_fingerprint(afile, stat_cache=stat_cache)
+    }
+
+
+def relocatable_file_fingerprint(afile, path_roots=None, stat_cache=None):
+    """ Computes a file fingerprint which does not depend on the file
+    location on the storage.
+
+    If the file is in one of the path roots, it is identified by its path
+    relative to this root, its mtime and size. Otherwise it is identified by
+    its basename, size and content digest.
+
+    Parameters
+    ----------
+    afile: string
+        the file to process.
+    path_roots: dict (optional)
+        {root_name: directory} mapping.
+    stat_cache: StatCache (optional)
+        directories listings (see :mod:`capsul.utils.stat_cache`) to use
+        instead of a system call.
+
+    Returns
+    -------
+    fingerprint: dict
+        the file fingerprint.
+    """
+    name = relocate_path(afile, path_roots)
+    if name != afile:
+        fingerprint = file_fingerprint(afile, stat_cache)
+        fingerprint["name"] = name
+        return fingerprint
+    return {
+        "name": os.path.basename(afile),
+        "fingerprint": path_fingerprint(afile, "hash", stat_cache)
     }
-    if os.path.isfile(afile):
-        stat = os.stat(afile)
-        fingerprint["size"] = str(stat.st_size)
-        fingerprint["mtime"] = str(stat.st_mtime)
-    return fingerprint
+
+
+def relocate_path(python_object, path_roots):
+    """ Replace paths located in one of the path roots by a location-
+    independent representation: "<root:root_name>/relative/path".
+
+    Parameters
+    ----------
+    python_object: object
+        a path, or a generic python object (dict, list, tuple) containing
+        paths.
+    path_roots: dict
+        {root_name: directory} mapping.
+
+    Returns
+    -------
+    out: object
+        the input object with relocated paths.
+    """
+    if isinstance(python_object, dict):
+        return dict((key, relocate_path(val, path_roots))
+                    for key, val in six.iteritems(python_object))
+    elif isinstance(python_object, (list, tuple)):
+        out = [relocate_path(val, path_roots) for val in python_object]
+        if isinstance(python_object, tuple):
+            out = tuple(out)
+        return out
+    elif isinstance(python_object, basestring) and path_roots:
+        # Use the deepest matching root
+        for root_name, root in sorted(six.iteritems(path_roots),
+                                      key=lambda item: -len(item[1])):
+            root = os.path.join(os.path.abspath(root), "")
+            if python_object.startswith(root):
+                return "<root:{0}>/{1}".format(
+                    root_name, python_object[len(root):])
+    return python_object
+
+
+def unrelocate_path(python_object, path_roots):
+    """ Revert :func:`relocate_path` using the current path roots.
+
+    Parameters
+    ----------
+    python_object: object
+        a relocated path, or a generic python object (dict, list, tuple)
+        containing relocated paths.
+    path_roots: dict
+        {root_name: directory} mapping.
+
+    Returns
+    -------
+    out: object
+        the input object with paths in the current path roots.
+    """
+    if isinstance(python_object, dict):
+        return dict((key, unrelocate_path(val, path_roots))
+                    for key, val in six.iteritems(python_object))
+    elif isinstance(python_object, (list, tuple)):
+        out = [unrelocate_path(val, path_roots) for val in python_object]
+        if isinstance(python_object, tuple):
+            out = tuple(out)
+        return out
+    elif (isinstance(python_object, basestring) and
+            python_object.startswith("<root:")):
+        end = python_object.find(">/")
+        root = path_roots.get(python_object[6:end])
+        if end > 0 and root is not None:
+            return os.path.join(os.path.abspath(root),
+                                python_object[end + 2:])
+    return python_object
+
+
+def is_empty_value(value):
+    """ Check if a parameter value is empty: undefined, None, empty string,
+    or a list containing only empty values.
+    """
+    if isinstance(value, (list, tuple)):
+        return all(is_empty_value(item) for item in value)
+    return value in (Undefined, None, "")
+
+
+def map_paths(recorded, current, path_map):
+    """ Match paths in a recorded parameter value with paths in the current
+    value of the same parameter.
+
+    Parameters
+    ----------
+    recorded: object
+        a parameter value, as recorded in the cache.
+    current: object
+        the same parameter value in the current workspace.
+    path_map: dict
+        {recorded_path: current_path} mapping, updated by this function.
+    """
+    if (isinstance(recorded, (list, tuple)) and
+            isinstance(current, (list, tuple))):
+        for recorded_item, current_item in zip(recorded, current):
+            map_paths(recorded_item, current_item, path_map)
+    elif (isinstance(recorded, basestring) and
+            isinstance(current, basestring) and current):
+        path_map[recorded] = current
 
 
 class CapsulResultEncoder(json.JSONEncoder):
@@ -780,6 +1148,207 @@ class CapsulResultDecoder(json.JSONDecoder):
             return obj
 
 
+############################################################################
+# Binary results
+############################################################################
+
+# Binary result file layout:
+#   - magic string (8 bytes)
+#   - format version (unsigned int, 4 bytes)
+#   - index size (unsigned long long, 8 bytes)
+#   - index: pickled list of (key, offset, size) entries, offsets being
+#     relative to the end of the index
+#   - entries: each value is pickled separately so that it can be decoded
+#     independently
+BINARY_RESULT_MAGIC = b"CAPSULRB"
+BINARY_RESULT_VERSION = 1
+_binary_header = struct.Struct("<8sIQ")
+_pickle_protocol = min(4, pickle.HIGHEST_PROTOCOL)
+
+
+def write_binary_result(fname, entries):
+    """ Write a process result in the binary format.
+
+    Parameters
+    ----------
+    fname: str
+        the output file name.
+    entries: list of 2-uplet
+        (key, value) result entries. Values must be picklable (see
+        :func:`plain_value` and :func:`picklable_result`).
+    """
+    blobs = []
+    index = []
+    offset = 0
+    for key, value in entries:
+        blob = pickle.dumps(value, _pickle_protocol)
+        index.append((key, offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+    index_blob = pickle.dumps(index, _pickle_protocol)
+    with open(fname, "wb") as open_file:
+        open_file.write(_binary_header.pack(
+            BINARY_RESULT_MAGIC, BINARY_RESULT_VERSION, len(index_blob)))
+        open_file.write(index_blob)
+        for blob in blobs:
+            open_file.write(blob)
+
+
+class BinaryResultReader(object):
+    """ Lazy reader for results written by :func:`write_binary_result`.
+
+    Only the index is read when the reader is created: values are decoded
+    when they are accessed.
+
+    >>> reader = BinaryResultReader("result.bin")
+    >>> reader.keys()
+    >>> outputs = reader["parameters/outputs"]
+    """
+
+    def __init__(self, fname):
+        """ Initialize the BinaryResultReader class.
+
+        Parameters
+        ----------
+        fname: str
+            the binary result file name.
+        """
+        self.fname = fname
+        with open(fname, "rb") as open_file:
+            magic, version, index_size = _binary_header.unpack(
+                open_file.read(_binary_header.size))
+            if magic != BINARY_RESULT_MAGIC:
+                raise ValueError(
+                    "'{0}' is not a capsul binary result file.".format(fname))
+            if version > BINARY_RESULT_VERSION:
+                raise ValueError(
+                    "'{0}' has an unsupported binary result version: "
+                    "{1}.".format(fname, version))
+            index = pickle.loads(open_file.read(index_size))
+        self._data_offset = _binary_header.size + index_size
+        self._index = OrderedDict((key, (offset, size))
+                                  for key, offset, size in index)
+
+    def keys(self):
+        """ Get the result entries keys.
+        """
+        return list(self._index.keys())
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __getitem__(self, key):
+        """ Decode a result entry.
+        """
+        offset, size = self._index[key]
+        with open(self.fname, "rb") as open_file:
+            open_file.seek(self._data_offset + offset)
+            return pickle.loads(open_file.read(size))
+
+
+def plain_value(value):
+    """ Convert trait values (TraitListObject, TraitDictObject...) into
+    plain python containers which can be pickled independently of their
+    HasTraits owner.
+    """
+    if isinstance(value, dict):
+        return dict((key, plain_value(item))
+                    for key, item in six.iteritems(value))
+    elif isinstance(value, tuple):
+        return tuple(plain_value(item) for item in value)
+    elif isinstance(value, list):
+        return [plain_value(item) for item in value]
+    return value
+
+
+def picklable_result(result):
+    """ Convert a process result into a picklable object, the same way
+    CapsulResultEncoder does for json.
+    """
+    if isinstance(result, ProcessResult):
+        return dict((name, plain_value(getattr(result, name)))
+                    for name in ["runtime", "returncode", "inputs",
+                                 "outputs"])
+    elif isinstance(result, InterfaceResult):
+        return "<skip_nipype_interface_result>"
+    return plain_value(result)
+
+
+def load_process_result(process_dir, parameter_names=None):
+    """ Read a process result from the cache.
+
+    Parameters
+    ----------
+    process_dir: str
+        the process memory folder.
+    parameter_names: list of str (optional)
+        the parameters to decode from binary results (default: all). Json
+        results are always fully decoded.
+
+    Returns
+    -------
+    result_dict: dict
+        the cached 'parameters', 'result' and 'duration' (None if it was
+        not recorded).
+    """
+    binary_fname = os.path.join(process_dir, "result.bin")
+    result_fname = os.path.join(process_dir, "result.json")
+    if os.path.isfile(binary_fname):
+        reader = BinaryResultReader(binary_fname)
+        parameters = {}
+        for key in reader.keys():
+            if not key.startswith("parameters/"):
+                continue
+            name = key[len("parameters/"):]
+            if parameter_names is None or name in parameter_names:
+                parameters[name] = reader[key]
+        result_dict = {'parameters': parameters,
+                       'result': reader["result"]}
+        if "duration" in reader:
+            result_dict['duration'] = reader["duration"]
+    elif os.path.isfile(result_fname):
+        with open(result_fname, "r") as json_data:
+            result_dict = json.load(json_data, cls=CapsulResultDecoder)
+    else:
+        raise KeyError(
+            "Non-existing cache value (may have been cleared).\n"
+            "File {0} does not exist.".format(result_fname))
+    result_dict.setdefault('duration', None)
+    return result_dict
+
+
+def export_result_to_json(process_dir, json_fname=None):
+    """ Export a binary process result from the cache to json.
+
+    Parameters
+    ----------
+    process_dir: str
+        the process memory folder.
+    json_fname: str (optional)
+        the output json file name. Default: "result.json" in the process
+        memory folder.
+
+    Returns
+    -------
+    json_fname: str
+        the written json file name.
+    """
+    reader = BinaryResultReader(os.path.join(process_dir, "result.bin"))
+    cache = {"parameters": {}}
+    for key in reader.keys():
+        if key.startswith("parameters/"):
+            cache["parameters"][key[len("parameters/"):]] = reader[key]
+        else:
+            cache[key] = reader[key]
+    if json_fname is None:
+        json_fname = os.path.join(process_dir, "result.json")
+    json_data = json.dumps(cache, sort_keys=True, check_circular=True,
+                           indent=4, cls=CapsulResultEncoder)
+    with open(json_fname, "w") as open_file:
+        open_file.write(json_data)
+    return json_fname
+
+
 ############################################################################
 # Memory manager: provide some tracking about what is computed when, to
 # be able to flush the disk
@@ -799,13 +1368,31 @@ class Memory(object):
     clear
     """
 
-    def __init__(self, cachedir):
+    def __init__(self, cachedir, relocatable=False, path_roots=None,
+                 result_format="json", shared_cachedirs=None,
+                 cache_server=None):
         """ Initialize the Memory class.
 
         Parameters
         ----------
         base_dir: string
             the directory name of the location for the caching.
+        relocatable: bool (optional, default False)
+            use cache keys which do not depend on absolute file paths (see
+            :class:`MemorizedProcess`).
+        path_roots: dict (optional)
+            {root_name: directory} mapping used in relocatable mode.
+        result_format: str (optional, default "json")
+            "json" or "binary" format used to write process results.
+        shared_cachedirs: list of str (optional)
+            read-only caches looked up after the cachedir one. Their entries
+            are promoted (copied) into the cachedir cache when they are
+            used.
+        cache_server: str (optional)
+            "host:port" address of a cache server (see
+            :class:`~capsul.study_config.cache_backends.CacheServer`) looked
+            up after the local and shared caches. New entries are sent to
+            it.
         """
         # Build the capsul memory folder
         if cachedir is not None:
@@ -819,8 +1406,34 @@ class Memory(object):
         # Define class parameters
         self.cachedir = cachedir
         self.timestamp = time.time()
+        self.relocatable = relocatable
+        self.path_roots = path_roots
+        self.result_format = result_format
+        self.backend = None
+        if cachedir is not None:
+            self.backend = self._create_backend(shared_cachedirs,
+                                                cache_server)
 
-    def cache(self, process, verbose=1):
+    def _create_backend(self, shared_cachedirs, cache_server):
+        """ Create the cache storage: the cachedir directory, possibly
+        followed by shared tiers.
+        """
+        local_backend = LocalCacheBackend(self.cachedir)
+        tiers = [local_backend]
+        for shared_cachedir in shared_cachedirs or []:
+            tiers.append(LocalCacheBackend(
+                os.path.join(os.path.abspath(shared_cachedir),
+                             "capsul_memory"), readonly=True))
+        if cache_server:
+            tiers.append(SocketCacheBackend(cache_server, self.cachedir))
+        if len(tiers) == 1:
+            return local_backend
+        if cache_server:
+            # new entries are sent to the server
+            return TieredCacheBackend(tiers, write_tier=tiers[-1])
+        return TieredCacheBackend(tiers)
+
+    def cache(self, process, verbose=1, process_hash=None):
         """ Create a proxy of the given process in order to only execute
         the process for input parameters not cached on disk.
 
@@ -830,6 +1443,9 @@ class Memory(object):
             the capsul Process to be wrapped and cached.
         verbose: int
             if different from zero, print console messages.
+        process_hash: str (optional)
+            the already known process cache key (see
+            :class:`MemorizedProcess`).
 
         Returns
         -------
@@ -874,7 +1490,11 @@ class Memory(object):
         # Otherwise a proxy process is created
         else:
             return MemorizedProcess(process, self.cachedir, self.timestamp,
-                                    verbose)
+                                    verbose, relocatable=self.relocatable,
+                                    path_roots=self.path_roots,
+                                    result_format=self.result_format,
+                                    process_hash=process_hash,
+                                    backend=self.backend)
 
     def clear(self, skips=None):
         """ Remove all the cache appart from those given to the method
@@ -22,7 +22,8 @@ logger = logging.getLogger(__name__)
 
 
 def run_process(output_dir, process_instance, cachedir=None,
-                generate_logging=False, verbose=0, **kwargs):
+                cache_options=None, process_hash=None, generate_logging=False,
+                verbose=0, execution_info=None, **kwargs):
     """ Execute a capsul process in a specific directory.
 
     Parameters
@@ -34,10 +35,18 @@ def run_process(output_dir, process_instance, cachedir=None,
     cachedir: str (optional, default None)
         save in the cache the current process execution.
         If None, no caching is done.
+    cache_options: dict (optional, default None)
+        additional keyword arguments passed to the Memory constructor.
+    process_hash: str (optional, default None)
+        the process cache key, if it is already known (see
+        :class:`~capsul.study_config.cache_planner.CachePlan`).
     generate_logging: bool (optional, default False)
         if True save the log stored in the process after its execution.
     verbose: int
         if different from zero, print console messages.
+    execution_info: dict (optional, default None)
+        if given, its 'cache_hit' item is set to True when the results were
+        loaded from the cache instead of running the process.
 
     Returns
     -------
@@ -86,18 +95,24 @@ def run_process(output_dir, process_instance, cachedir=None,
             call_with_inputs))
     if cachedir:
         # Create a memory object
-        mem = Memory(cachedir)
-        proxy_instance = mem.cache(process_instance, verbose=verbose)
+        mem = Memory(cachedir, **(cache_options or {}))
+        proxy_instance = mem.cache(process_instance, verbose=verbose,
+                                   process_hash=process_hash)
 
         # Execute the proxy process
         returncode = proxy_instance(**kwargs)
+        cache_hit = proxy_instance.cache_hit
     else:
+        cache_hit = False
         for k, v in six.iteritems(kwargs):
             setattr(process_instance, k, v)
         process_instance._before_run_process()
         returncode = process_instance._run_process()
         returncode = process_instance._after_run_process(returncode)
 
+    if execution_info is not None:
+        execution_info["cache_hit"] = cache_hit
+
     # Save the process log
     if generate_logging:
         process_instance.save_log(returncode)
@@ -0,0 +1,460 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Staging of the process files in a local scratch directory.
+
+When inputs live on a slow shared filesystem, :class:`InputStager` copies
+the input files of the next nodes of an execution list into a local
+directory in the background, while the current node is running. Process
+parameters are set to the staged files during the node execution, as
+:class:`~capsul.process.process.FileCopyProcess` does with its
+'destination'. Output files are written in the staging directory and
+copied back to their location in the background once the node is done.
+"""
+
+# System import
+import os
+import time
+import shutil
+import logging
+import threading
+import six
+from six.moves import queue
+
+# Trait import
+from traits.api import Undefined
+
+# Capsul import
+from capsul.utils.formats import files_group
+from capsul.utils.trait_paths import is_path_trait, path_values
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+def _map_paths(value, paths_map):
+    """ Replace the strings of a parameter value.
+    """
+    if isinstance(value, tuple):
+        return tuple(_map_paths(item, paths_map) for item in value)
+    if isinstance(value, list):
+        return [_map_paths(item, paths_map) for item in value]
+    if isinstance(value, six.string_types):
+        return paths_map.get(value, value)
+    return value
+
+
+class _Throttle(object):
+    """ Limit the bandwidth shared by the copy threads.
+    """
+
+    def __init__(self, bandwidth=0):
+        self.bandwidth = bandwidth
+        self.next_time = 0.
+        self.lock = threading.Lock()
+
+    def consume(self, nbytes):
+        """ Wait until nbytes can be transferred.
+        """
+        if not self.bandwidth:
+            return
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_time)
+            self.next_time = start + float(nbytes) / self.bandwidth
+            delay = self.next_time - now
+        time.sleep(delay)
+
+
+class StagingTask(object):
+    """ A file (and its companion files) copy done in the background.
+
+    Attributes
+    ----------
+    src: str
+        the file to be copied.
+    dest: str
+        the copied file.
+    size: int
+        the size of the file and its companion files.
+    done: threading.Event
+        set when the copy is over.
+    error: Exception
+        the copy error, if any.
+    """
+
+    def __init__(self, src, dest, size=0):
+        self.src = src
+        self.dest = dest
+        self.size = size
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self):
+        """ Wait for the end of the copy.
+
+        Returns
+        -------
+        success: bool
+            False if the copy failed.
+        """
+        self.done.wait()
+        return self.error is None
+
+
+class InputStager(object):
+    """ Prefetch the node inputs in a local directory and write back their
+    outputs asynchronously.
+
+    ::
+
+        stager = InputStager(execution_list, staging_directory)
+        try:
+            for node in execution_list:
+                stager.before_node(node)
+                # run the node
+                stager.after_node(node)
+        finally:
+            stager.close()
+
+    Only files existing when the stager is created, which are not written
+    by a node of the execution list, are staged. Temporary files, which are
+    already local, may be excluded. When a file can't be staged (disk limit
+    reached, copy error) the node reads it from its original location.
+
+    Attributes
+    ----------
+    staged: dict
+        {src_path: StagingTask} the staged input files.
+    write_backs: dict
+        {path: StagingTask} the output files copied back to their location.
+    """
+
+    def __init__(self, execution_list, staging_directory, excluded_paths=(),
+                 lookahead=1, disk_limit=0, bandwidth=0, workers=2,
+                 write_back=True):
+        """ Initialize the InputStager class.
+
+        Parameters
+        ----------
+        execution_list: list of Node or Process
+            the nodes to be executed, in execution order.
+        staging_directory: str
+            the local directory where files are staged.
+        excluded_paths: sequence of str (optional)
+            files which are never staged (pipeline temporaries for
+            instance).
+        lookahead: int (optional, default 1)
+            the inputs of the 'lookahead' nodes following the running one
+            are prefetched.
+        disk_limit: int (optional, default 0)
+            the size in bytes that staged files may use (0: no limit).
+        bandwidth: int (optional, default 0)
+            the bandwidth in bytes per second used by the copies (0: no
+            limit).
+        workers: int (optional, default 2)
+            the number of files copied concurrently.
+        write_back: bool (optional, default True)
+            if True, node outputs are also written in the staging
+            directory, then copied back.
+        """
+        self.execution_list = execution_list
+        self.staging_directory = staging_directory
+        self.lookahead = lookahead
+        self.disk_limit = disk_limit
+        self.write_back = write_back
+        self.workers = workers
+        self.throttle = _Throttle(bandwidth)
+
+        self.order = dict((id(node), index)
+                          for index, node in enumerate(execution_list))
+        self.staged = {}
+        self.write_backs = {}
+        self.used_bytes = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._counter = 0
+        # {node_id: (process, [(name, original_value)])}
+        self._saved_values = {}
+        # {node_id: {original_path: staged_path}} staged outputs
+        self._staged_outputs = {}
+
+        # Find the files read by each node
+        excluded_paths = set(excluded_paths)
+        outputs = set()
+        self.node_inputs = {}
+        self.node_outputs = {}
+        for node in execution_list:
+            node_outputs = self.node_outputs[id(node)] = {}
+            for name, value in self._file_parameters(node, True):
+                paths = [path for path in path_values(value)
+                         if path not in excluded_paths]
+                outputs.update(paths)
+                if paths:
+                    node_outputs[name] = paths
+        self.consumers = {}
+        for node in execution_list:
+            node_inputs = self.node_inputs[id(node)] = {}
+            for name, value in self._file_parameters(node, False):
+                paths = [path for path in path_values(value)
+                         if path not in excluded_paths
+                         and path not in outputs and os.path.isfile(path)]
+                if paths:
+                    node_inputs[name] = paths
+                    for path in paths:
+                        self.consumers.setdefault(path, set()).add(id(node))
+
+    @staticmethod
+    def _process(node):
+        return getattr(node, "process", node)
+
+    def _file_parameters(self, node, output):
+        """ Get the File parameters of a node.
+        """
+        process = self._process(node)
+        for name, trait in six.iteritems(process.user_traits()):
+            if bool(trait.output) != output or not is_path_trait(trait, directories=False):
+                continue
+            value = getattr(process, name)
+            if value not in (Undefined, None, ""):
+                yield name, value
+
+    def _new_staging_path(self, path):
+        """ Get a staging location for a file: each file is staged in its
+        own sub-directory, to avoid name conflicts.
+        """
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        directory = os.path.join(self.staging_directory, str(counter))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return os.path.join(directory, os.path.basename(path))
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        for index in range(max(1, self.workers)):
+            thread = threading.Thread(target=self._worker,
+                                      name="capsul_staging_%d" % index)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            try:
+                for src, dest in zip(files_group(task.src),
+                                     files_group(task.dest)):
+                    if src == task.src or os.path.isfile(src):
+                        self._copy(src, dest)
+            except Exception as e:
+                logger.warning("Cannot copy '{0}' to '{1}': {2}".format(
+                    task.src, task.dest, e))
+                task.error = e
+            finally:
+                task.done.set()
+
+    def _copy(self, src, dest, chunk_size=1024 * 1024):
+        """ Copy a file, sharing the bandwidth with the other copies.
+        """
+        directory = os.path.dirname(dest)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another copy
+                pass
+        with open(src, "rb") as src_file:
+            with open(dest, "wb") as dest_file:
+                while True:
+                    chunk = src_file.read(chunk_size)
+                    if not chunk:
+                        break
+                    self.throttle.consume(len(chunk))
+                    dest_file.write(chunk)
+        shutil.copystat(src, dest)
+
+    def _files_size(self, path):
+        size = 0
+        for fname in files_group(path):
+            try:
+                size += os.path.getsize(fname)
+            except OSError:
+                pass
+        return size
+
+    def prefetch(self, index):
+        """ Start the copy of the inputs of the nodes from index to
+        index + lookahead in the execution list.
+        """
+        for node in self.execution_list[index:index + self.lookahead + 1]:
+            for paths in six.itervalues(self.node_inputs[id(node)]):
+                for path in paths:
+                    if path in self.staged:
+                        continue
+                    size = self._files_size(path)
+                    if self.disk_limit and \
+                            self.used_bytes + size > self.disk_limit:
+                        logger.debug("Staging disk limit reached, '{0}' is "
+                                     "not staged".format(path))
+                        continue
+                    task = StagingTask(path, self._new_staging_path(path),
+                                       size)
+                    self.used_bytes += size
+                    self.staged[path] = task
+                    self._start_workers()
+                    self._queue.put(task)
+
+    def before_node(self, node):
+        """ Wait for the files needed by a node, and set its parameters to
+        the staged files.
+        """
+        node_id = id(node)
+        self.prefetch(self.order[node_id])
+        process = self._process(node)
+        saved = []
+        self._saved_values[node_id] = (process, saved)
+
+        # Outputs of previous nodes have to be copied back
+        for name, value in self._file_parameters(node, False):
+            for path in path_values(value):
+                self._wait_write_back(path)
+
+        # Read the staged inputs
+        for name, paths in six.iteritems(self.node_inputs[node_id]):
+            paths_map = {}
+            for path in paths:
+                task = self.staged.get(path)
+                if task is not None and task.wait():
+                    paths_map[path] = task.dest
+            if paths_map:
+                value = getattr(process, name)
+                saved.append((name, value))
+                setattr(process, name, _map_paths(value, paths_map))
+
+        # Write the outputs in the staging directory
+        staged_outputs = self._staged_outputs[node_id] = {}
+        if self.write_back:
+            for name, paths in six.iteritems(self.node_outputs[node_id]):
+                paths_map = {}
+                for path in paths:
+                    if path not in staged_outputs:
+                        staged_outputs[path] = self._new_staging_path(path)
+                    paths_map[path] = staged_outputs[path]
+                value = getattr(process, name)
+                saved.append((name, value))
+                setattr(process, name, _map_paths(value, paths_map))
+
+    def after_node(self, node):
+        """ Restore the node parameters, start copying its outputs back and
+        release the staged inputs which are not needed anymore.
+        """
+        node_id = id(node)
+        self._restore_parameters(node_id)
+
+        for path, staged_path in six.iteritems(
+                self._staged_outputs.pop(node_id, {})):
+            if not os.path.exists(staged_path):
+                # output not written by the process
+                continue
+            task = StagingTask(staged_path, path,
+                               self._files_size(staged_path))
+            self.used_bytes += task.size
+            self.write_backs[path] = task
+            self._start_workers()
+            self._queue.put(task)
+
+        for paths in six.itervalues(self.node_inputs[node_id]):
+            for path in paths:
+                consumers = self.consumers[path]
+                consumers.discard(node_id)
+                if not consumers:
+                    self._release(path)
+
+        # Prefetch the inputs of the next nodes while the copies of the
+        # outputs are running
+        self.prefetch(self.order[node_id] + 1)
+
+    def _restore_parameters(self, node_id):
+        """ Set the parameters of a node back to the unstaged files.
+        """
+        process, saved = self._saved_values.pop(node_id, (None, []))
+        for name, value in reversed(saved):
+            setattr(process, name, value)
+
+    def _wait_write_back(self, path):
+        """ Wait until a node output has been copied back.
+        """
+        task = self.write_backs.pop(path, None)
+        if task is None:
+            return
+        success = task.wait()
+        self._release_task(task, task.src)
+        if not success:
+            raise OSError("Cannot write back '{0}': {1}".format(
+                path, task.error))
+
+    def _release(self, path):
+        """ Delete a staged input file.
+        """
+        task = self.staged.get(path)
+        if task is None:
+            return
+        task.wait()
+        self._release_task(task, task.dest)
+
+    def _release_task(self, task, staged_path):
+        for fname in files_group(staged_path):
+            try:
+                os.unlink(fname)
+            except OSError:
+                pass
+        self.used_bytes -= task.size
+
+    def close(self):
+        """ Wait for the outputs to be copied back, stop the copy threads
+        and delete the staging directory.
+
+        The parameters of the nodes whose execution failed (after_node()
+        has not been called) are set back to the unstaged files.
+
+        Raises
+        ------
+        OSError: if an output could not be copied back.
+        """
+        for node_id in list(self._saved_values):
+            self._restore_parameters(node_id)
+        try:
+            errors = []
+            for path in list(self.write_backs):
+                try:
+                    self._wait_write_back(path)
+                except OSError as e:
+                    errors.append(str(e))
+            if errors:
+                raise OSError("\n".join(errors))
+        finally:
+            # Cancel the pending prefetches
+            while True:
+                try:
+                    task = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                task.error = "cancelled"
+                task.done.set()
+            for thread in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+            shutil.rmtree(self.staging_directory, ignore_errors=True)
@@ -13,6 +13,9 @@ import os
 import logging
 import json
 import sys
+import time
+import functools
+import tempfile
 import six
 if sys.version_info[:2] >= (2, 7):
     from collections import OrderedDict
@@ -23,7 +26,8 @@ else:
 logger = logging.getLogger(__name__)
 
 # Trait import
-from traits.api import File, Directory, Bool, String, Undefined
+from traits.api import (File, Directory, Bool, String, Undefined, Int,
+                        Float, Dict, Str, Enum)
 
 # Soma import
 from soma.controller import Controller
@@ -35,7 +39,20 @@ from capsul.study_config.run import run_process
 from capsul.pipeline.pipeline_workflow import (
     workflow_from_pipeline, local_workflow_run)
 from capsul.pipeline.pipeline_nodes import Node
+from capsul.pipeline.process_iteration import ProcessIteration
+from capsul.pipeline.critical_path import RuntimeHistory
+from capsul.pipeline import pipeline_tools
+from capsul.pipeline.temporary_files import (
+    TemporaryFilesTracker, StreamProducer)
+from capsul.study_config.staging import InputStager
+from capsul.pipeline.incremental import (IncrementalManifest, NodeFiles,
+                                         nodes_full_names)
+from capsul.pipeline.workflow_cache import WorkflowCache
+from capsul.pipeline.duplicate_nodes import (
+    duplicate_nodes, alias_temporary_outputs, alias_outputs,
+    restore_aliased_outputs)
 from capsul.study_config.process_instance import get_process_instance
+from capsul.utils.io_limits import process_io_limits, io_slots
 
 if sys.version_info[0] >= 3:
     basestring = str
@@ -89,6 +106,89 @@ class StudyConfig(Controller):
         subdirectory to output_directory. This subdirectory is named 
         '<count>-<name>' where <count> if self.process_counter and <name> 
         is the name of the process.
+    `scratch_directory` : str
+        Directory where pipeline temporary files are created (a tmpfs
+        mount for instance). Default: the system temporary directory.
+    `scratch_budget` : int (default 0)
+        Size in bytes that pipeline temporaries may use in the scratch
+        directory during an execution (0: no limit). The temporaries of a
+        node which are not expected to fit in the remaining budget (their
+        size is estimated from the node input files) are created in the
+        output directory.
+    `input_staging` : bool (default False)
+        Copy the input files of the next nodes in the scratch directory
+        while a node is running, and write the outputs back in the
+        background (local execution only, see
+        :class:`~capsul.study_config.staging.InputStager`). Staging is not
+        used with smart-caching: cache keys and recorded results would
+        refer to the staged files.
+    `staging_lookahead` : int (default 1)
+        Number of nodes whose inputs are prefetched ahead of the running
+        one.
+    `staging_disk_limit` : int (default 0)
+        Size in bytes that staged files may use (0: no limit).
+    `staging_bandwidth` : int (default 0)
+        Bandwidth in bytes per second used by the staging copies (0: no
+        limit).
+    `staging_write_back` : bool (default True)
+        Write the outputs in the scratch directory and copy them back once
+        the node is done.
+    `io_concurrency_limits` : dict
+        {path: max_processes} maximum number of processes using the
+        filesystem of each path at the same time (see
+        :mod:`capsul.utils.io_limits`). Processes which do not use these
+        filesystems are not throttled. Limits apply to the local
+        executions (including parallel iterations), to the jobs run by
+        soma-workflow, and to the work queue workers. Temporaries are not
+        streamed through named pipes when limits are set: a producer could
+        hold the slot its consumer waits for.
+    `io_locks_directory` : str
+        Directory of the lock files holding the io_concurrency_limits
+        slots. It has to be shared by all the machines running the jobs.
+        Default: a directory in the local temporary directory.
+    `incremental_execution` : bool (default False)
+        Skip the nodes which are up to date according to the fingerprints
+        recorded during the previous executions (see
+        :mod:`capsul.pipeline.incremental`).
+    `incremental_fingerprint` : str (default 'timestamp')
+        Files fingerprints used by the incremental execution: 'timestamp'
+        (modification time and size) or 'hash' (content digest).
+    `incremental_manifest` : str
+        The incremental execution manifest file. Default:
+        'capsul_manifest.json' in the output directory.
+    `merge_duplicate_nodes` : bool (default False)
+        Run only once the pipeline nodes running the same process with the
+        same inputs: the other ones reuse its results (see
+        :mod:`capsul.pipeline.duplicate_nodes`).
+    `cache_workflows` : bool (default False)
+        Reuse the soma-workflow workflows generated for pipelines with the
+        same structure, patching the command lines of the jobs whose
+        parameters changed (see :mod:`capsul.pipeline.workflow_cache`).
+    `workflow_cache_directory` : str
+        Directory where the generated workflows are saved. Default: they
+        are only kept in memory.
+    `prune_dead_nodes` : bool (default False)
+        Do not run the pipeline nodes whose outputs are neither used nor
+        wanted (see :func:`capsul.pipeline.pipeline_tools.dead_nodes`). The
+        pruned nodes are logged, and listed in the pruned_nodes attribute
+        after a local run.
+    `iteration_workers` : int (default 1)
+        Number of iterations of an iterative node run at the same time
+        during a local execution. The iterations are expanded when the node
+        runs, so their number may depend on the results of upstream nodes.
+    `job_bundle_duration` : float (default 0)
+        Duration in seconds under which soma-workflow jobs are merged into
+        bundle jobs running them in a single interpreter (0: no bundling,
+        see :mod:`capsul.pipeline.job_bundles`). Durations are taken from
+        the runtime history, else declared by the processes.
+    `runtime_history_file` : str (default Undefined)
+        JSON file where the execution times of the processes run locally
+        are recorded (see :class:`capsul.pipeline.critical_path.RuntimeHistory`).
+    `critical_path_priorities` : bool (default False)
+        Set the priorities of soma-workflow jobs from their remaining
+        critical-path length, so that the longest chains start first (see
+        :mod:`capsul.pipeline.critical_path`). Durations are taken from the
+        runtime history, else declared by the processes.
 
     Methods
     -------
@@ -136,6 +236,102 @@ class StudyConfig(Controller):
              "'<count>-<name>' where <count> if self.process_counter and <name> "
              "is the name of the process.")
 
+    scratch_directory = Directory(
+        Undefined,
+        desc="Directory where pipeline temporary files are created")
+
+    scratch_budget = Int(
+        0,
+        desc="Size in bytes that pipeline temporaries may use in the "
+             "scratch directory (0: no limit)")
+
+    input_staging = Bool(
+        False,
+        desc="Prefetch the input files in the scratch directory and write "
+             "the outputs back asynchronously")
+
+    staging_lookahead = Int(
+        1,
+        desc="Number of nodes whose inputs are prefetched ahead of the "
+             "running one")
+
+    staging_disk_limit = Int(
+        0,
+        desc="Size in bytes that staged files may use (0: no limit)")
+
+    staging_bandwidth = Int(
+        0,
+        desc="Bandwidth in bytes per second used by the staging copies "
+             "(0: no limit)")
+
+    staging_write_back = Bool(
+        True,
+        desc="Write the outputs in the scratch directory and copy them back "
+             "once the node is done")
+
+    io_concurrency_limits = Dict(
+        Str, Int,
+        desc="Maximum number of processes using the filesystem of each path "
+             "at the same time")
+
+    io_locks_directory = Directory(
+        Undefined,
+        desc="Directory of the lock files holding the I/O limits slots")
+
+    incremental_execution = Bool(
+        False,
+        desc="Skip the nodes which are up to date according to the "
+             "incremental manifest")
+
+    incremental_fingerprint = Enum(
+        "timestamp", "hash",
+        desc="Files fingerprints used by the incremental execution")
+
+    incremental_manifest = File(
+        Undefined,
+        desc="The incremental execution manifest file (default: "
+             "capsul_manifest.json in the output directory)")
+
+    merge_duplicate_nodes = Bool(
+        False,
+        desc="Run only once the pipeline nodes running the same process "
+             "with the same inputs")
+
+    cache_workflows = Bool(
+        False,
+        desc="Reuse the soma-workflow workflows generated for pipelines "
+             "with the same structure")
+
+    workflow_cache_directory = Directory(
+        Undefined,
+        desc="Directory where the generated workflows are saved (default: "
+             "memory only)")
+
+    prune_dead_nodes = Bool(
+        False,
+        desc="Do not run the pipeline nodes whose outputs are neither used "
+             "nor wanted")
+
+    iteration_workers = Int(
+        1,
+        desc="Number of iterations of an iterative node run at the same "
+             "time during a local execution")
+
+    job_bundle_duration = Float(
+        0.,
+        desc="Duration in seconds under which soma-workflow jobs are "
+             "bundled (0: no bundling)")
+
+    runtime_history_file = File(
+        Undefined,
+        desc="JSON file where the execution times of the processes are "
+             "recorded")
+
+    critical_path_priorities = Bool(
+        False,
+        desc="Prioritize the soma-workflow jobs starting the longest "
+             "chains")
+
     def __init__(self, study_name=None, init_config=None, modules=None,
                  **override_config):
         """ Initilize the StudyConfig class
@@ -260,7 +456,9 @@ class StudyConfig(Controller):
             return module
 
     def run(self, process_or_pipeline, output_directory= None,
-            executer_qc_nodes=True, verbose=0, **kwargs):
+            executer_qc_nodes=True, verbose=0, cache_plan=None,
+            incremental=None, targets=None, skip_existing_outputs=False,
+            **kwargs):
         """Method to execute a process or a pipline in a study configuration
          environment.
 
@@ -282,8 +480,28 @@ class StudyConfig(Controller):
             process nodes.
         verbose: int
             if different from zero, print console messages.
+        cache_plan: CachePlan (optional)
+            a smart-caching plan computed by :meth:`plan_cache` on the same
+            process or pipeline. Its cache keys are reused instead of being
+            computed again.
+        incremental: bool (optional)
+            skip the up-to-date nodes (see
+            :mod:`capsul.pipeline.incremental`). Default: the
+            incremental_execution option.
+        targets: list of str (optional)
+            names of pipeline outputs: only the nodes needed to produce them
+            are executed (see
+            :func:`~capsul.pipeline.pipeline_tools.nodes_needed_for_outputs`).
+        skip_existing_outputs: bool (optional, default False)
+            when targets are given, do not run the nodes whose needed
+            outputs already exist, nor the nodes upstream of them.
         """
-        
+        if incremental is None:
+            incremental = self.incremental_execution
+        manifest = None
+        if incremental:
+            manifest = self._incremental_manifest(output_directory)
+
         if self.create_output_directories:
             for name, trait in process_or_pipeline.user_traits().items():
                 if trait.output and isinstance(trait.handler, (File, Directory)):
@@ -298,9 +516,26 @@ class StudyConfig(Controller):
         if self.get_trait_value("use_soma_workflow"):
 
             # Create soma workflow pipeline
-            workflow = workflow_from_pipeline(process_or_pipeline)
-            controller, wf_id = local_workflow_run(process_or_pipeline.id,
-                                                   workflow)
+            if self.cache_workflows:
+                generate_workflow = self._workflow_cache().get_workflow
+            else:
+                generate_workflow = workflow_from_pipeline
+            workflow = generate_workflow(
+                process_or_pipeline,
+                io_limits=dict(self.io_concurrency_limits),
+                incremental=manifest, targets=targets,
+                skip_existing_outputs=skip_existing_outputs,
+                prune_dead_nodes=self.prune_dead_nodes,
+                merge_duplicates=self.merge_duplicate_nodes,
+                bundle_duration=self.job_bundle_duration,
+                critical_path_priorities=self.critical_path_priorities,
+                runtime_history=self._runtime_durations(),
+                io_locks_directory=self._io_locks_directory())
+            controller, wf_id = local_workflow_run(
+                process_or_pipeline.id, workflow,
+                local_engine=self.get_trait_value(
+                    "somaworkflow_local_engine"),
+                workers=self.get_trait_value("somaworkflow_local_workers"))
             workflow_status = controller.workflow_status(wf_id)
             elements_status = controller.workflow_elements_status(wf_id)
             # FIXME: it would be better if study_config does not require
@@ -344,6 +579,13 @@ class StudyConfig(Controller):
 
             # Temporary files can be generated for pipelines
             temporary_files = []
+            temporary_tracker = None
+            stager = None
+            stream_producers = []
+            completed_nodes = []
+            duplicates = {}
+            aliased_outputs = []
+            self.pruned_nodes = []
             result = None
             try:
                 # Generate ordered execution list
@@ -355,10 +597,36 @@ class StudyConfig(Controller):
                     if not executer_qc_nodes:
                         execution_list = [node for node in execution_list
                                         if node.node_type != "view_node"]
-                    for node in execution_list:
-                        # check temporary outputs and allocate files
-                        process_or_pipeline._check_temporary_files_for_node(
-                            node, temporary_files)
+                    # Keep the nodes needed to produce the targets
+                    if targets is not None:
+                        needed_ids = set(
+                            id(node) for node
+                            in pipeline_tools.nodes_needed_for_outputs(
+                                process_or_pipeline, targets,
+                                skip_existing=skip_existing_outputs))
+                        execution_list = [node for node in execution_list
+                                          if id(node) in needed_ids]
+                    # Remove the nodes whose outputs are not used
+                    elif self.prune_dead_nodes:
+                        pruned_nodes = pipeline_tools.dead_nodes(
+                            process_or_pipeline, execution_list)
+                        if pruned_nodes:
+                            node_names = nodes_full_names(
+                                process_or_pipeline)
+                            self.pruned_nodes = [
+                                node_names[id(node)]
+                                for node in pruned_nodes]
+                            logger.info("Study Config: pruned dead nodes: "
+                                        "{0}".format(
+                                            ", ".join(self.pruned_nodes)))
+                            if verbose:
+                                print("Pruned dead nodes: {0}".format(
+                                    ", ".join(self.pruned_nodes)))
+                            pruned_ids = set(id(node)
+                                             for node in pruned_nodes)
+                            execution_list = [
+                                node for node in execution_list
+                                if id(node) not in pruned_ids]
                 elif isinstance(process_or_pipeline, Process):
                     execution_list.append(process_or_pipeline)
                 else:
@@ -367,28 +635,378 @@ class StudyConfig(Controller):
                         "Pipeline instances".format(
                             process_or_pipeline.__module__.name__))
 
+                # Skip the up-to-date nodes. Temporaries are detected
+                # before they are allocated.
+                if manifest is not None:
+                    node_names = nodes_full_names(process_or_pipeline)
+                    temporary_nodes = set(
+                        id(node) for node in execution_list
+                        if NodeFiles(node).temporary)
+                    execution_list = manifest.stale_nodes(execution_list,
+                                                          node_names)
+
+                # Run only one of the nodes doing the same processing
+                if self.merge_duplicate_nodes \
+                        and isinstance(process_or_pipeline, Pipeline):
+                    duplicates = duplicate_nodes(execution_list)
+                    merged_ids = set(id(node)
+                                     for nodes in six.itervalues(duplicates)
+                                     for node in nodes)
+                    execution_list = [node for node in execution_list
+                                      if id(node) not in merged_ids]
+                    for representative, nodes in six.iteritems(duplicates):
+                        logger.info(
+                            "Study Config: {0} will reuse the results of "
+                            "{1}".format(", ".join(node.name
+                                                   for node in nodes),
+                                         representative.name))
+
+                if isinstance(process_or_pipeline, Pipeline):
+                    # When smart-caching is used, temporary files get
+                    # stable names so that downstream nodes can be found
+                    # in the cache
+                    temp_directory = self._stable_temporary_directory(
+                        output_directory)
+                    scratch_directory = self._scratch_directory()
+                    for node in execution_list:
+                        # check temporary outputs and allocate files.
+                        # Named pipes can't be cached: they are only used
+                        # without smart-caching.
+                        process_or_pipeline._check_temporary_files_for_node(
+                            node, temporary_files, temp_directory,
+                            scratch_directory,
+                            allow_fifos=(temp_directory is None
+                                         and not duplicates
+                                         and not self.io_concurrency_limits))
+                    # the nodes reading the duplicates temporaries read
+                    # the representatives ones
+                    for representative, nodes in six.iteritems(duplicates):
+                        for node in nodes:
+                            aliased_outputs.extend(alias_temporary_outputs(
+                                representative, node))
+                    # temporaries are released as soon as their last
+                    # consumer has been executed
+                    temporary_tracker = TemporaryFilesTracker(
+                        execution_list, temporary_files,
+                        scratch_directory=scratch_directory,
+                        budget=self.scratch_budget,
+                        spill_directory=self._spill_directory(
+                            output_directory))
+
+                # Prefetch the inputs in the scratch directory. Staged
+                # files are deleted after the execution: they can't be
+                # used in smart-caching keys.
+                use_staging = self.input_staging
+                if use_staging and self.get_trait_value(
+                        "use_smart_caching") not in [None, False]:
+                    logger.warning("Study Config: input staging is "
+                                   "disabled with smart-caching")
+                    use_staging = False
+                if use_staging:
+                    stager = InputStager(
+                        execution_list,
+                        tempfile.mkdtemp(prefix="capsul_staging_",
+                                         dir=self._scratch_directory()),
+                        excluded_paths=self._temporary_paths(
+                            temporary_files),
+                        lookahead=self.staging_lookahead,
+                        disk_limit=self.staging_disk_limit,
+                        bandwidth=self.staging_bandwidth,
+                        write_back=self.staging_write_back)
+
                 # Execute each process node element
+                done_nodes = set()
                 for process_node in execution_list:
-                    # Execute the process instance contained in the node
+                    # Get the process instance contained in the node
                     if isinstance(process_node, Node):
-                        result = self._run(process_node.process, 
-                                           output_directory, 
-                                           verbose, **kwargs)
+                        process_instance = process_node.process
+                    else:
+                        process_instance = process_node
+
+                    # Reuse the planned cache key if any
+                    process_hash = None
+                    if cache_plan is not None:
+                        process_hash = cache_plan.get_process_hash(
+                            process_instance)
 
                     # Execute the process instance
-                    else:
-                        result = self._run(process_node, output_directory,
-                                           verbose, **kwargs)
+                    if temporary_tracker is not None:
+                        temporary_tracker.before_node(process_node)
+                    if stager is not None:
+                        stager.before_node(process_node)
+                    if temporary_tracker is not None:
+                        streams = temporary_tracker.streams.get(
+                            id(process_node))
+                        if streams:
+                            # The node writes named pipes: run it while
+                            # its consumers are executed
+                            producer = StreamProducer(
+                                process_node, streams[0],
+                                functools.partial(
+                                    self._run, process_instance,
+                                    output_directory, verbose,
+                                    process_hash=process_hash, **kwargs))
+                            producer.start()
+                            stream_producers.append(
+                                (producer, streams[1]))
+                            continue
+                    result = self._run(process_instance,
+                                       output_directory, verbose,
+                                       process_hash=process_hash,
+                                       **kwargs)
+                    if stager is not None:
+                        stager.after_node(process_node)
+                    if temporary_tracker is not None:
+                        temporary_tracker.after_node(process_node)
+                    done_nodes.add(id(process_node))
+                    completed_nodes.append(process_node)
+                    for node in duplicates.get(process_node, []):
+                        alias_outputs(process_node, node)
+                        completed_nodes.append(node)
+
+                    # Wait for the producers whose consumers are done
+                    joined = True
+                    while joined:
+                        joined = False
+                        for item in list(stream_producers):
+                            producer, consumer_ids = item
+                            if not consumer_ids.issubset(done_nodes):
+                                continue
+                            producer.join()
+                            stream_producers.remove(item)
+                            producer.check()
+                            if stager is not None:
+                                stager.after_node(producer.node)
+                            temporary_tracker.after_node(producer.node)
+                            done_nodes.add(id(producer.node))
+                            completed_nodes.append(producer.node)
+                            joined = True
             finally:
-                # Destroy temporary files
-                if temporary_files:
-                    # If temporary files have been created, we are sure that
-                    # process_or_pipeline is a pipeline with a method
-                    # _free_temporary_files.
-                    process_or_pipeline._free_temporary_files(temporary_files)
+                # Stop the producers which are still waiting for their
+                # consumers
+                for producer, consumer_ids in stream_producers:
+                    producer.abort(timeout=10)
+                try:
+                    # Wait for the outputs to be written back
+                    if stager is not None:
+                        stager.close()
+                    # Record the executed nodes for the next incremental
+                    # executions
+                    if manifest is not None and completed_nodes:
+                        for node in completed_nodes:
+                            manifest.record(
+                                node_names[id(node)], node,
+                                temporary=(id(node) in temporary_nodes))
+                        manifest.save()
+                    # Save the execution times
+                    history = self._runtime_history()
+                    if history is not None:
+                        history.save()
+                finally:
+                    restore_aliased_outputs(aliased_outputs)
+                    # Destroy temporary files
+                    if temporary_files:
+                        # If temporary files have been created, we are sure
+                        # that process_or_pipeline is a pipeline with a
+                        # method _free_temporary_files.
+                        process_or_pipeline._free_temporary_files(
+                            temporary_files)
             return result
 
-    def _run(self, process_instance, output_directory, verbose, **kwargs):
+    def plan_cache(self, process_or_pipeline, output_directory=None,
+                   executer_qc_nodes=True):
+        """ Find out which nodes of a process or pipeline will be found in
+        the smart-caching memory, without executing anything.
+
+        The plan can then be given to :meth:`run` which will reuse its cache
+        keys.
+
+        Parameters
+        ----------
+        process_or_pipeline: Process or Pipeline instance (mandatory)
+            the process or pipeline we want to execute
+        output_directory: Directory name (optional)
+            the output directory which will be used for the execution
+            (default self.output_directory). It holds the smart-caching
+            memory.
+        executer_qc_nodes: bool (optional, default True)
+            if False, quality control nodes are not planned.
+
+        Returns
+        -------
+        plan: CachePlan
+            the smart-caching plan (see
+            :mod:`capsul.study_config.cache_planner`).
+        """
+        from capsul.study_config.cache_planner import plan_cache
+
+        if output_directory is None or output_directory is Undefined:
+            output_directory = self.output_directory
+        if output_directory in (None, Undefined, ""):
+            raise ValueError(
+                "An output directory is needed to locate the smart-caching "
+                "memory.")
+        return plan_cache(
+            process_or_pipeline,
+            self._smart_caching_directory(output_directory),
+            temp_directory=self._stable_temporary_directory(output_directory),
+            executer_qc_nodes=executer_qc_nodes,
+            cache_options=self._cache_options())
+
+    def _cache_options(self):
+        """ Get the smart-caching options, to be passed to the Memory
+        constructor.
+
+        Returns
+        -------
+        options: dict
+            Memory keyword arguments.
+        """
+        options = {}
+        if self.get_trait_value("smart_caching_relocatable"):
+            options["relocatable"] = True
+            options["path_roots"] = dict(
+                self.get_trait_value("smart_caching_path_roots") or {})
+        result_format = self.get_trait_value("smart_caching_result_format")
+        if result_format not in (None, "json"):
+            options["result_format"] = result_format
+        shared_cachedirs = self.get_trait_value(
+            "smart_caching_shared_directories")
+        if shared_cachedirs:
+            options["shared_cachedirs"] = list(shared_cachedirs)
+        cache_server = self.get_trait_value("smart_caching_server")
+        if cache_server not in (None, Undefined, ""):
+            options["cache_server"] = cache_server
+        return options
+
+    def _smart_caching_directory(self, output_directory):
+        """ Get the directory of the writable smart-caching memory: the
+        smart_caching_directory option if it is set, else the output
+        directory.
+        """
+        cachedir = self.get_trait_value("smart_caching_directory")
+        if cachedir in (None, Undefined, ""):
+            return output_directory
+        return cachedir
+
+    def _stable_temporary_directory(self, output_directory):
+        """ Get the directory where pipeline temporary files get stable
+        names.
+
+        Stable names are only needed when smart-caching is used: otherwise
+        temporary files are allocated with random names by the tempfile
+        module.
+
+        Parameters
+        ----------
+        output_directory: Directory name
+            the output directory used for the execution.
+
+        Returns
+        -------
+        temp_directory: str or None
+            None if temporary files should get random names.
+        """
+        if self.get_trait_value("use_smart_caching") in [None, False] \
+                or output_directory in (None, Undefined, ''):
+            return None
+        scratch_directory = self.scratch_directory
+        if scratch_directory not in (None, Undefined, ""):
+            return os.path.join(scratch_directory, "capsul_temporaries")
+        return os.path.join(output_directory, "capsul_temporaries")
+
+    def _scratch_directory(self):
+        """ Get the directory where temporary files are created (None: the
+        system temporary directory).
+        """
+        scratch_directory = self.scratch_directory
+        if scratch_directory in (None, Undefined, ""):
+            return None
+        if not os.path.isdir(scratch_directory):
+            os.makedirs(scratch_directory)
+        return scratch_directory
+
+    def _incremental_manifest(self, output_directory=None):
+        """ Get the incremental execution manifest.
+        """
+        filename = self.incremental_manifest
+        if filename in (None, Undefined, ""):
+            if output_directory in (None, Undefined, ""):
+                output_directory = self.output_directory
+            if output_directory in (None, Undefined, ""):
+                raise ValueError(
+                    "The incremental execution needs an output directory or "
+                    "an incremental_manifest file.")
+            filename = os.path.join(output_directory, "capsul_manifest.json")
+        return IncrementalManifest(filename, self.incremental_fingerprint)
+
+    def _workflow_cache(self):
+        """ Get the soma-workflow workflows cache of this study
+        configuration.
+        """
+        directory = self.workflow_cache_directory
+        if directory is Undefined:
+            directory = None
+        cache = getattr(self, "_workflow_cache_instance", None)
+        if cache is None or cache.directory != directory:
+            cache = WorkflowCache(directory)
+            self._workflow_cache_instance = cache
+        return cache
+
+    def _runtime_history(self):
+        """ Get the runtime history of this study configuration, or None
+        if the runtime_history_file option is not set.
+        """
+        filename = self.runtime_history_file
+        if filename in (None, Undefined, ""):
+            return None
+        history = getattr(self, "_runtime_history_instance", None)
+        if history is None or history.filename != filename:
+            history = RuntimeHistory(filename)
+            self._runtime_history_instance = history
+        return history
+
+    def _runtime_durations(self):
+        """ Get the {process_id: seconds} expected durations of the runtime
+        history, for jobs bundling and critical-path priorities.
+        """
+        history = self._runtime_history()
+        if history is None or not (self.critical_path_priorities
+                                   or self.job_bundle_duration):
+            return None
+        return history.durations()
+
+    def _io_locks_directory(self):
+        """ Get the directory of the I/O limits lock files, or None for the
+        default one.
+        """
+        if self.io_locks_directory in (Undefined, None, ""):
+            return None
+        return self.io_locks_directory
+
+    @staticmethod
+    def _temporary_paths(temporary_files):
+        """ Get the file names of the pipeline temporaries.
+        """
+        paths = []
+        for temp_file in temporary_files:
+            tmpfiles = temp_file[2]
+            if isinstance(tmpfiles, list):
+                paths.extend(tmpfiles)
+            else:
+                paths.append(tmpfiles)
+        return paths
+
+    def _spill_directory(self, output_directory):
+        """ Get the directory where temporary files are created when the
+        scratch budget is exceeded.
+        """
+        if output_directory in (None, Undefined, ""):
+            return None
+        return os.path.join(output_directory, "capsul_temporaries")
+
+    def _run(self, process_instance, output_directory, verbose,
+             process_hash=None, **kwargs):
         """ Method to execute a process in a study configuration environment.
 
         Parameters
@@ -400,6 +1018,8 @@ class StudyConfig(Controller):
             self.output_directory but left it unchanged.
         verbose: int
             if different from zero, print console messages.
+        process_hash: str (optional)
+            the smart-caching key of the process, if it is already known.
         """
         # Message
         logger.info("Study Config: executing process '{0}'...".format(
@@ -409,7 +1029,7 @@ class StudyConfig(Controller):
         if self.get_trait_value("use_smart_caching") in [None, False]:
             cachedir = None
         else:
-            cachedir = output_directory
+            cachedir = self._smart_caching_directory(output_directory)
 
         # Update the output directory folder if necessary
         if output_directory is not None and output_directory is not Undefined and output_directory:
@@ -424,13 +1044,29 @@ class StudyConfig(Controller):
                             not(process_instance.output_directory)):
                         process_instance.output_directory = output_directory
         
-        returncode, log_file = run_process(
-            output_directory,
-            process_instance,
-            cachedir=cachedir,
-            generate_logging=self.generate_logging,
-            verbose=verbose,
-            **kwargs)
+        start_time = time.time()
+        execution_info = {}
+        # Pipelines and iterations hold no slot: their nodes do
+        if isinstance(process_instance, (Pipeline, ProcessIteration)):
+            limits = {}
+        else:
+            limits = process_io_limits(process_instance,
+                                       self.io_concurrency_limits)
+        with io_slots(limits, self._io_locks_directory()):
+            returncode, log_file = run_process(
+                output_directory,
+                process_instance,
+                cachedir=cachedir,
+                cache_options=self._cache_options(),
+                process_hash=process_hash,
+                generate_logging=self.generate_logging,
+                verbose=verbose,
+                execution_info=execution_info,
+                **kwargs)
+        # results restored from the cache do not tell the process cost
+        history = self._runtime_history()
+        if history is not None and not execution_info.get("cache_hit"):
+            history.record(process_instance.id, time.time() - start_time)
 
         # Increment the number of executed process count
         self.process_counter += 1
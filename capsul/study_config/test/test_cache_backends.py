@@ -0,0 +1,109 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+# System import
+import unittest
+import os
+import tempfile
+import shutil
+
+# Capsul import
+from capsul.study_config.cache_backends import (
+    LocalCacheBackend, TieredCacheBackend, SocketCacheBackend, CacheServer)
+
+
+class TestCacheBackends(unittest.TestCase):
+    """ Store and find smart-caching entries.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_entry(self, backend, process_hash, content="result"):
+        """ Write a cache entry the way MemorizedProcess does.
+        """
+        process_dir = backend.new_entry("my.Process", process_hash)
+        with open(os.path.join(process_dir, "result.json"), "w") as f:
+            f.write(content)
+        backend.store("my.Process", process_hash, process_dir)
+        return process_dir
+
+    def read_entry(self, process_dir):
+        with open(os.path.join(process_dir, "result.json")) as f:
+            return f.read()
+
+    def test_local(self):
+        """ Test a local cache directory.
+        """
+        backend = LocalCacheBackend(os.path.join(self.tmpdir, "cache"))
+        self.assertEqual(backend.lookup("my.Process", "abc"), None)
+        process_dir = self.write_entry(backend, "abc")
+        self.assertEqual(backend.lookup("my.Process", "abc"), process_dir)
+        self.assertEqual(backend.keys("my.Process"), set(["abc"]))
+        readonly = LocalCacheBackend(backend.cachedir, readonly=True)
+        self.assertRaises(IOError, readonly.new_entry, "my.Process", "def")
+
+    def test_tiered(self):
+        """ Test lookups falling through tiers, with promotion.
+        """
+        shared = LocalCacheBackend(os.path.join(self.tmpdir, "shared"))
+        self.write_entry(shared, "abc", "shared result")
+        local = LocalCacheBackend(os.path.join(self.tmpdir, "local"))
+        backend = TieredCacheBackend(
+            [local, LocalCacheBackend(shared.cachedir, readonly=True)])
+        self.assertEqual(backend.keys("my.Process"), set(["abc"]))
+        self.assertEqual(local.lookup("my.Process", "abc"), None)
+        # without fetch, the entry is read in place
+        self.assertEqual(backend.lookup("my.Process", "abc", fetch=False),
+                         shared.lookup("my.Process", "abc"))
+        process_dir = backend.lookup("my.Process", "abc")
+        self.assertEqual(process_dir, local.lookup("my.Process", "abc"))
+        self.assertEqual(self.read_entry(process_dir), "shared result")
+        # new entries go to the local tier
+        self.write_entry(backend, "def")
+        self.assertEqual(local.keys("my.Process"), set(["abc", "def"]))
+        self.assertEqual(shared.keys("my.Process"), set(["abc"]))
+
+    def test_server(self):
+        """ Test a cache server on localhost.
+        """
+        server = CacheServer(os.path.join(self.tmpdir, "server"))
+        server.start()
+        try:
+            client1 = SocketCacheBackend(server.server_address,
+                                         os.path.join(self.tmpdir, "client1"))
+            client2 = SocketCacheBackend(server.server_address,
+                                         os.path.join(self.tmpdir, "client2"))
+            self.assertEqual(client2.lookup("my.Process", "abc"), None)
+            self.write_entry(client1, "abc", "remote result")
+            self.assertEqual(client2.keys("my.Process"), set(["abc"]))
+            process_dir = client2.lookup("my.Process", "abc")
+            self.assertEqual(self.read_entry(process_dir), "remote result")
+            self.assertTrue(process_dir.startswith(client2.local.cachedir))
+            self.assertRaises(IOError, client2.keys, "../etc")
+            client1.close()
+            client2.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def test():
+    """ Function to execute unitest.
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCacheBackends)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
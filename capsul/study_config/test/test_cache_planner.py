@@ -0,0 +1,116 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+# System import
+import unittest
+import os
+import tempfile
+import shutil
+
+# Capsul import
+from capsul.api import Process
+from capsul.study_config.memory import Memory
+from capsul.study_config.cache_planner import plan_cache
+
+# Trait import
+from traits.api import File, String
+
+
+class DummyFileProcess(Process):
+    """ Dummy file reader.
+    """
+    i = File(output=False, optional=False, desc="a file")
+    res = String(output=True, desc="the file content")
+
+    def _run_process(self):
+        self.res = open(self.i).read()
+
+
+class TestCachePlanner(unittest.TestCase):
+    """ Plan the smart-caching of a process.
+    """
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.cachedir, "in.txt")
+        with open(self.fname, "w") as open_file:
+            open_file.write("input data")
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def test_plan(self):
+        """ Test hits, misses and the reuse of planned keys.
+        """
+        process = DummyFileProcess()
+        process.i = self.fname
+
+        # Empty cache
+        plan = plan_cache(process, self.cachedir)
+        self.assertEqual([entry.status for entry in plan.entries], ["miss"])
+        self.assertEqual(plan.entries[0].duration, None)
+
+        # Execute with the planned key
+        proxy_process = Memory(self.cachedir).cache(
+            process, verbose=0,
+            process_hash=plan.get_process_hash(process))
+        proxy_process()
+
+        # The execution is now found in the cache, with its duration
+        process_hash = plan.get_process_hash(process)
+        plan = plan_cache(process, self.cachedir)
+        self.assertEqual(len(plan.hits), 1)
+        self.assertEqual(plan.hits[0].process_hash, process_hash)
+        self.assertTrue(os.path.isdir(plan.hits[0].process_dir))
+        self.assertTrue(plan.hits[0].duration is not None)
+
+        # Modified inputs are misses, estimated from the cached executions
+        with open(self.fname, "w") as open_file:
+            open_file.write("other input data")
+        plan = plan_cache(process, self.cachedir)
+        self.assertEqual(len(plan.misses), 1)
+        self.assertTrue(plan.misses[0].duration is not None)
+        self.assertTrue("1 miss(es)" in plan.report())
+
+    def test_outdated_plan(self):
+        """ Test that planned keys are not reused once the inputs changed.
+        """
+        process = DummyFileProcess()
+        process.i = self.fname
+        Memory(self.cachedir).cache(process, verbose=0)()
+        plan = plan_cache(process, self.cachedir)
+        self.assertEqual(len(plan.hits), 1)
+        self.assertEqual(plan.get_process_hash(process),
+                         plan.hits[0].process_hash)
+
+        # The input file changes between the planning and the execution
+        with open(self.fname, "w") as open_file:
+            open_file.write("other input data")
+        self.assertEqual(plan.get_process_hash(process), None)
+        Memory(self.cachedir).cache(
+            process, verbose=0,
+            process_hash=plan.get_process_hash(process))()
+        self.assertEqual(process.res, "other input data")
+
+        # So do the parameters
+        plan = plan_cache(process, self.cachedir)
+        process.i = os.path.join(self.cachedir, "other.txt")
+        self.assertEqual(plan.get_process_hash(process), None)
+
+
+def test():
+    """ Function to execute unitest.
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCachePlanner)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -19,6 +19,10 @@ from capsul.api import Process
 from capsul.api import FileCopyProcess
 from capsul.api import get_process_instance
 from capsul.study_config.memory import Memory
+from capsul.study_config.memory import get_process_hash
+from capsul.study_config.memory import relocate_path, unrelocate_path
+from capsul.study_config.memory import BinaryResultReader
+from capsul.study_config.memory import export_result_to_json
 
 # Trait import
 from traits.api import Float, File, List, String
@@ -50,6 +54,16 @@ class DummyCopyProcess(FileCopyProcess):
         self.s = repr(self.copied_inputs)
 
 
+class DummyFileProcess(Process):
+    """ Dummy file reader.
+    """
+    i = File(output=False, optional=False, desc="a file")
+    res = String(output=True, desc="the file content")
+
+    def _run_process(self):
+        self.res = open(self.i).read()
+
+
 class TestMemory(unittest.TestCase):
     """ Execute a process using smart-caching functionalities.
     """
@@ -92,6 +106,134 @@ class TestMemory(unittest.TestCase):
         # Call the test
         self.proxy_process_copy()
 
+    def test_relocatable_keys(self):
+        """ Test cache keys which do not depend on absolute paths.
+        """
+        # Create the same study in two locations
+        roots = [os.path.join(self.workspace_dir, "mount1", "study"),
+                 os.path.join(self.workspace_dir, "mount2", "study")]
+        os.makedirs(os.path.join(roots[0], "sub01"))
+        os.makedirs(os.path.join(roots[1], "sub01"))
+        fname = os.path.join(roots[0], "sub01", "t1.nii")
+        with open(fname, "w") as open_file:
+            open_file.write("t1 data")
+        shutil.copy2(fname, os.path.join(roots[1], "sub01"))
+
+        # Keys relative to the study root
+        process = DummyFileProcess()
+        hashes = []
+        for root in roots:
+            process.i = os.path.join(root, "sub01", "t1.nii")
+            hashes.append(get_process_hash(
+                process, relocatable=True, path_roots={"study": root})[0])
+            hashes.append(get_process_hash(process)[0])
+        self.assertEqual(hashes[0], hashes[2])
+        self.assertNotEqual(hashes[1], hashes[3])
+
+        # Keys from content outside of any root
+        other = os.path.join(self.workspace_dir, "t1.nii")
+        with open(other, "w") as open_file:
+            open_file.write("t1 data")
+        process.i = other
+        content_hash = get_process_hash(process, relocatable=True)[0]
+        self.assertEqual(
+            content_hash,
+            get_process_hash(process, relocatable=True,
+                             path_roots={"study": roots[0]})[0])
+        # the same file with another content has another key
+        with open(other, "w") as open_file:
+            open_file.write("other data")
+        self.assertNotEqual(
+            get_process_hash(process, relocatable=True)[0], content_hash)
+
+        # Paths translation
+        value = {"i": [fname, (fname, 12)], "j": "/somewhere/else"}
+        relocated = relocate_path(value, {"study": roots[0]})
+        self.assertEqual(relocated["i"][0], "<root:study>/sub01/t1.nii")
+        self.assertEqual(relocated["j"], "/somewhere/else")
+        self.assertEqual(
+            unrelocate_path(relocated, {"study": roots[1]})["i"][1],
+            (os.path.join(roots[1], "sub01", "t1.nii"), 12))
+
+    def test_relocatable_cache(self):
+        """ Test a cache shared between two study locations.
+        """
+        self.cachedir = tempfile.mkdtemp()
+        try:
+            roots = [os.path.join(self.workspace_dir, "study1"),
+                     os.path.join(self.workspace_dir, "study2")]
+            for root in roots:
+                os.mkdir(root)
+            fname = os.path.join(roots[0], "in.txt")
+            with open(fname, "w") as open_file:
+                open_file.write("input data")
+            shutil.copy2(fname, roots[1])
+            results = []
+            for root in roots:
+                mem = Memory(self.cachedir, relocatable=True,
+                             path_roots={"study": root})
+                proxy_process = mem.cache(DummyFileProcess(), verbose=0)
+                proxy_process(i=os.path.join(root, "in.txt"))
+                results.append(proxy_process.res)
+                # the input is left unchanged when the result is restored
+                self.assertEqual(proxy_process.i,
+                                 os.path.join(root, "in.txt"))
+            self.assertEqual(results, ["input data", "input data"])
+            self.assertEqual(len(os.listdir(
+                os.path.join(self.cachedir, "capsul_memory",
+                             *DummyFileProcess().id.split(".")))), 1)
+        finally:
+            shutil.rmtree(self.cachedir)
+
+    def test_binary_results(self):
+        """ Test the binary result format and its json export.
+        """
+        self.cachedir = tempfile.mkdtemp()
+        try:
+            mem = Memory(self.cachedir, result_format="binary")
+            proxy_process = mem.cache(DummyProcess(), verbose=0)
+            for param in [(1., 2.3), (2., 2.), (1., 2.3)]:
+                proxy_process(f=param[0], ff=param[1])
+                self.assertEqual(proxy_process.res, param[0] * param[1])
+            process_dirs = [
+                dirpath for dirpath, dirnames, filenames
+                in os.walk(self.cachedir) if "result.bin" in filenames]
+            self.assertEqual(len(process_dirs), 2)
+            reader = BinaryResultReader(
+                os.path.join(process_dirs[0], "result.bin"))
+            self.assertTrue("result" in reader)
+            self.assertTrue("parameters/res" in reader)
+            json_fname = export_result_to_json(process_dirs[0])
+            self.assertTrue(os.path.isfile(json_fname))
+
+            # A json-configured cache reads binary results
+            proxy_process = Memory(self.cachedir).cache(
+                DummyProcess(), verbose=0)
+            proxy_process(f=2., ff=2.)
+            self.assertEqual(proxy_process.res, 4.)
+        finally:
+            shutil.rmtree(self.cachedir)
+
+    def test_shared_cache(self):
+        """ Test a read-only shared cache promoted in a local one.
+        """
+        shared_dir = tempfile.mkdtemp()
+        self.cachedir = tempfile.mkdtemp()
+        try:
+            proxy_process = Memory(shared_dir).cache(DummyProcess(),
+                                                     verbose=0)
+            proxy_process(f=2., ff=3.)
+            mem = Memory(self.cachedir, shared_cachedirs=[shared_dir])
+            proxy_process = mem.cache(DummyProcess(), verbose=0)
+            proxy_process(f=2., ff=3.)
+            self.assertEqual(proxy_process.res, 6.)
+            process_id = DummyProcess().id
+            self.assertEqual(mem.backend.tiers[0].keys(process_id),
+                             mem.backend.tiers[1].keys(process_id))
+        finally:
+            shutil.rmtree(shared_dir)
+            shutil.rmtree(self.cachedir)
+
     def proxy_process(self):
         """ Test the proxy process behaviours.
         """
@@ -0,0 +1,126 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+# System import
+import unittest
+import os
+import tempfile
+import shutil
+
+# Capsul import
+from capsul.api import Process
+from capsul.study_config.staging import InputStager
+
+# Trait import
+from traits.api import File, List
+
+
+class DummyCopy(Process):
+    """ Dummy process concatenating its input files.
+    """
+    inputs = List(File(), output=False, optional=False, desc="input files")
+    output = File(output=True, optional=False, desc="output file")
+
+    def _run_process(self):
+        with open(self.output, "w") as f:
+            for fname in self.inputs:
+                f.write(open(fname).read())
+
+
+class FailingCopy(DummyCopy):
+    """ Dummy process failing after it has read its inputs.
+    """
+    def _run_process(self):
+        super(FailingCopy, self)._run_process()
+        raise RuntimeError("processing failed")
+
+
+class TestStaging(unittest.TestCase):
+    """ Test the input staging.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="capsul_test_")
+        self.shared = os.path.join(self.tmpdir, "shared")
+        self.staging = os.path.join(self.tmpdir, "staging")
+        os.mkdir(self.shared)
+        self.files = []
+        for name in ("a", "b"):
+            fname = os.path.join(self.shared, name + ".txt")
+            with open(fname, "w") as f:
+                f.write(name)
+            self.files.append(fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_staging(self):
+        process1 = DummyCopy()
+        process1.inputs = self.files
+        process1.output = os.path.join(self.shared, "ab.txt")
+        process2 = DummyCopy()
+        process2.inputs = [process1.output, self.files[0]]
+        process2.output = os.path.join(self.shared, "aba.txt")
+        execution_list = [process1, process2]
+
+        stager = InputStager(execution_list, self.staging, disk_limit=100,
+                             bandwidth=1000)
+        self.assertEqual(sorted(stager.consumers), self.files)
+        try:
+            # inputs and output of the first node are staged
+            stager.before_node(process1)
+            for fname in process1.inputs + [process1.output]:
+                self.assertTrue(fname.startswith(self.staging))
+            process1()
+            stager.after_node(process1)
+            self.assertEqual(process1.inputs, self.files)
+
+            # the first node output is read once written back, a.txt is
+            # still staged for the second node
+            stager.before_node(process2)
+            self.assertEqual(process2.inputs[0], process1.output)
+            self.assertEqual(open(process1.output).read(), "ab")
+            self.assertTrue(process2.inputs[1].startswith(self.staging))
+            self.assertTrue(process2.output.startswith(self.staging))
+            process2()
+            stager.after_node(process2)
+        finally:
+            stager.close()
+        self.assertEqual(open(process2.output).read(), "aba")
+        self.assertFalse(os.path.exists(self.staging))
+        self.assertEqual(stager.used_bytes, 0)
+
+    def test_failed_node(self):
+        process = FailingCopy()
+        process.inputs = self.files
+        process.output = os.path.join(self.shared, "ab.txt")
+        stager = InputStager([process], self.staging)
+        try:
+            stager.before_node(process)
+            self.assertTrue(process.output.startswith(self.staging))
+            self.assertRaises(RuntimeError, process)
+        finally:
+            stager.close()
+        # the parameters do not point to the deleted staging directory
+        self.assertEqual(process.inputs, self.files)
+        self.assertEqual(process.output,
+                         os.path.join(self.shared, "ab.txt"))
+        self.assertFalse(os.path.exists(self.staging))
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestStaging)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,139 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import sys
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+from traits.api import File
+from capsul.api import Process
+from capsul.api import Pipeline
+from capsul.study_config.work_queue import WorkQueueCoordinator
+
+
+class CopyProcess(Process):
+    """ Process copying a file
+    """
+    def __init__(self):
+        super(CopyProcess, self).__init__()
+        self.add_trait("input_image", File(optional=False))
+        self.add_trait("output_image", File(optional=False, output=True))
+
+    def _run_process(self):
+        with open(self.input_image) as input_file:
+            with open(self.output_image, "w") as output_file:
+                output_file.write(input_file.read())
+
+
+class CrashProcess(CopyProcess):
+    """ Process killing its worker the first time it runs
+    """
+    def __init__(self):
+        super(CrashProcess, self).__init__()
+        self.add_trait("marker", File(optional=False))
+
+    def _run_process(self):
+        if not os.path.exists(self.marker):
+            open(self.marker, "w").close()
+            os._exit(1)
+        super(CrashProcess, self)._run_process()
+
+
+class CopyPipeline(Pipeline):
+    """ Copies exchanging a temporary file, and iterated copies
+    """
+    def pipeline_definition(self):
+        self.add_process(
+            "node1", "capsul.study_config.test.test_work_queue.CopyProcess")
+        self.add_process(
+            "node2", "capsul.study_config.test.test_work_queue.CopyProcess")
+        self.add_iterative_process(
+            "copies", "capsul.study_config.test.test_work_queue.CopyProcess",
+            iterative_plugs=["input_image", "output_image"])
+        self.add_link("node1.output_image->node2.input_image")
+        self.export_parameter("node1", "input_image")
+        self.export_parameter("node2", "output_image")
+        self.export_parameter("copies", "input_image", "inputs")
+        self.export_parameter("copies", "output_image", "outputs")
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="capsul_test_")
+        self.coordinator = WorkQueueCoordinator(("localhost", 0),
+                                                heartbeat_timeout=10.)
+        self.coordinator.start()
+        address = "localhost:{0}".format(
+            self.coordinator.server_address[1])
+        self.workers = [
+            subprocess.Popen([sys.executable, "-m",
+                              "capsul.study_config.work_queue",
+                              "-c", address, "-n", "worker{0}".format(i),
+                              "-b", "1"])
+            for i in range(2)]
+        self.assertTrue(self.coordinator.wait_workers(2, timeout=60))
+
+    def tearDown(self):
+        self.coordinator.close()
+        for worker in self.workers:
+            if worker.poll() is None:
+                worker.kill()
+            worker.wait()
+        shutil.rmtree(self.directory)
+
+    def write_input(self, name):
+        filename = os.path.join(self.directory, name)
+        with open(filename, "w") as openfile:
+            openfile.write(name)
+        return filename
+
+    def test_pipeline(self):
+        pipeline = CopyPipeline()
+        pipeline.input_image = self.write_input("input")
+        pipeline.output_image = os.path.join(self.directory, "output")
+        pipeline.inputs = [self.write_input("input{0}".format(i))
+                           for i in range(3)]
+        self.coordinator.run(pipeline, timeout=60)
+        with open(pipeline.output_image) as openfile:
+            self.assertEqual(openfile.read(), "input")
+        # the iteration outputs are computed by the workers
+        self.assertEqual(len(pipeline.outputs), 3)
+        for i, output in enumerate(pipeline.outputs):
+            with open(output) as openfile:
+                self.assertEqual(openfile.read(), "input{0}".format(i))
+        workers = dict((name, worker) for name, iteration, worker
+                       in self.coordinator.assignments if iteration is None)
+        # node2 reads the temporary file written by node1
+        self.assertEqual(workers["node2"], workers["node1"])
+
+    def test_worker_loss(self):
+        process = CrashProcess()
+        process.input_image = self.write_input("input")
+        process.output_image = os.path.join(self.directory, "output")
+        process.marker = os.path.join(self.directory, "marker")
+        self.coordinator.run(process, timeout=60)
+        with open(process.output_image) as openfile:
+            self.assertEqual(openfile.read(), "input")
+        self.assertEqual(len(self.coordinator.workers()), 1)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestWorkQueue)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
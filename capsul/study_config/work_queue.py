@@ -0,0 +1,702 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Distributed execution of pipelines on a pool of TCP workers.
+
+A :class:`WorkQueueCoordinator` owns the flattened pipeline graph, and
+hands the nodes whose upstream nodes are done to workers connected over
+TCP. The outputs computed by the workers are sent back and set on the
+coordinator pipeline, so that they are propagated through the links as in
+a local execution::
+
+    coordinator = WorkQueueCoordinator(("", 8751))
+    coordinator.start()
+    coordinator.run(pipeline, temp_directory="/shared/tmp")
+
+Workers are started on each machine with::
+
+    python -m capsul.study_config.work_queue -c coordinator_host:8751
+
+A worker instantiates the processes from their identifier (see
+:func:`~capsul.study_config.process_instance.get_process_instance`), so
+they have to be importable on every machine, and the files have to be on a
+shared filesystem. The iterations of a
+:class:`~capsul.pipeline.process_iteration.ProcessIteration` are expanded
+when the node becomes ready, and are run as separate tasks.
+
+Scheduling is locality-aware: a node reading temporary files is given
+first to the worker which wrote them (the same iteration, for iterations
+over iterations). Otherwise, the nodes starting the longest chains are
+given first (see :mod:`capsul.pipeline.critical_path`). Workers send heartbeats: a worker which disconnects or
+stops sending them is lost, and its running task is run again elsewhere,
+up to a number of retries.
+
+Messages are JSON lines: ``hello``, ``heartbeat`` and ``result`` from the
+workers, ``run`` and ``stop`` from the coordinator.
+"""
+
+from __future__ import print_function
+
+# System import
+import sys
+import json
+import time
+import socket
+import itertools
+import threading
+import traceback
+import logging
+from optparse import OptionParser
+import six
+from six.moves import queue
+from six.moves import socketserver
+
+# Trait import
+from traits.api import Undefined
+
+# Capsul import
+from capsul.pipeline.pipeline import Pipeline
+from capsul.pipeline.process_iteration import ProcessIteration
+from capsul.pipeline.pipeline_tools import where_is_plug_value_from
+from capsul.pipeline.critical_path import (expected_duration,
+                                           critical_path_lengths)
+from capsul.study_config.process_instance import get_process_instance
+from capsul.utils.io_limits import process_io_limits, io_slots
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+if sys.version_info[0] >= 3:
+    xrange = range
+
+
+def _encode(value):
+    """ Make a parameter value JSON serializable.
+    """
+    if value is Undefined:
+        return {"__undefined__": True}
+    if isinstance(value, dict):
+        return dict((key, _encode(item)) for key, item in six.iteritems(value))
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value):
+    """ Revert :func:`_encode`.
+    """
+    if isinstance(value, dict):
+        if list(value) == ["__undefined__"]:
+            return Undefined
+        return dict((key, _decode(item)) for key, item in six.iteritems(value))
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _send_message(stream, message):
+    stream.write((json.dumps(message) + "\n").encode("utf-8"))
+    stream.flush()
+
+
+def _read_message(stream):
+    line = stream.readline()
+    if not line:
+        raise IOError("Work queue connection closed.")
+    return json.loads(line.decode("utf-8"))
+
+
+class _WorkerConnection(object):
+    """ A worker connected to the coordinator.
+    """
+
+    def __init__(self, worker_id, name, connection, wfile):
+        self.id = worker_id
+        self.name = name
+        self.connection = connection
+        self.wfile = wfile
+        self.last_seen = time.time()
+        self.task = None
+        self.alive = True
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            _send_message(self.wfile, message)
+
+    def close(self):
+        """ Close the connection: the request handler detects it, and the
+        worker is lost.
+        """
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except (socket.error, OSError):
+            pass
+
+
+class _WorkerRequestHandler(socketserver.StreamRequestHandler):
+    """ Handle the messages of a worker connection.
+    """
+
+    def handle(self):
+        try:
+            message = _read_message(self.rfile)
+        except (IOError, ValueError):
+            return
+        if message.get("command") != "hello":
+            return
+        worker = self.server._add_worker(message.get("name"),
+                                         self.connection, self.wfile)
+        try:
+            while True:
+                message = _read_message(self.rfile)
+                worker.last_seen = time.time()
+                if message.get("command") == "result":
+                    self.server._events.put(("result", worker, message))
+        except (IOError, ValueError):
+            pass
+        finally:
+            self.server._remove_worker(worker)
+
+
+class _Task(object):
+    """ Execution of a process (or of an iteration) by a worker.
+    """
+
+    def __init__(self, task_id, node, process, iteration=None):
+        self.id = task_id
+        self.node = node
+        self.iteration = iteration
+        self.process_id = process.id
+        self.parameters = dict((name, getattr(process, name))
+                               for name in process.user_traits())
+        self.preferred = set()
+        self.retries = 0
+        self.outputs = None
+
+
+class _Run(object):
+    """ Execution of a list of nodes by a WorkQueueCoordinator.
+    """
+
+    def __init__(self, coordinator, nodes, temp_files):
+        self.coordinator = coordinator
+        self.nodes = nodes
+        node_ids = set(id(node) for node in nodes)
+        temporaries = set((id(node), plug_name)
+                          for node, plug_name, tmpfiles, value in temp_files)
+        self.waited = {}
+        self.successors = dict((id(node), []) for node in nodes)
+        self.temporary_sources = {}
+        for node in nodes:
+            producers = set()
+            sources = []
+            for plug_name, plug in six.iteritems(getattr(node, "plugs", {})):
+                if plug.output:
+                    continue
+                source, source_plug, parent = where_is_plug_value_from(plug)
+                if source is None or source is node \
+                        or id(source) not in node_ids:
+                    continue
+                if id(source) not in producers:
+                    producers.add(id(source))
+                    self.successors[id(source)].append(node)
+                if (id(source), source_plug) in temporaries:
+                    sources.append(source)
+            self.waited[id(node)] = len(producers)
+            self.temporary_sources[id(node)] = sources
+        # remaining critical-path lengths
+        durations = {}
+        for node in nodes:
+            process = getattr(node, "process", node)
+            if isinstance(process, ProcessIteration):
+                process = process.process
+            durations[id(node)] = expected_duration(process,
+                                                    coordinator.history)
+        self.lengths = critical_path_lengths(
+            durations, dict((key, [id(node) for node in successors])
+                            for key, successors
+                            in six.iteritems(self.successors)),
+            durations)
+        # {id(node): {iteration: worker id}}
+        self.executed_by = {}
+        self.node_tasks = {}
+        # {id(node): True} for iterations computing their outputs lists
+        self.computed_outputs = {}
+        self.remaining = len(nodes)
+        self.ready = []
+        self.running = {}
+
+    def run(self, timeout=None):
+        start = time.time()
+        for node in self.nodes:
+            if self.waited[id(node)] == 0:
+                self._start_node(node)
+        while self.remaining:
+            self._dispatch()
+            try:
+                event = self.coordinator._events.get(timeout=1.)
+            except queue.Empty:
+                if timeout is not None and time.time() - start > timeout:
+                    raise RuntimeError(
+                        "The work queue execution did not end in {0} "
+                        "seconds.".format(timeout))
+                continue
+            if event[0] == "result":
+                self._task_done(event[1], event[2])
+            elif event[0] == "lost":
+                self._worker_lost(event[1])
+
+    def _start_node(self, node):
+        """ Create the tasks of a node whose upstream nodes are done.
+        """
+        process = getattr(node, "process", node)
+        tasks = []
+        if isinstance(process, ProcessIteration):
+            size, no_output_value = process.iteration_size()
+            self.computed_outputs[id(node)] = no_output_value
+            for parameter in process.regular_parameters:
+                setattr(process.process, parameter,
+                        getattr(process, parameter))
+            for iteration in xrange(size or 0):
+                process._set_iteration(iteration, no_output_value)
+                tasks.append(self._new_task(node, process.process,
+                                            iteration))
+        else:
+            tasks.append(self._new_task(node, process))
+        self.node_tasks[id(node)] = tasks
+        if not tasks:
+            self._node_done(node)
+        self.ready.extend(tasks)
+
+    def _new_task(self, node, process, iteration=None):
+        task = _Task(next(self.coordinator._task_ids), node, process,
+                     iteration)
+        for source in self.temporary_sources[id(node)]:
+            workers = self.executed_by.get(id(source), {})
+            if iteration is not None and iteration in workers:
+                task.preferred.add(workers[iteration])
+            else:
+                task.preferred.update(six.itervalues(workers))
+        return task
+
+    def _dispatch(self):
+        """ Send the ready tasks to the idle workers: first to a worker
+        holding their temporary inputs, then the tasks without an available
+        preferred worker, and the tasks preferring busy workers last.
+        """
+        if not self.ready:
+            return
+        workers = self.coordinator._alive_workers()
+        idle = dict((worker.id, worker) for worker in workers
+                    if worker.task is None)
+        alive_ids = set(worker.id for worker in workers)
+        # the tasks starting the longest chains first
+        ready = sorted(self.ready,
+                       key=lambda task: -self.lengths[id(task.node)])
+        for step in (0, 1, 2):
+            for task in ready:
+                if task not in self.ready:
+                    continue
+                if not idle:
+                    return
+                if step == 0:
+                    candidates = [worker_id for worker_id in task.preferred
+                                  if worker_id in idle]
+                elif step == 1 and task.preferred & alive_ids:
+                    continue
+                else:
+                    candidates = sorted(idle)
+                if candidates:
+                    self._send_task(task, idle.pop(candidates[0]))
+
+    def _send_task(self, task, worker):
+        self.ready.remove(task)
+        self.running[task.id] = task
+        worker.task = task
+        try:
+            worker.send({"command": "run", "task": task.id,
+                         "process": task.process_id,
+                         "parameters": _encode(task.parameters)})
+        except (IOError, ValueError, socket.error) as e:
+            # the request handler reports the worker as lost
+            logger.warning("Can't send a task to the worker {0}: "
+                           "{1}".format(worker.name, e))
+            worker.close()
+
+    def _task_done(self, worker, message):
+        if worker.task is not None and worker.task.id == message.get("task"):
+            worker.task = None
+        task = self.running.pop(message.get("task"), None)
+        if task is None:
+            # result of a previous run, or of a task given to another worker
+            return
+        if message.get("status") != "ok":
+            raise RuntimeError(
+                "{0} failed on the worker {1}: {2}".format(
+                    task.process_id, worker.name, message.get("message")))
+        task.outputs = _decode(message.get("outputs", {}))
+        if self.coordinator.history is not None \
+                and message.get("duration") is not None:
+            self.coordinator.history.record(task.process_id,
+                                            message["duration"])
+        self.executed_by.setdefault(id(task.node), {})[task.iteration] \
+            = worker.id
+        self.coordinator.assignments.append(
+            (getattr(task.node, "name", task.process_id), task.iteration,
+             worker.name))
+        tasks = self.node_tasks[id(task.node)]
+        if all(node_task.outputs is not None for node_task in tasks):
+            self._node_done(task.node)
+
+    def _node_done(self, node):
+        """ Set the outputs of a node on the coordinator, and start the
+        nodes waiting for it.
+        """
+        process = getattr(node, "process", node)
+        tasks = self.node_tasks[id(node)]
+        if isinstance(process, ProcessIteration):
+            outputs = {}
+            if self.computed_outputs.get(id(node)):
+                for parameter in process.iterative_parameters:
+                    if process.trait(parameter).output:
+                        outputs[parameter] = [task.outputs[parameter]
+                                              for task in tasks]
+        else:
+            outputs = tasks[0].outputs
+        for name, value in six.iteritems(outputs):
+            setattr(process, name, value)
+        self.remaining -= 1
+        for successor in self.successors[id(node)]:
+            self.waited[id(successor)] -= 1
+            if self.waited[id(successor)] == 0:
+                self._start_node(successor)
+
+    def _worker_lost(self, worker):
+        task = worker.task
+        worker.task = None
+        if task is None or self.running.get(task.id) is not task:
+            return
+        del self.running[task.id]
+        task.retries += 1
+        if task.retries > self.coordinator.max_retries:
+            raise RuntimeError(
+                "{0} could not run: {1} workers were lost while running "
+                "it.".format(task.process_id, task.retries))
+        logger.warning("Worker {0} lost, {1} will run again.".format(
+            worker.name, task.process_id))
+        task.preferred.discard(worker.id)
+        self.ready.insert(0, task)
+
+
+class WorkQueueCoordinator(socketserver.ThreadingMixIn,
+                           socketserver.TCPServer):
+    """ Run pipelines on the workers connected to a TCP port.
+
+    >>> coordinator = WorkQueueCoordinator(("localhost", 0))
+    >>> coordinator.start()
+    >>> coordinator.wait_workers(2)
+    >>> coordinator.run(pipeline)
+    >>> coordinator.close()
+
+    Attributes
+    ----------
+    heartbeat_timeout: float
+        a worker which sends no message during this time (in seconds) is
+        lost.
+    max_retries: int
+        number of times a task is run again after the loss of its worker.
+    assignments: list
+        (node name, iteration, worker name) tasks done during the last run.
+    history: RuntimeHistory
+        the execution times of the processes, used to run the longest
+        chains first, and completed with the tasks durations. None if no
+        history is used.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address=("localhost", 0), heartbeat_timeout=30.,
+                 max_retries=2, history=None):
+        """ Initialize the WorkQueueCoordinator class.
+
+        Parameters
+        ----------
+        server_address: 2-uplet (optional)
+            the (host, port) address to listen to. With port 0, a free port
+            is chosen: see the server_address attribute.
+        heartbeat_timeout: float (optional)
+            see the class attributes.
+        max_retries: int (optional)
+            see the class attributes.
+        history: RuntimeHistory (optional)
+            see the class attributes.
+        """
+        socketserver.TCPServer.__init__(self, server_address,
+                                        _WorkerRequestHandler)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_retries = max_retries
+        self.history = history
+        self.assignments = []
+        self._workers = {}
+        self._worker_ids = itertools.count(1)
+        self._task_ids = itertools.count(1)
+        self._lock = threading.Condition()
+        self._run_lock = threading.Lock()
+        self._events = queue.Queue()
+        self._closed = threading.Event()
+
+    def start(self):
+        """ Accept workers, and watch their heartbeats, in background
+        threads.
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        monitor = threading.Thread(target=self._monitor_workers)
+        monitor.daemon = True
+        monitor.start()
+        return thread
+
+    def close(self):
+        """ Stop the workers and the server.
+        """
+        for worker in self._alive_workers():
+            try:
+                worker.send({"command": "stop"})
+            except (IOError, ValueError, socket.error):
+                # already disconnected
+                pass
+        self._closed.set()
+        self.shutdown()
+        self.server_close()
+
+    def workers(self):
+        """ Names of the connected workers.
+        """
+        return [worker.name for worker in self._alive_workers()]
+
+    def wait_workers(self, count, timeout=None):
+        """ Wait until some workers are connected.
+
+        Returns
+        -------
+        connected: bool
+            False if the timeout expired before.
+        """
+        end = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while len(self._workers) < count:
+                if end is not None and time.time() >= end:
+                    return False
+                self._lock.wait(1. if end is None
+                                else min(1., end - time.time()))
+        return True
+
+    def _add_worker(self, name, connection, wfile):
+        with self._lock:
+            worker_id = next(self._worker_ids)
+            worker = _WorkerConnection(worker_id, name or str(worker_id),
+                                       connection, wfile)
+            self._workers[worker_id] = worker
+            self._lock.notify_all()
+        logger.info("Worker {0} connected.".format(worker.name))
+        self._events.put(("hello", worker))
+        return worker
+
+    def _remove_worker(self, worker):
+        with self._lock:
+            if not worker.alive:
+                return
+            worker.alive = False
+            del self._workers[worker.id]
+        logger.info("Worker {0} disconnected.".format(worker.name))
+        self._events.put(("lost", worker))
+
+    def _alive_workers(self):
+        with self._lock:
+            return [self._workers[worker_id]
+                    for worker_id in sorted(self._workers)]
+
+    def _monitor_workers(self):
+        """ Disconnect the workers which stopped sending heartbeats.
+        """
+        while not self._closed.wait(self.heartbeat_timeout / 4.):
+            now = time.time()
+            for worker in self._alive_workers():
+                if now - worker.last_seen > self.heartbeat_timeout:
+                    logger.warning("Worker {0} timed out.".format(
+                        worker.name))
+                    worker.close()
+
+    def run(self, process_or_pipeline, temp_directory=None, timeout=None):
+        """ Execute a pipeline (or a single process) on the workers.
+
+        Parameters
+        ----------
+        process_or_pipeline: Process or Pipeline
+            the process or pipeline to execute.
+        temp_directory: str (optional)
+            directory of the temporary files. It has to be shared by the
+            workers. Default: the tempfile module default directory.
+        timeout: float (optional)
+            maximum execution time, in seconds. Default: no limit.
+        """
+        with self._run_lock:
+            if isinstance(process_or_pipeline, Pipeline):
+                nodes = process_or_pipeline.workflow_ordered_nodes()
+            else:
+                nodes = [process_or_pipeline]
+            self.assignments = []
+            temp_files = []
+            try:
+                if isinstance(process_or_pipeline, Pipeline):
+                    for node in nodes:
+                        process_or_pipeline._check_temporary_files_for_node(
+                            node, temp_files, temp_directory)
+                _Run(self, nodes, temp_files).run(timeout)
+            finally:
+                if temp_files:
+                    process_or_pipeline._free_temporary_files(temp_files)
+                if self.history is not None:
+                    self.history.save()
+
+
+class WorkQueueWorker(object):
+    """ Run the tasks of a WorkQueueCoordinator.
+
+    Attributes
+    ----------
+    server_address: 2-uplet
+        the (host, port) address of the coordinator.
+    name: str
+        the name of the worker in the coordinator logs.
+    heartbeat: float
+        interval between heartbeats, in seconds.
+    """
+
+    def __init__(self, server_address, name=None, heartbeat=5.,
+                 study_config=None):
+        """ Initialize the WorkQueueWorker class.
+
+        Parameters
+        ----------
+        server_address: 2-uplet
+            see the class attributes.
+        name: str (optional)
+            see the class attributes. Default: the host name.
+        heartbeat: float (optional)
+            see the class attributes.
+        study_config: StudyConfig (optional)
+            the study config of the processes.
+        """
+        self.server_address = server_address
+        self.name = name or socket.gethostname()
+        self.heartbeat = heartbeat
+        self.study_config = study_config
+
+    def serve(self):
+        """ Run the tasks until the coordinator stops or disconnects.
+        """
+        connection = socket.create_connection(self.server_address)
+        rfile = connection.makefile("rb")
+        wfile = connection.makefile("wb")
+        lock = threading.Lock()
+        stopped = threading.Event()
+
+        def send(message):
+            with lock:
+                _send_message(wfile, message)
+
+        def send_heartbeats():
+            while not stopped.wait(self.heartbeat):
+                try:
+                    send({"command": "heartbeat"})
+                except (IOError, socket.error):
+                    return
+
+        send({"command": "hello", "name": self.name})
+        thread = threading.Thread(target=send_heartbeats)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                try:
+                    message = _read_message(rfile)
+                except IOError:
+                    break
+                command = message.get("command")
+                if command == "stop":
+                    break
+                elif command == "run":
+                    send(self.run_task(message))
+        finally:
+            stopped.set()
+            connection.close()
+
+    def run_task(self, message):
+        """ Run a task, and build its result message.
+        """
+        result = {"command": "result", "task": message.get("task")}
+        try:
+            process = get_process_instance(message["process"],
+                                           study_config=self.study_config)
+            for name, value in six.iteritems(
+                    _decode(message.get("parameters", {}))):
+                setattr(process, name, value)
+            limits = {}
+            locks_directory = None
+            if self.study_config is not None:
+                limits = process_io_limits(
+                    process, self.study_config.io_concurrency_limits)
+                locks_directory = self.study_config._io_locks_directory()
+            with io_slots(limits, locks_directory):
+                start_time = time.time()
+                process()
+                result["duration"] = time.time() - start_time
+            result["outputs"] = _encode(dict(
+                (name, getattr(process, name))
+                for name, trait in six.iteritems(process.user_traits())
+                if trait.output))
+            result["status"] = "ok"
+        except Exception as e:
+            logger.error("Task {0} failed: {1}".format(
+                message.get("task"), traceback.format_exc()))
+            result["status"] = "error"
+            result["message"] = "{0}: {1}".format(e.__class__.__name__, e)
+        return result
+
+
+def main(argv=None):
+    """ Run a work queue worker.
+    """
+    parser = OptionParser(
+        usage="python -m capsul.study_config.work_queue -c HOST:PORT "
+              "[-n NAME] [-b HEARTBEAT]")
+    parser.add_option("-c", "--coordinator", dest="coordinator",
+                      help="the coordinator address.")
+    parser.add_option("-n", "--name", dest="name",
+                      help="the worker name (default: the host name).")
+    parser.add_option("-b", "--heartbeat", dest="heartbeat", type="float",
+                      default=5.,
+                      help="interval between heartbeats, in seconds "
+                           "(default 5).")
+    options, args = parser.parse_args(argv)
+    if not options.coordinator or ":" not in options.coordinator:
+        parser.error("a coordinator HOST:PORT address is required.")
+    host, port = options.coordinator.rsplit(":", 1)
+    worker = WorkQueueWorker((host, int(port)), options.name,
+                             options.heartbeat)
+    try:
+        worker.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" File copy strategies.
+
+A process which only reads its inputs does not need a full copy of them:
+
+* 'copy': a real copy of the file contents and metadata.
+* 'hardlink': a hard link to the file, or a copy if the destination is on
+  another filesystem.
+* 'symlink': a symbolic link to the file.
+* 'reflink': a copy-on-write clone of the file (Linux btrfs, XFS...). An
+  error is raised if the filesystem does not support clones.
+* 'cow': a copy-on-write clone when the filesystem supports it, a copy
+  otherwise.
+
+Hard links and symbolic links share the data with the source file: they
+must not be used for files modified in place.
+"""
+
+# System import
+import os
+import sys
+import shutil
+import optparse
+from multiprocessing.pool import ThreadPool
+
+# Capsul import
+from capsul.utils.formats import files_group
+
+# ioctl request cloning a file on Linux (FICLONE)
+_FICLONE = 0x40049409
+
+
+def reflink(src, dest):
+    """ Clone a file: the clone shares the source data blocks until one of
+    the files is modified.
+
+    Raises
+    ------
+    OSError: if the system or the filesystem does not support clones.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflink is not supported on this system")
+    with open(src, "rb") as src_file:
+        with open(dest, "wb") as dest_file:
+            try:
+                fcntl.ioctl(dest_file.fileno(), _FICLONE, src_file.fileno())
+            except (IOError, OSError) as e:
+                dest_file.close()
+                os.unlink(dest)
+                raise OSError("cannot clone '{0}' to '{1}': {2}".format(
+                    src, dest, e))
+    shutil.copystat(src, dest)
+
+
+def _copy(src, dest):
+    shutil.copy2(src, dest)
+
+
+def _hardlink(src, dest):
+    try:
+        os.link(src, dest)
+    except OSError:
+        # cross-device link or unsupported filesystem
+        shutil.copy2(src, dest)
+
+
+def _symlink(src, dest):
+    os.symlink(os.path.abspath(src), dest)
+
+
+def _cow(src, dest):
+    try:
+        reflink(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+# copy_strategies: {name: copy_function}
+copy_strategies = {
+    "copy": _copy,
+    "hardlink": _hardlink,
+    "symlink": _symlink,
+    "reflink": reflink,
+    "cow": _cow,
+}
+
+
+def copy_file(src, dest, strategy="copy"):
+    """ Copy a file using a copy strategy.
+
+    An existing destination file is replaced.
+
+    Parameters
+    ----------
+    src: str
+        the source file.
+    dest: str
+        the destination file.
+    strategy: str (optional, default 'copy')
+        one of the copy strategies: 'copy', 'hardlink', 'symlink',
+        'reflink', 'cow'.
+    """
+    if strategy not in copy_strategies:
+        raise ValueError("'{0}' is not a valid copy strategy, expect one "
+                         "of {1}".format(strategy, sorted(copy_strategies)))
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    copy_strategies[strategy](src, dest)
+
+
+def copy_files_group(src, dest, strategy="copy"):
+    """ Copy a file and its existing companion files (see
+    :func:`capsul.utils.formats.files_group`).
+
+    Parameters
+    ----------
+    src: str
+        the source main file.
+    dest: str
+        the destination main file.
+    strategy: str (optional, default 'copy')
+        the copy strategy (see :func:`copy_file`).
+
+    Returns
+    -------
+    copied: list of str
+        the destination files.
+    """
+    copied = []
+    for src_file, dest_file in zip(files_group(src), files_group(dest)):
+        if src_file == src or os.path.isfile(src_file):
+            copy_file(src_file, dest_file, strategy)
+            copied.append(dest_file)
+    return copied
+
+
+def copy_files(copies, workers=1):
+    """ Copy a list of files and their companion files.
+
+    Parameters
+    ----------
+    copies: list of 3-uplet
+        the copies to be done (src, dest, strategy).
+    workers: int (optional, default 1)
+        the number of copies done in parallel.
+    """
+    # a file used by several inputs is copied once
+    unique_copies = []
+    destinations = set()
+    for copy in copies:
+        if copy[1] not in destinations:
+            destinations.add(copy[1])
+            unique_copies.append(copy)
+    copies = unique_copies
+    if workers <= 1 or len(copies) <= 1:
+        for src, dest, strategy in copies:
+            copy_files_group(src, dest, strategy)
+        return
+    pool = ThreadPool(min(workers, len(copies)))
+    try:
+        pool.map(lambda copy: copy_files_group(*copy), copies)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main():
+    """ Copy files (used by soma-workflow jobs).
+    """
+    parser = optparse.OptionParser(
+        usage="python -m capsul.utils.file_copy [--strategy STRATEGY] "
+              "SRC DEST [SRC DEST ...]")
+    parser.add_option("-s", "--strategy", dest="strategy", default="copy",
+                      help="copy strategy: {0}".format(
+                          ", ".join(sorted(copy_strategies))))
+    options, args = parser.parse_args()
+    if len(args) % 2 != 0:
+        parser.error("expect (SRC, DEST) pairs")
+    copy_files([(args[i], args[i + 1], options.strategy)
+                for i in range(0, len(args), 2)])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Fingerprints of files and parameters values.
+
+Smart-caching keys and duplicate nodes detection
+(:mod:`capsul.study_config.memory`), cache plans
+(:mod:`capsul.study_config.cache_planner`), incremental execution
+(:mod:`capsul.pipeline.incremental`) and workflows caches
+(:mod:`capsul.pipeline.workflow_cache`) all use these functions, so that
+they agree on what changed.
+
+Files are fingerprinted by their size and modification time ('timestamp'
+mode) or by their size and content digest ('hash' mode). Directories are
+fingerprinted by their modification time.
+"""
+
+# System import
+import os
+import stat
+import hashlib
+import six
+
+# Trait import
+from traits.api import Undefined
+
+# Fingerprint modes
+fingerprint_modes = ("timestamp", "hash")
+
+# Content digests cache: {path: (size, mtime, digest)}
+_file_digests = {}
+
+
+def file_digest(afile, file_stat=None):
+    """ Computes the md5 digest of a file content.
+
+    Digests are cached for the current session as long as the file size and
+    mtime do not change.
+
+    Parameters
+    ----------
+    afile: string
+        the file to process.
+    file_stat: os.stat_result (optional)
+        the file stat, if it is already known.
+
+    Returns
+    -------
+    digest: string
+        the file content md5 digest.
+    """
+    if file_stat is None:
+        file_stat = os.stat(afile)
+    cached = _file_digests.get(afile)
+    if cached is not None \
+            and cached[:2] == (file_stat.st_size, file_stat.st_mtime):
+        return cached[2]
+    hasher = hashlib.new("md5")
+    with open(afile, "rb") as open_file:
+        for block in iter(lambda: open_file.read(1024 * 1024), b""):
+            hasher.update(block)
+    digest = hasher.hexdigest()
+    _file_digests[afile] = (file_stat.st_size, file_stat.st_mtime, digest)
+    return digest
+
+
+def path_fingerprint(path, mode="timestamp", stat_cache=None):
+    """ Get the fingerprint of a file or directory.
+
+    Parameters
+    ----------
+    path: str
+        the file or directory.
+    mode: str (optional, default 'timestamp')
+        'timestamp': size and modification time, 'hash': size and content
+        digest.
+    stat_cache: StatCache (optional)
+        directories listings (see :mod:`capsul.utils.stat_cache`) to use
+        instead of one system call per file.
+
+    Returns
+    -------
+    fingerprint: list
+        the fingerprint (JSON compatible), or None if the path does not
+        exist.
+    """
+    if not isinstance(path, six.string_types) or not path:
+        return None
+    content_file = path
+    file_stat = None
+    if stat_cache is not None:
+        file_stat = stat_cache.stat(path)
+        content_file = stat_cache.content_path(path)
+    if file_stat is None:
+        if stat_cache is not None and not stat_cache.isdir(path):
+            return None
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.S_ISDIR(file_stat.st_mode):
+            return ["directory", file_stat.st_mtime]
+    if mode == "hash":
+        return [file_stat.st_size, file_digest(content_file, file_stat)]
+    return [file_stat.st_size, file_stat.st_mtime]
+
+
+def value_fingerprint(value, mode=None, stat_cache=None):
+    """ Get a JSON compatible fingerprint of a parameter value.
+
+    Empty values (Undefined, None and empty strings) are all None.
+    Temporary paths are their pattern string, and values which are not
+    JSON compatible their representation.
+
+    Parameters
+    ----------
+    value: object
+        the parameter value.
+    mode: str (optional)
+        if given, strings are fingerprinted as [string, fingerprint], where
+        fingerprint is the :func:`path_fingerprint` in this mode (None if
+        the string is not an existing path).
+    stat_cache: StatCache (optional)
+        directories listings (see :mod:`capsul.utils.stat_cache`) to use
+        instead of one system call per file.
+
+    Returns
+    -------
+    fingerprint: object
+    """
+    if value is Undefined or value is None \
+            or (isinstance(value, six.string_types) and not value):
+        return None
+    if isinstance(value, (list, tuple)):
+        return [value_fingerprint(item, mode, stat_cache) for item in value]
+    if isinstance(value, dict):
+        return dict((key, value_fingerprint(item, mode, stat_cache))
+                    for key, item in six.iteritems(value))
+    if hasattr(value, "pattern"):
+        # temporary path
+        return str(value)
+    if isinstance(value, six.string_types):
+        if mode is None:
+            return value
+        return [value, path_fingerprint(value, mode, stat_cache)]
+    if isinstance(value, (bool, float) + six.integer_types):
+        return value
+    return repr(value)
@@ -0,0 +1,103 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" File formats registry.
+
+Some file formats are made of several files (an Analyze image is a .img
+and a .hdr file for instance). Files of such formats have to be
+transferred, copied or deleted together. The registry gives, for each
+format, its extensions and their companion files extensions.
+"""
+
+# System import
+import os
+import six
+
+# formats: {name: ext_props}
+#     ext_props: {ext: [dependent_exts]}
+#     dependent_exts: (ext, mandatory)
+#     SPM stores the orientation of NIFTI-1 images it modifies in .mat files.
+formats = {
+    'NIFTI-1': {'.nii': [('.mat', False)],
+                '.img': [('.hdr', True), ('.mat', False)],
+                '.nii.gz': []},
+    'GIS': {'.ima': [('.dim', True)]},
+    'GIFTI': {'.gii': []},
+    'MESH': {'.mesh': []},
+    'ARG': {'.arg': [('.data', False)]},
+}
+
+# Companion files which may be attached to any file
+generic_companions = ['.minf']
+
+
+def register_format(name, extensions):
+    """ Register a file format.
+
+    Parameters
+    ----------
+    name: str
+        the format name.
+    extensions: dict
+        {ext: [(dependent_ext, mandatory), ...]} format extensions and the
+        extensions of their companion files.
+    """
+    formats[name] = extensions
+
+
+def get_merged_formats():
+    """ Get the formats extensions, regardless of the formats names.
+
+    Returns
+    -------
+    merged_formats: dict
+        {ext: [(dependent_ext, mandatory), ...]}
+    """
+    merged_formats = {}
+    for format, values in six.iteritems(formats):
+        merged_formats.update(values)
+    return merged_formats
+
+
+def files_group(path, merged_formats=None):
+    """ Get a file and its companion files.
+
+    Companion files are not checked to exist.
+
+    Parameters
+    ----------
+    path: str
+        the main file name.
+    merged_formats: dict (optional)
+        the formats extensions (see :func:`get_merged_formats`). Default:
+        the registered formats.
+
+    Returns
+    -------
+    paths: list of str
+        path, followed by its companion files.
+    """
+    if merged_formats is None:
+        merged_formats = get_merged_formats()
+    bname = os.path.basename(path)
+    l0 = len(path) - len(bname)
+    p0 = 0
+    paths = [path]
+    while True:
+        p = bname.find('.', p0)
+        if p < 0:
+            break
+        ext = bname[p:]
+        p0 = p + 1
+        format_def = merged_formats.get(ext)
+        if format_def:
+            path0 = path[:l0 + p]
+            paths += [path0 + e[0] for e in format_def]
+            break
+    paths += [path + ext for ext in generic_companions]
+    return paths
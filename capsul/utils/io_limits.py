@@ -0,0 +1,319 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Per-filesystem I/O concurrency limits.
+
+Running many processes against the same network mount may collapse its
+throughput. The number of processes running at the same time on a mount
+point can be limited: a process is bound to the mount points of its File
+and Directory parameters values. Processes which do not use a limited
+mount point are not throttled.
+
+Limits are given as a {path: max_processes} dict, where path is a mount
+point, or any directory of the filesystem.
+
+Processes hold lock files while they run (:func:`io_slots`), so that the
+limits hold for local executions, work queue workers and workflow jobs,
+which run in separate processes, possibly on several machines. The command
+of workflow jobs is wrapped by :func:`io_limited_command` to wait for a
+free slot, so that independent jobs are not ordered in advance.
+"""
+
+# System import
+import os
+import sys
+import time
+import hashlib
+import logging
+import optparse
+import tempfile
+import threading
+import contextlib
+import six
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+# Trait import
+from traits.api import Undefined
+
+# Capsul import
+from capsul.utils.trait_paths import is_path_trait, path_values
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# mount_points_cache: {directory: mount_point}
+_mount_points_cache = {}
+
+# Slots held by each thread: {mount_point: slot_file}
+_held_slots = threading.local()
+
+
+def mount_point(path):
+    """ Get the mount point of the filesystem a path belongs to.
+
+    The path does not need to exist: the mount point of its nearest
+    existing parent directory is used.
+
+    Parameters
+    ----------
+    path: str
+        a file or directory name.
+
+    Returns
+    -------
+    mount_point: str
+    """
+    path = os.path.abspath(path)
+    if not os.path.isdir(path):
+        path = os.path.dirname(path)
+    result = _mount_points_cache.get(path)
+    if result is not None:
+        return result
+    walked = []
+    current = path
+    while True:
+        result = _mount_points_cache.get(current)
+        if result is not None:
+            break
+        walked.append(current)
+        if os.path.ismount(current):
+            result = current
+            break
+        parent = os.path.dirname(current)
+        if parent == current:
+            result = current
+            break
+        current = parent
+    for directory in walked:
+        if os.path.exists(directory):
+            _mount_points_cache[directory] = result
+    return result
+
+
+def process_mount_points(process):
+    """ Get the mount points a process reads or writes.
+
+    Parameters
+    ----------
+    process: Process
+        the process. Its File and Directory parameters values are used.
+
+    Returns
+    -------
+    mount_points: set of str
+    """
+    mount_points = set()
+    for name, trait in six.iteritems(process.user_traits()):
+        if not is_path_trait(trait):
+            continue
+        value = getattr(process, name, Undefined)
+        for path in path_values(value):
+            mount_points.add(mount_point(path))
+    return mount_points
+
+
+def normalize_io_limits(io_limits):
+    """ Get I/O limits indexed by mount points.
+
+    Parameters
+    ----------
+    io_limits: dict
+        {path: max_processes}. A limit <= 0 means no limit.
+
+    Returns
+    -------
+    limits: dict
+        {mount_point: max_processes}. When several paths of the same
+        filesystem are given, the lowest limit is used.
+    """
+    limits = {}
+    for path, limit in six.iteritems(io_limits or {}):
+        if limit <= 0:
+            continue
+        mount = mount_point(path)
+        limits[mount] = min(limit, limits.get(mount, limit))
+    return limits
+
+
+def _slots_directory(mount, lock_directory=None):
+    """ Get the directory of the lock files of the slots of a mount point.
+    """
+    if lock_directory is None:
+        lock_directory = os.path.join(tempfile.gettempdir(),
+                                      "capsul_io_slots")
+    return os.path.join(lock_directory,
+                        hashlib.md5(mount.encode("utf-8")).hexdigest())
+
+
+def _acquire_slot(mount, limit, lock_directory, poll_interval):
+    """ Wait for a free slot of a mount point, and lock it.
+
+    Returns
+    -------
+    slot_file: file
+        the locked slot file, or None when file locks are not available.
+    """
+    if fcntl is None:
+        logger.warning("File locks are not available: I/O limits are not "
+                       "enforced")
+        return None
+    directory = _slots_directory(mount, lock_directory)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # created by another process in the meantime
+            if not os.path.isdir(directory):
+                raise
+    waiting = False
+    while True:
+        for index in range(limit):
+            slot_file = open(os.path.join(directory,
+                                          "slot{0}".format(index)), "a")
+            try:
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot_file
+            except (IOError, OSError):
+                slot_file.close()
+        if not waiting:
+            logger.debug("Waiting for an I/O slot on '{0}'".format(mount))
+            waiting = True
+        time.sleep(poll_interval)
+
+
+@contextlib.contextmanager
+def io_slots(limits, lock_directory=None, poll_interval=0.2):
+    """ Hold a slot of each limited mount point while the 'with' block runs.
+
+    Slots are lock files: the limits hold for all the processes sharing the
+    lock directory, whatever runs them. Slots are always acquired in the
+    same (sorted) order, so that processes using several limited mount
+    points do not deadlock. A thread which already holds a slot of a mount
+    point (a process run inside another one) does not wait for another one.
+
+    Parameters
+    ----------
+    limits: dict
+        {mount_point: max_processes} the limited mount points.
+    lock_directory: str (optional)
+        directory of the lock files. It has to be shared by all the
+        processes to throttle: processes running on several machines need a
+        directory on a shared filesystem. Default: a directory of the local
+        temporary directory.
+    poll_interval: float (optional)
+        interval between attempts to get a slot, in seconds.
+    """
+    thread_slots = getattr(_held_slots, "slots", None)
+    if thread_slots is None:
+        thread_slots = _held_slots.slots = {}
+    held = []
+    try:
+        for mount in sorted(limits):
+            if mount in thread_slots:
+                continue
+            slot_file = _acquire_slot(mount, limits[mount], lock_directory,
+                                      poll_interval)
+            if slot_file is not None:
+                thread_slots[mount] = slot_file
+                held.append(mount)
+        yield
+    finally:
+        for mount in reversed(held):
+            slot_file = thread_slots.pop(mount)
+            fcntl.flock(slot_file, fcntl.LOCK_UN)
+            slot_file.close()
+
+
+def process_io_limits(process, io_limits):
+    """ Get the limits of the mount points used by a process.
+
+    Parameters
+    ----------
+    process: Process
+        the process.
+    io_limits: dict
+        {path: max_processes} limits, see :func:`normalize_io_limits`.
+
+    Returns
+    -------
+    limits: dict
+        {mount_point: max_processes} for the limited mount points the
+        process uses.
+    """
+    limits = normalize_io_limits(io_limits)
+    if not limits:
+        return {}
+    return dict((mount, limits[mount])
+                for mount in process_mount_points(process)
+                if mount in limits)
+
+
+def io_limited_command(command, limits, lock_directory=None):
+    """ Get a command line waiting for I/O slots (see :func:`io_slots`)
+    before running a command, for workflow jobs.
+
+    Parameters
+    ----------
+    command: list
+        the command line.
+    limits: dict
+        {mount_point: max_processes} the limited mount points the command
+        uses (see :func:`process_io_limits`).
+    lock_directory: str (optional)
+        directory of the lock files, see :func:`io_slots`.
+
+    Returns
+    -------
+    command: list
+        the command, unchanged if there are no limits.
+    """
+    if not limits:
+        return command
+    prefix = ["python", "-m", "capsul.utils.io_limits"]
+    for mount in sorted(limits):
+        prefix += ["-l", "{0}:{1}".format(limits[mount], mount)]
+    if lock_directory:
+        prefix += ["-d", lock_directory]
+    return prefix + ["--"] + list(command)
+
+
+def main(argv=None):
+    """ Run a command once it gets slots on the limited mount points.
+    """
+    parser = optparse.OptionParser(
+        usage="python -m capsul.utils.io_limits -l MAX:MOUNT_POINT "
+              "[-l ...] [-d LOCK_DIRECTORY] -- COMMAND...")
+    parser.add_option("-l", "--limit", dest="limits", action="append",
+                      default=[],
+                      help="maximum number of processes on a mount point")
+    parser.add_option("-d", "--lock-directory", dest="lock_directory",
+                      help="directory of the lock files")
+    parser.disable_interspersed_args()
+    options, args = parser.parse_args(argv)
+    if not args:
+        parser.error("no command")
+    limits = {}
+    for limit in options.limits:
+        try:
+            count, mount = limit.split(":", 1)
+            limits[mount] = int(count)
+        except ValueError:
+            parser.error("invalid limit '{0}', expect MAX:MOUNT_POINT".format(
+                limit))
+    # Python commands are run in this interpreter
+    from capsul.pipeline.job_bundles import run_command
+    with io_slots(limits, options.lock_directory):
+        return run_command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
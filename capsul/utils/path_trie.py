@@ -0,0 +1,104 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Matching of paths against a set of root directories.
+
+Workflow generation checks every file parameter of every job against the
+shared resource and transfer directories of the computing resource.
+:class:`PathTrie` compiles the directories into a tree of path components,
+so that the cost of a match depends on the depth of the path instead of the
+number of directories, and remembers the paths already matched::
+
+    trie = PathTrie({"/neurospin/data": ("brainvisa", "uuid")})
+    trie.lookup("/neurospin/data/sub1/t1.nii")
+    # ('/neurospin/data', ('brainvisa', 'uuid'))
+"""
+
+# System import
+import os
+import six
+
+
+class PathTrie(object):
+    """ Root directories compiled for the search of the directory containing
+    a path.
+
+    When roots are nested, the deepest one containing a path is found.
+    """
+
+    def __init__(self, roots=None, sep=os.sep):
+        """ Initialize the PathTrie class.
+
+        Parameters
+        ----------
+        roots: dict or sequence (optional)
+            {directory: value} or directories (their value is the directory
+            itself).
+        sep: str (optional)
+            the path separator.
+        """
+        self.sep = sep
+        self._roots = {}
+        self._tree = {}
+        self._cache = {}
+        if roots:
+            if not isinstance(roots, dict):
+                roots = dict((root, root) for root in roots)
+            for root, value in six.iteritems(roots):
+                self.add(root, value)
+
+    def __len__(self):
+        return len(self._roots)
+
+    def add(self, root, value=None):
+        """ Add a root directory.
+        """
+        if value is None:
+            value = root
+        node = self._tree
+        for component in self._split(root):
+            node = node.setdefault(component, {})
+        node[None] = (root, value)
+        self._roots[root] = value
+        self._cache.clear()
+
+    def _split(self, root):
+        stripped = root.rstrip(self.sep)
+        if not stripped and root:
+            # file system root
+            return [""]
+        return stripped.split(self.sep)
+
+    def lookup(self, path):
+        """ Find the root directory containing a path.
+
+        Parameters
+        ----------
+        path: str
+            the path. It has to be strictly inside the root directory.
+
+        Returns
+        -------
+        match: tuple
+            (root, value) of the deepest root directory containing the
+            path, or None.
+        """
+        try:
+            return self._cache[path]
+        except KeyError:
+            pass
+        match = None
+        node = self._tree
+        components = path.split(self.sep)
+        for component in components[:-1]:
+            node = node.get(component)
+            if node is None:
+                break
+            match = node.get(None, match)
+        self._cache[path] = match
+        return match
@@ -0,0 +1,261 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Batched file existence queries.
+
+Checking the files of a large pipeline one at a time is slow on network
+storage. :class:`StatCache` lists each directory once, keeps its entries
+for a few seconds, and can list many directories in parallel
+(:meth:`StatCache.prefetch`). The stats of the files, used by the
+smart-caching keys, are kept with the listings.
+
+The pipeline tools use a new cache for each call, so that they see the
+files written by the nodes run in between. A cache shared by the GUI
+views, which only display files status, is given by
+:func:`get_stat_cache`.
+"""
+
+# System import
+import os
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+import six
+
+# Entry kinds
+_FILE = "f"
+_DIRECTORY = "d"
+_OTHER = "o"
+
+
+def _scan_directory(dirname):
+    """ Get the kinds of the entries of a directory.
+
+    Returns
+    -------
+    entries: dict
+        {name: kind}, kind is 'f' (file), 'd' (directory) or 'o' (other).
+        Broken symbolic links are not listed. An inexisting directory has
+        no entries.
+    """
+    entries = {}
+    if hasattr(os, "scandir"):
+        try:
+            for entry in os.scandir(dirname):
+                try:
+                    if entry.is_dir():
+                        entries[entry.name] = _DIRECTORY
+                    elif entry.is_file():
+                        entries[entry.name] = _FILE
+                    elif not entry.is_symlink() or os.path.exists(entry.path):
+                        entries[entry.name] = _OTHER
+                except OSError:
+                    pass
+        except OSError:
+            pass
+    else:
+        try:
+            names = os.listdir(dirname)
+        except OSError:
+            names = []
+        for name in names:
+            path = os.path.join(dirname, name)
+            if os.path.isdir(path):
+                entries[name] = _DIRECTORY
+            elif os.path.isfile(path):
+                entries[name] = _FILE
+            elif os.path.exists(path):
+                entries[name] = _OTHER
+    return entries
+
+
+class StatCache(object):
+    """ Cache of the directories entries.
+
+    ::
+
+        stat_cache = StatCache()
+        stat_cache.prefetch(paths)
+        existing = [path for path in paths if stat_cache.exists(path)]
+
+    Files which do not exist yet but will be copies of other files (cached
+    results restored with shutil.copy2, which keeps the size and mtime) can
+    be declared with :meth:`alias`: they are then seen as the source file.
+
+    Attributes
+    ----------
+    ttl: float
+        time in seconds during which a directory listing is reused (None:
+        listings are kept until they are invalidated).
+    workers: int
+        number of directories listed in parallel by :meth:`prefetch`.
+    """
+
+    def __init__(self, ttl=5., workers=8):
+        """ Initialize the StatCache class.
+
+        Parameters
+        ----------
+        ttl: float (optional, default 5)
+            time in seconds during which a directory listing is reused
+            (None: listings are kept until they are invalidated).
+        workers: int (optional, default 8)
+            number of directories listed in parallel by :meth:`prefetch`.
+        """
+        self.ttl = ttl
+        self.workers = workers
+        # {dirname: (listing_time, entries, {name: stat})}
+        self._directories = {}
+        self._aliases = {}
+        self._lock = threading.Lock()
+
+    def _expired(self, item, now):
+        return self.ttl is not None and now - item[0] > self.ttl
+
+    @staticmethod
+    def _split(path):
+        return os.path.split(os.path.normpath(os.path.abspath(path)))
+
+    def _listing(self, dirname):
+        """ Get the listing of a directory, listing it if needed.
+        """
+        with self._lock:
+            item = self._directories.get(dirname)
+        if item is not None and not self._expired(item, time.time()):
+            return item
+        item = (time.time(), _scan_directory(dirname), {})
+        with self._lock:
+            self._directories[dirname] = item
+        return item
+
+    def _kind(self, path):
+        if not isinstance(path, six.string_types) or not path:
+            return None
+        dirname, basename = self._split(self.content_path(path))
+        if not basename:
+            # root directory
+            return _DIRECTORY if os.path.isdir(dirname) else None
+        return self._listing(dirname)[1].get(basename)
+
+    def alias(self, path, source):
+        """ Declare that path will be a copy of source.
+
+        Parameters
+        ----------
+        path: str
+            the future file path.
+        source: str
+            the existing file which will be copied.
+        """
+        self._aliases[path] = source
+
+    def content_path(self, path):
+        """ Get the existing file holding the content of path.
+        """
+        return self._aliases.get(path, path)
+
+    def exists(self, path):
+        """ Same as os.path.exists(), using the cached directories listings.
+        """
+        return self._kind(path) is not None
+
+    def isfile(self, path):
+        """ Same as os.path.isfile(), using the cached directories listings.
+        """
+        return self._kind(path) == _FILE
+
+    def isdir(self, path):
+        """ Same as os.path.isdir(), using the cached directories listings.
+        """
+        return self._kind(path) == _DIRECTORY
+
+    def stat(self, path):
+        """ Get the stat of a file, kept with its directory listing.
+
+        Returns
+        -------
+        stat: os.stat_result
+            the file stat, or None if path is not an existing file.
+        """
+        if not isinstance(path, six.string_types) or not path:
+            return None
+        dirname, basename = self._split(self.content_path(path))
+        item = self._listing(dirname)
+        if item[1].get(basename) != _FILE:
+            return None
+        stats = item[2]
+        stat = stats.get(basename)
+        if stat is None:
+            try:
+                stat = os.stat(os.path.join(dirname, basename))
+            except OSError:
+                return None
+            stats[basename] = stat
+        return stat
+
+    def prefetch(self, paths):
+        """ List the directories of many paths at once, in parallel.
+
+        Parameters
+        ----------
+        paths: iterable of str
+            the paths which will be queried.
+        """
+        now = time.time()
+        dirnames = set()
+        with self._lock:
+            for path in paths:
+                if not isinstance(path, six.string_types) or not path:
+                    continue
+                dirname = self._split(path)[0]
+                item = self._directories.get(dirname)
+                if item is None or self._expired(item, now):
+                    dirnames.add(dirname)
+        if not dirnames:
+            return
+        dirnames = sorted(dirnames)
+        if self.workers <= 1 or len(dirnames) == 1:
+            listings = [_scan_directory(dirname) for dirname in dirnames]
+        else:
+            pool = ThreadPool(min(self.workers, len(dirnames)))
+            try:
+                listings = pool.map(_scan_directory, dirnames)
+            finally:
+                pool.close()
+                pool.join()
+        now = time.time()
+        with self._lock:
+            for dirname, entries in zip(dirnames, listings):
+                self._directories[dirname] = (now, entries, {})
+
+    def invalidate(self, path=None):
+        """ Forget cached listings.
+
+        Parameters
+        ----------
+        path: str (optional)
+            forget the listing of the directory containing path. Default:
+            forget everything.
+        """
+        with self._lock:
+            if path is None:
+                self._directories = {}
+            else:
+                self._directories.pop(self._split(path)[0], None)
+
+
+_stat_cache = None
+
+
+def get_stat_cache():
+    """ Get the stat cache shared by the GUI views.
+    """
+    global _stat_cache
+    if _stat_cache is None:
+        _stat_cache = StatCache()
+    return _stat_cache
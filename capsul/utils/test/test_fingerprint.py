@@ -0,0 +1,77 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+# System import
+import unittest
+import os
+import tempfile
+import shutil
+
+# Trait import
+from traits.api import Undefined
+
+# Capsul import
+from capsul.utils.fingerprint import path_fingerprint, value_fingerprint
+from capsul.utils.stat_cache import StatCache
+
+
+class TestFingerprint(unittest.TestCase):
+    """ Test the files and values fingerprints.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="capsul_test_")
+        self.image = os.path.join(self.tmpdir, "image.nii")
+        with open(self.image, "w") as openfile:
+            openfile.write("data")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_path_fingerprint(self):
+        missing = os.path.join(self.tmpdir, "missing.nii")
+        for stat_cache in (None, StatCache(ttl=None)):
+            fingerprint = path_fingerprint(self.image, stat_cache=stat_cache)
+            self.assertEqual(fingerprint[0], 4)
+            digest = path_fingerprint(self.image, "hash", stat_cache)
+            self.assertEqual(digest, [4, "8d777f385d3dfec8815d20f7496026dc"])
+            self.assertEqual(path_fingerprint(self.tmpdir, "hash",
+                                              stat_cache)[0], "directory")
+            self.assertEqual(path_fingerprint(missing,
+                                              stat_cache=stat_cache), None)
+            self.assertEqual(path_fingerprint(Undefined,
+                                              stat_cache=stat_cache), None)
+        # the same fingerprints with or without a stat cache
+        self.assertEqual(path_fingerprint(self.image),
+                         path_fingerprint(self.image,
+                                          stat_cache=StatCache(ttl=None)))
+
+    def test_value_fingerprint(self):
+        value = {"images": [self.image, "", Undefined], "threshold": 0.5,
+                 "name": "subject"}
+        self.assertEqual(value_fingerprint(value),
+                         {"images": [self.image, None, None],
+                          "threshold": 0.5, "name": "subject"})
+        fingerprint = value_fingerprint(value, "timestamp")
+        self.assertEqual(fingerprint["images"][0],
+                         [self.image, path_fingerprint(self.image)])
+        self.assertEqual(fingerprint["name"], ["subject", None])
+        self.assertEqual(value_fingerprint(set([1])), repr(set([1])))
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFingerprint)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
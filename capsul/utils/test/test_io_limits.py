@@ -0,0 +1,196 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+# System import
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import threading
+import fcntl
+
+# Trait import
+from traits.api import File, Float
+
+# Capsul import
+from capsul.api import Process, Pipeline, StudyConfig
+from capsul.utils.io_limits import (mount_point, process_mount_points,
+                                    io_slots, process_io_limits,
+                                    io_limited_command, _slots_directory)
+
+
+class DummyProcess(Process):
+    """ Dummy process using a file.
+    """
+    input = File(output=False, optional=True, desc="a file")
+    f = Float(output=False, optional=True, desc="a float")
+
+    def _run_process(self):
+        pass
+
+
+class SlowProcess(Process):
+    """ Dummy process recording how many instances run concurrently.
+    """
+    input = File(output=False, optional=True, desc="a file")
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def _run_process(self):
+        with self.lock:
+            self.running.append(self)
+            self.max_running.append(len(self.running))
+        time.sleep(0.05)
+        with self.lock:
+            self.running.remove(self)
+
+
+class SlowPipeline(Pipeline):
+    """ Pipeline iterating SlowProcess.
+    """
+    def pipeline_definition(self):
+        self.add_iterative_process(
+            "slow", "capsul.utils.test.test_io_limits.SlowProcess",
+            iterative_plugs=["input"])
+        self.export_parameter("slow", "input")
+
+
+def _try_slot(limits, lock_directory):
+    """ Check if the slots of a mount point are free, without waiting.
+    """
+    for mount, limit in limits.items():
+        directory = _slots_directory(mount, lock_directory)
+        for index in range(limit):
+            with open(os.path.join(directory,
+                                   "slot{0}".format(index)), "a") as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (IOError, OSError):
+                    continue
+                fcntl.flock(f, fcntl.LOCK_UN)
+                return True
+    return False
+
+
+class TestIOLimits(unittest.TestCase):
+    """ Test the per-filesystem concurrency limits.
+    """
+    def setUp(self):
+        self.root = mount_point(tempfile.gettempdir())
+        self.processes = []
+        for i in range(4):
+            process = DummyProcess()
+            process.input = os.path.join(self.root, "capsul_%d.nii" % i)
+            self.processes.append(process)
+        # a process which does not use files
+        self.processes.append(DummyProcess())
+
+    def test_mount_point(self):
+        self.assertTrue(os.path.ismount(self.root))
+        self.assertEqual(
+            mount_point(os.path.join(self.root, "capsul_unknown", "a.nii")),
+            self.root)
+        self.assertEqual(process_mount_points(self.processes[0]),
+                         set([self.root]))
+        self.assertEqual(process_mount_points(self.processes[-1]), set())
+
+    def test_slots(self):
+        lock_directory = tempfile.mkdtemp(prefix="capsul_test_")
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def run(process):
+            with io_slots(process_io_limits(process, {self.root: 2}),
+                          lock_directory, poll_interval=0.01):
+                with lock:
+                    running.append(process)
+                    max_running.append(len(running))
+                time.sleep(0.05)
+                with lock:
+                    running.remove(process)
+
+        try:
+            threads = [threading.Thread(target=run, args=(process, ))
+                       for process in self.processes]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            shutil.rmtree(lock_directory)
+        # 2 processes on the filesystem, and the one without files
+        self.assertEqual(len(max_running), 5)
+        self.assertTrue(max(max_running) <= 3)
+
+    def test_nested_slots(self):
+        lock_directory = tempfile.mkdtemp(prefix="capsul_test_")
+        limits = {self.root: 1}
+        try:
+            # a process run inside another one reuses its slot
+            with io_slots(limits, lock_directory, poll_interval=0.01):
+                with io_slots(limits, lock_directory, poll_interval=0.01):
+                    pass
+                # the slot is still held by the outer block
+                acquired = []
+                thread = threading.Thread(
+                    target=lambda: acquired.append(
+                        _try_slot(limits, lock_directory)))
+                thread.start()
+                thread.join()
+                self.assertEqual(acquired, [False])
+            self.assertTrue(_try_slot(limits, lock_directory))
+        finally:
+            shutil.rmtree(lock_directory)
+
+    def test_parallel_iterations(self):
+        lock_directory = tempfile.mkdtemp(prefix="capsul_test_")
+        try:
+            study_config = StudyConfig(
+                modules=[], iteration_workers=4,
+                io_concurrency_limits={self.root: 1},
+                io_locks_directory=lock_directory)
+            pipeline = SlowPipeline()
+            pipeline.set_study_config(study_config)
+            pipeline.input = [process.input
+                              for process in self.processes[:4]]
+            del SlowProcess.max_running[:]
+            study_config.run(pipeline)
+        finally:
+            shutil.rmtree(lock_directory)
+        # iteration workers wait for the slot of the filesystem
+        self.assertEqual(SlowProcess.max_running, [1, 1, 1, 1])
+
+    def test_limited_command(self):
+        command = ["python", "-c", "pass"]
+        limits = process_io_limits(self.processes[0], {self.root: 2})
+        self.assertEqual(limits, {self.root: 2})
+        self.assertEqual(
+            io_limited_command(command, limits, "/locks"),
+            ["python", "-m", "capsul.utils.io_limits",
+             "-l", "2:{0}".format(self.root), "-d", "/locks", "--"]
+            + command)
+        # processes without limited files run their command directly
+        self.assertEqual(process_io_limits(self.processes[-1],
+                                           {self.root: 2}), {})
+        self.assertEqual(io_limited_command(command, {}), command)
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestIOLimits)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,54 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+# System import
+import unittest
+
+# Capsul import
+from capsul.utils.path_trie import PathTrie
+
+
+class TestPathTrie(unittest.TestCase):
+    """ Test the matching of paths against root directories.
+    """
+    def test_lookup(self):
+        trie = PathTrie({"/data": "data", "/data/shared/": "shared",
+                         "/home/user": "home"}, sep="/")
+        self.assertEqual(len(trie), 3)
+        self.assertEqual(trie.lookup("/data/sub1/t1.nii"), ("/data", "data"))
+        # the deepest root is found
+        self.assertEqual(trie.lookup("/data/shared/t1.nii"),
+                         ("/data/shared/", "shared"))
+        self.assertEqual(trie.lookup("/data/sharedfile"), ("/data", "data"))
+        # paths have to be inside the roots
+        self.assertEqual(trie.lookup("/data"), None)
+        self.assertEqual(trie.lookup("/home/username/t1.nii"), None)
+        self.assertEqual(trie.lookup("data/t1.nii"), None)
+        # lookups are memorized until roots are added
+        self.assertEqual(trie.lookup("/tmp/t1.nii"), None)
+        trie.add("/")
+        self.assertEqual(trie.lookup("/tmp/t1.nii"), ("/", "/"))
+
+    def test_sequence(self):
+        trie = PathTrie(["/a/b", "/c"], sep="/")
+        self.assertEqual(trie.lookup("/a/b/c"), ("/a/b", "/a/b"))
+        self.assertEqual(trie.lookup("/a/c"), None)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPathTrie)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
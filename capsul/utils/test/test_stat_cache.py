@@ -0,0 +1,87 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+# System import
+import unittest
+import os
+import tempfile
+import shutil
+
+# Capsul import
+from capsul.utils.stat_cache import StatCache
+
+
+class TestStatCache(unittest.TestCase):
+    """ Test the batched file existence queries.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="capsul_test_")
+        self.paths = []
+        for subdir in ("a", "b"):
+            os.mkdir(os.path.join(self.tmpdir, subdir))
+            for name in ("1.nii", "2.nii"):
+                path = os.path.join(self.tmpdir, subdir, name)
+                open(path, "w").close()
+                self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_exists(self):
+        stat_cache = StatCache(ttl=3600)
+        missing = os.path.join(self.tmpdir, "a", "3.nii")
+        stat_cache.prefetch(self.paths + [missing, None])
+        for path in self.paths:
+            self.assertTrue(stat_cache.exists(path))
+            self.assertTrue(stat_cache.isfile(path))
+            self.assertFalse(stat_cache.isdir(path))
+        self.assertTrue(stat_cache.isdir(os.path.join(self.tmpdir, "a")))
+        self.assertTrue(stat_cache.isdir(os.path.join(self.tmpdir, "b/")))
+        self.assertFalse(stat_cache.exists(missing))
+        self.assertFalse(stat_cache.exists(
+            os.path.join(self.tmpdir, "c", "1.nii")))
+        self.assertFalse(stat_cache.exists(""))
+        self.assertTrue(stat_cache.exists("/"))
+
+        # listings are reused until they expire or are invalidated
+        open(missing, "w").close()
+        self.assertFalse(stat_cache.exists(missing))
+        stat_cache.invalidate(missing)
+        self.assertTrue(stat_cache.exists(missing))
+        os.unlink(missing)
+        stat_cache.ttl = 0
+        self.assertFalse(stat_cache.exists(missing))
+
+    def test_stat(self):
+        stat_cache = StatCache(ttl=None)
+        with open(self.paths[0], "w") as f:
+            f.write("data")
+        self.assertEqual(stat_cache.stat(self.paths[0]).st_size, 4)
+        self.assertEqual(stat_cache.stat(os.path.join(self.tmpdir, "a")),
+                         None)
+        # a future copy of a file is seen as its source
+        copy = os.path.join(self.tmpdir, "a", "copy.nii")
+        self.assertEqual(stat_cache.stat(copy), None)
+        stat_cache.alias(copy, self.paths[0])
+        self.assertTrue(stat_cache.isfile(copy))
+        self.assertEqual(stat_cache.stat(copy).st_size, 4)
+        self.assertEqual(stat_cache.content_path(copy), self.paths[0])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestStatCache)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
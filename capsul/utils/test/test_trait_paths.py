@@ -0,0 +1,64 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+# System import
+import unittest
+
+# Trait import
+from traits.api import HasTraits, File, Directory, List, Float, Undefined
+
+# Capsul import
+from capsul.utils.trait_paths import is_path_trait, path_values
+
+
+class Parameters(HasTraits):
+    """ Parameters of several types.
+    """
+    image = File()
+    directory = Directory()
+    images = List(File())
+    directories = List(Directory())
+    value = Float()
+
+
+class TestTraitPaths(unittest.TestCase):
+    """ Test the file names helpers.
+    """
+    def test_is_path_trait(self):
+        parameters = Parameters()
+        for name, path, file_path in (("image", True, True),
+                                      ("directory", True, False),
+                                      ("images", True, True),
+                                      ("directories", True, False),
+                                      ("value", False, False)):
+            trait = parameters.trait(name)
+            self.assertEqual(is_path_trait(trait), path)
+            self.assertEqual(is_path_trait(trait, directories=False),
+                             file_path)
+
+    def test_path_values(self):
+        value = ["/a.nii", "", Undefined, ("/b.nii", None), 3]
+        self.assertEqual(path_values(value), ["/a.nii", "/b.nii"])
+        self.assertEqual(path_values(value, keep_empty=True),
+                         ["/a.nii", None, None, "/b.nii", None, None])
+        self.assertEqual(path_values({"image": "/c.nii"}), ["/c.nii"])
+        self.assertEqual(path_values(Undefined), [])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTraitPaths)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,75 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" File names in process parameters.
+
+Pipeline tools (temporary files, staging, caching, I/O limits...) need the
+file names a process reads or writes: :func:`is_path_trait` tells which
+parameters hold file names, and :func:`path_values` gets the file names of
+a parameter value.
+"""
+
+# System import
+import six
+
+# Trait import
+from traits.api import Directory
+
+# Soma import
+from soma.controller.trait_utils import is_trait_pathname
+
+
+def is_path_trait(trait, directories=True):
+    """ Check if a trait is a File or a Directory, or a container of them.
+
+    Parameters
+    ----------
+    trait: CTrait
+        the trait to check.
+    directories: bool (optional, default True)
+        if False, only File traits (and containers of File) are accepted.
+
+    Returns
+    -------
+    result: bool
+    """
+    if is_trait_pathname(trait):
+        return directories or not isinstance(trait.trait_type, Directory)
+    return any(is_path_trait(inner, directories)
+               for inner in trait.inner_traits)
+
+
+def path_values(value, keep_empty=False):
+    """ Get the file names of a parameter value.
+
+    Parameters
+    ----------
+    value: object
+        a parameter value: a string, or a list, tuple or dict of values.
+    keep_empty: bool (optional, default False)
+        if True, items which are not file names (empty, undefined...) are
+        returned as None, so that the items of two values of the same
+        parameter can be matched.
+
+    Returns
+    -------
+    paths: list of str
+        the file names, in the value order.
+    """
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        paths = []
+        for item in value:
+            paths.extend(path_values(item, keep_empty))
+        return paths
+    if isinstance(value, six.string_types) and value:
+        return [value]
+    if keep_empty:
+        return [None]
+    return []